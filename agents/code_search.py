@@ -3,24 +3,34 @@ CodeSearch Agent
 ================
 """
 
+from os import getenv
 from pathlib import Path
+from tempfile import gettempdir
 
-from agno.agent import Agent
-from agno.context.workspace import WorkspaceContextProvider
-
+from app.history import HISTORY_RUNS, HISTORY_SUMMARIES, HistoryBudget, RollingSummary
+from app.memory import memory
+from app.metrics import metrics
+from app.prompt import PROMPT_DATETIME_FORMAT, prompt_cache_stats
 from app.settings import default_model
+from app.singleflight import SingleFlightAgent
+from app.workspace_index import IndexedWorkspaceContextProvider
 from db import get_postgres_db
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 
 # Wraps a read-only Workspace toolkit behind a sub-agent. The parent agent
 # sees a single `query_my_codebase(question)` tool; the sub-agent handles
-# listing, searching, and reading files.
-codebase_context = WorkspaceContextProvider(
+# listing, searching, and reading files. Search, recursive listing, and
+# `find_symbol` answer from an incremental file index that the AgentOS
+# lifespan builds at startup (see app/workspace_index.py). File navigation
+# is mechanical, so the sub-agent runs on the fast model tier
+# (app/model_router.py).
+codebase_context = IndexedWorkspaceContextProvider(
     id="my-codebase",
     name="My Codebase",
     root=REPO_ROOT,
-    model=default_model(),
+    index_path=Path(getenv("WORKSPACE_INDEX_PATH", Path(gettempdir()) / "agentos-workspace-index.json")),
+    model=default_model("my-codebase", tier="fast"),
 )
 
 
@@ -32,16 +42,27 @@ so plainly and offer to take a codebase question instead.
 """
 
 
-code_search = Agent(
+# With SINGLE_FLIGHT=True, identical concurrent questions share one run (app/singleflight.py).
+# Memory updates are written after the run, in one batch, and only the
+# MEMORY_CONTEXT_LIMIT most relevant memories reach the prompt (app/memory.py).
+code_search = SingleFlightAgent(
     id="code-search",
     name="CodeSearch",
-    model=default_model(),
+    model=default_model("code-search"),
     db=get_postgres_db(),
     tools=codebase_context.get_tools(),
+    tool_hooks=[metrics.tool_hook],
     instructions=CODE_SEARCH_INSTRUCTIONS + "\n\n" + codebase_context.instructions(),
     enable_agentic_memory=True,
+    memory_manager=memory,
+    pre_hooks=[memory.context_hook],
     add_datetime_to_context=True,
+    datetime_format=PROMPT_DATETIME_FORMAT,
+    post_hooks=[prompt_cache_stats.hook, metrics.run_hook, memory.flush_hook],
     add_history_to_context=True,
-    num_history_runs=5,
+    num_history_runs=HISTORY_RUNS,
+    compression_manager=HistoryBudget(),
+    session_summary_manager=RollingSummary() if HISTORY_SUMMARIES else None,
+    add_session_summary_to_context=HISTORY_SUMMARIES,
     markdown=True,
 )
@@ -5,45 +5,98 @@ WebSearch Agent
 
 from os import getenv
 
-from agno.agent import Agent
-from agno.tools.mcp import MCPTools
-from agno.tools.parallel import ParallelTools
+from agno.knowledge.embedder.openai import OpenAIEmbedder
+from agno.tools import Toolkit
 
+from app.fanout import WebFanOut
+from app.history import HISTORY_RUNS, HISTORY_SUMMARIES, HistoryBudget, RollingSummary
+from app.memory import memory
+from app.metrics import metrics
+from app.prompt import PROMPT_DATETIME_FORMAT, prompt_cache_stats
 from app.settings import default_model
+from app.singleflight import SingleFlightAgent
+from app.tool_output import ToolOutputCompactor
 from db import get_postgres_db
+from db.tool_cache import ToolCache
 
 # When PARALLEL_API_KEY is set, use the official parallel-web SDK —
 # the agent gets `parallel_search` and `parallel_extract` directly.
 # Without a key, fall back to the keyless MCP endpoint and the agent
-# gets `web_search` and `web_fetch` instead. AgentOS handles MCP
-# connect/close as part of its lifespan.
+# gets `web_search` and `web_fetch` instead, over a pool of MCP sessions
+# (MCP_POOL_SIZE) so concurrent runs don't queue behind one session.
+# AgentOS connects it in its lifespan; app/main.py stops the pool. Only the
+# branch in use is imported (the MCP client stack alone is ~0.5s of cold start).
+web_tools: Toolkit
 if getenv("PARALLEL_API_KEY"):
-    web_tools: ParallelTools | MCPTools = ParallelTools()
+    from agno.tools.parallel import ParallelTools
+
+    web_tools = ParallelTools()
 else:
-    web_tools = MCPTools(url="https://search.parallel.ai/mcp", transport="streamable-http")
+    from app.mcp_pool import PooledMCPTools
+
+    web_tools = PooledMCPTools(url=getenv("WEB_SEARCH_MCP_URL", "https://search.parallel.ai/mcp"))
+
+# Cache search and fetch results in Postgres so repeat questions skip the
+# round-trip to Parallel. Time-sensitive queries ("latest", "today", ...)
+# use the short WEB_CACHE_RECENT_TTL. Set WEB_CACHE_SIMILARITY (e.g. 0.95)
+# to also serve near-duplicate queries via embeddings.
+_similarity = getenv("WEB_CACHE_SIMILARITY")
+web_cache = ToolCache(
+    table_name="web_tool_cache",
+    tools={"parallel_search": "query", "web_search": "query", "parallel_extract": "url", "web_fetch": "url"},
+    ttl=int(getenv("WEB_CACHE_TTL", "3600")),
+    recent_ttl=int(getenv("WEB_CACHE_RECENT_TTL", "300")),
+    embedder=OpenAIEmbedder(id="text-embedding-3-small") if _similarity else None,
+    similarity=float(_similarity) if _similarity else None,
+    enabled=getenv("WEB_CACHE_ENABLED", "True").lower() in ("1", "true", "yes"),
+)
+
+# Fetched pages over TOOL_OUTPUT_TOKEN_BUDGET tokens are cut to the passages
+# relevant to the question before the model (and the session history) sees
+# them; the full page is stored and readable by id (app/tool_output.py).
+# Sits outside the cache, so cached pages are stored whole.
+tool_output = ToolOutputCompactor(tools={"web_fetch": "url", "parallel_extract": "urls", "search_many": "urls"})
+
+# search_many runs several searches / page reads in one tool call, a bounded
+# number at a time and each under WEB_FANOUT_TIMEOUT, and returns the hits
+# merged by URL and ranked across queries (app/fanout.py). Each branch goes
+# through the metrics and cache hooks like a direct call would.
+web_fanout = WebFanOut(web_tools, hooks=[metrics.tool_hook, web_cache.hook])
 
 
 WEB_SEARCH_INSTRUCTIONS = """\
 Search the web for current information.
 
 Workflow:
-1. Use the search tool to find candidate sources for the question.
+1. Use the search tool to find candidate sources for the question. When the question needs several queries (sub-questions, different angles, things to compare) or several pages, make one search_many call with all of them instead of searching or fetching one at a time.
 2. For recent-event, “latest,” or “recently” questions, answer only from search results you actually found in this run; do not infer newer publications, titles, or dates beyond what the results support.
 3. When the user asks about specific pages, or when search snippets are too thin to safely summarize a recent claim, follow up with the extract / fetch tool to read the most relevant URLs before answering.
-4. Cite the sources you used as plain URLs. Prefer recent, authoritative pages. If you cannot find a good answer, say so plainly.
+4. Long pages come back trimmed to the passages most relevant to the question, with an output id. If the part you need is missing, call read_stored_output with that id and a more specific query instead of fetching the page again.
+5. Cite the sources you used as plain URLs. Prefer recent, authoritative pages. If you cannot find a good answer, say so plainly.
 """
 
 
-web_search = Agent(
+# With SINGLE_FLIGHT=True, identical concurrent questions share one run (app/singleflight.py).
+# Memory updates are written after the run, in one batch, and only the
+# MEMORY_CONTEXT_LIMIT most relevant memories reach the prompt (app/memory.py).
+web_search = SingleFlightAgent(
     id="web-search",
     name="WebSearch",
-    model=default_model(),
+    model=default_model("web-search"),
     db=get_postgres_db(),
-    tools=[web_tools],
+    tools=[web_tools, web_fanout.search_many, tool_output.read_stored_output],
+    tool_hooks=[metrics.tool_hook, tool_output.hook, web_cache.hook],
     instructions=WEB_SEARCH_INSTRUCTIONS,
     enable_agentic_memory=True,
+    memory_manager=memory,
+    pre_hooks=[memory.context_hook],
     add_datetime_to_context=True,
+    datetime_format=PROMPT_DATETIME_FORMAT,
+    post_hooks=[prompt_cache_stats.hook, metrics.run_hook, memory.flush_hook],
     add_history_to_context=True,
-    num_history_runs=5,
+    num_history_runs=HISTORY_RUNS,
+    compression_manager=HistoryBudget(),
+    session_summary_manager=RollingSummary() if HISTORY_SUMMARIES else None,
+    add_session_summary_to_context=HISTORY_SUMMARIES,
     markdown=True,
 )
@@ -0,0 +1,92 @@
+"""
+App Tools
+=========
+
+python -m app importtime                 # where `import app.main` spends its time
+python -m app importtime --top 40        # longer list
+python -m app importtime -m app.asgi     # profile another module
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter
+and summarizes the report: slowest modules by cumulative time and the
+top-level packages that account for the most self time.
+"""
+
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+app = typer.Typer(add_completion=False, no_args_is_help=True, pretty_exceptions_show_locals=False)
+console = Console()
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(stderr: str) -> list[ImportRecord]:
+    """Parse ``-X importtime`` lines (``import time: self | cumulative | name``)."""
+    records: list[ImportRecord] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line.removeprefix("import time:").split("|", 2)
+            records.append(ImportRecord(name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return records
+
+
+@app.command()
+def importtime(
+    module: str = typer.Option("app.main", "--module", "-m", help="Module to import."),
+    top: int = typer.Option(25, "--top", "-n", help="Rows per table."),
+) -> None:
+    """Import-time profile of the app in a fresh interpreter."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")]))}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    records = parse_importtime(result.stderr)
+    if result.returncode != 0 or not records:
+        console.print(result.stderr[-2000:], markup=False)
+        raise typer.Exit(1)
+
+    total_us = max(r.cumulative_us for r in records)
+    slowest = Table(title=f"Slowest imports under `import {module}` ({total_us / 1e6:.2f}s total)")
+    for column in ("Module", "Cumulative", "Self"):
+        slowest.add_column(column, justify="left" if column == "Module" else "right")
+    for r in sorted(records, key=lambda r: r.cumulative_us, reverse=True)[:top]:
+        slowest.add_row(r.module, f"{r.cumulative_us / 1000:.0f}ms", f"{r.self_us / 1000:.0f}ms")
+    console.print(slowest)
+
+    packages: dict[str, int] = defaultdict(int)
+    for r in records:
+        packages[r.module.split(".")[0]] += r.self_us
+    by_package = Table(title="Self time by top-level package")
+    for column in ("Package", "Self", "Share"):
+        by_package.add_column(column, justify="left" if column == "Package" else "right")
+    for name, us in sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+        by_package.add_row(name, f"{us / 1000:.0f}ms", f"{us / total_us:.0%}")
+    console.print(by_package)
+
+
+@app.callback()
+def main() -> None:
+    """Developer tools for the AgentOS app."""
+
+
+if __name__ == "__main__":
+    app()
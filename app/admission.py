@@ -0,0 +1,322 @@
+"""
+Admission Control
+=================
+
+Opt-in rate limits and concurrency caps on agent runs, per user, per
+agent and per interface (API or Slack), so one caller fanning out runs
+can't take every model and tool slot on the replicas.
+
+Each run is checked against three keys:
+
+- the user: the JWT ``sub`` for API runs, the Slack user id for Slack
+  events. An API run without a JWT user (authorization is off, as in
+  dev) has no user key; the client address isn't one, since behind the
+  platform's proxy every request comes from the same few addresses;
+- the agent (team, workflow) being run;
+- the interface, ``api`` or ``slack``.
+
+Every key can have a concurrency cap (runs at once) and a token-bucket
+rate (runs per minute, at most ``ADMISSION_BURST`` back to back); ``0``
+means no limit. Off unless ``ADMISSION_ENABLED=True``. With
+``ADMISSION_BACKEND=postgres`` the buckets and slots are rows in
+Postgres (``db/admission.py``) and the limits hold across all workers
+and replicas; ``local`` keeps them in process, so each worker enforces
+them on its own.
+
+API runs are admitted by ``AdmissionMiddleware``. A run over a cap may
+wait up to ``ADMISSION_MAX_WAIT`` seconds for a slot; otherwise, or when
+its rate bucket won't refill in that time, it gets an immediate 429 with
+``Retry-After``. Slack events are admitted by the worker pool, and an
+event that isn't is deferred in the queue (see ``app/slack.py``). Runs
+from the scheduler's internal token are not limited.
+
+If the backend fails, runs are admitted and the error counted. Wait
+times and rejections are at ``/ops/admission`` and in ``/ops/metrics``.
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from os import getenv
+from typing import Any
+from uuid import uuid4
+
+from agno.utils.log import log_warning
+
+from app.inflight import RUN_PATH
+from app.metrics import ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS, metrics
+from app.stats import percentiles
+from db.admission import AdmissionStore, Check, Decision
+
+ADMISSION_ENABLED = getenv("ADMISSION_ENABLED", "False").lower() in ("1", "true", "yes")
+ADMISSION_BACKEND = getenv("ADMISSION_BACKEND", "postgres").lower()
+ADMISSION_USER_CONCURRENCY = int(getenv("ADMISSION_USER_CONCURRENCY", "4"))
+ADMISSION_USER_RATE = float(getenv("ADMISSION_USER_RATE", "60"))
+ADMISSION_AGENT_CONCURRENCY = int(getenv("ADMISSION_AGENT_CONCURRENCY", "0"))
+ADMISSION_AGENT_RATE = float(getenv("ADMISSION_AGENT_RATE", "0"))
+ADMISSION_API_CONCURRENCY = int(getenv("ADMISSION_API_CONCURRENCY", "0"))
+ADMISSION_API_RATE = float(getenv("ADMISSION_API_RATE", "0"))
+ADMISSION_SLACK_CONCURRENCY = int(getenv("ADMISSION_SLACK_CONCURRENCY", "0"))
+ADMISSION_SLACK_RATE = float(getenv("ADMISSION_SLACK_RATE", "0"))
+ADMISSION_BURST = float(getenv("ADMISSION_BURST", "10"))
+ADMISSION_MAX_WAIT = float(getenv("ADMISSION_MAX_WAIT", "2.0"))
+ADMISSION_LEASE = int(getenv("ADMISSION_LEASE", "900"))
+
+SCHEDULER_USER = "__scheduler__"
+
+# Seconds a run over a concurrency cap is told to wait; nothing says when a slot frees up.
+_CONCURRENCY_RETRY = 1.0
+# While waiting for a slot, how often to ask the backend again (a slot freed in this worker wakes waiters early).
+_POLL_INTERVAL = 0.25
+
+
+@dataclass
+class Limits:
+    concurrency: int
+    per_minute: float
+
+
+class Overloaded(Exception):
+    """A run was not admitted."""
+
+    def __init__(self, scope: str, reason: str, retry_after: float) -> None:
+        super().__init__(f"{scope} {reason} limit reached; retry in {retry_after:.1f}s")
+        self.scope = scope
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class Ticket:
+    holder: str | None  # None when nothing needs releasing
+    waited: float = 0.0
+
+
+# -- Local backend --------------------------------------------------------------
+
+
+class LocalLimiter:
+    """In-process stand-in for ``AdmissionStore``: the same checks, per worker."""
+
+    def __init__(self) -> None:
+        self.buckets: dict[str, tuple[float, float]] = {}
+        self.slots: Counter[str] = Counter()
+        self.holders: dict[str, list[str]] = {}
+
+    def acquire(self, checks: list[Check], holder: str, concurrency_retry: float = _CONCURRENCY_RETRY) -> Decision:
+        for check in checks:
+            if check.concurrency > 0 and self.slots[check.key] >= check.concurrency:
+                return Decision(False, check.scope, "concurrency", concurrency_retry)
+        now = time.monotonic()
+        refilled: dict[str, float] = {}
+        for check in checks:
+            if check.per_minute <= 0:
+                continue
+            rate = check.per_minute / 60
+            tokens, updated = self.buckets.get(check.key, (check.capacity, now))
+            tokens = min(check.capacity, tokens + (now - updated) * rate)
+            if tokens < 1:
+                return Decision(False, check.scope, "rate", (1 - tokens) / rate)
+            refilled[check.key] = tokens
+        for key, tokens in refilled.items():
+            self.buckets[key] = (tokens - 1, now)
+        capped = [c.key for c in checks if c.concurrency > 0]
+        self.slots.update(capped)
+        self.holders[holder] = capped
+        return Decision(True)
+
+    def release(self, holder: str) -> None:
+        self.slots.subtract(self.holders.pop(holder, []))
+        self.slots += Counter()  # drop keys at zero
+
+    def usage(self, limit: int = 10) -> dict[str, int]:
+        return dict(self.slots.most_common(limit))
+
+
+# -- Admission ------------------------------------------------------------------
+
+
+class Admission:
+    """Builds the checks for a run, admits it (waiting briefly for a slot), and keeps stats."""
+
+    def __init__(
+        self,
+        backend: str = ADMISSION_BACKEND,
+        *,
+        enabled: bool = ADMISSION_ENABLED,
+        max_wait: float = ADMISSION_MAX_WAIT,
+        burst: float = ADMISSION_BURST,
+    ) -> None:
+        self.enabled = enabled
+        self.backend = backend
+        self.max_wait = max_wait
+        self.burst = burst
+        self.limiter: AdmissionStore | LocalLimiter = (
+            AdmissionStore(lease=ADMISSION_LEASE) if backend == "postgres" else LocalLimiter()
+        )
+        self.limits = {
+            "user": Limits(ADMISSION_USER_CONCURRENCY, ADMISSION_USER_RATE),
+            "agent": Limits(ADMISSION_AGENT_CONCURRENCY, ADMISSION_AGENT_RATE),
+            "api": Limits(ADMISSION_API_CONCURRENCY, ADMISSION_API_RATE),
+            "slack": Limits(ADMISSION_SLACK_CONCURRENCY, ADMISSION_SLACK_RATE),
+        }
+        self.admitted: Counter[str] = Counter()
+        self.rejected: Counter[str] = Counter()
+        self.errors = 0
+        self.waits: dict[str, deque[float]] = {}
+        self._freed: asyncio.Event | None = None
+
+    def checks(self, *, user: str | None, agent: str | None, interface: str) -> list[Check]:
+        """The keys a run is checked against; scopes without limits are left out."""
+        keys = [("user", f"user:{user}", self.limits["user"])] if user else []
+        if agent:
+            keys.append(("agent", f"agent:{agent}", self.limits["agent"]))
+        keys.append(("interface", f"interface:{interface}", self.limits.get(interface, Limits(0, 0))))
+        return [
+            Check(scope, key, limits.concurrency, limits.per_minute, self.burst)
+            for scope, key, limits in keys
+            if limits.concurrency > 0 or limits.per_minute > 0
+        ]
+
+    async def acquire(
+        self, *, user: str | None, agent: str | None, interface: str, max_wait: float | None = None
+    ) -> Ticket:
+        """Admit a run or raise ``Overloaded``. Pass the ticket to ``release()`` once the run ends."""
+        checks = self.checks(user=user, agent=agent, interface=interface) if self.enabled else []
+        if not checks or user == SCHEDULER_USER:
+            return Ticket(None)
+        max_wait = self.max_wait if max_wait is None else max_wait
+        holder = uuid4().hex
+        started = time.monotonic()
+        while True:
+            try:
+                decision = await self._acquire(checks, holder)
+            except Exception as exc:
+                # Failing open: a backend outage shouldn't take the API down with it.
+                log_warning(f"Admission check failed, admitting: {exc}")
+                self.errors += 1
+                return Ticket(None)
+            waited = time.monotonic() - started
+            if decision.admitted:
+                self._record(interface, "admitted", waited)
+                return Ticket(holder, waited)
+            remaining = max_wait - waited
+            retry_after = decision.retry_after
+            if remaining <= 0 or (decision.reason == "rate" and retry_after > remaining):
+                self._record(interface, "rejected", waited)
+                self.rejected[f"{interface}.{decision.scope}.{decision.reason}"] += 1
+                ADMISSION_REJECTED.labels(interface, decision.scope, decision.reason).inc()
+                raise Overloaded(decision.scope or "unknown", decision.reason or "unknown", retry_after)
+            await self._wait(retry_after if decision.reason == "rate" else min(_POLL_INTERVAL, remaining))
+
+    async def release(self, ticket: Ticket) -> None:
+        if ticket.holder is None:
+            return
+        try:
+            if isinstance(self.limiter, LocalLimiter):
+                self.limiter.release(ticket.holder)
+            else:
+                await asyncio.to_thread(self.limiter.release, ticket.holder)
+        except Exception as exc:
+            # The leases expire on their own after ADMISSION_LEASE.
+            log_warning(f"Could not release admission slots: {exc}")
+            self.errors += 1
+        if self._freed is not None:
+            self._freed.set()
+            self._freed = None
+
+    def snapshot(self) -> dict:
+        try:
+            busiest: Any = self.limiter.usage()
+        except Exception as exc:
+            busiest = {"error": str(exc)}
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend,
+            "max_wait": self.max_wait,
+            "limits": {scope: vars(limits) for scope, limits in self.limits.items()},
+            "admitted": dict(self.admitted),
+            "rejected": dict(sorted(self.rejected.items())),
+            "errors": self.errors,
+            "wait_seconds": {interface: percentiles(waits) for interface, waits in self.waits.items()},
+            "busiest": busiest,
+        }
+
+    # -- Internals ------------------------------------------------------------
+
+    async def _acquire(self, checks: list[Check], holder: str) -> Decision:
+        if isinstance(self.limiter, LocalLimiter):
+            return self.limiter.acquire(checks, holder)
+        return await asyncio.to_thread(self.limiter.acquire, checks, holder, _CONCURRENCY_RETRY)
+
+    async def _wait(self, seconds: float) -> None:
+        """Sleep ``seconds``, or less if a slot is released in this worker."""
+        if self._freed is None:
+            self._freed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._freed.wait(), seconds)
+        except TimeoutError:
+            pass
+
+    def _record(self, interface: str, outcome: str, waited: float) -> None:
+        if outcome == "admitted":
+            self.admitted[interface] += 1
+        self.waits.setdefault(interface, deque(maxlen=1000)).append(waited)
+        ADMISSION_WAIT_SECONDS.labels(interface, outcome).observe(waited)
+
+
+admission = Admission()
+
+
+class AdmissionMiddleware:
+    """Admit agent / team / workflow run requests, or answer 429 with ``Retry-After``.
+
+    Must run inside the JWT middleware (it reads ``request.state.user_id``),
+    so it is appended to the end of ``app.user_middleware`` rather than
+    added with ``add_middleware``.
+    """
+
+    def __init__(self, app: Any, admission: Admission = admission) -> None:
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        match = RUN_PATH.match(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if match is None or not self.admission.enabled:
+            await self.app(scope, receive, send)
+            return
+        user = (scope.get("state") or {}).get("user_id")
+        try:
+            ticket = await self.admission.acquire(user=user, agent=metrics.entities(match.group(2)), interface="api")
+        except Overloaded as exc:
+            await _too_many_requests(send, exc)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await self.admission.release(ticket)
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+async def _too_many_requests(send: Any, exc: Overloaded) -> None:
+    retry_after = max(1, math.ceil(exc.retry_after))
+    body = json.dumps({"detail": f"Too many runs for this {exc.scope}; retry in {retry_after}s."}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,105 @@
+"""
+ASGI Entrypoint
+===============
+
+``app.asgi:app`` is what the servers run. It is a thin ASGI wrapper that
+imports nothing heavy, so the port is bound within milliseconds of the
+process starting.
+
+The real AgentOS app (``app.main:app`` — agents, models, DB handles,
+MCP tools, interfaces) is imported in a background warm-up task as soon
+as the lifespan starts, then its own lifespan is entered. Requests that
+arrive earlier wait for the warm-up instead of failing; ``/health``
+answers 503 until the app is ready so load balancers hold traffic back.
+
+When ``app.main`` was already imported (gunicorn preloads it in the
+master) the warm-up only runs the lifespan.
+"""
+
+import asyncio
+import importlib
+import json
+import time
+from typing import Any
+
+from agno.utils.log import log_error
+
+from app.startup import startup
+
+
+class LazyApp:
+    """ASGI app that loads ``target`` (``"module:attr"``) in the background on startup."""
+
+    def __init__(self, target: str) -> None:
+        self.module, _, self.attr = target.partition(":")
+        self._app: Any = None
+        self._state: dict = {}
+        self._ready = asyncio.Event()
+        self._shutdown = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if self._app is None:
+            if scope["type"] == "http" and scope["path"] == "/health":
+                await _json(send, 503, {"status": "starting"})
+                return
+            self._start()
+            await self._ready.wait()
+            if self._app is None:
+                await _json(send, 500, {"detail": "AgentOS failed to start; see logs"})
+                return
+        if self._state:
+            scope["state"] = {**scope.get("state", {}), **self._state}
+        await self._app(scope, receive, send)
+
+    # -- Internals ----------------------------------------------------------
+
+    def _start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="agentos-warm-up")
+
+    async def _run(self) -> None:
+        """Import the app and hold its lifespan open until shutdown (one task, so anyio scopes stay valid)."""
+        try:
+            with startup.phase(f"import {self.module}"):
+                module = await asyncio.to_thread(importlib.import_module, self.module)
+            app = getattr(module, self.attr)
+            started = time.perf_counter()
+            async with app.router.lifespan_context(app) as state:
+                startup.record("lifespan", time.perf_counter() - started)
+                self._state = dict(state or {})
+                self._app = app
+                self._ready.set()
+                startup.ready()
+                await self._shutdown.wait()
+        except Exception as exc:
+            log_error(f"AgentOS warm-up failed: {type(exc).__name__}: {exc}")
+            raise
+        finally:
+            self._ready.set()
+
+    async def _lifespan(self, receive: Any, send: Any) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self._shutdown.set()
+                if self._task is not None:
+                    await asyncio.gather(self._task, return_exceptions=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def _json(send: Any, status: int, body: dict) -> None:
+    payload = json.dumps(body).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": payload})
+
+
+app = LazyApp("app.main:app")
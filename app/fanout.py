@@ -0,0 +1,319 @@
+"""
+Web Fan-Out
+===========
+
+One WebSearch tool call that runs several searches and page reads at
+once, instead of a chain of model round-trips that each search or fetch
+one thing.
+
+``search_many(queries, urls)`` starts one branch per query and per URL
+on the agent's own search and fetch tools (``parallel_search`` /
+``parallel_extract`` with a Parallel key, ``web_search`` / ``web_fetch``
+over MCP without one):
+
+- At most ``WEB_FANOUT_CONCURRENCY`` branches run at a time, and a call
+  takes at most ``WEB_FANOUT_MAX_BRANCHES`` of them; the rest are
+  reported back as skipped.
+- Each branch gets ``WEB_FANOUT_TIMEOUT`` seconds once it starts. A slow
+  or failing branch is reported under ``failed`` and the others are
+  returned without it.
+- Search hits are merged by URL (``normalize_url``, so tracking params
+  and trailing slashes don't count) and ranked by reciprocal rank fusion
+  across the queries, so pages several queries agree on come first. The
+  pages that were read come before them, in the order asked for.
+
+Branches run through the same hooks as a direct call (metrics and the
+web cache), and the merged result is compacted like any other fetch (see
+``app/tool_output.py``). Call and branch counts, timeouts and latency
+are at ``/ops/fan-out``; ``python -m evals fan-out`` compares it with
+one call at a time against a local search server.
+"""
+
+import asyncio
+import inspect
+import json
+import re
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from functools import partial
+from os import getenv
+from typing import Any
+
+from agno.tools import Toolkit
+from agno.tools.function import ToolResult
+
+from app.stats import percentiles
+from app.tool_output import json_object
+from db.tool_cache import normalize_url
+
+WEB_FANOUT_CONCURRENCY = int(getenv("WEB_FANOUT_CONCURRENCY", "4"))
+WEB_FANOUT_TIMEOUT = float(getenv("WEB_FANOUT_TIMEOUT", "20"))
+WEB_FANOUT_MAX_BRANCHES = int(getenv("WEB_FANOUT_MAX_BRANCHES", "8"))
+WEB_FANOUT_MAX_RESULTS = int(getenv("WEB_FANOUT_MAX_RESULTS", "10"))
+
+# Reciprocal rank fusion constant: a hit at rank r in one query scores 1 / (_RRF_K + r).
+_RRF_K = 60
+
+# Search and fetch tools the fan-out can drive, in order of preference:
+# tool name → (argument it takes, whether that argument is a list).
+_SEARCH_TOOLS = {"parallel_search": ("search_queries", True), "web_search": ("query", False)}
+_FETCH_TOOLS = {"parallel_extract": ("urls", True), "web_fetch": ("url", False)}
+
+_URL = re.compile(r"https?://[^\s<>\"')\]]+")
+# A search result in plain-text output starts after a blank line or at a numbered line ("1. ", "2) ").
+_BLOCK = re.compile(r"\n\s*\n|\n(?=\s*\d+[.)]\s)")
+_NUMBER = re.compile(r"^\s*\d+[.)]\s*")
+
+Hook = Callable[[str, Callable[..., Awaitable[Any]], dict], Awaitable[Any]]
+
+
+class FanOutStats:
+    """Process-wide counters for ``/ops/fan-out``."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.branches = {"search": 0, "fetch": 0}
+        self.skipped = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.duplicates = 0
+        self.in_flight = 0
+        self.call_seconds: deque[float] = deque(maxlen=1000)
+        self.branch_seconds: deque[float] = deque(maxlen=1000)
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "branches": dict(self.branches),
+            "skipped": self.skipped,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "duplicates_merged": self.duplicates,
+            "in_flight": self.in_flight,
+            "call_ms": percentiles(self.call_seconds, scale=1000, digits=1),
+            "branch_ms": percentiles(self.branch_seconds, scale=1000, digits=1),
+        }
+
+
+class WebFanOut:
+    """The ``search_many`` tool over the search and fetch tools of ``web_tools``."""
+
+    def __init__(
+        self,
+        web_tools: Toolkit,
+        *,
+        hooks: list[Hook] | None = None,
+        concurrency: int = WEB_FANOUT_CONCURRENCY,
+        timeout: float = WEB_FANOUT_TIMEOUT,
+        max_branches: int = WEB_FANOUT_MAX_BRANCHES,
+        max_results: int = WEB_FANOUT_MAX_RESULTS,
+        stats: FanOutStats | None = None,
+    ) -> None:
+        self.web_tools = web_tools
+        self.hooks = hooks or []
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.max_branches = max(1, max_branches)
+        self.max_results = max_results
+        self.stats = stats or FanOutStats()
+
+    def __deepcopy__(self, memo: dict) -> "WebFanOut":
+        # AgentOS deep-copies the agent (and its tool list) per request; the toolkit and stats stay shared.
+        return self
+
+    # -- Tool -----------------------------------------------------------------
+
+    async def search_many(self, queries: list[str] | None = None, urls: list[str] | None = None) -> str:
+        """Run several web searches and page reads at the same time and return the merged results.
+
+        Use this instead of searching or fetching one thing at a time whenever the question needs more than one
+        query (different angles, sub-questions, names to compare) or more than one page.
+
+        Args:
+            queries (list[str]): Search queries to run at once.
+            urls (list[str]): Pages to read at once.
+
+        Returns:
+            str: JSON with "results" (the pages read, then search hits ranked across all queries with duplicate
+            URLs merged) and "failed" (queries or pages that errored or timed out).
+        """
+        queries = _unique(q.strip() for q in queries or [] if q.strip())
+        urls = _unique((u.strip() for u in urls or [] if u.strip()), key=normalize_url)
+        if not queries and not urls:
+            return json.dumps({"error": "Give at least one query or URL."})
+        search = self._tool(_SEARCH_TOOLS) if queries else None
+        fetch = self._tool(_FETCH_TOOLS) if urls else None
+        if (queries and search is None) or (urls and fetch is None):
+            return json.dumps({"error": f"No {'search' if queries and search is None else 'fetch'} tool available."})
+
+        branches = [("query", q) for q in queries] + [("url", u) for u in urls]
+        skipped = branches[self.max_branches :]
+        branches = branches[: self.max_branches]
+        self.stats.calls += 1
+        self.stats.skipped += len(skipped)
+        gate = asyncio.Semaphore(self.concurrency)
+
+        async def run(kind: str, value: str) -> tuple[str | None, str | None]:
+            tool = search if kind == "query" else fetch
+            assert tool is not None
+            name, arguments = tool(value)
+            async with gate:
+                self.stats.branches["search" if kind == "query" else "fetch"] += 1
+                self.stats.in_flight += 1
+                started = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(self._call(name, arguments), self.timeout)
+                except TimeoutError:
+                    self.stats.timeouts += 1
+                    return None, f"timed out after {self.timeout:g}s"
+                except Exception as exc:
+                    self.stats.errors += 1
+                    return None, f"{type(exc).__name__}: {exc}"
+                finally:
+                    self.stats.in_flight -= 1
+                    self.stats.branch_seconds.append(time.perf_counter() - started)
+            content = result.content if isinstance(result, ToolResult) else result
+            content = content if isinstance(content, str) else json.dumps(content, default=str)
+            if content.startswith("Error") or _error_of(content):
+                self.stats.errors += 1
+                return None, _error_of(content) or content[:200]
+            return content, None
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(run(kind, value) for kind, value in branches))
+        self.stats.call_seconds.append(time.perf_counter() - started)
+
+        pages: list[dict] = []
+        ranked: list[list[dict]] = []
+        failed = [{kind: value, "error": error} for (kind, value), (_, error) in zip(branches, outcomes) if error]
+        failed += [{kind: value, "error": "skipped: too many branches in one call"} for kind, value in skipped]
+        for (kind, value), (content, _) in zip(branches, outcomes):
+            if content is None:
+                continue
+            if kind == "url":
+                pages += _pages(value, content)
+            else:
+                ranked.append([{**hit, "queries": [value]} for hit in _hits(content)])
+        results = self._merge(pages, ranked)
+        return json.dumps({"results": results, "failed": failed}, indent=2)
+
+    def snapshot(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "timeout": self.timeout,
+            "max_branches": self.max_branches,
+            "max_results": self.max_results,
+            **self.stats.snapshot(),
+        }
+
+    # -- Internals ------------------------------------------------------------
+
+    def _tool(self, tools: dict[str, tuple[str, bool]]) -> Callable[[str], tuple[str, dict]] | None:
+        """``value → (tool name, arguments)`` for the first of ``tools`` that ``web_tools`` has, if any."""
+        for name, (argument, is_list) in tools.items():
+            if name in self.web_tools.functions:
+                return partial(_tool_call, name, argument, is_list)
+        return None
+
+    async def _call(self, name: str, arguments: dict) -> Any:
+        """Call tool ``name`` through ``hooks``, the first hook outermost, as agno would."""
+        entrypoint = self.web_tools.functions[name].entrypoint
+        if entrypoint is None:
+            raise RuntimeError(f"tool {name!r} has no entrypoint")
+
+        async def call(**kwargs: Any) -> Any:
+            if inspect.iscoroutinefunction(entrypoint):
+                return await entrypoint(**kwargs)
+            result = await asyncio.to_thread(entrypoint, **kwargs)
+            return await result if inspect.isawaitable(result) else result
+
+        for hook in reversed(self.hooks):
+            call = partial(_hooked, hook, name, call)
+        return await call(**arguments)
+
+    def _merge(self, pages: list[dict], ranked: list[list[dict]]) -> list[dict]:
+        """Pages first, then hits fused across queries; one entry per normalized URL."""
+        merged: dict[str, dict] = {}
+        for page in pages:
+            merged.setdefault(normalize_url(page["url"]), page)
+        read = list(merged)
+        scores: dict[str, float] = {}
+        for hits in ranked:
+            for rank, hit in enumerate(hits, start=1):
+                key = normalize_url(hit["url"])
+                entry = merged.get(key)
+                if entry is None:
+                    merged[key] = hit
+                else:
+                    self.stats.duplicates += 1
+                    entry["queries"] = _unique([*entry.get("queries", []), *hit["queries"]])
+                    if "excerpts" in entry:
+                        entry["excerpts"] = _unique([*entry["excerpts"], *hit["excerpts"]])
+                    entry["title"] = entry.get("title") or hit["title"]
+                if key not in read:
+                    scores[key] = scores.get(key, 0.0) + 1 / (_RRF_K + rank)
+        top = sorted(scores, key=scores.__getitem__, reverse=True)[: self.max_results]
+        return [merged[key] for key in read + top]
+
+
+def _tool_call(name: str, argument: str, is_list: bool, value: str) -> tuple[str, dict]:
+    return name, {argument: [value] if is_list else value}
+
+
+async def _hooked(hook: Hook, name: str, call: Callable[..., Awaitable[Any]], **arguments: Any) -> Any:
+    return await hook(name, call, arguments)
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+
+def _hits(content: str) -> list[dict]:
+    """``{url, title, excerpts}`` per search result, from Parallel's JSON or a plain-text result list."""
+    payload = json_object(content)
+    if isinstance(payload, dict) and isinstance(payload.get("results"), list):
+        return [
+            {
+                "url": item["url"],
+                "title": str(item.get("title") or ""),
+                "excerpts": list(item.get("excerpts") or ([item["excerpt"]] if item.get("excerpt") else [])),
+            }
+            for item in payload["results"]
+            if isinstance(item, dict) and item.get("url")
+        ]
+    hits = []
+    for block in _BLOCK.split(content):
+        match = _URL.search(block)
+        if match is None:
+            continue
+        url = match.group().rstrip(".,;")
+        lines = [line.strip() for line in block.strip().splitlines() if line.strip()]
+        title = _NUMBER.sub("", _URL.sub("", lines[0])).strip(" -—|:[]()")
+        excerpt = " ".join(line for line in lines[1:] if not _URL.fullmatch(line))
+        hits.append({"url": url, "title": title, "excerpts": [excerpt] if excerpt else []})
+    return hits
+
+
+def _pages(url: str, content: str) -> list[dict]:
+    """One ``{url, title, full_content}`` per page read; ``parallel_extract`` JSON keeps its own results."""
+    payload = json_object(content)
+    if isinstance(payload, dict) and isinstance(payload.get("results"), list):
+        return [item for item in payload["results"] if isinstance(item, dict) and item.get("url")]
+    return [{"url": url, "title": "", "full_content": content}]
+
+
+def _error_of(content: str) -> str | None:
+    payload = json_object(content)
+    return str(payload["error"]) if isinstance(payload, dict) and payload.get("error") else None
+
+
+def _unique(values: Any, key: Callable[[str], str] = lambda value: value) -> list:
+    seen: set[str] = set()
+    out = []
+    for value in values:
+        if key(value) not in seen:
+            seen.add(key(value))
+            out.append(value)
+    return out
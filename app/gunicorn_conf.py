@@ -0,0 +1,84 @@
+"""
+Gunicorn Config
+===============
+
+Production serving mode: one gunicorn master, N uvicorn workers.
+
+    gunicorn -c python:app.gunicorn_conf app.asgi:app
+
+- ``WEB_CONCURRENCY`` sets the worker count; unset, it follows the CPU
+  limit of the container (cgroup quota, then CPU affinity).
+- With ``PRELOAD_APP`` (default) ``app.main`` is imported once in the
+  master and forked, so agents, tools and config are built once and
+  shared copy-on-write. Nothing connects at import time; each worker
+  drops any inherited DB connections in ``post_fork``. Set it to False
+  for the fastest port bind (scale-to-zero): each worker then builds the
+  app in its background warm-up (see ``app/asgi.py``).
+- On SIGTERM / SIGHUP each worker stops accepting, lets in-flight
+  (streaming) runs finish for up to ``GRACEFUL_TIMEOUT`` seconds, then
+  runs the lifespan shutdown.
+- The schedule poller runs in one worker across all replicas (see
+  ``app/scheduler.py``).
+- With ``PROMETHEUS_MULTIPROC_DIR`` set, ``/ops/metrics`` aggregates all
+  workers (see ``app/metrics.py``).
+"""
+
+import math
+import os
+from os import getenv
+from pathlib import Path
+
+from uvicorn_worker import UvicornWorker
+
+
+def _cpu_limit() -> int:
+    """CPUs this container may use: cgroup v2 / v1 quota, else affinity."""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        quota_us = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period_us = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        if quota_us > 0:
+            return max(1, math.ceil(quota_us / period_us))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+bind = f"0.0.0.0:{getenv('PORT', '8000')}"
+workers = int(getenv("WEB_CONCURRENCY") or _cpu_limit())
+worker_class = "app.gunicorn_conf.AgentOSWorker"
+preload_app = getenv("PRELOAD_APP", "True").lower() in ("1", "true", "yes")
+graceful_timeout = int(getenv("GRACEFUL_TIMEOUT", "120"))
+timeout = 60
+keepalive = 5
+errorlog = "-"
+
+
+def on_starting(server):  # type: ignore[no-untyped-def]
+    if preload_app:
+        import app.main  # noqa: F401
+
+
+def post_fork(server, worker):  # type: ignore[no-untyped-def]
+    from db import dispose_engines
+
+    dispose_engines(close=False)
+
+
+def child_exit(server, worker):  # type: ignore[no-untyped-def]
+    # With PROMETHEUS_MULTIPROC_DIR, drop the dead worker's live gauges from /ops/metrics.
+    if getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+class AgentOSWorker(UvicornWorker):
+    # Leave a few seconds after uvicorn stops waiting on requests for the
+    # lifespan shutdown to run before gunicorn's hard kill.
+    CONFIG_KWARGS = {"loop": "auto", "http": "auto", "timeout_graceful_shutdown": max(graceful_timeout - 10, 1)}
@@ -0,0 +1,296 @@
+"""
+Conversation History
+====================
+
+Bounded history for agents with ``add_history_to_context=True``.
+
+Each run replays the last ``HISTORY_RUNS`` runs of the session. Before the
+first model call of a run, ``HistoryBudget``:
+
+- truncates replayed tool results to ``HISTORY_TOOL_RESULT_TOKENS`` each
+  (only the copies sent to the model — stored runs are untouched);
+- drops the oldest replayed turns until the history fits in
+  ``HISTORY_TOKEN_BUDGET`` tokens.
+
+Runs that age out of the window are folded into a rolling summary by
+``RollingSummary``. The summary lives on the session (``session.summary``)
+and is added to the system prompt, so long sessions keep their gist
+without resending every turn. It is updated incrementally: the previous
+summary plus the runs that aged out since, one small model call per run.
+
+Per-run numbers (session load time, history tokens before / after
+trimming, turns dropped, tool results truncated) are attached to the run's
+``metrics.additional_metrics["history"]`` and aggregated at
+``/ops/history``.
+
+    Agent(
+        add_history_to_context=True,
+        num_history_runs=HISTORY_RUNS,
+        compression_manager=HistoryBudget(),
+        session_summary_manager=RollingSummary(),
+        add_session_summary_to_context=True,
+    )
+"""
+
+import weakref
+from dataclasses import dataclass
+from os import getenv
+from typing import TYPE_CHECKING, Any
+
+from agno.compression.manager import CompressionManager
+from agno.models.message import Message
+from agno.models.utils import get_model
+from agno.run.base import RunStatus
+from agno.session.summary import SessionSummary, SessionSummaryManager
+from agno.utils.log import log_debug, log_warning
+from agno.utils.tokens import count_text_tokens, count_tokens
+
+from db.session import session_load_seconds
+
+if TYPE_CHECKING:
+    from agno.metrics import RunMetrics
+    from agno.session.agent import AgentSession
+    from agno.session.team import TeamSession
+
+HISTORY_RUNS = int(getenv("HISTORY_RUNS", "5"))
+HISTORY_TOKEN_BUDGET = int(getenv("HISTORY_TOKEN_BUDGET", "8000"))
+HISTORY_TOOL_RESULT_TOKENS = int(getenv("HISTORY_TOOL_RESULT_TOKENS", "500"))
+HISTORY_SUMMARIES = getenv("HISTORY_SUMMARIES", "True").lower() in ("1", "true", "yes")
+
+# Key in session.session_data marking the last run folded into the summary.
+_SUMMARY_THROUGH = "history_summary_through"
+# Runs agno leaves out of history (see AgentSession.get_messages).
+_SKIPPED_STATUSES = (RunStatus.paused, RunStatus.cancelled, RunStatus.error)
+_CHARS_PER_TOKEN = 4
+
+
+class HistoryStats:
+    """Process-wide counters for ``/ops/history``."""
+
+    def __init__(self) -> None:
+        self.runs = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.max_tokens_after = 0
+        self.turns_dropped = 0
+        self.tool_results_truncated = 0
+        self.load_seconds = 0.0
+        self.max_load_seconds = 0.0
+        self.summaries = 0
+        self.summary_tokens = 0
+
+    def record_run(self, record: dict) -> None:
+        self.runs += 1
+        self.tokens_before += record["tokens_before"]
+        self.tokens_after += record["tokens_after"]
+        self.max_tokens_after = max(self.max_tokens_after, record["tokens_after"])
+        self.turns_dropped += record["turns_dropped"]
+        self.tool_results_truncated += record["tool_results_truncated"]
+        if record.get("load_ms") is not None:
+            self.load_seconds += record["load_ms"] / 1000
+            self.max_load_seconds = max(self.max_load_seconds, record["load_ms"] / 1000)
+
+    def record_summary(self, tokens: int) -> None:
+        self.summaries += 1
+        self.summary_tokens = tokens
+
+    def snapshot(self) -> dict:
+        runs = max(self.runs, 1)
+        return {
+            "runs": self.runs,
+            "avg_tokens_before": round(self.tokens_before / runs),
+            "avg_tokens_after": round(self.tokens_after / runs),
+            "max_tokens_after": self.max_tokens_after,
+            "turns_dropped": self.turns_dropped,
+            "tool_results_truncated": self.tool_results_truncated,
+            "avg_load_ms": round(self.load_seconds / runs * 1000, 2),
+            "max_load_ms": round(self.max_load_seconds * 1000, 2),
+            "summaries": self.summaries,
+            "last_summary_tokens": self.summary_tokens,
+            "budget": {
+                "runs": HISTORY_RUNS,
+                "tokens": HISTORY_TOKEN_BUDGET,
+                "tool_result_tokens": HISTORY_TOOL_RESULT_TOKENS,
+            },
+        }
+
+
+history_stats = HistoryStats()
+
+
+# ---------------------------------------------------------------------------
+# Token budget for replayed history
+# ---------------------------------------------------------------------------
+@dataclass
+class HistoryBudget(CompressionManager):
+    """Trim replayed history in place, once per run, before the model sees it.
+
+    Plugged in through agno's ``compression_manager`` hook, which hands over
+    the exact message list sent to the model. No model calls are made:
+    tool results are cut to a head with a marker, and whole turns (a user
+    message and everything after it) are dropped oldest-first.
+    """
+
+    token_budget: int = HISTORY_TOKEN_BUDGET
+    tool_result_tokens: int = HISTORY_TOOL_RESULT_TOKENS
+
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        # First history message of each run already trimmed (the copies are per run).
+        self._trimmed: weakref.WeakValueDictionary[int, Message] = weakref.WeakValueDictionary()
+
+    def should_compress(
+        self, messages: list[Message], tools: Any = None, model: Any = None, response_format: Any = None
+    ) -> bool:
+        first = next((m for m in messages if m.from_history), None)
+        return first is not None and self._trimmed.get(id(first)) is not first
+
+    async def ashould_compress(
+        self, messages: list[Message], tools: Any = None, model: Any = None, response_format: Any = None
+    ) -> bool:
+        return self.should_compress(messages, tools, model, response_format)
+
+    def compress(self, messages: list[Message], run_metrics: "RunMetrics | None" = None) -> None:
+        history = [m for m in messages if m.from_history]
+        if not history:
+            return
+        self._trimmed[id(history[0])] = history[0]
+        try:
+            self._trim(messages, history, run_metrics)
+        except Exception as exc:
+            log_warning(f"History trimming failed, sending it as loaded: {exc}")
+
+    async def acompress(self, messages: list[Message], run_metrics: "RunMetrics | None" = None) -> None:
+        self.compress(messages, run_metrics=run_metrics)
+
+    def _trim(self, messages: list[Message], history: list[Message], run_metrics: "RunMetrics | None") -> None:
+        model = get_model(self.model)
+        model_id = (model.id if model is not None else None) or "gpt-4o"
+
+        tokens_before = count_tokens(history, model_id=model_id)
+        truncated = sum(self._truncate(m, model_id) for m in history if m.role == "tool")
+
+        turns = _split_turns(history)
+        total_turns = len(turns)
+        sizes = [count_tokens(turn, model_id=model_id) for turn in turns]
+        dropped: list[Message] = []
+        while turns and sum(sizes) > self.token_budget:
+            dropped.extend(turns.pop(0))
+            sizes.pop(0)
+        if dropped:
+            dropped_ids = {id(m) for m in dropped}
+            messages[:] = [m for m in messages if id(m) not in dropped_ids]
+        if turns:
+            self._trimmed[id(turns[0][0])] = turns[0][0]
+
+        load = session_load_seconds.get()
+        record = {
+            "messages": sum(len(turn) for turn in turns),
+            "tokens_before": tokens_before,
+            "tokens_after": sum(sizes),
+            "turns_dropped": total_turns - len(turns),
+            "tool_results_truncated": truncated,
+            "load_ms": round(load * 1000, 2) if load is not None else None,
+        }
+        history_stats.record_run(record)
+        if run_metrics is not None:
+            run_metrics.additional_metrics = {**(run_metrics.additional_metrics or {}), "history": record}
+        log_debug(
+            f"History: {record['tokens_before']} -> {record['tokens_after']} tokens, "
+            f"{record['turns_dropped']} turn(s) dropped, {truncated} tool result(s) truncated"
+        )
+
+    def _truncate(self, message: Message, model_id: str) -> bool:
+        content = message.compressed_content or message.get_content_string()
+        tokens = count_tokens([message], model_id=model_id)
+        if tokens <= self.tool_result_tokens:
+            return False
+        head = content[: self.tool_result_tokens * _CHARS_PER_TOKEN]
+        message.compressed_content = f"{head}\n[... truncated; {tokens} tokens in the original result]"
+        return True
+
+
+def _split_turns(history: list[Message]) -> list[list[Message]]:
+    """Group messages into turns, each starting at a user message."""
+    turns: list[list[Message]] = []
+    for message in history:
+        if message.role == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+# ---------------------------------------------------------------------------
+# Rolling summary of runs that aged out of the window
+# ---------------------------------------------------------------------------
+@dataclass
+class RollingSummary(SessionSummaryManager):
+    """Fold runs older than the last ``recent_runs`` into ``session.summary``.
+
+    Only runs not yet summarized are sent, together with the previous
+    summary, so the cost per run stays flat as the session grows. Runs
+    that are still replayed verbatim are never summarized, and no model
+    call is made while the session fits in the window.
+    """
+
+    recent_runs: int = HISTORY_RUNS
+
+    def create_session_summary(
+        self, session: "AgentSession | TeamSession", run_metrics: "RunMetrics | None" = None
+    ) -> SessionSummary | None:
+        aged = _unsummarized_runs(session, self.recent_runs)
+        summary = super().create_session_summary(session, run_metrics=run_metrics) if aged else None
+        self._mark(session, aged, summary)
+        return summary
+
+    async def acreate_session_summary(
+        self, session: "AgentSession | TeamSession", run_metrics: "RunMetrics | None" = None
+    ) -> SessionSummary | None:
+        aged = _unsummarized_runs(session, self.recent_runs)
+        summary = await super().acreate_session_summary(session, run_metrics=run_metrics) if aged else None
+        self._mark(session, aged, summary)
+        return summary
+
+    def _prepare_summary_messages(self, session: Any = None) -> list[Message] | None:
+        aged = _unsummarized_runs(session, self.recent_runs) if session is not None else []
+        conversation = [
+            m
+            for run in aged
+            for m in run.messages or []
+            if m.role in ("user", "assistant") and not m.from_history and m.content
+        ]
+        self.model = get_model(self.model)
+        if not conversation or self.model is None:
+            return None
+        request = self.summary_request_message
+        if session.summary is not None:
+            request = (
+                f"Summary of the earlier conversation:\n{session.summary.summary}\n\n"
+                "Update it with the conversation above and return one combined summary."
+            )
+        return [
+            self.get_system_message(conversation=conversation, response_format=self.get_response_format(self.model)),
+            Message(role="user", content=request),
+        ]
+
+    @staticmethod
+    def _mark(session: "AgentSession | TeamSession", aged: list, summary: SessionSummary | None) -> None:
+        if summary is None:
+            return
+        session.session_data = {**(session.session_data or {}), _SUMMARY_THROUGH: aged[-1].run_id}
+        history_stats.record_summary(count_text_tokens(summary.summary))
+
+
+def _unsummarized_runs(session: "AgentSession | TeamSession", recent_runs: int) -> list:
+    """Runs outside the replay window that the summary does not cover yet."""
+    runs = [
+        run
+        for run in session.runs or []
+        if getattr(run, "parent_run_id", None) is None and getattr(run, "status", None) not in _SKIPPED_STATUSES
+    ]
+    aged = runs[:-recent_runs] if recent_runs > 0 else runs
+    through = (session.session_data or {}).get(_SUMMARY_THROUGH)
+    ids = [run.run_id for run in aged]
+    if through in ids:
+        return aged[ids.index(through) + 1 :]
+    return aged
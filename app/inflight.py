@@ -0,0 +1,84 @@
+"""
+In-flight Runs
+==============
+
+ASGI middleware that counts agent / team / workflow runs and Slack
+events currently being served by this worker. A streaming run counts
+until its last chunk is sent.
+
+On shutdown or reload the server stops accepting connections and waits
+up to ``GRACEFUL_TIMEOUT`` for these to finish; the lifespan logs what is
+still running and ``/ops/serving`` exposes the live count.
+"""
+
+import asyncio
+import re
+import time
+from typing import Any
+
+from agno.utils.log import log_info, log_warning
+
+# A run request, with its entity kind and id; shared by the run middlewares (metrics, admission).
+RUN_PATH = re.compile(r"^/(agents|teams|workflows)/([^/]+)/runs(?:/[^/]+/continue)?/?$")
+
+
+class InFlightRuns:
+    """Counter of active run requests with an awaitable "idle" signal."""
+
+    def __init__(self) -> None:
+        self.active = 0
+        self.started = 0
+        self.finished = 0
+        self._idle: asyncio.Event | None = None
+
+    def enter(self) -> None:
+        self.active += 1
+        self.started += 1
+        if self._idle is not None:
+            self._idle.clear()
+
+    def exit(self) -> None:
+        self.active -= 1
+        self.finished += 1
+        if self.active == 0 and self._idle is not None:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until no runs are active. Returns ``False`` on timeout."""
+        if self.active == 0:
+            return True
+        log_info(f"Draining {self.active} in-flight run(s), up to {timeout:.0f}s")
+        self._idle = asyncio.Event()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except TimeoutError:
+            log_warning(f"{self.active} run(s) still active after {timeout:.0f}s; they will be cancelled")
+            return False
+        log_info(f"Drained in-flight runs in {time.monotonic() - started:.1f}s")
+        return True
+
+    def snapshot(self) -> dict:
+        return {"active": self.active, "started": self.started, "finished": self.finished}
+
+
+inflight = InFlightRuns()
+
+
+class InFlightMiddleware:
+    """Track matching POST requests in ``tracker`` for the full response lifetime."""
+
+    def __init__(self, app: Any, tracker: InFlightRuns = inflight) -> None:
+        self.app = app
+        self.tracker = tracker
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        path = scope["path"] if scope["type"] == "http" and scope["method"] == "POST" else ""
+        if not (RUN_PATH.match(path) or path.startswith("/slack/")):
+            await self.app(scope, receive, send)
+            return
+        self.tracker.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.tracker.exit()
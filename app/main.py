@@ -3,76 +3,148 @@ AgentOS Entrypoint
 ==================
 """
 
+import asyncio
 from contextlib import asynccontextmanager
 from os import getenv
 from pathlib import Path
 
+from agno.agent import Agent
 from agno.os import AgentOS
+from agno.team import Team
 from agno.utils.log import log_info
+from agno.workflow import Workflow
+from starlette.middleware import Middleware
 
-from agents.code_search import code_search
-from agents.web_search import web_search
-from db import get_postgres_db
+from agents.code_search import code_search, codebase_context
+from agents.web_search import web_search, web_tools
+from app.admission import AdmissionMiddleware, admission
+from app.inflight import InFlightMiddleware, inflight
+from app.memory import memory
+from app.metrics import RunMetricsMiddleware, metrics
+from app.ops import router as ops_router
+from app.scheduler import internal_service_token, scheduler_base_url, scheduler_leader
+from app.startup import startup
+from app.tracing import tracing
+from db import dispose_engines, get_postgres_db, get_trace_db
+from db.session import TRACE_DB_ID
 
 # ---------------------------------------------------------------------------
 # Environment
 # ---------------------------------------------------------------------------
 runtime_env = getenv("RUNTIME_ENV", "prd")
-scheduler_base_url = getenv("AGENTOS_URL", "http://127.0.0.1:8000")
 
 # ---------------------------------------------------------------------------
 # Interfaces
 # - The CodeSearch agent becomes available on Slack when both env vars are set
+# - Slack events are acked immediately and answered from a Postgres queue
+#   by the worker pool started in the lifespan (see app/slack.py)
 # ---------------------------------------------------------------------------
 SLACK_BOT_TOKEN = getenv("SLACK_BOT_TOKEN", "")
 SLACK_SIGNING_SECRET = getenv("SLACK_SIGNING_SECRET", "")
+SLACK_DRAIN_TIMEOUT = float(getenv("SLACK_DRAIN_TIMEOUT", "30"))
 
 interfaces: list = []
+slack = None
 if SLACK_BOT_TOKEN and SLACK_SIGNING_SECRET:
-    from agno.os.interfaces.slack import Slack
+    from app.slack import QueuedSlack
 
-    interfaces.append(
-        Slack(
-            agent=code_search,
-            streaming=True,
-            token=SLACK_BOT_TOKEN,
-            signing_secret=SLACK_SIGNING_SECRET,
-            resolve_user_identity=True,
-        )
+    slack = QueuedSlack(
+        agent=code_search,
+        streaming=True,
+        token=SLACK_BOT_TOKEN,
+        signing_secret=SLACK_SIGNING_SECRET,
+        resolve_user_identity=True,
     )
+    interfaces.append(slack)
 
 
 # ---------------------------------------------------------------------------
 # Lifespan — extension hook for app-level startup / teardown.
 #
-# AgentOS handles the MCP lifecycle (connect on startup, close on shutdown).
+# AgentOS handles the MCP lifecycle (connect on startup, close on shutdown);
+# the keyless web tools' session pool is stopped here (app/mcp_pool.py).
 # Keep this hook in place so you can plug in your own setup as needed.
+#
+# Runs once per worker. /ops/metrics is registered here (see app/metrics.py),
+# along with the span exporter (app/tracing.py) and the memory writer
+# (app/memory.py). The schedule poller only starts in the worker that wins
+# the scheduler lock; the Slack worker pool runs in every worker.
+# Slack events still running after SLACK_DRAIN_TIMEOUT go back to the
+# queue for another worker. By shutdown the server has already waited on
+# in-flight runs; drain() is a last short wait before tearing down.
 # ---------------------------------------------------------------------------
 @asynccontextmanager
 async def lifespan(app):  # type: ignore[no-untyped-def]
     log_info("AgentOS lifespan: startup")
+    entities = [*(agent_os.agents or []), *(agent_os.teams or []), *(agent_os.workflows or [])]
+    metrics.start(app, entity_ids=[e.id for e in entities if e.id])
+    with startup.phase("workspace index"):
+        await asyncio.to_thread(codebase_context.index.build)
+    codebase_context.index.watch()
+    await tracing.start()
+    await memory.start()
+    # Only local entities can be dispatched in-process; remote ones go over HTTP.
+    await scheduler_leader.start(app, entities=[e for e in entities if isinstance(e, Agent | Team | Workflow)])
+    if slack is not None:
+        await slack.pool.start()
     try:
         yield
     finally:
+        if slack is not None:
+            await slack.pool.stop(timeout=SLACK_DRAIN_TIMEOUT)
+        await inflight.drain(timeout=5)
+        await scheduler_leader.stop()
+        codebase_context.index.stop()
+        await memory.stop()
+        await tracing.stop()
+        metrics.stop()
+        stop_mcp_pool = getattr(web_tools, "stop", None)
+        if stop_mcp_pool is not None:
+            await stop_mcp_pool()
+        dispose_engines()
         log_info("AgentOS lifespan: shutdown")
 
 
+# ---------------------------------------------------------------------------
+# Tracing
+# - Installed before AgentOS, which keeps an existing tracer provider:
+#   traces are sampled and exported in batches off the request path
+#   (see app/tracing.py), to TRACE_DB_URL when it is set.
+# ---------------------------------------------------------------------------
+trace_db = get_trace_db()
+with startup.phase("tracing"):
+    tracing.setup(trace_db, separate_db=trace_db.id == TRACE_DB_ID)
+
 # ---------------------------------------------------------------------------
 # Create AgentOS
+# - Servers run app.asgi:app, which imports this module in a background
+#   warm-up task; startup phases are timed and logged once ready.
 # ---------------------------------------------------------------------------
-agent_os = AgentOS(
-    name="AgentOS",
-    tracing=True,
-    scheduler=True,
-    scheduler_base_url=scheduler_base_url,
-    authorization=runtime_env == "prd",
-    lifespan=lifespan,
-    db=get_postgres_db(),
-    agents=[web_search, code_search],
-    interfaces=interfaces,
-    config=str(Path(__file__).parent / "config.yaml"),
-)
-app = agent_os.get_app()
+with startup.phase("agent_os"):
+    agent_os = AgentOS(
+        name="AgentOS",
+        tracing=True,
+        scheduler=False,  # the poller is started by scheduler_leader in one worker cluster-wide
+        scheduler_base_url=scheduler_base_url,
+        internal_service_token=internal_service_token,
+        authorization=runtime_env == "prd",
+        lifespan=lifespan,
+        db=get_postgres_db(),
+        agents=[web_search, code_search],
+        interfaces=interfaces,
+        config=str(Path(__file__).parent / "config.yaml"),
+    )
+if tracing.separate_db:
+    # Lets the traces API (and os.agno.com) query it with db_id=agentos-traces.
+    agent_os.dbs.setdefault(TRACE_DB_ID, []).append(trace_db)
+with startup.phase("get_app"):
+    app = agent_os.get_app()
+app.state.slack = slack
+app.include_router(ops_router)
+app.add_middleware(InFlightMiddleware, tracker=inflight)
+app.add_middleware(RunMetricsMiddleware, recorder=metrics)
+# Innermost, inside the JWT middleware, so runs are limited per authenticated user (see app/admission.py).
+app.user_middleware.append(Middleware(AdmissionMiddleware, admission=admission))
 
 
 if __name__ == "__main__":
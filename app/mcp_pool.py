@@ -0,0 +1,480 @@
+"""
+MCP Session Pool
+================
+
+Pooled replacement for agno's ``MCPTools`` over streamable HTTP, used by
+the WebSearch agent's keyless fallback.
+
+``MCPTools`` holds one ``ClientSession`` for the whole process, so every
+concurrent tool call queues behind it and a dropped session stalls every
+run until the next restart. ``PooledMCPTools`` keeps ``MCP_POOL_SIZE``
+sessions open instead and leases one per tool call:
+
+- All sessions share one ``httpx.AsyncClient`` with keep-alive and HTTP/2,
+  so the sessions reuse connections rather than opening their own.
+- Each session is owned by a background task that connects, initializes,
+  pings it every ``MCP_HEALTH_INTERVAL`` seconds, and reconnects with
+  exponential backoff (capped at ``MCP_RECONNECT_MAX``) when it drops or
+  fails a ping.
+- A call waits at most ``MCP_ACQUIRE_TIMEOUT`` seconds for a free session
+  and ``MCP_CALL_TIMEOUT`` seconds for the result. A call whose session
+  drops under it fails at once and is retried on another session.
+
+It is still an ``MCPTools`` subclass, so AgentOS connects it in its
+lifespan like before. The pool outlives ``close()`` (an agent run that
+connected the toolkit closes it again afterwards); ``stop()`` shuts it
+down, from the app lifespan. Pool usage, wait time, per-tool call latency,
+timeouts and reconnects are at ``/ops/mcp``. ``python -m evals mcp-pool``
+runs it against a local MCP server (``evals/fake_mcp.py``).
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from collections.abc import Coroutine
+from contextlib import suppress
+from datetime import timedelta
+from functools import partial
+from os import getenv
+from typing import Any
+
+import httpx
+from agno.tools.function import Function, ToolResult
+from agno.tools.mcp import MCPTools
+from agno.utils.log import log_debug, log_info, log_warning
+from mcp import ClientSession
+from mcp.client.streamable_http import streamable_http_client
+from mcp.shared.exceptions import McpError
+from mcp.types import CallToolResult, TextContent
+
+from app.stats import percentiles
+
+MCP_POOL_SIZE = int(getenv("MCP_POOL_SIZE", "4"))
+MCP_CALL_TIMEOUT = float(getenv("MCP_CALL_TIMEOUT", "60"))
+MCP_ACQUIRE_TIMEOUT = float(getenv("MCP_ACQUIRE_TIMEOUT", "10"))
+MCP_HEALTH_INTERVAL = float(getenv("MCP_HEALTH_INTERVAL", "30"))
+MCP_RECONNECT_MAX = float(getenv("MCP_RECONNECT_MAX", "30"))
+MCP_HTTP2 = getenv("MCP_HTTP2", "True").lower() in ("1", "true", "yes")
+
+# Idle time before a pooled HTTP connection is dropped; the health ping keeps busy pools warm.
+_KEEPALIVE_EXPIRY = 60.0
+# How long a session's server-sent event stream may sit quiet before httpx gives up on it.
+_SSE_READ_TIMEOUT = 300.0
+
+
+class MCPPoolStats:
+    """Process-wide counters for ``/ops/mcp``."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.acquire_timeouts = 0
+        self.retries = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.reconnects = 0
+        self.health_failures = 0
+        self.call_seconds: dict[str, deque[float]] = {}
+        self.wait_seconds: deque[float] = deque(maxlen=1000)
+
+    def record_call(self, tool: str, seconds: float) -> None:
+        self.calls += 1
+        self.call_seconds.setdefault(tool, deque(maxlen=1000)).append(seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "acquire_timeouts": self.acquire_timeouts,
+            "retries": self.retries,
+            "connects": self.connects,
+            "connect_failures": self.connect_failures,
+            "reconnects": self.reconnects,
+            "health_failures": self.health_failures,
+            "wait_ms": percentiles(self.wait_seconds, scale=1000, digits=1),
+            "call_ms": {
+                tool: percentiles(samples, scale=1000, digits=1) for tool, samples in self.call_seconds.items()
+            },
+        }
+
+
+mcp_pool_stats = MCPPoolStats()
+
+
+class _Slot:
+    """One pooled session and the state its owner task shares with callers."""
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.session: ClientSession | None = None
+        self.busy = False
+        self.down = asyncio.Event()
+        # Set once the current session has closed; replaced on every reconnect.
+        self.closed = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+
+class PooledMCPTools(MCPTools):
+    """``MCPTools`` over a pool of streamable-HTTP sessions, leased one per tool call."""
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        size: int = MCP_POOL_SIZE,
+        call_timeout: float = MCP_CALL_TIMEOUT,
+        acquire_timeout: float = MCP_ACQUIRE_TIMEOUT,
+        health_interval: float = MCP_HEALTH_INTERVAL,
+        reconnect_max: float = MCP_RECONNECT_MAX,
+        http2: bool = MCP_HTTP2,
+        headers: dict[str, str] | None = None,
+        stats: MCPPoolStats = mcp_pool_stats,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(url=url, transport="streamable-http", **kwargs)
+        self._url = url
+        self.size = max(1, size)
+        self.call_timeout = call_timeout
+        self.acquire_timeout = acquire_timeout
+        self.health_interval = health_interval
+        self.reconnect_max = reconnect_max
+        self.http2 = http2
+        self.headers = headers or {}
+        self.stats = stats
+        self._slots: list[_Slot] = []
+        self._available: asyncio.Condition | None = None
+        self._http: httpx.AsyncClient | None = None
+        self._closing = False
+        self._waiting = 0
+
+    # -- Lifecycle -------------------------------------------------------------
+
+    async def _connect(self) -> None:
+        """Start the pool unless it is running, then wait (up to ``timeout_seconds``) for the tools.
+
+        ``MCPTools.connect()`` calls this. Once started the pool counts as
+        connected even while every session is reconnecting, so agent runs
+        never open their own connection.
+        """
+        if not self._slots:
+            self._start()
+        self._initialized = True
+        try:
+            await asyncio.wait_for(self._wait_for_tools(), self.timeout_seconds)
+        except TimeoutError:
+            log_warning(f"MCP pool: no session to {self._url} yet; tools register once one connects")
+
+    def _start(self) -> None:
+        self._closing = False
+        self._available = asyncio.Condition()
+        self._http = httpx.AsyncClient(
+            http2=self.http2,
+            headers=self.headers,
+            follow_redirects=True,
+            timeout=httpx.Timeout(self.call_timeout, read=_SSE_READ_TIMEOUT),
+            # One request in flight plus one open event stream per session.
+            limits=httpx.Limits(
+                max_connections=2 * self.size,
+                max_keepalive_connections=2 * self.size,
+                keepalive_expiry=_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self._slots = [_Slot(i) for i in range(self.size)]
+        for slot in self._slots:
+            slot.task = asyncio.create_task(self._own(slot), name=f"mcp-pool-{slot.index}")
+
+    async def stop(self) -> None:
+        """Stop every session owner, closing each session in the task that opened it."""
+        if not self._slots:
+            return
+        self._closing = True
+        for slot in self._slots:
+            slot.down.set()
+        if self._available is not None:
+            async with self._available:
+                self._available.notify_all()
+        tasks = [slot.task for slot in self._slots if slot.task is not None]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=5)
+            for task in pending:
+                task.cancel()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        self._slots = []
+        self._initialized = False
+
+    async def is_alive(self) -> bool:
+        return any(slot.session is not None for slot in self._slots)
+
+    async def build_tools(self) -> None:
+        """Register a pooled entrypoint for every tool the server lists."""
+        async with self._lease() as lease:
+            listed = await lease.call(lease.session.list_tools(), self.timeout_seconds)
+        self._check_tools_filters(
+            available_tools=[tool.name for tool in listed.tools],
+            include_tools=self.include_tools,
+            exclude_tools=self.exclude_tools,
+        )
+        prefix = f"{self.tool_name_prefix}_" if self.tool_name_prefix else ""
+        for tool in listed.tools:
+            if self.exclude_tools and tool.name in self.exclude_tools:
+                continue
+            if self.include_tools is not None and tool.name not in self.include_tools:
+                continue
+            stop_after = tool.name in self.stop_after_tool_call_tools
+            f = Function(
+                name=prefix + tool.name,
+                description=tool.description,
+                parameters=tool.inputSchema,
+                entrypoint=partial(self._call_tool, tool.name),
+                skip_entrypoint_processing=True,
+                requires_confirmation=tool.name in self.requires_confirmation_tools,
+                external_execution=tool.name in self.external_execution_required_tools,
+                stop_after_tool_call=stop_after,
+                show_result=tool.name in self.show_result_tools or stop_after,
+                cache_results=self.cache_results,
+                cache_dir=self.cache_dir,
+                cache_ttl=self.cache_ttl,
+            )
+            self.functions[f.name] = f
+            log_debug(f"Function: {f.name} registered with {self.name} (pooled)")
+
+    def snapshot(self) -> dict:
+        connected = sum(1 for slot in self._slots if slot.session is not None)
+        in_use = sum(1 for slot in self._slots if slot.busy and slot.session is not None)
+        return {
+            "url": self.url,
+            "size": self.size,
+            "connected": connected,
+            "in_use": in_use,
+            "idle": connected - in_use,
+            "waiting": self._waiting,
+            "utilization": round(in_use / self.size, 2),
+            "http2": self.http2,
+            "tools": sorted(self.functions),
+            **self.stats.snapshot(),
+            "budget": {
+                "call_timeout": self.call_timeout,
+                "acquire_timeout": self.acquire_timeout,
+                "health_interval": self.health_interval,
+                "reconnect_max": self.reconnect_max,
+            },
+        }
+
+    # -- Tool calls ------------------------------------------------------------
+
+    async def _call_tool(self, tool_name: str, **kwargs: Any) -> ToolResult:
+        started = time.perf_counter()
+        try:
+            result = await self._call_with_retry(tool_name, kwargs)
+        except Exception as exc:
+            if _is_timeout(exc):
+                self.stats.timeouts += 1
+                return ToolResult(content=f"Error: MCP tool '{tool_name}' timed out: {exc}")
+            self.stats.errors += 1
+            log_warning(f"MCP tool '{tool_name}' failed: {exc}")
+            return ToolResult(content=f"Error: {exc}")
+        finally:
+            self.stats.record_call(tool_name, time.perf_counter() - started)
+        return _tool_result(tool_name, result)
+
+    async def _call_with_retry(self, tool_name: str, arguments: dict[str, Any]) -> CallToolResult:
+        """Call the tool on a leased session; if that session drops mid-call, retry once on another."""
+        for attempt in range(2):
+            try:
+                async with self._lease() as lease:
+                    return await lease.call(
+                        lease.session.call_tool(
+                            tool_name, arguments, read_timeout_seconds=timedelta(seconds=self.call_timeout)
+                        ),
+                        # The session's own read timeout fires first; this only guards a wedged transport.
+                        self.call_timeout + 5,
+                    )
+            except ConnectionError:
+                if attempt:
+                    raise
+                self.stats.retries += 1
+        raise AssertionError("unreachable")
+
+    def _lease(self) -> "_Lease":
+        return _Lease(self)
+
+    async def _acquire(self) -> _Slot:
+        if self._available is None or self._closing:
+            raise RuntimeError("MCP pool is not connected")
+        started = time.perf_counter()
+        self._waiting += 1
+        try:
+            async with self._available:
+                await asyncio.wait_for(
+                    self._available.wait_for(lambda: self._closing or self._free() is not None),
+                    self.acquire_timeout,
+                )
+                slot = self._free()
+                if slot is None:
+                    raise RuntimeError("MCP pool is closing")
+                slot.busy = True
+        except TimeoutError:
+            self.stats.acquire_timeouts += 1
+            raise TimeoutError(f"no MCP session free within {self.acquire_timeout:g}s") from None
+        finally:
+            self._waiting -= 1
+        self.stats.wait_seconds.append(time.perf_counter() - started)
+        return slot
+
+    async def _release(self, slot: _Slot, session: ClientSession, *, broken: bool = False) -> None:
+        assert self._available is not None
+        async with self._available:
+            # The slot may have reconnected (and been leased again) since this lease began.
+            if slot.session is not session:
+                return
+            if broken:
+                # Hand the session back to its owner task to reconnect.
+                slot.down.set()
+            slot.busy = False
+            self._available.notify()
+
+    def _free(self) -> _Slot | None:
+        for slot in self._slots:
+            if slot.session is not None and not slot.busy and not slot.down.is_set():
+                return slot
+        return None
+
+    # -- Session owners --------------------------------------------------------
+
+    async def _own(self, slot: _Slot) -> None:
+        """Keep ``slot`` connected until the pool closes, backing off between reconnects."""
+        delay = 0.5
+        while not self._closing:
+            slot.down.clear()
+            try:
+                assert self._http is not None
+                async with streamable_http_client(self._url, http_client=self._http) as (read, write, _):
+                    async with ClientSession(
+                        read, write, read_timeout_seconds=timedelta(seconds=self.timeout_seconds)
+                    ) as session:
+                        await session.initialize()
+                        self.stats.connects += 1
+                        delay = 0.5
+                        await self._publish(slot, session)
+                        await self._watch(slot, session)
+            except Exception as exc:
+                if not self._closing:
+                    self.stats.connect_failures += 1
+                    log_warning(f"MCP pool: session {slot.index} to {self.url} failed: {exc}")
+            finally:
+                await self._withdraw(slot)
+            if self._closing:
+                return
+            self.stats.reconnects += 1
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, self.reconnect_max)
+
+    async def _publish(self, slot: _Slot, session: ClientSession) -> None:
+        assert self._available is not None
+        async with self._available:
+            slot.session = session
+            slot.closed = asyncio.Event()
+            self._available.notify()
+        if not self.functions:
+            try:
+                await self.build_tools()
+                log_info(f"MCP pool: {len(self.functions)} tools from {self.url} over {self.size} sessions")
+            except Exception as exc:
+                log_warning(f"MCP pool: listing tools from {self.url} failed: {exc}")
+
+    async def _withdraw(self, slot: _Slot) -> None:
+        # Fail calls still waiting on this session; the session itself won't.
+        slot.closed.set()
+        if self._available is None:
+            slot.session = None
+            return
+        async with self._available:
+            slot.session = None
+            slot.busy = False
+            self._available.notify_all()
+
+    async def _watch(self, slot: _Slot, session: ClientSession) -> None:
+        """Ping the session every health interval; return when it is marked down or a ping fails.
+
+        Pings go out while calls are in flight too (requests on a session are
+        multiplexed), so a session that drops mid-call is noticed and those
+        calls fail right away instead of at their timeout.
+        """
+        while True:
+            with suppress(TimeoutError):
+                await asyncio.wait_for(slot.down.wait(), self.health_interval)
+                return
+            try:
+                await asyncio.wait_for(session.send_ping(), self.timeout_seconds)
+            except Exception as exc:
+                self.stats.health_failures += 1
+                log_warning(f"MCP pool: session {slot.index} failed its health check: {exc!r}")
+                return
+
+    async def _wait_for_tools(self) -> None:
+        while not self.functions:
+            await asyncio.sleep(0.05)
+
+
+class _Lease:
+    """``async with pool._lease() as lease`` — one session for one call, marked down if the call breaks it."""
+
+    def __init__(self, pool: PooledMCPTools) -> None:
+        self.pool = pool
+        self.slot: _Slot | None = None
+
+    async def __aenter__(self) -> "_Lease":
+        self.slot = await self.pool._acquire()
+        assert self.slot.session is not None
+        self.session = self.slot.session
+        self.closed = self.slot.closed
+        return self
+
+    async def __aexit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: object) -> None:
+        assert self.slot is not None
+        # A read timeout leaves the session usable; anything else (session
+        # terminated, connection reset, wedged transport) gets it reconnected.
+        broken = isinstance(exc, Exception) and not _is_timeout(exc)
+        await self.pool._release(self.slot, self.session, broken=broken)
+
+    async def call(self, request: Coroutine[Any, Any, Any], timeout: float) -> Any:
+        """Await ``request`` on the leased session, giving up after ``timeout`` or once the session closes."""
+        call = asyncio.ensure_future(request)
+        closed = asyncio.ensure_future(self.closed.wait())
+        try:
+            done, _ = await asyncio.wait((call, closed), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            if not call.done():
+                call.cancel()
+        if call in done:
+            return call.result()
+        if closed in done:
+            raise ConnectionError("MCP session closed during the call")
+        raise TimeoutError(f"no response within {timeout:g}s")
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    return isinstance(exc, TimeoutError) or (
+        isinstance(exc, McpError) and exc.error.code == httpx.codes.REQUEST_TIMEOUT
+    )
+
+
+def _tool_result(tool_name: str, result: CallToolResult) -> ToolResult:
+    if result.isError:
+        return ToolResult(content=f"Error from MCP tool '{tool_name}': {result.content}")
+    parts = [
+        item.text if isinstance(item, TextContent) else f"[Unsupported content type: {item.type}]"
+        for item in result.content
+    ]
+    return ToolResult(content="\n".join(parts).strip())
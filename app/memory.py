@@ -0,0 +1,436 @@
+"""
+Agentic Memory
+==============
+
+Batched memory writes and bounded memory retrieval for agents with
+``enable_agentic_memory=True``.
+
+agno's ``update_user_memory`` tool runs the memory manager's model and its
+add / update / delete tools inside the run, each tool a round-trip to
+Postgres, and every run loads all of the user's memories into the prompt.
+``memory`` (a ``BatchedMemoryManager``, passed as ``memory_manager=``)
+changes both:
+
+- writes: with ``MEMORY_WRITES=deferred`` (the default) the tool only
+  queues the task and returns. Once the run completes, ``memory.flush_hook``
+  (a post-hook) hands the user's queued tasks to a lifespan task, which
+  runs them as one memory-manager call off the request path and writes
+  the result in one bulk upsert and one delete. Tasks from a run that
+  never completed are flushed after ``MEMORY_FLUSH_INTERVAL`` seconds.
+  ``MEMORY_WRITES=immediate`` keeps agno's behaviour;
+- retrieval: at most ``MEMORY_CONTEXT_LIMIT`` memories go into the prompt
+  (0 sends them all). ``MEMORY_RETRIEVAL=recent`` (the default) picks the
+  most recently updated; ``semantic`` ranks the latest
+  ``MEMORY_CANDIDATES`` by embedding similarity to the run's input, at
+  the cost of one embedding request per run. ``memory.context_hook`` (a
+  pre-hook) fetches them in a thread before agno builds the prompt.
+
+The same task merges near-duplicate memories every
+``MEMORY_COMPACT_INTERVAL`` seconds (0 disables; see
+``db/memory_compaction.py``). Queue depth, flush latency, memories per
+prompt and the last compaction are at ``/ops/memory``.
+
+Outside the AgentOS lifespan (scripts, evals) the post-hook flushes
+inline instead.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Any
+from uuid import uuid4
+
+import numpy as np
+from agno.db.base import BaseDb
+from agno.db.postgres import PostgresDb
+from agno.db.schemas.memory import UserMemory
+from agno.knowledge.embedder.openai import OpenAIEmbedder
+from agno.memory import MemoryManager
+from agno.run.agent import RunInput, RunOutput
+from agno.utils.log import log_info, log_warning
+
+from app.stats import percentiles
+from db import get_postgres_db
+from db.embedding_cache import CachedEmbedder
+from db.memory_compaction import CompactionResult, MemoryCompaction
+
+MEMORY_WRITES = getenv("MEMORY_WRITES", "deferred").lower()
+MEMORY_CONTEXT_LIMIT = int(getenv("MEMORY_CONTEXT_LIMIT", "20"))
+MEMORY_RETRIEVAL = getenv("MEMORY_RETRIEVAL", "recent").lower()
+MEMORY_CANDIDATES = int(getenv("MEMORY_CANDIDATES", "200"))
+MEMORY_FLUSH_INTERVAL = float(getenv("MEMORY_FLUSH_INTERVAL", "30"))
+MEMORY_COMPACT_INTERVAL = int(getenv("MEMORY_COMPACT_INTERVAL", "3600"))
+MEMORY_COMPACT_SIMILARITY = float(getenv("MEMORY_COMPACT_SIMILARITY", "0.9"))
+MEMORY_COMPACT_MIN = int(getenv("MEMORY_COMPACT_MIN", "10"))
+
+_FLUSH_CONCURRENCY = 4
+_QUEUED_REPLY = "Memory update queued; it will be saved once this response is complete."
+
+# Memories fetched by the pre-hook for this run: (manager id, user id, memories).
+_context_memories: ContextVar[tuple[int, str, list[UserMemory]] | None] = ContextVar("context_memories", default=None)
+# Writes staged by the memory manager's tools during a flush.
+_staged: ContextVar["_StagedWrites | None"] = ContextVar("staged_memory_writes", default=None)
+
+
+class MemoryStats:
+    """Process-wide counters for ``/ops/memory``."""
+
+    def __init__(self) -> None:
+        self.tasks_queued = 0
+        self.flushes = 0
+        self.tasks_flushed = 0
+        self.upserts = 0
+        self.deletes = 0
+        self.flush_failures = 0
+        self.flush_seconds: deque[float] = deque(maxlen=1000)
+        self.write_lag_seconds: deque[float] = deque(maxlen=1000)
+        self.context_memories: deque[int] = deque(maxlen=1000)
+        self.retrieval_seconds: deque[float] = deque(maxlen=1000)
+        self.compaction_failures = 0
+        self.last_compaction: dict | None = None
+
+    def snapshot(self) -> dict:
+        return {
+            "tasks_queued": self.tasks_queued,
+            "flushes": self.flushes,
+            "tasks_flushed": self.tasks_flushed,
+            "upserts": self.upserts,
+            "deletes": self.deletes,
+            "flush_failures": self.flush_failures,
+            "flush_ms": percentiles(self.flush_seconds, scale=1000, digits=1),
+            "write_lag_ms": percentiles(self.write_lag_seconds, scale=1000, digits=1),
+            "context_memories": percentiles(self.context_memories, digits=1),
+            "retrieval_ms": percentiles(self.retrieval_seconds, scale=1000, digits=1),
+            "compaction_failures": self.compaction_failures,
+            "last_compaction": self.last_compaction,
+        }
+
+
+@dataclass
+class _StagedWrites:
+    """The memory manager's add / update / delete calls, held for one bulk write."""
+
+    upserts: dict[str, UserMemory] = field(default_factory=dict)
+    deletes: set[str] = field(default_factory=set)
+
+    def tools(self, user_id: str, input_string: str) -> dict[str, Any]:
+        def add_memory(memory: str, topics: list[str] | None = None) -> str:
+            memory_id = str(uuid4())
+            self.upserts[memory_id] = UserMemory(
+                memory_id=memory_id, user_id=user_id, memory=memory, topics=topics, input=input_string
+            )
+            return "Memory added successfully"
+
+        def update_memory(memory_id: str, memory: str, topics: list[str] | None = None) -> str:
+            if memory == "":
+                return "Can't update memory with empty string. Use the delete memory function if available."
+            self.deletes.discard(memory_id)
+            self.upserts[memory_id] = UserMemory(
+                memory_id=memory_id, user_id=user_id, memory=memory, topics=topics, input=input_string
+            )
+            return "Memory updated successfully"
+
+        def delete_memory(memory_id: str) -> str:
+            self.upserts.pop(memory_id, None)
+            self.deletes.add(memory_id)
+            return "Memory deleted successfully"
+
+        return {tool.__name__: tool for tool in (add_memory, update_memory, delete_memory)}
+
+    def commit(self, db: Any, user_id: str) -> None:
+        if self.upserts:
+            db.upsert_memories(list(self.upserts.values()))
+        if self.deletes:
+            db.delete_user_memories(list(self.deletes), user_id=user_id)
+
+
+class BatchedMemoryManager(MemoryManager):
+    """``MemoryManager`` with deferred, batched agentic writes and a bounded set of memories per prompt."""
+
+    def __init__(
+        self,
+        *,
+        deferred: bool = MEMORY_WRITES == "deferred",
+        context_limit: int = MEMORY_CONTEXT_LIMIT,
+        retrieval: str = MEMORY_RETRIEVAL,
+        candidates: int = MEMORY_CANDIDATES,
+        embedder: CachedEmbedder | None = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.deferred = deferred
+        self.context_limit = context_limit
+        self.retrieval = retrieval
+        self.candidates = candidates
+        self.embedder = embedder
+        self.stats = MemoryStats()
+        self.compaction: MemoryCompaction | None = None
+        self._pending: dict[str, list[tuple[float, str]]] = {}
+        self._ready: set[str] = set()
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        self._wake = asyncio.Event()
+
+    def __deepcopy__(self, memo: dict) -> "BatchedMemoryManager":
+        # AgentOS deep-copies the agent (and its hook lists) per request; the queue must stay shared.
+        return self
+
+    # -- Retrieval --------------------------------------------------------------
+
+    def get_user_memories(self, user_id: str | None = None) -> list[UserMemory] | None:
+        """The memories that go into the prompt: prefetched by ``context_hook``, else fetched now."""
+        user_id = user_id or "default"
+        prefetched = _context_memories.get()
+        if prefetched is not None and prefetched[:2] == (id(self), user_id):
+            return prefetched[2]
+        return self.select_memories(user_id)
+
+    async def aget_user_memories(self, user_id: str | None = None) -> list[UserMemory] | None:
+        user_id = user_id or "default"
+        prefetched = _context_memories.get()
+        if prefetched is not None and prefetched[:2] == (id(self), user_id):
+            return prefetched[2]
+        return await asyncio.to_thread(self.select_memories, user_id)
+
+    async def context_hook(self, run_input: RunInput, user_id: str | None = None) -> None:
+        """agno pre-hook: fetch this run's memories off the event loop before the prompt is built."""
+        user_id = user_id or "default"
+        query = run_input.input_content_string() if self.retrieval == "semantic" else None
+        memories = await asyncio.to_thread(self.select_memories, user_id, query)
+        _context_memories.set((id(self), user_id, memories))
+
+    def select_memories(self, user_id: str, query: str | None = None) -> list[UserMemory]:
+        """At most ``context_limit`` of the user's memories, oldest first."""
+        started = time.perf_counter()
+        if self.context_limit <= 0:
+            memories = self._user_memories(user_id, sort_by="updated_at", sort_order="asc")
+        elif self.retrieval == "semantic" and query:
+            memories = self._most_similar(user_id, query)
+        else:
+            memories = self._most_recent(user_id, self.context_limit)
+        self.stats.retrieval_seconds.append(time.perf_counter() - started)
+        self.stats.context_memories.append(len(memories))
+        return memories
+
+    def _most_recent(self, user_id: str, limit: int) -> list[UserMemory]:
+        return self._user_memories(user_id, limit=limit, sort_by="updated_at", sort_order="desc")[::-1]
+
+    def _user_memories(self, user_id: str, **kwargs: Any) -> list[UserMemory]:
+        # Memories are read from the sync database only; the writer runs in a thread.
+        if not isinstance(self.db, BaseDb):
+            return []
+        memories = self.db.get_user_memories(user_id=user_id, **kwargs)
+        return [m for m in memories if isinstance(m, UserMemory)]
+
+    def _most_similar(self, user_id: str, query: str) -> list[UserMemory]:
+        newest = self._most_recent(user_id, max(self.candidates, self.context_limit))
+        if len(newest) <= self.context_limit:
+            return newest
+        try:
+            embeddings, _ = self._embedder().get_embeddings_batch_and_usage([query, *(m.memory for m in newest)])
+        except Exception as exc:
+            log_warning(f"Memory retrieval: embedding failed, using the most recent memories: {exc}")
+            return newest[-self.context_limit :]
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        scores = vectors[1:] @ vectors[0]
+        top = np.argsort(-scores)[: self.context_limit]
+        return [newest[i] for i in sorted(top)]
+
+    def _embedder(self) -> CachedEmbedder:
+        if self.embedder is None:
+            self.embedder = CachedEmbedder(embedder=OpenAIEmbedder(id="text-embedding-3-small"))
+        return self.embedder
+
+    # -- Deferred writes --------------------------------------------------------
+
+    def update_memory_task(self, task: str, user_id: str | None = None) -> str:
+        if not self.deferred:
+            return super().update_memory_task(task, user_id=user_id)
+        with self._lock:
+            self._pending.setdefault(user_id or "default", []).append((time.monotonic(), task))
+        self.stats.tasks_queued += 1
+        return _QUEUED_REPLY
+
+    async def aupdate_memory_task(self, task: str, user_id: str | None = None) -> str:
+        if not self.deferred:
+            return await super().aupdate_memory_task(task, user_id=user_id)
+        return self.update_memory_task(task, user_id=user_id)
+
+    async def flush_hook(self, run_output: RunOutput) -> None:
+        """agno post-hook: the run is complete, so its queued memory updates can be written."""
+        user_id = run_output.user_id or "default"
+        with self._lock:
+            if user_id not in self._pending:
+                return
+            self._ready.add(user_id)
+        if self._task is not None:
+            self._wake.set()
+        else:
+            await asyncio.to_thread(self.flush, user_id)
+
+    def flush(self, user_id: str) -> None:
+        """Run ``user_id``'s queued tasks as one memory-manager call and write the result in bulk."""
+        with self._lock:
+            queued = self._pending.pop(user_id, [])
+            self._ready.discard(user_id)
+        if not queued or not isinstance(self.db, BaseDb):
+            return
+        started = time.perf_counter()
+        tasks = [task for _, task in queued]
+        staged = _StagedWrites()
+        token = _staged.set(staged)
+        try:
+            existing = self._user_memories(user_id)
+            self.run_memory_task(
+                task=_combine(tasks),
+                existing_memories=[{"memory_id": m.memory_id, "memory": m.memory} for m in existing],
+                user_id=user_id,
+                db=self.db,
+                delete_memories=self.delete_memories,
+                update_memories=self.update_memories,
+                add_memories=self.add_memories,
+                clear_memories=self.clear_memories,
+            )
+            staged.commit(self.db, user_id)
+        except Exception as exc:
+            self.stats.flush_failures += 1
+            log_warning(f"Memory flush for user {user_id} failed; {len(tasks)} update(s) dropped: {exc}")
+            return
+        finally:
+            _staged.reset(token)
+        self.stats.flushes += 1
+        self.stats.tasks_flushed += len(tasks)
+        self.stats.upserts += len(staged.upserts)
+        self.stats.deletes += len(staged.deletes)
+        self.stats.flush_seconds.append(time.perf_counter() - started)
+        self.stats.write_lag_seconds.append(time.monotonic() - queued[0][0])
+
+    def _get_db_tools(self, user_id: str, db: Any, input_string: str, *args: Any, **kwargs: Any) -> list:
+        tools = super()._get_db_tools(user_id, db, input_string, *args, **kwargs)
+        staged = _staged.get()
+        if staged is None:
+            return tools
+        replacements = staged.tools(user_id, input_string)
+        for tool in tools:
+            if tool.__name__ in replacements:
+                replacements[tool.__name__].__doc__ = tool.__doc__  # the model sees agno's descriptions
+        return [replacements.get(tool.__name__, tool) for tool in tools]
+
+    def _due(self, stale_after: float | None) -> list[str]:
+        cutoff = None if stale_after is None else time.monotonic() - stale_after
+        with self._lock:
+            return [
+                user_id
+                for user_id, queued in self._pending.items()
+                if user_id in self._ready or cutoff is None or queued[0][0] <= cutoff
+            ]
+
+    # -- Lifespan ---------------------------------------------------------------
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        if MEMORY_COMPACT_INTERVAL > 0 and isinstance(self.db, PostgresDb):
+            self.compaction = MemoryCompaction(
+                self.db,
+                self._embedder(),
+                similarity=MEMORY_COMPACT_SIMILARITY,
+                min_memories=MEMORY_COMPACT_MIN,
+            )
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="memory-writer")
+        log_info(
+            f"Memory writer started (writes {'deferred' if self.deferred else 'immediate'}, "
+            f"{self.retrieval} retrieval, context limit {self.context_limit})"
+        )
+
+    async def stop(self) -> None:
+        """Stop the task and flush every queued update."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self._flush_due(stale_after=None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pending_users = len(self._pending)
+            pending_tasks = sum(len(queued) for queued in self._pending.values())
+        return {
+            "writes": "deferred" if self.deferred else "immediate",
+            "retrieval": self.retrieval,
+            "context_limit": self.context_limit,
+            "pending_users": pending_users,
+            "pending_tasks": pending_tasks,
+            "compaction_interval": MEMORY_COMPACT_INTERVAL,
+            **self.stats.snapshot(),
+        }
+
+    async def _run(self) -> None:
+        # Workers start together; spread their compaction passes out.
+        next_compaction = time.monotonic() + random.uniform(0, min(MEMORY_COMPACT_INTERVAL, 300))
+        compacted_since: int | None = None
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), MEMORY_FLUSH_INTERVAL)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            await self._flush_due(stale_after=MEMORY_FLUSH_INTERVAL)
+            if self.compaction is not None and time.monotonic() >= next_compaction:
+                next_compaction = time.monotonic() + MEMORY_COMPACT_INTERVAL
+                started_at = int(time.time())
+                if await self._compact(compacted_since):
+                    compacted_since = started_at - self.compaction.settle_seconds
+
+    async def _flush_due(self, stale_after: float | None) -> None:
+        semaphore = asyncio.Semaphore(_FLUSH_CONCURRENCY)
+
+        async def flush(user_id: str) -> None:
+            async with semaphore:
+                await asyncio.to_thread(self.flush, user_id)
+
+        await asyncio.gather(*(flush(user_id) for user_id in self._due(stale_after)))
+
+    async def _compact(self, since: int | None) -> bool:
+        assert self.compaction is not None
+        started = time.perf_counter()
+        try:
+            result: CompactionResult = await asyncio.to_thread(self.compaction.compact, since)
+        except Exception as exc:
+            self.stats.compaction_failures += 1
+            log_warning(f"Memory compaction failed: {exc}")
+            return False
+        self.stats.last_compaction = {
+            "at": time.time(),
+            "users": result.users,
+            "merged": result.merged,
+            "skipped": result.skipped,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        if result.merged:
+            log_info(f"Memory compaction: merged {result.merged} memories across {result.users} users")
+        return not result.skipped
+
+
+memory = BatchedMemoryManager(db=get_postgres_db())
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _combine(tasks: list[str]) -> str:
+    if len(tasks) == 1:
+        return tasks[0]
+    return "Apply each of these memory updates, in order:\n" + "\n".join(
+        f"{i}. {task}" for i, task in enumerate(tasks, 1)
+    )
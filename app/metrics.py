@@ -0,0 +1,380 @@
+"""
+Metrics
+=======
+
+Prometheus metrics for runs, models, tools and the database, served at
+``/ops/metrics`` (registered from the AgentOS lifespan). AgentOS's own
+``GET /metrics`` (usage metrics, JSON) is left as it is.
+
+- ``agentos_run_duration_seconds`` / ``agentos_runs_in_flight``: agent,
+  team and workflow run requests (and Slack events) by ``kind`` and
+  ``entity_id``, from ``RunMetricsMiddleware``. A streaming run lasts
+  until its last chunk is sent.
+- ``agentos_admission_wait_seconds`` / ``agentos_admission_rejected_total``:
+  time runs waited for admission by ``interface`` and ``outcome``, and
+  429s / deferred Slack events by ``interface``, ``scope`` and
+  ``reason``, from ``app/admission.py``.
+- ``agno_time_to_first_token_seconds`` / ``agno_run_tokens``: per
+  completed agent run, by ``agent_id`` and ``model``, from the
+  ``metrics.run_hook`` post-hook. Tokens are split by ``type`` (input,
+  output, cache_read).
+- ``agno_model_tier_duration_seconds`` / ``agno_model_tier_tokens`` /
+  ``agno_model_escalations_total``: each routed model call (a run's whole
+  tool loop) by ``route`` and ``tier``, from ``app/model_router.py``.
+- ``agno_tool_duration_seconds``: every tool call by ``tool_name`` and
+  ``status``, from the ``metrics.tool_hook`` tool hook.
+- ``db_query_duration_seconds`` / ``db_pool_connections_in_use`` /
+  ``db_pool_connections_limit``: every SQLAlchemy engine (the shared
+  ``get_postgres_db()`` pool, the trace database, the vector stores) by
+  ``database`` and ``statement`` (SELECT, INSERT, ...).
+- ``agentos_event_loop_lag_seconds``: how late each worker's event loop
+  wakes a task that sleeps ``METRICS_LOOP_LAG_INTERVAL`` seconds, i.e.
+  how long something blocked the loop. Sampled from the lifespan; 0
+  turns it off.
+
+Label values that come from requests or configuration (entity ids, tool
+and model names, databases) are capped at ``METRICS_MAX_LABEL_VALUES``
+distinct values per label; later ones are reported as ``other``, so a
+client that posts to random agent ids can't grow the series count.
+
+Each gunicorn worker keeps its own metrics. Set
+``PROMETHEUS_MULTIPROC_DIR`` to an empty, writable directory to have
+``/ops/metrics`` report all workers of the replica together.
+``python -m evals metrics-overhead`` measures what the instrumentation
+costs per request, tool call and query.
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from os import getenv
+from typing import Any
+
+from agno.run.agent import RunOutput
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client import REGISTRY as DEFAULT_REGISTRY
+from sqlalchemy import Engine, event
+from sqlalchemy.pool import QueuePool
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.inflight import RUN_PATH
+
+METRICS_ENABLED = getenv("METRICS_ENABLED", "True").lower() in ("1", "true", "yes")
+METRICS_MAX_LABEL_VALUES = int(getenv("METRICS_MAX_LABEL_VALUES", "50"))
+MULTIPROCESS = bool(getenv("PROMETHEUS_MULTIPROC_DIR"))
+METRICS_LOOP_LAG_INTERVAL = float(getenv("METRICS_LOOP_LAG_INTERVAL", "0.25"))
+# Under /ops with the other operational endpoints; AgentOS serves its own JSON usage metrics at /metrics.
+METRICS_PATH = "/ops/metrics"
+
+_SECONDS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+_TTFT = (0.1, 0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 20.0)
+_TOKENS = (100, 500, 1000, 2000, 5000, 10_000, 20_000, 50_000, 100_000, 200_000)
+_QUERY = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+_LAG = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class BoundedLabel:
+    """Passes the first ``limit`` distinct values of a label through; later ones become ``other``."""
+
+    def __init__(self, limit: int = METRICS_MAX_LABEL_VALUES) -> None:
+        self.limit = limit
+        self.seen: set[str] = set()
+
+    def seed(self, values: list[str]) -> None:
+        """Always pass ``values`` through, on top of ``limit`` others."""
+        new = set(values) - self.seen
+        self.seen |= new
+        self.limit += len(new)
+
+    def __call__(self, value: str | None) -> str:
+        value = value or "unknown"
+        if value in self.seen:
+            return value
+        if len(self.seen) < self.limit:
+            self.seen.add(value)
+            return value
+        return "other"
+
+
+RUN_SECONDS = Histogram(
+    "agentos_run_duration_seconds",
+    "Run request duration, through the last streamed chunk.",
+    ["kind", "entity_id", "status"],
+    buckets=_SECONDS,
+)
+RUNS_IN_FLIGHT = Gauge(
+    "agentos_runs_in_flight",
+    "Run requests being served.",
+    ["kind", "entity_id"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "agentos_admission_wait_seconds",
+    "Time a run waited for a rate or concurrency slot.",
+    ["interface", "outcome"],
+    buckets=_QUERY,
+)
+ADMISSION_REJECTED = Counter(
+    "agentos_admission_rejected",
+    "Runs turned away (API) or deferred (Slack) by admission control.",
+    ["interface", "scope", "reason"],
+)
+TTFT_SECONDS = Histogram(
+    "agno_time_to_first_token_seconds",
+    "Time to the model's first token, per completed agent run.",
+    ["agent_id", "model"],
+    buckets=_TTFT,
+)
+RUN_TOKENS = Histogram(
+    "agno_run_tokens",
+    "Model tokens per completed agent run.",
+    ["agent_id", "model", "type"],
+    buckets=_TOKENS,
+)
+MODEL_TIER_SECONDS = Histogram(
+    "agno_model_tier_duration_seconds",
+    "Routed model call duration, including its tool calls, by route and tier.",
+    ["route", "tier", "status"],
+    buckets=_SECONDS,
+)
+MODEL_TIER_TOKENS = Histogram(
+    "agno_model_tier_tokens",
+    "Model tokens per routed model call, by route and tier.",
+    ["route", "tier", "type"],
+    buckets=_TOKENS,
+)
+MODEL_ESCALATIONS = Counter(
+    "agno_model_escalations",
+    "Routed model calls retried on a stronger tier after an error.",
+    ["route", "from_tier", "to_tier"],
+)
+TOOL_SECONDS = Histogram(
+    "agno_tool_duration_seconds",
+    "Tool call duration, including tool hooks such as the web cache.",
+    ["tool_name", "status"],
+    buckets=_SECONDS,
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time.",
+    ["database", "statement"],
+    buckets=_QUERY,
+)
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Connections checked out of the engine pool.",
+    ["database"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_LIMIT = Gauge(
+    "db_pool_connections_limit",
+    "Pool size plus max overflow.",
+    ["database"],
+    multiprocess_mode="livesum",
+)
+EVENT_LOOP_LAG = Histogram(
+    "agentos_event_loop_lag_seconds",
+    "How late the event loop woke a sleeping task.",
+    buckets=_LAG,
+)
+
+
+class Metrics:
+    """Label bounds, the hooks agents register, and the ``/ops/metrics`` route."""
+
+    def __init__(self) -> None:
+        self.entities = BoundedLabel()
+        self.agents = BoundedLabel()
+        self.models = BoundedLabel()
+        self.tools = BoundedLabel()
+        self.databases = BoundedLabel()
+        self._engines: set[int] = set()
+        self._listening = False
+        self._lag_task: asyncio.Task | None = None
+
+    def __deepcopy__(self, memo: dict) -> "Metrics":
+        # AgentOS deep-copies the agent (and its hook lists) per request; the label bounds must stay shared.
+        return self
+
+    # -- Lifespan ---------------------------------------------------------------
+
+    def start(self, app: Any, entity_ids: list[str] | None = None) -> None:
+        """Register ``/ops/metrics`` and start timing queries on every engine.
+
+        ``entity_ids`` (the served agents, teams and workflows) always keep
+        their own label, however many unknown ids clients post to.
+        """
+        if not METRICS_ENABLED:
+            return
+        self.entities.seed(entity_ids or [])
+        self.agents.seed(entity_ids or [])
+        app.router.add_route(METRICS_PATH, self.endpoint, methods=["GET"], include_in_schema=False)
+        if not self._listening:
+            event.listen(Engine, "engine_connect", self._on_engine_connect)
+            self._listening = True
+        if METRICS_LOOP_LAG_INTERVAL > 0 and self._lag_task is None:
+            self._lag_task = asyncio.get_running_loop().create_task(self._watch_loop(METRICS_LOOP_LAG_INTERVAL))
+
+    def stop(self) -> None:
+        if self._listening:
+            event.remove(Engine, "engine_connect", self._on_engine_connect)
+            self._listening = False
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+    async def endpoint(self, request: Request) -> Response:
+        if MULTIPROCESS:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = DEFAULT_REGISTRY
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+    async def _watch_loop(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            EVENT_LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
+
+    # -- Agent hooks ------------------------------------------------------------
+
+    def run_hook(self, run_output: RunOutput, agent: Any = None) -> None:
+        """agno post-hook: time to first token and tokens for the completed run."""
+        metrics = run_output.metrics
+        if metrics is None:
+            return
+        agent_id = self.agents(run_output.agent_id or getattr(agent, "id", None))
+        model = self.models(run_output.model)
+        if metrics.time_to_first_token is not None:
+            TTFT_SECONDS.labels(agent_id, model).observe(metrics.time_to_first_token)
+        for kind, tokens in (
+            ("input", metrics.input_tokens),
+            ("output", metrics.output_tokens),
+            ("cache_read", metrics.cache_read_tokens),
+        ):
+            if tokens:
+                RUN_TOKENS.labels(agent_id, model, kind).observe(tokens)
+
+    async def tool_hook(self, function_name: str, function_call: Callable[..., Awaitable[Any]], arguments: dict) -> Any:
+        """agno tool hook: time the call (and any hooks after this one)."""
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await function_call(**arguments)
+            status = "ok"
+            return result
+        finally:
+            TOOL_SECONDS.labels(self.tools(function_name), status).observe(time.perf_counter() - started)
+
+    # -- Database ---------------------------------------------------------------
+
+    def _on_engine_connect(self, conn: Any) -> None:
+        engine = conn.engine
+        if id(engine) in self._engines:
+            return
+        self._engines.add(id(engine))
+        self.instrument_engine(engine)
+
+    def instrument_engine(self, engine: Engine) -> None:
+        """Time statements and track pool checkouts on ``engine``."""
+        database = self.databases(engine.url.database)
+        queries = {verb: DB_QUERY_SECONDS.labels(database, verb) for verb in _VERBS}
+
+        # The start time rides on the statement's execution context, so failed statements leave nothing behind.
+        def before(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+            if context is not None:
+                context._metrics_started = time.perf_counter()
+
+        def after(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+            started = getattr(context, "_metrics_started", None)
+            if started is not None:
+                queries[_verb(statement)].observe(time.perf_counter() - started)
+
+        def failed(error: Any) -> None:
+            started = getattr(error.execution_context, "_metrics_started", None)
+            if started is not None:
+                queries[_verb(error.statement or "")].observe(time.perf_counter() - started)
+
+        event.listen(engine, "before_cursor_execute", before)
+        event.listen(engine, "after_cursor_execute", after)
+        event.listen(engine, "handle_error", failed)
+
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            return
+        in_use = DB_POOL_IN_USE.labels(database)
+        DB_POOL_LIMIT.labels(database).set(pool.size() + max(pool._max_overflow, 0))
+
+        def checked_out(*_: Any) -> None:
+            in_use.set(pool.checkedout())
+
+        event.listen(pool, "checkout", checked_out)
+        event.listen(pool, "checkin", checked_out)
+        in_use.set(pool.checkedout())
+
+
+metrics = Metrics()
+
+
+class RunMetricsMiddleware:
+    """Time run requests and count the ones in flight, by kind and entity id."""
+
+    def __init__(self, app: Any, recorder: Metrics = metrics) -> None:
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        match = RUN_PATH.match(path)
+        if match is not None:
+            kind, entity_id = match.group(1)[:-1], self.recorder.entities(match.group(2))
+        elif path.startswith("/slack/"):
+            kind, entity_id = "slack", "slack"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        status = "error"
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = f"{message['status'] // 100}xx"
+            await send(message)
+
+        gauge = RUNS_IN_FLIGHT.labels(kind, entity_id)
+        gauge.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            gauge.dec()
+            RUN_SECONDS.labels(kind, entity_id, status).observe(time.perf_counter() - started)
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+_VERBS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "OTHER")
+
+
+def _verb(statement: str) -> str:
+    head = statement.lstrip()[:7].split(None, 1)
+    verb = head[0].upper() if head else ""
+    return verb if verb in _VERBS else "OTHER"
@@ -0,0 +1,303 @@
+"""
+Model Routing
+=============
+
+Named model tiers, and a model that picks one per run.
+
+``MODEL_TIERS`` lists the tiers from cheapest to strongest, as
+``name=model_id`` pairs (``fast=gpt-5.4-mini,standard=gpt-5.4`` by
+default). Every agent gets a ``RoutedResponses`` from
+``default_model(route, tier)``; ``route`` names the agent or sub-agent
+(``web-search``, ``my-codebase``, ...) and ``tier`` is either a tier
+name, which pins it, or ``auto``:
+
+- ``auto`` sends a run to the cheapest tier when its input is short and
+  plain (at most ``MODEL_FAST_MAX_CHARS`` characters, one question, no
+  code block, nothing like "explain", "compare" or "design"), and to
+  ``MODEL_DEFAULT_TIER`` otherwise;
+- ``MODEL_ROUTES`` (``my-codebase=fast,web-search=auto``) overrides the
+  tier of any route without a code change;
+- ``MODEL_ROUTING=off`` sends everything to ``MODEL_DEFAULT_TIER``.
+
+The tier is picked once per model call, which in agno covers the whole
+tool-calling loop of a run, so a run never switches model half way
+unless it fails. A run whose tier raises a provider error (rate limit,
+timeout, context window, ...) is retried on the next stronger tier
+(``MODEL_ESCALATE``), but only before it has called a tool or, when
+streamed, sent anything: a retry would run those tools again. The run's
+``model`` is set to the tier's model id, so the per-model token and
+time-to-first-token metrics stay accurate.
+
+Latency, time to first token and tokens per route and tier, plus
+escalations, are at ``/ops/models`` and in ``/ops/metrics``.
+"""
+
+import re
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Any
+
+from agno.exceptions import ModelProviderError
+from agno.models.message import Message
+from agno.utils.log import log_debug, log_warning
+
+from app.metrics import MODEL_ESCALATIONS, MODEL_TIER_SECONDS, MODEL_TIER_TOKENS
+from app.prompt import StablePromptResponses
+from app.stats import percentiles
+
+
+def _pairs(value: str) -> dict[str, str]:
+    """``"a=x, b=y"`` → ``{"a": "x", "b": "y"}``, in order."""
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {key.strip(): val.strip() for key, val in pairs if key.strip() and val.strip()}
+
+
+MODEL_TIERS = _pairs(getenv("MODEL_TIERS", "fast=gpt-5.4-mini,standard=gpt-5.4"))
+MODEL_DEFAULT_TIER = getenv("MODEL_DEFAULT_TIER", "standard")
+MODEL_ROUTING = getenv("MODEL_ROUTING", "auto").lower()
+MODEL_ROUTES = _pairs(getenv("MODEL_ROUTES", ""))
+MODEL_FAST_MAX_CHARS = int(getenv("MODEL_FAST_MAX_CHARS", "300"))
+MODEL_ESCALATE = getenv("MODEL_ESCALATE", "True").lower() in ("1", "true", "yes")
+
+if MODEL_DEFAULT_TIER not in MODEL_TIERS:
+    log_warning(f"MODEL_DEFAULT_TIER={MODEL_DEFAULT_TIER} is not in MODEL_TIERS; using the strongest tier")
+    MODEL_DEFAULT_TIER = list(MODEL_TIERS)[-1]
+
+# Errors worth another try on a stronger model. Authentication errors are not: every tier shares the key.
+_ESCALATE_ON = (ModelProviderError, TimeoutError)
+_COMPLEX = re.compile(
+    r"\b(why|explain|compare|comparison|design|architect\w*|refactor|debug|trade-?offs?|analy[sz]e"
+    r"|step[- ]by[- ]step|pros and cons|in depth|implement\w*|plan)\b",
+    re.IGNORECASE,
+)
+
+
+def route_input(text: str, max_chars: int = MODEL_FAST_MAX_CHARS) -> bool:
+    """True when ``text`` is short and plain enough for the cheapest tier."""
+    text = text.strip()
+    return (
+        bool(text)
+        and len(text) <= max_chars
+        and "```" not in text
+        and text.count("?") <= 1
+        and _COMPLEX.search(text) is None
+    )
+
+
+def _last_input(messages: list[Message]) -> str:
+    for message in reversed(messages):
+        if message.role == "user":
+            return message.content if isinstance(message.content, str) else ""
+    return ""
+
+
+class ModelTierStats:
+    """Process-wide per route / tier numbers for ``/ops/models``."""
+
+    def __init__(self) -> None:
+        self.calls: dict[tuple[str, str], int] = {}
+        self.errors: dict[tuple[str, str], int] = {}
+        self.seconds: dict[tuple[str, str], deque[float]] = {}
+        self.ttft: dict[tuple[str, str], deque[float]] = {}
+        self.tokens: dict[tuple[str, str], list[int]] = {}
+        self.escalations: dict[str, int] = {}
+
+    def record(
+        self, route: str, tier: str, seconds: float, ok: bool, ttft: float | None, tokens: tuple[int, int]
+    ) -> None:
+        key = (route, tier)
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if not ok:
+            self.errors[key] = self.errors.get(key, 0) + 1
+            MODEL_TIER_SECONDS.labels(route, tier, "error").observe(seconds)
+            return
+        self.seconds.setdefault(key, deque(maxlen=1000)).append(seconds)
+        MODEL_TIER_SECONDS.labels(route, tier, "ok").observe(seconds)
+        if ttft is not None:
+            self.ttft.setdefault(key, deque(maxlen=1000)).append(ttft)
+        totals = self.tokens.setdefault(key, [0, 0])
+        for i, (kind, count) in enumerate(zip(("input", "output"), tokens)):
+            totals[i] += count
+            if count:
+                MODEL_TIER_TOKENS.labels(route, tier, kind).observe(count)
+
+    def escalated(self, route: str, from_tier: str, to_tier: str) -> None:
+        key = f"{route}:{from_tier}->{to_tier}"
+        self.escalations[key] = self.escalations.get(key, 0) + 1
+        MODEL_ESCALATIONS.labels(route, from_tier, to_tier).inc()
+
+    def snapshot(self) -> dict:
+        routes: dict[str, dict] = {}
+        for key in sorted(self.calls):
+            route, tier = key
+            ok = self.calls[key] - self.errors.get(key, 0)
+            input_tokens, output_tokens = self.tokens.get(key, [0, 0])
+            routes.setdefault(route, {})[tier] = {
+                "calls": self.calls[key],
+                "errors": self.errors.get(key, 0),
+                "seconds": percentiles(self.seconds.get(key)),
+                "ttft_seconds": percentiles(self.ttft.get(key)),
+                "input_tokens_avg": round(input_tokens / ok) if ok else None,
+                "output_tokens_avg": round(output_tokens / ok) if ok else None,
+            }
+        return {
+            "routing": MODEL_ROUTING,
+            "tiers": MODEL_TIERS,
+            "default_tier": MODEL_DEFAULT_TIER,
+            "routes": routes,
+            "escalations": dict(sorted(self.escalations.items())),
+        }
+
+
+model_tier_stats = ModelTierStats()
+
+
+@dataclass
+class RoutedResponses(StablePromptResponses):
+    """``StablePromptResponses`` that hands each call to the model of the tier picked for it.
+
+    Its own ``id`` is the default tier's model, which is what agno reports
+    for the agent; the call itself runs on one of ``tier_models``.
+    """
+
+    route: str = "default"
+    tier: str = "auto"
+    tier_models: dict[str, StablePromptResponses] = field(default_factory=dict)
+
+    # -- Routing ----------------------------------------------------------------
+
+    def pick_tier(self, messages: list[Message]) -> str:
+        """The tier a call with ``messages`` starts on."""
+        if MODEL_ROUTING == "off":
+            return MODEL_DEFAULT_TIER
+        if self.tier != "auto":
+            return self.tier
+        return next(iter(self.tier_models)) if route_input(_last_input(messages)) else MODEL_DEFAULT_TIER
+
+    def _next_tier(self, tier: str) -> str | None:
+        tiers = list(self.tier_models)
+        position = tiers.index(tier)
+        return tiers[position + 1] if MODEL_ESCALATE and position + 1 < len(tiers) else None
+
+    def _start(self, tier: str, kwargs: dict) -> tuple[float, tuple[int, int]]:
+        run_response = kwargs.get("run_response")
+        if run_response is not None:
+            run_response.model = self.tier_models[tier].id
+        return time.perf_counter(), _run_tokens(run_response)
+
+    def _finish(
+        self, tier: str, kwargs: dict, started: tuple[float, tuple[int, int]], ok: bool, ttft: float | None
+    ) -> None:
+        began, (input_before, output_before) = started
+        input_after, output_after = _run_tokens(kwargs.get("run_response"))
+        tokens = (input_after - input_before, output_after - output_before)
+        model_tier_stats.record(self.route, tier, time.perf_counter() - began, ok, ttft, tokens)
+
+    def _escalate(self, tier: str, exc: Exception, *, progressed: bool) -> str:
+        """The tier to retry on, or re-raise ``exc``.
+
+        ``progressed`` is whether the failed attempt got past its first
+        model response: it has appended assistant and tool messages and run
+        the tools (recorded on the run), or streamed output to the caller.
+        """
+        next_tier = self._next_tier(tier)
+        if next_tier is None or progressed or not isinstance(exc, _ESCALATE_ON):
+            raise exc
+        log_debug(f"{self.route}: {tier} model failed ({exc}); escalating to {next_tier}")
+        model_tier_stats.escalated(self.route, tier, next_tier)
+        return next_tier
+
+    # -- Model interface --------------------------------------------------------
+
+    def response(self, messages: list[Message], *args: Any, **kwargs: Any) -> Any:
+        tier = self.pick_tier(messages)
+        sent = len(messages)
+        while True:
+            started = self._start(tier, kwargs)
+            try:
+                result = self.tier_models[tier].response(messages, *args, **kwargs)
+            except Exception as exc:
+                self._finish(tier, kwargs, started, False, None)
+                tier = self._escalate(tier, exc, progressed=len(messages) > sent)
+                continue
+            self._finish(tier, kwargs, started, True, None)
+            return result
+
+    async def aresponse(self, messages: list[Message], *args: Any, **kwargs: Any) -> Any:
+        tier = self.pick_tier(messages)
+        sent = len(messages)
+        while True:
+            started = self._start(tier, kwargs)
+            try:
+                result = await self.tier_models[tier].aresponse(messages, *args, **kwargs)
+            except Exception as exc:
+                self._finish(tier, kwargs, started, False, None)
+                tier = self._escalate(tier, exc, progressed=len(messages) > sent)
+                continue
+            self._finish(tier, kwargs, started, True, None)
+            return result
+
+    def response_stream(self, messages: list[Message], *args: Any, **kwargs: Any) -> Iterator[Any]:
+        tier = self.pick_tier(messages)
+        sent = len(messages)
+        while True:
+            started = self._start(tier, kwargs)
+            ttft: float | None = None
+            try:
+                for chunk in self.tier_models[tier].response_stream(messages, *args, **kwargs):
+                    if ttft is None:
+                        ttft = time.perf_counter() - started[0]
+                    yield chunk
+            except Exception as exc:
+                self._finish(tier, kwargs, started, False, ttft)
+                tier = self._escalate(tier, exc, progressed=ttft is not None or len(messages) > sent)
+                continue
+            self._finish(tier, kwargs, started, True, ttft)
+            return
+
+    async def aresponse_stream(self, messages: list[Message], *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        tier = self.pick_tier(messages)
+        sent = len(messages)
+        while True:
+            started = self._start(tier, kwargs)
+            ttft: float | None = None
+            try:
+                async for chunk in self.tier_models[tier].aresponse_stream(messages, *args, **kwargs):
+                    if ttft is None:
+                        ttft = time.perf_counter() - started[0]
+                    yield chunk
+            except Exception as exc:
+                self._finish(tier, kwargs, started, False, ttft)
+                tier = self._escalate(tier, exc, progressed=ttft is not None or len(messages) > sent)
+                continue
+            self._finish(tier, kwargs, started, True, ttft)
+            return
+
+
+def routed_model(route: str = "default", tier: str = "auto") -> RoutedResponses:
+    """A ``RoutedResponses`` for ``route``, on ``tier`` unless ``MODEL_ROUTES`` says otherwise."""
+    tier = MODEL_ROUTES.get(route, tier)
+    if tier != "auto" and tier not in MODEL_TIERS:
+        log_warning(f"Unknown model tier {tier!r} for {route}; routing it automatically")
+        tier = "auto"
+    return RoutedResponses(
+        id=MODEL_TIERS[MODEL_DEFAULT_TIER],
+        route=route,
+        tier=tier,
+        tier_models={name: StablePromptResponses(id=model_id) for name, model_id in MODEL_TIERS.items()},
+    )
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _run_tokens(run_response: Any) -> tuple[int, int]:
+    metrics = getattr(run_response, "metrics", None)
+    if metrics is None:
+        return 0, 0
+    return metrics.input_tokens or 0, metrics.output_tokens or 0
@@ -0,0 +1,126 @@
+"""
+Ops Routes
+==========
+
+Operational endpoints mounted next to the AgentOS API.
+"""
+
+from fastapi import APIRouter, Request
+
+from agents.web_search import tool_output, web_cache, web_fanout, web_tools
+from app.admission import admission
+from app.history import history_stats
+from app.inflight import inflight
+from app.memory import memory
+from app.model_router import model_tier_stats
+from app.prompt import prompt_cache_stats
+from app.scheduler import scheduler_leader, scheduler_stats
+from app.singleflight import single_flight
+from app.slack_stream import slack_stream_stats
+from app.startup import startup
+from app.tracing import tracing
+from db import pool_stats
+
+router = APIRouter(prefix="/ops", tags=["Ops"])
+
+
+@router.get("/db/pool")
+def db_pool() -> dict:
+    """Connection pool usage for every shared engine in this worker."""
+    return {"pools": pool_stats()}
+
+
+@router.get("/web-cache")
+def web_cache_stats() -> dict:
+    """Hit / miss / store counters for the WebSearch tool cache."""
+    return web_cache.snapshot()
+
+
+@router.get("/tool-output")
+def tool_output_stats() -> dict:
+    """Fetched pages compacted before reaching the model: tokens before / after per tool, and compaction time."""
+    return tool_output.snapshot()
+
+
+@router.get("/fan-out")
+def fan_out_stats() -> dict:
+    """search_many calls: branches run, skipped, timed out and failed, duplicate URLs merged, and latency."""
+    return web_fanout.snapshot()
+
+
+@router.get("/mcp")
+def mcp_pool() -> dict:
+    """MCP session pool for the keyless WebSearch tools: sessions in use, wait and call latency, reconnects."""
+    snapshot = getattr(web_tools, "snapshot", None)
+    if snapshot is None:
+        return {"enabled": False}
+    return {"enabled": True, **snapshot()}
+
+
+@router.get("/single-flight")
+def single_flight_stats() -> dict:
+    """Coalesced agent runs: leaders, followers that shared their run, and the coalescing ratio per agent."""
+    return single_flight.snapshot()
+
+
+@router.get("/prompt-cache")
+def prompt_cache() -> dict:
+    """Prompt layout, and input vs. cached input tokens and time to first token per agent."""
+    return prompt_cache_stats.snapshot()
+
+
+@router.get("/traces")
+def traces() -> dict:
+    """Trace sampling decisions, span buffer depth, batch export latency, drops and the last retention roll-up."""
+    return tracing.snapshot()
+
+
+@router.get("/memory")
+def memory_stats() -> dict:
+    """Queued memory updates, batched flush latency, memories per prompt and the last compaction."""
+    return memory.snapshot()
+
+
+@router.get("/admission")
+def admission_stats() -> dict:
+    """Admission limits, runs admitted and rejected per interface and scope, wait times, and the busiest keys."""
+    return admission.snapshot()
+
+
+@router.get("/models")
+def models() -> dict:
+    """Model tiers, and calls, latency, time to first token, tokens and escalations per route and tier."""
+    return model_tier_stats.snapshot()
+
+
+@router.get("/serving")
+def serving() -> dict:
+    """This worker's in-flight runs and whether it leads the scheduler."""
+    return {"scheduler": scheduler_leader.snapshot(), "runs": inflight.snapshot()}
+
+
+@router.get("/scheduler")
+def scheduler() -> dict:
+    """Scheduler leadership, and per-schedule runs, lateness and run latency seen by this worker."""
+    return {"leader": scheduler_leader.snapshot(), "jobs": scheduler_stats.snapshot()}
+
+
+@router.get("/startup")
+def startup_phases() -> dict:
+    """Cold-start breakdown for this worker."""
+    return startup.snapshot()
+
+
+@router.get("/history")
+def history() -> dict:
+    """Conversation history budget: tokens replayed, trimmed and summarized, and session load time."""
+    return history_stats.snapshot()
+
+
+@router.get("/slack")
+def slack_queue(request: Request) -> dict:
+    """Slack event queue depth, this worker's wait / run times, and streamed-reply flush stats."""
+    slack = getattr(request.app.state, "slack", None)
+    if slack is None:
+        return {"enabled": False}
+    return {"enabled": True, **slack.pool.snapshot(), "stream": slack_stream_stats.snapshot()}
@@ -0,0 +1,281 @@
+"""
+Prompt Layout
+=============
+
+Cache-friendly prompt assembly for the platform's agents.
+
+OpenAI caches the longest prompt prefix it has seen recently (tools, then
+messages, from the first token), so a prompt only reuses the cache up to
+its first byte that changed. agno builds the system message as
+instructions, then ``<additional_information>`` with the current time to
+the microsecond, then tool instructions, then the user's memories and the
+session summary. The timestamp alone makes every system message unique.
+
+With ``PROMPT_LAYOUT=stable`` (the default), ``StablePromptResponses``
+rewrites each request before it is sent:
+
+- static content first, in agno's order: instructions (for CodeSearch,
+  including the workspace instructions), markdown / name hints, tool and
+  memory-tool instructions;
+- volatile content last, in a fixed order, inside ``<run_context>``: the
+  current time, the user's memories, the session summary;
+- tool schemas sorted by name, so the tool block is identical whatever
+  order the toolkits (or an MCP server) listed them in;
+- a ``prompt_cache_key`` derived from the static part, so requests sharing
+  it are routed to the same cache.
+
+Agents also pass ``datetime_format=PROMPT_DATETIME_FORMAT`` (to the hour
+by default), so the time only changes once an hour.
+
+``prompt_cache_stats.hook`` (a post-hook) records input and cached input
+tokens from each run's usage data; the cached-token ratio and
+time-to-first-token with and without a cache hit, per agent, are at
+``/ops/prompt-cache``.
+"""
+
+import re
+from collections import deque
+from collections.abc import AsyncIterator, Iterator
+from hashlib import sha256
+from os import getenv
+from typing import TYPE_CHECKING, Any
+
+from agno.models.message import Message
+from agno.models.openai import OpenAIResponses
+from agno.models.response import ModelResponse
+from agno.run.agent import RunOutput, RunOutputEvent
+from agno.run.team import TeamRunOutput, TeamRunOutputEvent
+from agno.tools.function import Function
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from agno.compression.manager import CompressionManager
+
+from app.stats import percentile
+
+PROMPT_LAYOUT = getenv("PROMPT_LAYOUT", "stable").lower()
+PROMPT_DATETIME_FORMAT = getenv("PROMPT_DATETIME_FORMAT", "%Y-%m-%d %H:00")
+
+_CONTEXT_OPEN = "<run_context>"
+_CONTEXT_CLOSE = "</run_context>"
+
+# Volatile blocks agno writes into the system message, in the order they are moved to the end.
+_VOLATILE = (
+    ("time", re.compile(r"^- The current time is [^\n]*\n?", re.MULTILINE)),
+    (
+        "memories",
+        re.compile(
+            r"You have access to user info and preferences from previous interactions.*?"
+            r"over the past memories\.\n?|"
+            r"You have the capability to retain memories from previous interactions with the user, "
+            r"but have not had any interactions with the user yet\.\n?",
+            re.DOTALL,
+        ),
+    ),
+    (
+        "summary",
+        re.compile(r"Here is a brief summary of your previous interactions:.*?over the past summary\.\n*", re.DOTALL),
+    ),
+)
+_EMPTY_ADDITIONAL_INFORMATION = re.compile(r"<additional_information>\s*</additional_information>\n*")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def stable_system_message(content: str) -> tuple[str, str]:
+    """Return agno's system message with its volatile blocks moved to the end, and its static part."""
+    if _CONTEXT_OPEN in content:
+        return content, content.split(_CONTEXT_OPEN, 1)[0].rstrip()
+    volatile: list[str] = []
+    for _, pattern in _VOLATILE:
+        for match in pattern.finditer(content):
+            volatile.append(match.group(0).strip())
+        content = pattern.sub("", content)
+    static = _BLANK_LINES.sub("\n\n", _EMPTY_ADDITIONAL_INFORMATION.sub("", content)).strip()
+    if not volatile:
+        return static, static
+    body = "\n\n".join(block.removeprefix("- ") for block in volatile if block)
+    return f"{static}\n\n{_CONTEXT_OPEN}\n{body}\n{_CONTEXT_CLOSE}", static
+
+
+def _tool_name(tool: Any) -> str:
+    if isinstance(tool, dict):
+        return str(tool.get("name") or tool.get("function", {}).get("name") or "")
+    return str(getattr(tool, "name", ""))
+
+
+class StablePromptResponses(OpenAIResponses):
+    """``OpenAIResponses`` that sends static prompt content first and volatile content last."""
+
+    def _layout(self, messages: list[Message], tools: list | None) -> list | None:
+        if PROMPT_LAYOUT != "stable":
+            return tools
+        for message in messages:
+            if message.role in ("system", "developer") and isinstance(message.content, str):
+                message.content, _ = stable_system_message(message.content)
+                break
+        return sorted(tools, key=_tool_name) if tools else tools
+
+    def get_request_params(self, messages: list[Message] | None = None, *args: Any, **kwargs: Any) -> dict[str, Any]:
+        params = super().get_request_params(messages, *args, **kwargs)
+        if PROMPT_LAYOUT == "stable" and messages and "prompt_cache_key" not in params:
+            system = next((m for m in messages if m.role in ("system", "developer")), None)
+            if system is not None and isinstance(system.content, str):
+                _, static = stable_system_message(system.content)
+                params["prompt_cache_key"] = sha256(f"{self.id}\n{static}".encode()).hexdigest()[:32]
+        return params
+
+    # The four entry points below keep Model's signatures, only laying out ``tools`` first.
+
+    def response(
+        self,
+        messages: list[Message],
+        response_format: dict | type[BaseModel] | None = None,
+        tools: list[Function | dict] | None = None,
+        tool_choice: str | dict[str, Any] | None = None,
+        tool_call_limit: int | None = None,
+        run_response: RunOutput | TeamRunOutput | None = None,
+        send_media_to_model: bool = True,
+        compression_manager: "CompressionManager | None" = None,
+    ) -> ModelResponse:
+        return super().response(
+            messages,
+            response_format=response_format,
+            tools=self._layout(messages, tools),
+            tool_choice=tool_choice,
+            tool_call_limit=tool_call_limit,
+            run_response=run_response,
+            send_media_to_model=send_media_to_model,
+            compression_manager=compression_manager,
+        )
+
+    async def aresponse(
+        self,
+        messages: list[Message],
+        response_format: dict | type[BaseModel] | None = None,
+        tools: list[Function | dict] | None = None,
+        tool_choice: str | dict[str, Any] | None = None,
+        tool_call_limit: int | None = None,
+        run_response: RunOutput | TeamRunOutput | None = None,
+        send_media_to_model: bool = True,
+        compression_manager: "CompressionManager | None" = None,
+    ) -> ModelResponse:
+        return await super().aresponse(
+            messages,
+            response_format=response_format,
+            tools=self._layout(messages, tools),
+            tool_choice=tool_choice,
+            tool_call_limit=tool_call_limit,
+            run_response=run_response,
+            send_media_to_model=send_media_to_model,
+            compression_manager=compression_manager,
+        )
+
+    def response_stream(
+        self,
+        messages: list[Message],
+        response_format: dict | type[BaseModel] | None = None,
+        tools: list[Function | dict] | None = None,
+        tool_choice: str | dict[str, Any] | None = None,
+        tool_call_limit: int | None = None,
+        stream_model_response: bool = True,
+        run_response: RunOutput | TeamRunOutput | None = None,
+        send_media_to_model: bool = True,
+        compression_manager: "CompressionManager | None" = None,
+    ) -> Iterator[ModelResponse | RunOutputEvent | TeamRunOutputEvent]:
+        yield from super().response_stream(
+            messages,
+            response_format=response_format,
+            tools=self._layout(messages, tools),
+            tool_choice=tool_choice,
+            tool_call_limit=tool_call_limit,
+            stream_model_response=stream_model_response,
+            run_response=run_response,
+            send_media_to_model=send_media_to_model,
+            compression_manager=compression_manager,
+        )
+
+    async def aresponse_stream(
+        self,
+        messages: list[Message],
+        response_format: dict | type[BaseModel] | None = None,
+        tools: list[Function | dict] | None = None,
+        tool_choice: str | dict[str, Any] | None = None,
+        tool_call_limit: int | None = None,
+        stream_model_response: bool = True,
+        run_response: RunOutput | TeamRunOutput | None = None,
+        send_media_to_model: bool = True,
+        compression_manager: "CompressionManager | None" = None,
+    ) -> AsyncIterator[ModelResponse | RunOutputEvent | TeamRunOutputEvent]:
+        async for chunk in super().aresponse_stream(
+            messages,
+            response_format=response_format,
+            tools=self._layout(messages, tools),
+            tool_choice=tool_choice,
+            tool_call_limit=tool_call_limit,
+            stream_model_response=stream_model_response,
+            run_response=run_response,
+            send_media_to_model=send_media_to_model,
+            compression_manager=compression_manager,
+        ):
+            yield chunk
+
+
+# ---------------------------------------------------------------------------
+# Cached-token reporting
+# ---------------------------------------------------------------------------
+
+
+class PromptCacheStats:
+    """Per-agent input / cached-input token totals for ``/ops/prompt-cache``."""
+
+    def __init__(self) -> None:
+        self.agents: dict[str, dict[str, Any]] = {}
+
+    def __deepcopy__(self, memo: dict) -> "PromptCacheStats":
+        # AgentOS deep-copies the agent (and its hook list) per request; every copy must record here.
+        return self
+
+    def hook(self, run_output: RunOutput, agent: Any = None) -> None:
+        """agno post-hook: record the run's usage."""
+        metrics = run_output.metrics
+        if metrics is None or not metrics.input_tokens:
+            return
+        agent_id = run_output.agent_id or getattr(agent, "id", None) or "unknown"
+        entry = self.agents.setdefault(
+            agent_id,
+            {
+                "runs": 0,
+                "input_tokens": 0,
+                "cached_tokens": 0,
+                "ttft_hit": deque(maxlen=1000),
+                "ttft_miss": deque(maxlen=1000),
+            },
+        )
+        cached = metrics.cache_read_tokens or 0
+        entry["runs"] += 1
+        entry["input_tokens"] += metrics.input_tokens
+        entry["cached_tokens"] += cached
+        if metrics.time_to_first_token is not None:
+            entry["ttft_hit" if cached else "ttft_miss"].append(metrics.time_to_first_token)
+
+    def snapshot(self) -> dict:
+        agents = {}
+        for agent_id, entry in self.agents.items():
+            agents[agent_id] = {
+                "runs": entry["runs"],
+                "input_tokens": entry["input_tokens"],
+                "cached_tokens": entry["cached_tokens"],
+                "cached_ratio": round(entry["cached_tokens"] / entry["input_tokens"], 3)
+                if entry["input_tokens"]
+                else None,
+                "ttft_ms": {"cache_hit": _p50_ms(entry["ttft_hit"]), "cache_miss": _p50_ms(entry["ttft_miss"])},
+            }
+        return {"layout": PROMPT_LAYOUT, "datetime_format": PROMPT_DATETIME_FORMAT, "agents": agents}
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+def _p50_ms(samples: deque[float]) -> float | None:
+    p50 = percentile(samples, 50)
+    return None if p50 is None else round(p50 * 1000, 1)
@@ -0,0 +1,502 @@
+"""
+Scheduler Leader
+================
+
+AgentOS starts a schedule poller in every process that imports the app.
+With several workers and replicas that means several pollers, and
+``claim_due_schedule`` treats a claim older than five minutes as stale,
+so a long job can be claimed and fired a second time by another poller.
+
+``SchedulerLeader`` runs the poller in exactly one worker across all
+replicas. Each worker tries a session-level Postgres advisory lock from
+the lifespan, on a connection it keeps open while it leads; the rest
+retry every ``poll_interval`` seconds. The leader re-checks that
+connection every tick and stands down if it is gone, and Postgres drops
+the lock when the leader's connection closes, so a crashed or recycled
+leader is replaced on the next retry.
+
+Each claimed schedule is a lease: while it runs, the poller refreshes
+``locked_at`` every third of ``SCHEDULER_LEASE`` seconds, so no other
+poller reclaims it; a job left behind by a dead leader is reclaimed once
+the lease expires.
+
+``ScheduleDispatcher`` runs schedules that target an agent, team or
+workflow registered in this process (``POST /{agents|teams|workflows}/{id}/runs``)
+directly, without the HTTP round-trip through ``AGENTOS_URL``. Anything
+else is sent over HTTP with the internal token, and whichever worker or
+replica answers has to accept it: with authorization on (``RUNTIME_ENV=prd``)
+that takes a shared ``AGENTOS_INTERNAL_TOKEN``. Without one, a warning is
+logged and only in-process schedules run; the rest are recorded as failed.
+
+Dispatch is delayed by up to ``SCHEDULER_JITTER`` seconds so jobs due on
+the same minute don't start in lockstep. A schedule claimed more than
+``SCHEDULER_MISFIRE_GRACE`` seconds late (e.g. after downtime) follows
+``SCHEDULER_MISFIRE_POLICY``:
+
+- ``run_once`` (default): run once now, then resume the cron from now;
+- ``skip``: don't run; resume the cron from now;
+- ``catch_up``: run every missed occurrence, one per tick, up to the
+  last ``SCHEDULER_CATCH_UP_MAX``.
+
+Per-schedule run counts, lateness and run latency are at ``/ops/scheduler``.
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import secrets
+import time
+from collections import deque
+from datetime import datetime
+from os import getenv
+from typing import Any
+from uuid import uuid4
+
+import pytz
+from agno.agent import Agent
+from agno.db.schemas.scheduler import Schedule
+from agno.run.agent import RunOutput
+from agno.run.base import RunStatus
+from agno.run.team import TeamRunOutput
+from agno.run.workflow import WorkflowRunOutput
+from agno.scheduler import ScheduleExecutor, SchedulePoller
+from agno.scheduler.cron import compute_next_run
+from agno.team import Team
+from agno.utils.log import log_debug, log_error, log_info, log_warning
+from agno.workflow import Workflow
+from croniter import croniter
+from sqlalchemy import Connection, text
+
+from app.stats import percentiles
+from db import db_url, get_engine, get_postgres_db
+
+SCHEDULER_POLL_INTERVAL = int(getenv("SCHEDULER_POLL_INTERVAL", "15"))
+SCHEDULER_LEASE = int(getenv("SCHEDULER_LEASE", "300"))
+SCHEDULER_JITTER = float(getenv("SCHEDULER_JITTER", "2.0"))
+SCHEDULER_MISFIRE_GRACE = int(getenv("SCHEDULER_MISFIRE_GRACE", "300"))
+SCHEDULER_MISFIRE_POLICY = getenv("SCHEDULER_MISFIRE_POLICY", "run_once")
+SCHEDULER_CATCH_UP_MAX = int(getenv("SCHEDULER_CATCH_UP_MAX", "10"))
+
+MISFIRE_POLICIES = ("run_once", "skip", "catch_up")
+_LOCK_KEY = "agentos-scheduler"
+_RUN_ENDPOINT = re.compile(r"^/(agents|teams|workflows)/([^/]+)/runs/?$")
+# Run endpoint form fields the in-process path understands; any other field sends the schedule over HTTP.
+_LOCAL_PAYLOAD_KEYS = frozenset({"message", "session_id", "user_id", "metadata", "dependencies", "session_state"})
+_JSON_PAYLOAD_KEYS = ("metadata", "dependencies", "session_state")
+
+
+# ---------------------------------------------------------------------------
+# Per-schedule metrics
+# ---------------------------------------------------------------------------
+class SchedulerStats:
+    """Per-schedule counters for ``/ops/scheduler``."""
+
+    def __init__(self) -> None:
+        self.jobs: dict[str, dict[str, Any]] = {}
+        self._durations: dict[str, deque[float]] = {}
+
+    def record(
+        self, sched: Schedule, *, status: str, dispatch: str, lateness: float, duration: float | None = None
+    ) -> None:
+        job = self.jobs.setdefault(
+            sched.id,
+            {"name": sched.name, "runs": 0, "failed": 0, "skipped": 0, "local": 0, "http": 0, "max_lateness": 0.0},
+        )
+        job["name"] = sched.name
+        job["last_status"] = status
+        job["last_run_at"] = int(time.time())
+        job["last_lateness"] = round(lateness, 3)
+        job["max_lateness"] = round(max(job["max_lateness"], lateness), 3)
+        if status == "skipped":
+            job["skipped"] += 1
+            return
+        job["runs"] += 1
+        job["failed"] += status == "failed"
+        job[dispatch] += 1
+        if duration is not None:
+            self._durations.setdefault(sched.id, deque(maxlen=100)).append(duration)
+
+    def snapshot(self) -> dict:
+        jobs = {}
+        for schedule_id, job in self.jobs.items():
+            jobs[schedule_id] = {**job, "run_seconds": percentiles(self._durations.get(schedule_id))}
+        return jobs
+
+
+scheduler_stats = SchedulerStats()
+
+
+# ---------------------------------------------------------------------------
+# Executor: misfire policy, in-process dispatch, metrics
+# ---------------------------------------------------------------------------
+class ScheduleDispatcher(ScheduleExecutor):
+    """``ScheduleExecutor`` that runs local agents in-process and applies the misfire policy."""
+
+    def __init__(
+        self,
+        *,
+        entities: list[Agent | Team | Workflow] | None = None,
+        misfire_policy: str = SCHEDULER_MISFIRE_POLICY,
+        misfire_grace: int = SCHEDULER_MISFIRE_GRACE,
+        catch_up_max: int = SCHEDULER_CATCH_UP_MAX,
+        stats: SchedulerStats = scheduler_stats,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        if misfire_policy not in MISFIRE_POLICIES:
+            raise ValueError(f"SCHEDULER_MISFIRE_POLICY must be one of {MISFIRE_POLICIES}, got {misfire_policy!r}")
+        self.entities = entities or []
+        self.misfire_policy = misfire_policy
+        self.misfire_grace = misfire_grace
+        self.catch_up_max = catch_up_max
+        self.stats = stats
+
+    async def execute(
+        self, schedule: Schedule | dict[str, Any], db: Any, release_schedule: bool = True
+    ) -> dict[str, Any]:
+        sched = Schedule.from_dict(schedule) if isinstance(schedule, dict) else schedule
+        due_at = sched.next_run_at or int(time.time())
+        lateness = max(0.0, time.time() - due_at)
+        misfired = release_schedule and lateness > self.misfire_grace
+        dispatch = "local" if self._local_entity(sched) is not None else "http"
+
+        if misfired and self.misfire_policy == "skip":
+            log_warning(f"Schedule {sched.name or sched.id} misfired ({lateness:.0f}s late), skipping this run")
+            self.stats.record(sched, status="skipped", dispatch=dispatch, lateness=lateness)
+            await self._release(db, sched, due_at, catch_up=False)
+            return {"schedule_id": sched.id, "status": "skipped"}
+
+        started = time.perf_counter()
+        result: dict[str, Any] = {"status": "failed"}
+        try:
+            # The base class records schedule runs and retries; releasing is done here.
+            result = await super().execute(sched, db, release_schedule=False)
+            return result
+        finally:
+            self.stats.record(
+                sched,
+                status=str(result.get("status", "failed")),
+                dispatch=dispatch,
+                lateness=lateness,
+                duration=time.perf_counter() - started,
+            )
+            if release_schedule:
+                await self._release(db, sched, due_at, catch_up=misfired and self.misfire_policy == "catch_up")
+
+    # -- In-process dispatch --------------------------------------------------
+
+    async def _call_endpoint(self, schedule: Schedule) -> dict[str, Any]:
+        entity = self._local_entity(schedule)
+        if entity is None:
+            if not self.internal_service_token:
+                return _local_result("failed", error="AGENTOS_INTERNAL_TOKEN is not set; only in-process schedules run")
+            return await super()._call_endpoint(schedule)
+        return await self._run_local(entity, schedule)
+
+    def _local_entity(self, schedule: Schedule) -> Agent | Team | Workflow | None:
+        match = _RUN_ENDPOINT.match(schedule.endpoint or "")
+        payload = schedule.payload or {}
+        if match is None or (schedule.method or "POST").upper() != "POST" or "message" not in payload:
+            return None
+        if set(payload) - _LOCAL_PAYLOAD_KEYS - {"stream", "background"}:
+            return None
+        kind: type[Agent | Team | Workflow] = {"agents": Agent, "teams": Team, "workflows": Workflow}[match.group(1)]
+        return next((e for e in self.entities if isinstance(e, kind) and e.id == match.group(2)), None)
+
+    async def _run_local(self, entity: Agent | Team | Workflow, schedule: Schedule) -> dict[str, Any]:
+        payload = dict(schedule.payload or {})
+        kwargs: dict[str, Any] = {"session_id": payload.get("session_id") or str(uuid4())}
+        if payload.get("user_id"):
+            kwargs["user_id"] = payload["user_id"]
+        for key in _JSON_PAYLOAD_KEYS:
+            value = payload.get(key)
+            if isinstance(value, str):
+                value = json.loads(value)
+            if value is not None:
+                kwargs[key] = value
+        timeout = schedule.timeout_seconds or self.timeout
+        # A fresh copy per run, as the AgentOS run route does, so concurrent runs don't share state.
+        fresh = entity.deep_copy()
+        try:
+            response: RunOutput | TeamRunOutput | WorkflowRunOutput = await asyncio.wait_for(
+                fresh.arun(payload["message"], stream=False, **kwargs), timeout
+            )
+        except TimeoutError:
+            return _local_result("failed", error=f"Run timed out after {timeout}s", session_id=kwargs["session_id"])
+
+        data = response.to_dict()
+        status = getattr(response, "status", None)
+        if status == RunStatus.completed:
+            outcome, error = "success", None
+        elif status == RunStatus.paused:
+            outcome, error = "paused", None
+        else:
+            outcome = "failed"
+            error = data.get("error") or data.get("content") or f"Run ended with status {status}"
+        return _local_result(
+            outcome,
+            error=str(error) if error else None,
+            run_id=data.get("run_id"),
+            session_id=data.get("session_id") or kwargs["session_id"],
+            input=data.get("input") if isinstance(data.get("input"), dict) else None,
+            output=self._extract_output(data),
+            requirements=self._extract_requirements(data) if outcome == "paused" else None,
+        )
+
+    # -- Release / misfire ------------------------------------------------------
+
+    async def _release(self, db: Any, sched: Schedule, due_at: int, *, catch_up: bool) -> None:
+        try:
+            if catch_up:
+                next_run_at = _catch_up_next(sched, due_at, self.catch_up_max)
+            else:
+                next_run_at = compute_next_run(sched.cron_expr, sched.timezone or "UTC")
+        except Exception as exc:
+            log_warning(f"Failed to compute next_run_at for schedule {sched.id}, disabling it: {exc}")
+            next_run_at = None
+            try:
+                await asyncio.to_thread(db.update_schedule, sched.id, enabled=False)
+            except Exception as disable_exc:
+                log_error(f"Failed to disable schedule {sched.id}: {disable_exc}")
+        try:
+            await asyncio.to_thread(db.release_schedule, sched.id, next_run_at=next_run_at)
+        except Exception as exc:
+            log_error(f"Failed to release schedule {sched.id}: {exc}")
+
+
+def _local_result(status: str, **fields: Any) -> dict[str, Any]:
+    """Executor result in the shape ``ScheduleExecutor`` stores on the schedule run."""
+    base = {
+        "status": status,
+        "status_code": None,
+        "error": None,
+        "run_id": None,
+        "session_id": None,
+        "input": None,
+        "output": None,
+        "requirements": None,
+    }
+    return base | fields
+
+
+def _catch_up_next(sched: Schedule, due_at: int, catch_up_max: int) -> int:
+    """Next occurrence after ``due_at``; if more than ``catch_up_max`` are missed, only the last ones are kept."""
+    tz = pytz.timezone(sched.timezone or "UTC")
+    now = time.time()
+    cron = croniter(sched.cron_expr, datetime.fromtimestamp(due_at, tz=tz))
+    missed: deque[int] = deque(maxlen=max(catch_up_max, 1))
+    while True:
+        occurrence = int(cron.get_next(datetime).timestamp())
+        if occurrence > now:
+            return missed[0] if missed else occurrence
+        missed.append(occurrence)
+
+
+# ---------------------------------------------------------------------------
+# Poller: leases and jitter
+# ---------------------------------------------------------------------------
+class LeasedSchedulePoller(SchedulePoller):
+    """``SchedulePoller`` that claims with a ``lease`` it keeps alive, and jitters dispatch."""
+
+    def __init__(self, *, lease: int = SCHEDULER_LEASE, jitter: float = SCHEDULER_JITTER, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.lease = lease
+        self.jitter = jitter
+
+    async def pause(self) -> None:
+        """Stop claiming; schedules already running finish and are released normally."""
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _poll_once(self) -> None:
+        while self._running:
+            self._in_flight -= {t for t in self._in_flight if t.done()}
+            if len(self._in_flight) >= self.max_concurrent:
+                log_warning(f"Max concurrent executions reached ({self.max_concurrent}), waiting")
+                break
+            try:
+                schedule = await asyncio.to_thread(self.db.claim_due_schedule, self.worker_id, self.lease)
+            except Exception as exc:
+                log_error(f"Error claiming schedule: {exc}")
+                break
+            if schedule is None:
+                break
+            sched = Schedule.from_dict(schedule) if isinstance(schedule, dict) else schedule
+            log_info(f"Claimed schedule: {sched.name or sched.id}")
+            task = asyncio.create_task(self._execute_safe(sched))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _execute_safe(self, schedule: Schedule | dict[str, Any]) -> None:
+        sched = Schedule.from_dict(schedule) if isinstance(schedule, dict) else schedule
+        heartbeat = asyncio.create_task(self._heartbeat(sched.id), name=f"schedule-lease-{sched.id}")
+        try:
+            if self.jitter > 0:
+                await asyncio.sleep(random.uniform(0, self.jitter))
+            await super()._execute_safe(sched)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, schedule_id: str) -> None:
+        """Keep the claim fresh while the schedule runs, so it is not reclaimed as stale."""
+        while True:
+            await asyncio.sleep(max(self.lease / 3, 1))
+            try:
+                await asyncio.to_thread(self.db.update_schedule, schedule_id, locked_at=int(time.time()))
+            except Exception as exc:
+                log_warning(f"Could not renew lease on schedule {schedule_id}: {exc}")
+
+
+# ---------------------------------------------------------------------------
+# Leader election
+# ---------------------------------------------------------------------------
+class SchedulerLeader:
+    """Cluster-wide leader election for the AgentOS schedule poller."""
+
+    def __init__(
+        self,
+        *,
+        db: Any,
+        base_url: str,
+        internal_service_token: str,
+        poll_interval: int = SCHEDULER_POLL_INTERVAL,
+        lock_key: str = _LOCK_KEY,
+    ) -> None:
+        self.db = db
+        self.base_url = base_url
+        self.internal_service_token = internal_service_token
+        self.poll_interval = poll_interval
+        self.lock_key = lock_key
+        self.worker_id = f"{os.getpid()}-{uuid4().hex[:8]}"
+        self.poller: LeasedSchedulePoller | None = None
+        self.leader_since: float | None = None
+        self._lock_conn: Connection | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.poller is not None and self._lock_conn is not None
+
+    async def start(self, app: Any = None, entities: list[Agent | Team | Workflow] | None = None) -> None:
+        """Begin campaigning; returns immediately. ``entities`` are dispatched in-process."""
+        self._task = asyncio.create_task(self._campaign(app, entities or []), name="scheduler-leader")
+
+    async def stop(self) -> None:
+        """Stop campaigning, stop the poller if we lead, and release the lock."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.poller is not None:
+            await self.poller.stop()
+            self.poller = None
+        await asyncio.to_thread(self._unlock)
+
+    def snapshot(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "worker_id": self.worker_id,
+            "leader": self.is_leader,
+            "leader_since": int(self.leader_since) if self.leader_since else None,
+            "in_flight": len(self.poller._in_flight) if self.poller is not None else 0,
+            "lease": SCHEDULER_LEASE,
+            "jitter": SCHEDULER_JITTER,
+            "misfire_policy": SCHEDULER_MISFIRE_POLICY,
+        }
+
+    # -- Internals ----------------------------------------------------------
+
+    async def _campaign(self, app: Any, entities: list[Agent | Team | Workflow]) -> None:
+        while True:
+            if await asyncio.to_thread(self._try_lock):
+                await self._lead(app, entities)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _lead(self, app: Any, entities: list[Agent | Team | Workflow]) -> None:
+        executor = ScheduleDispatcher(
+            entities=entities, base_url=self.base_url, internal_service_token=self.internal_service_token
+        )
+        if self.poller is None:
+            self.poller = LeasedSchedulePoller(
+                db=self.db, executor=executor, poll_interval=self.poll_interval, worker_id=self.worker_id
+            )
+        else:
+            self.poller.executor = executor
+        if app is not None:
+            app.state.scheduler_executor = executor
+            app.state.scheduler_poller = self.poller
+        await self.poller.start()
+        self.leader_since = time.time()
+        log_info(f"Scheduler leader: {self.worker_id}")
+        while await asyncio.to_thread(self._still_locked):
+            await asyncio.sleep(self.poll_interval)
+        log_warning("Scheduler lock connection lost; standing down")
+        await self.poller.pause()
+        self.leader_since = None
+        await asyncio.to_thread(self._unlock)
+
+    def _try_lock(self) -> bool:
+        try:
+            conn = get_engine(db_url).connect().execution_options(isolation_level="AUTOCOMMIT")
+        except Exception as exc:
+            log_warning(f"Scheduler lock attempt failed: {exc}")
+            return False
+        try:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": self.lock_key}).scalar()
+        except Exception as exc:
+            conn.close()
+            log_warning(f"Scheduler lock attempt failed: {exc}")
+            return False
+        if not locked:
+            conn.close()
+            log_debug(f"Scheduler lock held elsewhere ({self.worker_id} standing by)")
+            return False
+        self._lock_conn = conn
+        return True
+
+    def _still_locked(self) -> bool:
+        if self._lock_conn is None:
+            return False
+        try:
+            self._lock_conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+
+    def _unlock(self) -> None:
+        conn, self._lock_conn = self._lock_conn, None
+        if conn is None:
+            return
+        try:
+            conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": self.lock_key})
+        except Exception:
+            pass  # the lock goes with the connection
+        finally:
+            # Never hand a connection with session-level lock state back to the pool.
+            conn.invalidate()
+            conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Shared leader for this process
+# ---------------------------------------------------------------------------
+scheduler_base_url = getenv("AGENTOS_URL", "http://127.0.0.1:8000")
+internal_service_token = getenv("AGENTOS_INTERNAL_TOKEN", "")
+if not internal_service_token:
+    if getenv("RUNTIME_ENV", "prd") == "prd":
+        # A per-process token would get HTTP-dispatched schedules rejected by every other worker and replica.
+        log_warning("AGENTOS_INTERNAL_TOKEN is not set; only schedules for local agents, teams and workflows will run")
+    else:
+        # Without authorization AgentOS doesn't check the token.
+        internal_service_token = secrets.token_urlsafe(32)
+
+scheduler_leader = SchedulerLeader(
+    db=get_postgres_db(),
+    base_url=scheduler_base_url,
+    internal_service_token=internal_service_token,
+)
@@ -7,7 +7,16 @@ Shared runtime objects for the platform.
 
 from agno.models.openai import OpenAIResponses
 
+from app.model_router import routed_model
 
-def default_model() -> OpenAIResponses:
-    """Fresh model instance per agent — avoids shared-state footguns."""
-    return OpenAIResponses(id="gpt-5.4")
+
+def default_model(route: str = "default", tier: str = "auto") -> OpenAIResponses:
+    """Fresh model instance per agent — avoids shared-state footguns.
+
+    ``route`` names the agent or sub-agent; each run goes to the model
+    tier picked for it, ``tier`` or one chosen from the input (see
+    app/model_router.py). Static prompt content is sent first and
+    volatile content last, so provider prompt caching covers the prefix
+    (see app/prompt.py).
+    """
+    return routed_model(route, tier)
@@ -0,0 +1,397 @@
+"""
+Single-flight Runs
+==================
+
+Opt-in coalescing of identical concurrent agent runs. When a Slack thread
+or a scheduled job fans out, the same question often reaches WebSearch or
+CodeSearch several times within seconds; without this each copy is a
+full model and tool run.
+
+``SingleFlightAgent`` is an ``Agent`` whose ``arun`` (what the AgentOS
+routes, the Slack workers and the scheduler all call) keys each run on:
+
+- the agent id and the input, whitespace-collapsed and case-folded;
+- the run options that change the answer (``stream`` / ``stream_events``,
+  ``dependencies``, ``knowledge_filters``, ``output_schema``);
+- the caller's session, if the agent replays history and the session
+  already has runs, and the caller's user id, if the agent adds user
+  memories to its prompt and that user has any. First messages from
+  different users therefore share a key; follow-ups in a conversation
+  don't.
+
+The first run for a key (the leader) runs as usual in a background task.
+Runs with the same key that arrive while it is in flight (followers)
+don't start a model call: they replay the leader's events from the
+start and then follow it live, with their own ``run_id`` / ``session_id``
+stamped on each event. When the leader finishes, each follower's copy
+of the run is stored in the follower's own session, so its history
+reads as if it had run. The leader keeps running while any caller is
+still listening and is cancelled once all of them have gone.
+
+Coalescing is per worker process and only covers runs in flight at the
+same moment; nothing is cached after a run ends. Text-only runs are
+eligible; runs with media, explicit session state or ``background=True``
+always run on their own. Enable with ``SINGLE_FLIGHT=True``; leader /
+follower counts and the coalescing ratio per agent are at
+``/ops/single-flight``.
+"""
+
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator, Coroutine, Sequence
+from copy import copy
+from hashlib import sha256
+from os import getenv
+from typing import Any, Literal, overload
+from uuid import uuid4
+
+from agno.agent import Agent
+from agno.db.base import SessionType
+from agno.filters import FilterExpr
+from agno.media import Audio, File, Image, Video
+from agno.models.message import Message
+from agno.run import RunContext
+from agno.run.agent import RunOutput, RunOutputEvent
+from agno.run.base import RunStatus
+from agno.session.agent import AgentSession
+from agno.utils.log import log_debug, log_warning
+from pydantic import BaseModel
+
+from db.session import TimedPostgresDb
+
+SINGLE_FLIGHT = getenv("SINGLE_FLIGHT", "False").lower() in ("1", "true", "yes")
+
+# Run options that, when set, make a run ineligible: its output depends on more than the key.
+_UNCOALESCED_OPTIONS = ("images", "audio", "videos", "files", "run_context", "session_state", "background")
+# Run options that change the answer, so they are part of the key.
+_KEYED_OPTIONS = ("stream_events", "dependencies", "knowledge_filters", "output_schema", "add_history_to_context")
+
+
+class SingleFlightStats:
+    """Process-wide counters for ``/ops/single-flight``."""
+
+    def __init__(self) -> None:
+        self.skipped = 0
+        self.persist_errors = 0
+        self.leaders: dict[str, int] = {}
+        self.followers: dict[str, int] = {}
+        self.max_followers = 0
+
+    def snapshot(self, in_flight: int) -> dict:
+        agents = sorted(set(self.leaders) | set(self.followers))
+        leaders = sum(self.leaders.values())
+        followers = sum(self.followers.values())
+        return {
+            "enabled": SINGLE_FLIGHT,
+            "in_flight": in_flight,
+            "leaders": leaders,
+            "followers": followers,
+            "skipped": self.skipped,
+            "coalescing_ratio": _ratio(followers, leaders + followers),
+            "max_followers": self.max_followers,
+            "persist_errors": self.persist_errors,
+            "agents": {
+                agent: {
+                    "leaders": self.leaders.get(agent, 0),
+                    "followers": self.followers.get(agent, 0),
+                    "coalescing_ratio": _ratio(
+                        self.followers.get(agent, 0), self.leaders.get(agent, 0) + self.followers.get(agent, 0)
+                    ),
+                }
+                for agent in agents
+            },
+        }
+
+
+class _Flight:
+    """One in-flight leader run and the events it has produced so far."""
+
+    def __init__(self, key: str, agent_id: str) -> None:
+        self.key = key
+        self.agent_id = agent_id
+        self.events: list[Any] = []
+        self.output: RunOutput | None = None
+        self.error: BaseException | None = None
+        self.done = False
+        self.listeners = 0
+        self.followers = 0
+        self.changed = asyncio.Condition()
+        self.task: asyncio.Task | None = None
+
+
+class SingleFlight:
+    """Registry of in-flight leader runs, keyed by ``SingleFlightAgent``."""
+
+    def __init__(self) -> None:
+        self.flights: dict[str, _Flight] = {}
+        self.stats = SingleFlightStats()
+
+    def join(self, key: str, agent_id: str) -> tuple[_Flight, bool]:
+        """Return the flight for ``key`` and whether the caller leads it (and must start it)."""
+        flight = self.flights.get(key)
+        leader = flight is None
+        if flight is None:
+            flight = self.flights[key] = _Flight(key, agent_id)
+            self.stats.leaders[agent_id] = self.stats.leaders.get(agent_id, 0) + 1
+        else:
+            flight.followers += 1
+            self.stats.followers[agent_id] = self.stats.followers.get(agent_id, 0) + 1
+            self.stats.max_followers = max(self.stats.max_followers, flight.followers)
+        flight.listeners += 1
+        return flight, leader
+
+    def leave(self, flight: _Flight) -> None:
+        flight.listeners -= 1
+        if flight.listeners == 0 and not flight.done and flight.task is not None:
+            log_debug(f"Single-flight: every caller left, cancelling run for {flight.agent_id}")
+            flight.task.cancel()
+
+    async def land(self, flight: _Flight) -> None:
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+        async with flight.changed:
+            flight.done = True
+            flight.changed.notify_all()
+
+    def snapshot(self) -> dict:
+        return self.stats.snapshot(in_flight=len(self.flights))
+
+
+single_flight = SingleFlight()
+
+
+class SingleFlightAgent(Agent):
+    """``Agent`` whose identical concurrent runs share one model / tool run when ``SINGLE_FLIGHT`` is on."""
+
+    # Agent.arun's overloads, verbatim: callers see the same types as on a plain Agent.
+    @overload
+    def arun(
+        self,
+        input: str | list | dict | Message | BaseModel | list[Message],
+        *,
+        stream: Literal[False] = False,
+        user_id: str | None = None,
+        session_id: str | None = None,
+        session_state: dict[str, Any] | None = None,
+        run_context: RunContext | None = None,
+        run_id: str | None = None,
+        audio: Sequence[Audio] | None = None,
+        images: Sequence[Image] | None = None,
+        videos: Sequence[Video] | None = None,
+        files: Sequence[File] | None = None,
+        stream_events: bool | None = None,
+        knowledge_filters: dict[str, Any] | list[FilterExpr] | None = None,
+        add_history_to_context: bool | None = None,
+        add_dependencies_to_context: bool | None = None,
+        add_session_state_to_context: bool | None = None,
+        dependencies: dict[str, Any] | None = None,
+        metadata: dict[str, Any] | None = None,
+        output_schema: type[BaseModel] | dict[str, Any] | None = None,
+        debug_mode: bool | None = None,
+        background: bool = False,
+        **kwargs: Any,
+    ) -> Coroutine[Any, Any, RunOutput]: ...
+
+    @overload
+    def arun(
+        self,
+        input: str | list | dict | Message | BaseModel | list[Message],
+        *,
+        stream: Literal[True] = True,
+        user_id: str | None = None,
+        session_id: str | None = None,
+        run_context: RunContext | None = None,
+        run_id: str | None = None,
+        audio: Sequence[Audio] | None = None,
+        images: Sequence[Image] | None = None,
+        videos: Sequence[Video] | None = None,
+        files: Sequence[File] | None = None,
+        stream_events: bool | None = None,
+        knowledge_filters: dict[str, Any] | list[FilterExpr] | None = None,
+        add_history_to_context: bool | None = None,
+        add_dependencies_to_context: bool | None = None,
+        add_session_state_to_context: bool | None = None,
+        dependencies: dict[str, Any] | None = None,
+        metadata: dict[str, Any] | None = None,
+        output_schema: type[BaseModel] | dict[str, Any] | None = None,
+        yield_run_output: bool | None = None,
+        debug_mode: bool | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[RunOutputEvent | RunOutput]: ...
+
+    def arun(self, input: Any, *, stream: bool | None = None, **kwargs: Any) -> Any:
+        streaming = stream if stream is not None else bool(self.stream)
+        if not SINGLE_FLIGHT:
+            return self._arun(input, streaming, kwargs)
+        if not isinstance(input, str) or any(kwargs.get(option) for option in _UNCOALESCED_OPTIONS):
+            single_flight.stats.skipped += 1
+            return self._arun(input, streaming, kwargs)
+        # Key and join in one step, with no await in between: a second copy
+        # of this run can't also find no flight and lead its own.
+        flight, leader = single_flight.join(self._flight_key(input, kwargs, streaming=streaming), self.id or "")
+        if leader:
+            flight.task = asyncio.create_task(self._lead(flight, input, kwargs, streaming=streaming))
+        if streaming:
+            return self._coalesced_stream(flight, leader, kwargs)
+        return self._coalesced_run(flight, leader, kwargs)
+
+    def _arun(self, input: Any, streaming: bool, kwargs: dict[str, Any]) -> Any:
+        """``Agent.arun`` with ``stream`` resolved the way agno resolves it (call site, then ``self.stream``)."""
+        if streaming:
+            return super().arun(input, stream=True, **kwargs)
+        return super().arun(input, stream=False, **kwargs)
+
+    # -- Callers ---------------------------------------------------------------
+
+    async def _coalesced_stream(self, flight: _Flight, leader: bool, kwargs: dict[str, Any]) -> AsyncIterator[Any]:
+        stamp = None if leader else _follower_stamp(kwargs)
+        want_output = bool(kwargs.get("yield_run_output"))
+        try:
+            seen = 0
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: seen < len(flight.events) or flight.done)
+                    done = flight.done
+                    batch = flight.events[seen:]
+                seen += len(batch)
+                for event in batch:
+                    if isinstance(event, RunOutput) and not want_output:
+                        continue
+                    yield event if stamp is None else _restamp(event, stamp)
+                if done:
+                    break
+        finally:
+            single_flight.leave(flight)
+        if flight.error is not None:
+            raise flight.error
+        if stamp is not None:
+            await self._store_follower_run(flight, stamp)
+
+    async def _coalesced_run(self, flight: _Flight, leader: bool, kwargs: dict[str, Any]) -> RunOutput:
+        try:
+            async with flight.changed:
+                await flight.changed.wait_for(lambda: flight.done)
+        finally:
+            single_flight.leave(flight)
+        if flight.error is not None:
+            raise flight.error
+        assert flight.output is not None
+        if leader:
+            return flight.output
+        stamp = _follower_stamp(kwargs)
+        await self._store_follower_run(flight, stamp)
+        return _restamp(flight.output, stamp)
+
+    # -- Leader ----------------------------------------------------------------
+
+    async def _lead(self, flight: _Flight, input: str, kwargs: dict[str, Any], *, streaming: bool) -> None:
+        try:
+            if streaming:
+                # Always ask for the final RunOutput; followers need it to store their copy.
+                async for event in super().arun(input, stream=True, **{**kwargs, "yield_run_output": True}):
+                    if isinstance(event, RunOutput):
+                        flight.output = event
+                    async with flight.changed:
+                        flight.events.append(event)
+                        flight.changed.notify_all()
+            else:
+                flight.output = await super().arun(input, stream=False, **kwargs)
+        except BaseException as exc:
+            flight.error = exc
+            if not isinstance(exc, Exception):
+                raise
+        finally:
+            await single_flight.land(flight)
+
+    # -- Keys and follower sessions --------------------------------------------
+
+    def _flight_key(self, input: str, kwargs: dict[str, Any], *, streaming: bool) -> str:
+        session_id = kwargs.get("session_id")
+        user_id = kwargs.get("user_id")
+        context: dict[str, Any] = {option: kwargs.get(option) for option in _KEYED_OPTIONS}
+        context["stream"] = streaming
+        history = kwargs.get("add_history_to_context")
+        if (history if history is not None else self.add_history_to_context) and session_id:
+            if self._session_has_runs(session_id, user_id):
+                context["session_id"] = session_id
+        if self._adds_memories() and user_id:
+            if self._user_has_memories(user_id):
+                context["user_id"] = user_id
+        text = " ".join(input.split()).casefold()
+        blob = json.dumps([self.id, text, context], sort_keys=True, default=repr)
+        return sha256(blob.encode()).hexdigest()
+
+    def _adds_memories(self) -> bool:
+        if self.add_memories_to_context is not None:
+            return self.add_memories_to_context
+        return bool(self.update_memory_on_run or self.enable_agentic_memory or self.memory_manager is not None)
+
+    # Existence checks on indexed columns, cheap enough to run inline like
+    # agno's own session reads; other databases fall back to loading the rows.
+
+    def _session_has_runs(self, session_id: str, user_id: str | None) -> bool:
+        if isinstance(self.db, TimedPostgresDb):
+            return self.db.session_has_runs(session_id, user_id)
+        if self.db is None:
+            return False
+        session = self.db.get_session(session_id=session_id, session_type=SessionType.AGENT, user_id=user_id)
+        return bool(session is not None and getattr(session, "runs", None))
+
+    def _user_has_memories(self, user_id: str) -> bool:
+        if isinstance(self.db, TimedPostgresDb):
+            return self.db.user_has_memories(user_id)
+        if self.db is None:
+            return False
+        return bool(self.db.get_user_memories(user_id=user_id, limit=1))
+
+    async def _store_follower_run(self, flight: _Flight, stamp: dict[str, Any]) -> None:
+        """Store the follower's copy of the leader's run in the follower's session."""
+        if self.db is None or flight.output is None or flight.output.status != RunStatus.completed:
+            return
+        run = _restamp(flight.output, stamp)
+        # The tokens were spent once, by the leader.
+        run.metrics = None
+        run.metadata = {**(run.metadata or {}), "coalesced_with": flight.output.run_id}
+        try:
+            await asyncio.to_thread(self._upsert_run, run)
+        except Exception as exc:
+            single_flight.stats.persist_errors += 1
+            log_warning(f"Single-flight: could not store coalesced run in session {run.session_id}: {exc}")
+
+    def _upsert_run(self, run: RunOutput) -> None:
+        assert self.db is not None and run.session_id is not None
+        session = self.db.get_session(session_id=run.session_id, session_type=SessionType.AGENT, user_id=run.user_id)
+        if not isinstance(session, AgentSession):
+            session = AgentSession(
+                session_id=run.session_id, agent_id=self.id, user_id=run.user_id, created_at=int(time.time())
+            )
+        session.upsert_run(run)
+        session.updated_at = int(time.time())
+        self.db.upsert_session(session)
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _follower_stamp(kwargs: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "run_id": kwargs.get("run_id") or str(uuid4()),
+        "session_id": kwargs.get("session_id") or str(uuid4()),
+        "user_id": kwargs.get("user_id"),
+    }
+
+
+def _restamp(event: Any, stamp: dict[str, Any]) -> Any:
+    """A shallow copy of ``event`` carrying the follower's run / session / user ids."""
+    event = copy(event)
+    for field, value in stamp.items():
+        if hasattr(event, field):
+            setattr(event, field, value)
+    return event
+
+
+def _ratio(part: int, whole: int) -> float | None:
+    return round(part / whole, 3) if whole else None
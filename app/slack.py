@@ -0,0 +1,292 @@
+"""
+Slack Interface
+===============
+
+Slack interface whose webhook only acks. ``QueuedSlack`` mounts the same
+``/slack/events`` endpoint as agno's ``Slack``, but a verified event is
+written to the Postgres queue (``db/slack_queue.py``) and answered with 200
+straight away, well inside Slack's 3-second deadline. Duplicate
+deliveries and Slack retries share an ``event_id`` and are dropped by the
+queue.
+
+``SlackWorkerPool`` runs in every worker process (started from the AgentOS
+lifespan) and claims events from the queue:
+
+- at most ``SLACK_WORKERS`` events at a time per process;
+- one event at a time per channel, oldest first;
+- at most ``SLACK_TEAM_CONCURRENCY`` events at a time per workspace,
+  across all processes and replicas.
+
+A claimed event then goes through admission control (``app/admission.py``)
+for its Slack user, the agent and the ``slack`` interface; one that is
+over a limit goes back to the queue until its ``Retry-After`` is up.
+
+On shutdown, events still running after the drain timeout are handed
+back to the queue for another worker. Queue depth, oldest pending age and
+wait-time percentiles are at ``/ops/slack``.
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import deque
+from enum import Enum
+from os import getenv
+from typing import Any
+
+from agno.os.interfaces.slack import Slack
+from agno.os.interfaces.slack.security import verify_slack_signature
+from agno.utils.log import log_error, log_info, log_warning
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field
+
+from app.admission import Overloaded, admission
+from app.slack_responder import SlackResponder
+from app.stats import percentiles
+from db.slack_queue import ClaimedEvent, SlackEventQueue
+
+SLACK_WORKERS = int(getenv("SLACK_WORKERS", "4"))
+SLACK_TEAM_CONCURRENCY = int(getenv("SLACK_TEAM_CONCURRENCY", "4"))
+SLACK_QUEUE_POLL = float(getenv("SLACK_QUEUE_POLL", "1.0"))
+SLACK_QUEUE_LEASE = int(getenv("SLACK_QUEUE_LEASE", "900"))
+
+
+class SlackEventResponse(BaseModel):
+    status: str = Field(default="ok")
+
+
+class SlackChallengeResponse(BaseModel):
+    challenge: str = Field(description="Challenge string to echo back to Slack")
+
+
+class SlackWorkerPool:
+    """Bounded pool of queue consumers in this process."""
+
+    def __init__(
+        self,
+        queue: SlackEventQueue,
+        responder: SlackResponder,
+        *,
+        workers: int = SLACK_WORKERS,
+        team_concurrency: int = SLACK_TEAM_CONCURRENCY,
+        poll_interval: float = SLACK_QUEUE_POLL,
+    ) -> None:
+        self.queue = queue
+        self.responder = responder
+        self.workers = workers
+        self.team_concurrency = team_concurrency
+        self.poll_interval = poll_interval
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.processed = 0
+        self.failed = 0
+        self.deferred = 0
+        self.waits: deque[float] = deque(maxlen=1000)
+        self.durations: deque[float] = deque(maxlen=1000)
+        self._running: dict[str, asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="slack-worker-pool")
+            log_info(f"Slack worker pool started ({self.workers} workers, {self.team_concurrency} per workspace)")
+
+    def wake(self) -> None:
+        """Claim now instead of at the next poll (called after a local enqueue)."""
+        self._wakeup.set()
+
+    async def stop(self, timeout: float) -> None:
+        """Stop claiming, give running events ``timeout`` seconds, then hand the rest back."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._running:
+            await asyncio.wait(list(self._running.values()), timeout=timeout)
+        unfinished = list(self._running)
+        for task in self._running.values():
+            task.cancel()
+        if unfinished:
+            log_warning(f"Returning {len(unfinished)} unfinished Slack event(s) to the queue")
+            try:
+                await asyncio.to_thread(self.queue.release, unfinished)
+            except Exception as exc:
+                log_error(f"Could not release Slack events {unfinished}: {exc}")
+
+    def snapshot(self) -> dict:
+        try:
+            queue: dict[str, Any] = self.queue.depth()
+        except Exception as exc:
+            queue = {"error": str(exc)}
+        return {
+            "queue": queue,
+            "worker": {
+                "id": self.worker_id,
+                "busy": len(self._running),
+                "workers": self.workers,
+                "team_concurrency": self.team_concurrency,
+                "processed": self.processed,
+                "failed": self.failed,
+                "deferred": self.deferred,
+            },
+            "wait_seconds": percentiles(self.waits),
+            "run_seconds": percentiles(self.durations),
+        }
+
+    # -- Internals ------------------------------------------------------------
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            free = self.workers - len(self._running)
+            if free > 0:
+                try:
+                    claimed = await asyncio.to_thread(self.queue.claim, self.worker_id, free, self.team_concurrency)
+                except Exception as exc:
+                    log_warning(f"Slack queue claim failed: {exc}")
+                    claimed = []
+                for item in claimed:
+                    self._running[item.event_id] = asyncio.create_task(self._process(item))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except TimeoutError:
+                pass
+
+    async def _process(self, item: ClaimedEvent) -> None:
+        try:
+            ticket = await admission.acquire(
+                user=_slack_user(item), agent=self.responder.entity_id, interface="slack", max_wait=0
+            )
+        except Overloaded as exc:
+            await self._defer(item, exc.retry_after)
+            return
+        self.waits.append(item.wait_seconds)
+        started = time.perf_counter()
+        error: str | None = None
+        try:
+            await self.responder.handle(item.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            log_error(f"Slack event {item.event_id} failed: {error}")
+        else:
+            self.durations.append(time.perf_counter() - started)
+        finally:
+            await admission.release(ticket)
+        self._running.pop(item.event_id, None)
+        self.processed += 1
+        self.failed += error is not None
+        try:
+            await asyncio.to_thread(self.queue.complete, item.event_id, error)
+        except Exception as exc:
+            log_warning(f"Could not mark Slack event {item.event_id} finished: {exc}")
+        # A channel or workspace slot just opened up.
+        self._wakeup.set()
+
+    async def _defer(self, item: ClaimedEvent, seconds: float) -> None:
+        """Put an event that wasn't admitted back in the queue for ``seconds``, freeing this slot."""
+        self._running.pop(item.event_id, None)
+        self.deferred += 1
+        try:
+            await asyncio.to_thread(self.queue.defer, item.event_id, seconds)
+        except Exception as exc:
+            log_warning(f"Could not defer Slack event {item.event_id}: {exc}")
+
+
+class QueuedSlack(Slack):
+    """agno ``Slack`` interface that acks immediately and processes from a durable queue."""
+
+    def __init__(
+        self,
+        *,
+        queue: SlackEventQueue | None = None,
+        workers: int = SLACK_WORKERS,
+        team_concurrency: int = SLACK_TEAM_CONCURRENCY,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.responder = SlackResponder(
+            self.agent or self.team or self.workflow,  # type: ignore[arg-type]
+            token=self.token,
+            reply_to_mentions_only=self.reply_to_mentions_only,
+            streaming=self.streaming,
+            loading_messages=self.loading_messages,
+            task_display_mode=self.task_display_mode,
+            loading_text=self.loading_text,
+            suggested_prompts=self.suggested_prompts,
+            ssl=self.ssl,
+            max_file_size=self.max_file_size,
+            resolve_user_identity=self.resolve_user_identity,
+        )
+        self.queue = queue or SlackEventQueue(lease=SLACK_QUEUE_LEASE)
+        self.pool = SlackWorkerPool(self.queue, self.responder, workers=workers, team_concurrency=team_concurrency)
+
+    def get_router(self, use_async: bool = True, **kwargs: Any) -> APIRouter:
+        tags: list[str | Enum] = list(self.tags)
+        router = APIRouter(prefix=self.prefix, tags=tags)
+        op_suffix = self.responder.entity_name.lower().replace(" ", "_")
+
+        @router.post(
+            "/events",
+            operation_id=f"slack_events_{op_suffix}",
+            name="slack_events",
+            description="Verify and enqueue incoming Slack events",
+            response_model=SlackChallengeResponse | SlackEventResponse,
+            response_model_exclude_none=True,
+            responses={
+                200: {"description": "Event accepted"},
+                400: {"description": "Missing Slack headers"},
+                403: {"description": "Invalid Slack signature"},
+                503: {"description": "Queue unavailable; Slack will retry"},
+            },
+        )
+        async def slack_events(request: Request):  # type: ignore[no-untyped-def]
+            body = await request.body()
+            timestamp = request.headers.get("X-Slack-Request-Timestamp")
+            slack_signature = request.headers.get("X-Slack-Signature", "")
+            if not timestamp or not slack_signature:
+                raise HTTPException(status_code=400, detail="Missing Slack headers")
+            if not verify_slack_signature(body, timestamp, slack_signature, signing_secret=self.signing_secret):
+                raise HTTPException(status_code=403, detail="Invalid signature")
+
+            data = json.loads(body)
+            if data.get("type") == "url_verification":
+                return SlackChallengeResponse(challenge=data.get("challenge"))
+
+            event = data.get("event")
+            if not event or not self.responder.wants(event):
+                return SlackEventResponse(status="ok")
+
+            event_id, team_id, channel_id = _queue_keys(data)
+            try:
+                queued = await asyncio.to_thread(self.queue.enqueue, event_id, team_id, channel_id, data)
+            except Exception as exc:
+                # Not acking makes Slack retry the delivery later.
+                log_error(f"Could not enqueue Slack event {event_id}: {exc}")
+                raise HTTPException(status_code=503, detail="Event queue unavailable")
+            if queued:
+                self.pool.wake()
+            return SlackEventResponse(status="ok")
+
+        self.router = router
+        return router
+
+
+def _queue_keys(data: dict) -> tuple[str, str, str]:
+    """``event_id``, workspace and channel of an Events API envelope."""
+    event = data["event"]
+    channel_id = event.get("channel") or (event.get("assistant_thread") or {}).get("channel_id") or ""
+    team_id = data.get("team_id") or event.get("team") or ""
+    event_id = data.get("event_id") or f"{channel_id}:{event.get('event_ts') or event.get('ts')}"
+    return event_id, team_id, channel_id
+
+
+def _slack_user(item: ClaimedEvent) -> str | None:
+    """Workspace-qualified Slack user id of the event's author."""
+    event = item.payload.get("event") or {}
+    user = event.get("user") or (event.get("assistant_thread") or {}).get("user_id")
+    return f"slack:{item.team_id}:{user}" if user else None
@@ -0,0 +1,359 @@
+"""
+Slack Responder
+===============
+
+Runs the agent for one Slack event and posts the reply.
+
+This is agno's Slack event handling (``agno.os.interfaces.slack.router``)
+lifted out of the webhook so queue workers can call it: the webhook only
+acks and enqueues (see ``app/slack.py``). The task-card / streaming
+rendering still comes from agno's ``process_event`` and ``StreamState``;
+streamed replies go through ``CoalescingStream`` (``app/slack_stream.py``)
+instead of slack_sdk's per-chunk ``chat_stream`` helper.
+
+``SLACK_API_URL`` points the Web API client elsewhere, e.g. at the local
+fake Slack API in ``evals/fake_slack.py``.
+"""
+
+from os import getenv
+from ssl import SSLContext
+from typing import TYPE_CHECKING, Any, Literal, cast
+
+from agno.agent import Agent, RemoteAgent
+from agno.os.interfaces.slack.events import process_event
+from agno.os.interfaces.slack.helpers import (
+    BotNameResolver,
+    build_run_metadata,
+    download_event_files_async,
+    extract_event_context,
+    resolve_channel_name,
+    resolve_slack_user,
+    send_slack_message_async,
+    should_respond,
+    strip_bot_mention,
+    upload_response_media_async,
+)
+from agno.os.interfaces.slack.state import StreamState
+from agno.team import RemoteTeam, Team
+from agno.utils.log import log_error
+from agno.workflow import RemoteWorkflow, Workflow
+
+from app.slack_stream import CoalescingStream
+
+if TYPE_CHECKING:
+    from slack_sdk.web.async_chat_stream import AsyncChatStream
+
+SLACK_API_URL = getenv("SLACK_API_URL", "https://slack.com/api/")
+
+# Slack sends lifecycle events for bots with these subtypes; processing them
+# would make the bot answer its own messages.
+_IGNORED_SUBTYPES = frozenset(
+    {"bot_message", "bot_add", "bot_remove", "bot_enable", "bot_disable", "message_changed", "message_deleted"}
+)
+
+# User-facing error message for failed requests
+_ERROR_MESSAGE = "Sorry, there was an error processing your message."
+
+# Slack caps streamed messages at ~40K total payload (text + task card blocks)
+_STREAM_CHAR_LIMIT = 39000
+_STREAM_CARD_LIMIT = 45
+
+
+class SlackResponder:
+    """Process queued Slack event envelopes for one agent, team or workflow."""
+
+    def __init__(
+        self,
+        entity: Agent | RemoteAgent | Team | RemoteTeam | Workflow | RemoteWorkflow,
+        *,
+        token: str | None,
+        reply_to_mentions_only: bool = True,
+        streaming: bool = True,
+        loading_messages: list[str] | None = None,
+        task_display_mode: str = "plan",
+        loading_text: str = "Thinking...",
+        suggested_prompts: list[dict[str, str]] | None = None,
+        ssl: SSLContext | None = None,
+        max_file_size: int = 1_073_741_824,
+        resolve_user_identity: bool = False,
+    ) -> None:
+        self.entity = entity
+        self.entity_type: Literal["agent", "team", "workflow"] = (
+            "agent"
+            if isinstance(entity, (Agent, RemoteAgent))
+            else "team"
+            if isinstance(entity, (Team, RemoteTeam))
+            else "workflow"
+        )
+        raw_name = getattr(entity, "name", None)
+        self.entity_name = raw_name if isinstance(raw_name, str) else self.entity_type
+        # Namespaces session ids so threads don't collide across mounted interfaces
+        self.entity_id = getattr(entity, "id", None) or self.entity_name
+        # Same fallback and check as agno's SlackTools, which the stock router builds.
+        _token = token or getenv("SLACK_TOKEN")
+        if not _token:
+            raise ValueError("SLACK_TOKEN is not set")
+        self.token: str = _token
+        self.reply_to_mentions_only = reply_to_mentions_only
+        self.streaming = streaming
+        self.loading_messages = loading_messages
+        self.task_display_mode = task_display_mode
+        self.loading_text = loading_text
+        self.suggested_prompts = suggested_prompts
+        self.ssl = ssl
+        self.max_file_size = max_file_size
+        self.resolve_user_identity = resolve_user_identity
+        self.bot_name_resolver = BotNameResolver()
+
+    def wants(self, event: dict) -> bool:
+        """Cheap pre-filter run in the webhook, so ignored events are never queued."""
+        if event.get("type") == "assistant_thread_started":
+            return self.streaming
+        # Bot self-loop prevention: check bot_id at both the top-level event and
+        # inside message_changed's nested "message" object.
+        if event.get("bot_id") or (event.get("message") or {}).get("bot_id"):
+            return False
+        if event.get("subtype") in _IGNORED_SUBTYPES:
+            return False
+        return should_respond(event, self.reply_to_mentions_only)
+
+    async def handle(self, data: dict) -> None:
+        event = data["event"]
+        if event.get("type") == "assistant_thread_started":
+            await self._thread_started(event)
+        elif self.streaming:
+            await self._stream_response(data)
+        else:
+            await self._respond(data)
+
+    # -- Internals ------------------------------------------------------------
+
+    def _client(self) -> Any:
+        from slack_sdk.web.async_client import AsyncWebClient
+
+        return AsyncWebClient(token=self.token, ssl=self.ssl, base_url=SLACK_API_URL)
+
+    async def _prepare(self, data: dict, client: Any) -> tuple[dict, str]:
+        """Event context with the bot mention replaced by its display name, plus the session id."""
+        ctx = extract_event_context(data["event"])
+        bot_user_id = (data.get("authorizations") or [{}])[0].get("user_id")
+        bot_name = await self.bot_name_resolver.resolve(client, bot_user_id) if bot_user_id else None
+        ctx["message_text"] = strip_bot_mention(ctx["message_text"], bot_user_id, bot_name)
+        return ctx, f"{self.entity_id}:{ctx['thread_id']}"
+
+    async def _run_kwargs(self, data: dict, ctx: dict, client: Any, session_id: str) -> tuple[str, dict[str, Any]]:
+        resolved_user_id = ctx["user"]
+        display_name = None
+        if self.resolve_user_identity:
+            resolved_user_id, display_name = await resolve_slack_user(client, ctx["user"])
+        channel_name = await resolve_channel_name(client, ctx["channel_id"])
+        files, images, videos, audio, skipped = await download_event_files_async(
+            self.token, data["event"], self.max_file_size
+        )
+        message_text = ctx["message_text"]
+        if skipped:
+            message_text = "[Skipped files: " + ", ".join(skipped) + "]\n" + message_text
+        return message_text, {
+            "user_id": resolved_user_id,
+            "session_id": session_id,
+            "metadata": build_run_metadata(display_name, resolved_user_id, ctx),
+            "dependencies": {
+                "Slack channel": f"#{channel_name}" if channel_name else ctx["channel_id"],
+                "Slack channel_id": ctx["channel_id"],
+                "Slack thread_ts": ctx["thread_id"],
+            },
+            "add_dependencies_to_context": True,
+            "files": files or None,
+            "images": images or None,
+            "videos": videos or None,
+            "audio": audio or None,
+        }
+
+    async def _set_status(self, client: Any, ctx: dict, status: str, **extra: Any) -> None:
+        try:
+            await client.assistant_threads_setStatus(
+                channel_id=ctx["channel_id"], thread_ts=ctx["thread_id"], status=status, **extra
+            )
+        except Exception:
+            pass
+
+    async def _respond(self, data: dict) -> None:
+        """Non-streaming: run to completion, then post the reply."""
+        client = self._client()
+        ctx, session_id = await self._prepare(data, client)
+        await self._set_status(client, ctx, self.loading_text)
+        try:
+            message_text, run_kwargs = await self._run_kwargs(data, ctx, client, session_id)
+            response = await self.entity.arun(message_text, **run_kwargs)  # type: ignore[union-attr]
+            if not response:
+                return
+            if response.status == "ERROR":
+                log_error(f"Error processing message: {response.content}")
+                await send_slack_message_async(
+                    client,
+                    channel=ctx["channel_id"],
+                    message=f"{_ERROR_MESSAGE} Please try again later.",
+                    thread_ts=ctx["thread_id"],
+                )
+                return
+            if getattr(response, "reasoning_content", None):
+                formatted = "*Reasoning:*\n> " + str(response.reasoning_content).replace("\n", "\n> ")
+                await send_slack_message_async(
+                    client, channel=ctx["channel_id"], message=formatted, thread_ts=ctx["thread_id"]
+                )
+            content = str(response.content) if response.content else ""
+            await send_slack_message_async(
+                client, channel=ctx["channel_id"], message=content, thread_ts=ctx["thread_id"]
+            )
+            await upload_response_media_async(client, response, ctx["channel_id"], ctx["thread_id"])
+        except Exception as e:
+            log_error(f"Error processing slack event: {str(e)}")
+            await send_slack_message_async(
+                client, channel=ctx["channel_id"], message=_ERROR_MESSAGE, thread_ts=ctx["thread_id"]
+            )
+        finally:
+            await self._set_status(client, ctx, "")
+
+    async def _stream_response(self, data: dict) -> None:
+        """Streaming: open a Slack chat stream and render run events into it as they arrive."""
+        client = self._client()
+        event = data["event"]
+        ctx, session_id = await self._prepare(data, client)
+        # Not consistently placed across Slack event envelope shapes
+        team_id = data.get("team_id") or event.get("team")
+        # recipient_user_id must be the human who wrote the message, not the bot;
+        # streaming to the bot's id shows a blank bubble until the stream stops.
+        user_id = ctx["user"]
+        state = StreamState(entity_type=self.entity_type, entity_name=self.entity_name)
+        stream: CoalescingStream | None = None
+
+        async def open_stream() -> CoalescingStream:
+            return CoalescingStream(
+                client,
+                channel=ctx["channel_id"],
+                thread_ts=ctx["thread_id"],
+                recipient_team_id=team_id,
+                recipient_user_id=user_id,
+                task_display_mode=self.task_display_mode,
+            )
+
+        async def rotate_stream(pending_text: str = "") -> None:
+            """Close the current stream and open a new one, carrying over in-progress cards."""
+            nonlocal stream
+            assert stream is not None
+            in_progress = [(k, v.title) for k, v in state.task_cards.items() if v.status == "in_progress"]
+            rotate_stop: dict[str, Any] = {}
+            if state.task_cards:
+                rotate_stop["chunks"] = state.resolve_all_pending("complete")
+            await stream.stop(**rotate_stop)
+            new_stream = await open_stream()
+            state.task_cards.clear()
+            state.stream_chars_sent = 0
+            stream = new_stream
+            for key, card_title in in_progress:
+                state.track_task(key, card_title)
+                await stream.append(
+                    markdown_text="",
+                    chunks=[{"type": "task_update", "id": key, "title": card_title, "status": "in_progress"}],
+                )
+            if pending_text:
+                continued = "_(continued)_\n" + pending_text
+                await stream.append(markdown_text=continued)
+                state.stream_chars_sent = len(continued)
+
+        try:
+            status_extra = {"loading_messages": self.loading_messages} if self.loading_messages else {}
+            await self._set_status(client, ctx, self.loading_text, **status_extra)
+
+            message_text, run_kwargs = await self._run_kwargs(data, ctx, client, session_id)
+            # Event-level chunks drive task card and tool lifecycle rendering
+            run_kwargs.update(stream=True, stream_events=True)
+            response_stream = self.entity.arun(message_text, **run_kwargs)  # type: ignore[union-attr]
+            if response_stream is None:
+                await self._set_status(client, ctx, "")
+                return
+
+            # Opened late so "Thinking..." stays visible during file download and agent startup
+            stream = await open_stream()
+
+            async for chunk in response_stream:
+                state.collect_media(chunk)
+                ev = getattr(chunk, "event", None)
+                # process_event only calls append(), which CoalescingStream mirrors.
+                if ev and await process_event(ev, chunk, state, cast("AsyncChatStream", stream)):
+                    break
+                # Card overflow: rotate before Slack rejects the payload
+                if len(state.task_cards) >= _STREAM_CARD_LIMIT:
+                    await rotate_stream(state.flush() if state.has_content() else "")
+                if state.has_content():
+                    if not state.title_set:
+                        state.title_set = True
+                        title = ctx["message_text"][:50].strip() or "New conversation"
+                        try:
+                            await client.assistant_threads_setTitle(
+                                channel_id=ctx["channel_id"], thread_ts=ctx["thread_id"], title=title
+                            )
+                        except Exception:
+                            pass
+                    content = state.flush()
+                    if state.stream_chars_sent + len(content) <= _STREAM_CHAR_LIMIT:
+                        await stream.append(markdown_text=content)
+                        state.stream_chars_sent += len(content)
+                    else:
+                        await rotate_stream(content)
+
+            # Default to complete when no terminal error/cancel event arrived
+            final_status: Literal["in_progress", "complete", "error"] = state.terminal_status or "complete"
+            stop_kwargs: dict[str, Any] = {}
+            if state.has_content():
+                stop_kwargs["markdown_text"] = state.flush()
+            if state.task_cards:
+                stop_kwargs["chunks"] = state.resolve_all_pending(final_status)
+            await stream.stop(**stop_kwargs)
+            await upload_response_media_async(client, state, ctx["channel_id"], ctx["thread_id"])
+
+        except Exception as e:
+            slack_resp = getattr(e, "response", None)
+            slack_body = slack_resp.data if slack_resp else None
+            slack_error = slack_body.get("error", "") if isinstance(slack_body, dict) else ""
+            is_msg_too_long = "msg_too_long" in slack_error or "msg_blocks_too_long" in slack_error
+            if not is_msg_too_long:
+                is_msg_too_long = "msg_too_long" in str(e)
+            if not is_msg_too_long:
+                log_error(
+                    f"Error streaming slack response [channel={ctx['channel_id']}, thread={ctx['thread_id']}, user={user_id}]: {e}"
+                )
+            await self._set_status(client, ctx, "")
+            # Close the open stream so Slack doesn't show stuck progress indicators
+            if stream is not None:
+                try:
+                    stop_kwargs_err: dict[str, Any] = {}
+                    if state.task_cards:
+                        stop_kwargs_err["chunks"] = state.resolve_all_pending(
+                            "complete" if is_msg_too_long else "error"
+                        )
+                    await stream.stop(**stop_kwargs_err)
+                except Exception:
+                    pass
+            if not is_msg_too_long:
+                await send_slack_message_async(
+                    client, channel=ctx["channel_id"], message=_ERROR_MESSAGE, thread_ts=ctx["thread_id"]
+                )
+
+    async def _thread_started(self, event: dict) -> None:
+        # setSuggestedPrompts requires "Agents & AI Apps" mode (streaming UX only)
+        thread_info = event.get("assistant_thread", {})
+        channel_id = thread_info.get("channel_id", "")
+        thread_ts = thread_info.get("thread_ts", "")
+        if not channel_id or not thread_ts:
+            return
+        prompts = self.suggested_prompts or [
+            {"title": "Help", "message": "What can you help me with?"},
+            {"title": "Search", "message": "Search the web for..."},
+        ]
+        try:
+            await self._client().assistant_threads_setSuggestedPrompts(
+                channel_id=channel_id, thread_ts=thread_ts, prompts=prompts
+            )
+        except Exception as e:
+            log_error(f"Failed to set suggested prompts: {str(e)}")
@@ -0,0 +1,298 @@
+"""
+Slack Stream Writer
+===================
+
+Coalescing replacement for slack_sdk's ``AsyncChatStream`` (the helper
+behind ``client.chat_stream()``), used for streamed Slack replies.
+
+The SDK helper calls ``chat.appendStream`` every ``buffer_size``
+characters and on every task card update, so a long answer with a few
+tool calls turns into hundreds of API calls and runs into Slack's rate
+limits. ``CoalescingStream`` keeps the same ``append()`` / ``stop()``
+interface but only buffers; a background flusher sends everything
+pending in one ``chat.appendStream`` call when either:
+
+- ``SLACK_STREAM_INTERVAL`` seconds have passed since the last flush, or
+- ``SLACK_STREAM_MAX_CHARS`` characters are waiting.
+
+Text is merged into one markdown chunk and repeated updates of the same
+task card collapse into the latest one, keeping their order.
+
+On a 429 the batch is kept, the flusher waits for ``Retry-After`` and
+the flush interval doubles (up to ``SLACK_STREAM_MAX_INTERVAL``); it
+eases back after successful flushes. ``stop()`` always sends whatever is
+still pending in the final ``chat.stopStream``, retried on 429, so the
+finished message is complete however much was throttled on the way.
+
+Flush counts, 429s, flush latency and batch sizes are at ``/ops/slack``
+(``stream``). ``python -m evals slack-stream`` runs the writer against a
+local fake Slack API (``evals/fake_slack.py``).
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import suppress
+from os import getenv
+from typing import Any
+
+from agno.utils.log import log_debug, log_warning
+
+from app.stats import percentiles
+
+SLACK_STREAM_INTERVAL = float(getenv("SLACK_STREAM_INTERVAL", "1.0"))
+SLACK_STREAM_MAX_INTERVAL = float(getenv("SLACK_STREAM_MAX_INTERVAL", "10.0"))
+SLACK_STREAM_MAX_CHARS = int(getenv("SLACK_STREAM_MAX_CHARS", "2000"))
+
+# Slack's limit for one markdown_text chunk.
+_MARKDOWN_CHUNK_LIMIT = 12000
+_FINAL_ATTEMPTS = 4
+
+
+class SlackStreamStats:
+    """Process-wide counters for ``/ops/slack``."""
+
+    def __init__(self) -> None:
+        self.streams = 0
+        self.appends = 0
+        self.flushes = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.chars = 0
+        self.flush_seconds: deque[float] = deque(maxlen=1000)
+        self.final_seconds: deque[float] = deque(maxlen=1000)
+        self.batch_chars: deque[int] = deque(maxlen=1000)
+
+    def snapshot(self) -> dict:
+        return {
+            "streams": self.streams,
+            "appends": self.appends,
+            "flushes": self.flushes,
+            "appends_per_flush": round(self.appends / self.flushes, 1) if self.flushes else None,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "chars": self.chars,
+            "flush_ms": percentiles(self.flush_seconds, scale=1000, digits=1),
+            "final_ms": percentiles(self.final_seconds, scale=1000, digits=1),
+            "batch_chars": percentiles(self.batch_chars, digits=1),
+            "budget": {
+                "interval": SLACK_STREAM_INTERVAL,
+                "max_interval": SLACK_STREAM_MAX_INTERVAL,
+                "max_chars": SLACK_STREAM_MAX_CHARS,
+            },
+        }
+
+
+slack_stream_stats = SlackStreamStats()
+
+
+class CoalescingStream:
+    """Batched ``chat.startStream`` / ``appendStream`` / ``stopStream`` for one reply."""
+
+    def __init__(
+        self,
+        client: Any,
+        *,
+        channel: str,
+        thread_ts: str,
+        recipient_team_id: str | None = None,
+        recipient_user_id: str | None = None,
+        task_display_mode: str | None = None,
+        interval: float = SLACK_STREAM_INTERVAL,
+        max_interval: float = SLACK_STREAM_MAX_INTERVAL,
+        max_chars: int = SLACK_STREAM_MAX_CHARS,
+        stats: SlackStreamStats = slack_stream_stats,
+    ) -> None:
+        self._client = client
+        self._channel = channel
+        self._start_args = {
+            "channel": channel,
+            "thread_ts": thread_ts,
+            "recipient_team_id": recipient_team_id,
+            "recipient_user_id": recipient_user_id,
+            "task_display_mode": task_display_mode,
+        }
+        self.base_interval = interval
+        self.interval = interval
+        self.max_interval = max_interval
+        self.max_chars = max_chars
+        self.stats = stats
+        self.ts: str | None = None
+        self.flushes = 0
+        self._pending: list[dict] = []
+        self._pending_chars = 0
+        self._last_flush = 0.0
+        self._blocked_until = 0.0
+        self._error: BaseException | None = None
+        self._stopped = False
+        self._ready = asyncio.Event()
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    async def append(self, *, markdown_text: str | None = None, chunks: list[dict] | None = None) -> None:
+        """Queue text and/or task card chunks; they are sent by the next flush."""
+        self._raise_error()
+        if self._stopped:
+            raise RuntimeError("Cannot append to a stopped Slack stream")
+        if not self._queue(markdown_text, chunks):
+            return
+        self.stats.appends += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"slack-stream-{self._channel}")
+        self._ready.set()
+        if self._pending_chars >= self.max_chars:
+            self._full.set()
+
+    async def stop(self, *, markdown_text: str | None = None, chunks: list[dict] | None = None) -> None:
+        """Send everything still pending and finalize the message. Later calls are no-ops."""
+        if self._stopped:
+            return
+        self._stopped = True
+        started = time.perf_counter()
+        async with self._lock:
+            if self._task is not None:
+                self._task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await self._task
+        error, self._error = self._error, None
+        self._queue(markdown_text, chunks)
+        batch, self._pending, self._pending_chars = self._pending, [], 0
+        for attempt in range(_FINAL_ATTEMPTS):
+            await self._wait_blocked()
+            try:
+                if self.ts is None:
+                    await self._start([])
+                await self._client.chat_stopStream(channel=self._channel, ts=self.ts, chunks=_split_markdown(batch))
+                break
+            except Exception as exc:
+                if attempt + 1 == _FINAL_ATTEMPTS or not self._rate_limited(exc):
+                    self.stats.errors += 1
+                    raise
+        self.stats.streams += 1
+        self.stats.final_seconds.append(time.perf_counter() - started)
+        self.stats.chars += sum(len(c["text"]) for c in batch if c["type"] == "markdown_text")
+        log_debug(f"Slack stream {self.ts} finished after {self.flushes} flush(es)")
+        if error is not None:
+            # A mid-stream update failed; the message is closed, now let the caller handle it.
+            raise error
+
+    # -- Internals ------------------------------------------------------------
+
+    def _queue(self, markdown_text: str | None, chunks: list[dict] | None) -> bool:
+        """Merge into the pending batch. Returns False when there was nothing to add."""
+        added = False
+        if markdown_text:
+            if self._pending and self._pending[-1]["type"] == "markdown_text":
+                self._pending[-1]["text"] += markdown_text
+            else:
+                self._pending.append({"type": "markdown_text", "text": markdown_text})
+            self._pending_chars += len(markdown_text)
+            added = True
+        for chunk in chunks or []:
+            chunk = dict(chunk)
+            if chunk.get("type") == "task_update":
+                # Only the latest state of a card matters; keep its first position.
+                for i, queued in enumerate(self._pending):
+                    if queued.get("type") == "task_update" and queued.get("id") == chunk.get("id"):
+                        self._pending[i] = chunk
+                        break
+                else:
+                    self._pending.append(chunk)
+            else:
+                self._pending.append(chunk)
+            added = True
+        return added
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._error is None:
+            await self._ready.wait()
+            wait = self._last_flush + self.interval - loop.time()
+            if wait > 0 and self._pending_chars < self.max_chars:
+                self._full.clear()
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(self._full.wait(), wait)
+            await self._wait_blocked()
+            async with self._lock:
+                await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            self._ready.clear()
+            return
+        batch, chars = self._pending, self._pending_chars
+        self._pending, self._pending_chars = [], 0
+        self._ready.clear()
+        self._full.clear()
+        started = time.perf_counter()
+        try:
+            if self.ts is None:
+                await self._start(_split_markdown(batch))
+            else:
+                await self._client.chat_appendStream(channel=self._channel, ts=self.ts, chunks=_split_markdown(batch))
+        except Exception as exc:
+            if not self._rate_limited(exc):
+                # Surfaced to the responder on its next append() / stop().
+                self.stats.errors += 1
+                self._error = exc
+                return
+            # Put the batch back in front of anything queued meanwhile.
+            queued, self._pending, self._pending_chars = self._pending, batch, chars
+            for chunk in queued:
+                if chunk["type"] == "markdown_text":
+                    self._queue(chunk["text"], None)
+                else:
+                    self._queue(None, [chunk])
+            self._ready.set()
+            return
+        self._last_flush = asyncio.get_running_loop().time()
+        self.flushes += 1
+        self.interval = max(self.base_interval, self.interval * 0.75)
+        self.stats.flushes += 1
+        self.stats.chars += chars
+        self.stats.batch_chars.append(chars)
+        self.stats.flush_seconds.append(time.perf_counter() - started)
+
+    async def _start(self, chunks: list[dict]) -> None:
+        args = {k: v for k, v in self._start_args.items() if v is not None}
+        response = await self._client.chat_startStream(**args, chunks=chunks or None)
+        self.ts = str(response["ts"])
+
+    def _rate_limited(self, exc: Exception) -> bool:
+        """Back off on a 429; returns False for any other error."""
+        response = getattr(exc, "response", None)
+        if getattr(response, "status_code", None) != 429:
+            return False
+        headers = getattr(response, "headers", None) or {}
+        retry_after = float(headers.get("Retry-After") or headers.get("retry-after") or self.interval)
+        self.stats.rate_limited += 1
+        self.interval = min(self.max_interval, max(self.interval * 2, retry_after))
+        self._blocked_until = asyncio.get_running_loop().time() + retry_after
+        log_warning(
+            f"Slack rate limited stream updates; retrying in {retry_after:.1f}s, flushing every {self.interval:.1f}s"
+        )
+        return True
+
+    async def _wait_blocked(self) -> None:
+        delay = self._blocked_until - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+def _split_markdown(chunks: list[dict]) -> list[dict]:
+    """Split markdown chunks longer than Slack accepts in one chunk."""
+    out: list[dict] = []
+    for chunk in chunks:
+        text = chunk.get("text", "") if chunk["type"] == "markdown_text" else ""
+        if len(text) <= _MARKDOWN_CHUNK_LIMIT:
+            out.append(chunk)
+            continue
+        for i in range(0, len(text), _MARKDOWN_CHUNK_LIMIT):
+            out.append({"type": "markdown_text", "text": text[i : i + _MARKDOWN_CHUNK_LIMIT]})
+    return out
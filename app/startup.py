@@ -0,0 +1,52 @@
+"""
+Startup Timing
+==============
+
+Wall-clock breakdown of cold start, per phase.
+
+    with startup.phase("agent_os"):
+        agent_os = AgentOS(...)
+
+Phases are recorded in order (nested phases appear after their parent
+finishes) and logged as one line once the app is ready. ``/ops/startup``
+returns the same numbers.
+"""
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from agno.utils.log import log_info
+
+
+class StartupTimer:
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+        self.ready_after: float | None = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases.append((name, seconds))
+
+    def ready(self) -> None:
+        """Mark the app as ready to serve and log the breakdown."""
+        self.ready_after = time.perf_counter() - self.origin
+        breakdown = " | ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases)
+        log_info(f"Startup: {breakdown} | ready after {self.ready_after:.2f}s")
+
+    def snapshot(self) -> dict:
+        return {
+            "phases": [{"name": name, "seconds": round(seconds, 4)} for name, seconds in self.phases],
+            "ready_after": self.ready_after,
+        }
+
+
+startup = StartupTimer()
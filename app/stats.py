@@ -0,0 +1,44 @@
+"""
+Stats
+=====
+
+Percentiles of the samples behind the ``/ops/*`` endpoints and the
+``python -m evals`` reports.
+"""
+
+import math
+from collections.abc import Iterable
+
+REPORT_PERCENTILES = (50, 95, 99)
+
+
+def percentile(values: Iterable[float], q: float) -> float | None:
+    """Linear-interpolated percentile (``q`` in 0-100); None when there are no values."""
+    return _interpolate(sorted(values), q)
+
+
+def percentiles(samples: Iterable[float] | None, *, scale: float = 1.0, digits: int = 3) -> dict:
+    """``count``, ``p50``, ``p95`` and ``max`` of ``samples`` times ``scale``, for an ops snapshot."""
+    ordered = sorted(s * scale for s in samples or ())
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "p50": round(_interpolate(ordered, 50) or 0.0, digits),
+        "p95": round(_interpolate(ordered, 95) or 0.0, digits),
+        "max": round(ordered[-1], digits),
+    }
+
+
+def distribution(values: Iterable[float]) -> dict[str, float | None]:
+    """``p50`` / ``p95`` / ``p99`` and ``n``, for a benchmark report."""
+    ordered = sorted(values)
+    return {f"p{q}": _interpolate(ordered, q) for q in REPORT_PERCENTILES} | {"n": len(ordered)}
+
+
+def _interpolate(ordered: list[float], q: float) -> float | None:
+    if not ordered:
+        return None
+    rank = (len(ordered) - 1) * q / 100
+    lo, hi = math.floor(rank), math.ceil(rank)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (rank - lo)
@@ -0,0 +1,371 @@
+"""
+Tool Output Compaction
+======================
+
+Cuts large fetched pages down to the passages relevant to the question
+before they reach the model, plugged into an Agent through
+``tool_hooks=[..., tool_output.hook, web_cache.hook]``.
+
+Without it, a ``web_fetch`` / ``parallel_extract`` result goes into the
+prompt whole, is stored in the session, and is replayed as history on
+later turns. When a result is longer than ``TOOL_OUTPUT_TOKEN_BUDGET``
+tokens, the page text goes through one pass of:
+
+1. boilerplate stripping: navigation, cookie / subscribe / share lines,
+   image and link-only lines, and short lines repeated across the page;
+2. chunking into passages of about ``_PASSAGE_TOKENS`` tokens, each
+   under the nearest heading;
+3. BM25 scoring of each passage against the question: the tool's own
+   ``objective`` / ``search_queries`` arguments plus the user's latest
+   message;
+4. keeping the best passages, in page order, until the budget is used.
+
+The full output is stored out of line (``db/tool_outputs.py``) and the
+compacted result carries its id; the agent can ask for other parts of
+it with the ``read_stored_output(output_id, query)`` tool. For
+``parallel_extract`` each URL's content is compacted separately, with
+an equal share of the budget. Results served from the web cache are
+compacted the same way, so the cache keeps whole pages.
+
+Tokens before and after, and compaction time, are at
+``/ops/tool-output``; ``python -m evals tool-output`` compares tokens and
+time to first token with and without compaction.
+"""
+
+import asyncio
+import json
+import math
+import re
+import time
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from dataclasses import dataclass
+from os import getenv
+from typing import Any
+
+from agno.run.base import RunContext
+from agno.tools.function import ToolResult
+from agno.utils.log import log_warning
+from agno.utils.tokens import count_text_tokens
+
+from app.stats import percentiles
+from db.tool_outputs import ToolOutputStore
+
+TOOL_OUTPUT_COMPACTION = getenv("TOOL_OUTPUT_COMPACTION", "True").lower() in ("1", "true", "yes")
+TOOL_OUTPUT_TOKEN_BUDGET = int(getenv("TOOL_OUTPUT_TOKEN_BUDGET", "2000"))
+TOOL_OUTPUT_RETENTION = int(getenv("TOOL_OUTPUT_RETENTION", "604800"))
+
+_PASSAGE_TOKENS = 150
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+_BOILERPLATE = re.compile(
+    r"\b(cookies?|privacy policy|terms of (?:use|service)|all rights reserved|subscribe|newsletter|sign (?:in|up)"
+    r"|log ?in|share (?:on|this)|follow us|skip to (?:main )?content|advertisement|accept all|enable javascript"
+    r"|back to top|related (?:posts|articles)|read more)\b|©",
+    re.IGNORECASE,
+)
+_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or that the this to was what when where "
+    "which who why will with you your about does do can me my".split()
+)
+
+
+@dataclass
+class Passage:
+    position: int
+    text: str
+    tokens: int
+    terms: Counter[str]
+    score: float = 0.0
+
+
+class ToolOutputStats:
+    """Process-wide counters for ``/ops/tool-output``."""
+
+    def __init__(self) -> None:
+        self.calls: Counter[str] = Counter()
+        self.compacted: Counter[str] = Counter()
+        self.tokens_before: Counter[str] = Counter()
+        self.tokens_after: Counter[str] = Counter()
+        self.seconds: deque[float] = deque(maxlen=1000)
+        self.store_errors = 0
+        self.reads = 0
+
+    def snapshot(self) -> dict:
+        tools = {}
+        for tool in sorted(self.calls):
+            before, after = self.tokens_before[tool], self.tokens_after[tool]
+            tools[tool] = {
+                "calls": self.calls[tool],
+                "compacted": self.compacted[tool],
+                "tokens_before": before,
+                "tokens_after": after,
+                "kept_ratio": round(after / before, 4) if before else None,
+            }
+        return {
+            "tools": tools,
+            "compaction_seconds": percentiles(self.seconds),
+            "stored_reads": self.reads,
+            "store_errors": self.store_errors,
+        }
+
+
+class ToolOutputCompactor:
+    """Tool hook that compacts the results of ``tools`` (name → the argument holding the URL(s))."""
+
+    def __init__(
+        self,
+        tools: dict[str, str],
+        *,
+        token_budget: int = TOOL_OUTPUT_TOKEN_BUDGET,
+        enabled: bool = TOOL_OUTPUT_COMPACTION,
+        store: ToolOutputStore | None = None,
+    ) -> None:
+        self.tools = tools
+        self.token_budget = token_budget
+        self.enabled = enabled
+        self.store = store or ToolOutputStore(retention=TOOL_OUTPUT_RETENTION)
+        self.stats = ToolOutputStats()
+
+    def __deepcopy__(self, memo: dict) -> "ToolOutputCompactor":
+        # AgentOS deep-copies the agent (and its hook and tool lists) per request; the stats stay shared.
+        return self
+
+    # -- Hook -----------------------------------------------------------------
+
+    async def hook(
+        self,
+        function_name: str,
+        function_call: Callable[..., Awaitable[Any]],
+        arguments: dict,
+        run_context: RunContext | None = None,
+    ) -> Any:
+        """Agno tool hook: call through, then compact the result if it is over budget."""
+        result = await function_call(**arguments)
+        if not self.enabled or function_name not in self.tools:
+            return result
+        content = result.content if _is_plain_tool_result(result) else result
+        if not isinstance(content, str) or not content:
+            return result
+        self.stats.calls[function_name] += 1
+        query = _query(arguments, run_context)
+        source = arguments.get(self.tools[function_name])
+        source = ", ".join(source) if isinstance(source, list) else str(source or "")
+        started = time.perf_counter()
+        compacted, before, after = await asyncio.to_thread(self._compact, function_name, source, content, query)
+        self.stats.seconds.append(time.perf_counter() - started)
+        self.stats.tokens_before[function_name] += before
+        self.stats.tokens_after[function_name] += after
+        if compacted is None:
+            return result
+        self.stats.compacted[function_name] += 1
+        return ToolResult(content=compacted) if isinstance(result, ToolResult) else compacted
+
+    # -- Tool -----------------------------------------------------------------
+
+    async def read_stored_output(self, output_id: str, query: str) -> str:
+        """Read other parts of a fetched page that was trimmed to the passages relevant to the question.
+
+        Args:
+            output_id (str): The id from the trimmed result, e.g. "out_3f2a9c...".
+            query (str): What to look for in the page. The most relevant passages are returned.
+
+        Returns:
+            str: The passages of the stored page most relevant to the query.
+        """
+        try:
+            stored = await asyncio.to_thread(self.store.get, output_id)
+        except Exception as exc:
+            return json.dumps({"error": f"Could not read {output_id}: {exc}"})
+        if stored is None:
+            return json.dumps({"error": f"{output_id} is unknown or has expired; fetch the page again."})
+        self.stats.reads += 1
+        source, content = stored
+        text, _, _ = await asyncio.to_thread(compact_text, content, query, self.token_budget)
+        return f"[{output_id} from {source}, passages most relevant to {query!r}]\n\n{text}"
+
+    def snapshot(self) -> dict:
+        return {"enabled": self.enabled, "token_budget": self.token_budget, **self.stats.snapshot()}
+
+    # -- Internals ------------------------------------------------------------
+
+    def _compact(self, tool_name: str, source: str, content: str, query: str) -> tuple[str | None, int, int]:
+        """``(compacted, tokens before, tokens after)``; compacted is None when the output is left as is."""
+        before = count_text_tokens(content)
+        if before <= self.token_budget:
+            return None, before, before
+        payload = json_object(content)
+        if isinstance(payload, dict) and isinstance(payload.get("results"), list) and payload["results"]:
+            compacted = self._compact_results(tool_name, payload, query)
+        else:
+            output_id = self._put(tool_name, source, content)
+            text, kept, total = compact_text(content, query, self.token_budget)
+            compacted = f"{_note(output_id, kept, total, before)}\n\n{text}"
+        return compacted, before, count_text_tokens(compacted)
+
+    def _compact_results(self, tool_name: str, payload: dict, query: str) -> str:
+        """Compact each result of a ``parallel_extract``-style payload within an equal share of the budget."""
+        budget = max(_PASSAGE_TOKENS, self.token_budget // len(payload["results"]))
+        for item in payload["results"]:
+            if not isinstance(item, dict):
+                continue
+            page = item.get("full_content") or "\n\n".join(item.get("excerpts") or [])
+            if not isinstance(page, str) or count_text_tokens(page) <= budget:
+                continue
+            output_id = self._put(tool_name, str(item.get("url") or ""), page)
+            text, kept, total = compact_text(page, f"{item.get('title') or ''} {query}", budget)
+            item.pop("full_content", None)
+            item["excerpts"] = text.split("\n\n[…]\n\n")
+            item["output_id"] = output_id
+            item["note"] = f"{kept} of {total} passages kept; read_stored_output(output_id, query) for the rest."
+        return json.dumps(payload, indent=2)
+
+    def _put(self, tool_name: str, source: str, content: str) -> str:
+        try:
+            return self.store.put(tool_name, source, content)
+        except Exception as exc:
+            log_warning(f"Could not store full {tool_name} output: {exc}")
+            self.stats.store_errors += 1
+            return ToolOutputStore.output_id(content)
+
+
+# ---------------------------------------------------------------------------
+# Extraction
+# ---------------------------------------------------------------------------
+
+
+def strip_boilerplate(lines: Iterable[str]) -> Iterator[str]:
+    """Drop navigation, consent, share and link-only lines; pass the rest through."""
+    lines = list(lines)
+    repeated = Counter(line.strip() for line in lines if 0 < len(line.strip()) < 80)
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            yield ""
+            continue
+        if len(stripped) < 80 and repeated[stripped] > 1:
+            continue
+        if len(stripped) < 200 and _BOILERPLATE.search(stripped):
+            continue
+        without_links = _LINK.sub("", stripped).strip(" |•·-*>")
+        if stripped.startswith("![") or len(without_links) < 0.4 * len(stripped):
+            continue
+        yield line.rstrip()
+
+
+def passages(lines: Iterable[str], size: int = _PASSAGE_TOKENS) -> Iterator[str]:
+    """Pack paragraphs into passages of about ``size`` tokens, each prefixed with its section heading."""
+    heading = ""
+    buffer: list[str] = []
+    length = 0
+    for line in lines:
+        if line.startswith("#"):
+            if buffer:
+                yield "\n".join(buffer)
+            heading, buffer, length = line.strip(), [], 0
+            continue
+        if not line:
+            if length >= size:
+                yield "\n".join(buffer)
+                buffer, length = [], 0
+            continue
+        if not buffer and heading:
+            buffer.append(heading)
+        buffer.append(line)
+        length += len(line) // 4
+    if buffer:
+        yield "\n".join(buffer)
+
+
+def compact_text(content: str, query: str, budget: int) -> tuple[str, int, int]:
+    """The passages of ``content`` most relevant to ``query`` within ``budget`` tokens, in page order.
+
+    Returns ``(text, passages kept, passages total)``.
+    """
+    chunks = [
+        Passage(i, text, count_text_tokens(text), Counter(_terms(text)))
+        for i, text in enumerate(passages(strip_boilerplate(content.splitlines())))
+    ]
+    if not chunks:
+        return "", 0, 0
+    _bm25(chunks, Counter(_terms(query)))
+    # Passages that don't match the question at all only fill the budget when nothing matches (then: the lead).
+    candidates = [c for c in chunks if c.score > 0] or chunks
+    kept: list[Passage] = []
+    used = 0
+    for chunk in sorted(candidates, key=lambda c: (-c.score, c.position)):
+        if used + chunk.tokens > budget:
+            continue
+        kept.append(chunk)
+        used += chunk.tokens
+    if not kept:
+        # A single passage larger than the whole budget: keep its head.
+        best = min(chunks, key=lambda c: (-c.score, c.position))
+        return best.text[: budget * 4], 1, len(chunks)
+    kept.sort(key=lambda c: c.position)
+    parts: list[str] = []
+    for previous, chunk in zip([None, *kept], kept):
+        if parts and previous is not None and chunk.position != previous.position + 1:
+            parts.append("[…]")
+        parts.append(chunk.text)
+    return "\n\n".join(parts), len(kept), len(chunks)
+
+
+def _bm25(chunks: list[Passage], query: Counter[str]) -> None:
+    if not query:
+        return
+    lengths = [sum(c.terms.values()) for c in chunks]
+    average = sum(lengths) / len(chunks) or 1.0
+    frequency = Counter(term for c in chunks for term in c.terms.keys() & query.keys())
+    for chunk, length in zip(chunks, lengths):
+        score = 0.0
+        for term in query:
+            tf = chunk.terms.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(chunks) - frequency[term] + 0.5) / (frequency[term] + 0.5))
+            score += idf * tf * (_BM25_K1 + 1) / (tf + _BM25_K1 * (1 - _BM25_B + _BM25_B * length / average))
+        chunk.score = score
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _terms(text: str) -> list[str]:
+    return [w for w in _WORD.findall(text.casefold()) if w not in _STOPWORDS and len(w) > 1]
+
+
+def _query(arguments: dict, run_context: RunContext | None) -> str:
+    """The tool's own focus arguments plus the user's latest message."""
+    parts = [str(arguments.get("objective") or "")]
+    parts += [str(q) for q in arguments.get("search_queries") or arguments.get("queries") or []]
+    for message in reversed((run_context.messages if run_context else None) or []):
+        if message.role == "user" and isinstance(message.content, str):
+            parts.append(message.content)
+            break
+    return " ".join(p for p in parts if p)
+
+
+def _note(output_id: str, kept: int, total: int, tokens: int) -> str:
+    return (
+        f"[Trimmed to the {kept} of {total} passages most relevant to the question ({tokens} tokens in full). "
+        f"Full page stored as {output_id}; call read_stored_output(output_id, query) for other parts.]"
+    )
+
+
+def _is_plain_tool_result(result: Any) -> bool:
+    return isinstance(result, ToolResult) and not (result.images or result.videos or result.audios or result.files)
+
+
+def json_object(content: str) -> Any:
+    """``content`` parsed when it is a JSON object (a tool error or structured result), else None."""
+    if not content.lstrip().startswith("{"):
+        return None
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return None
@@ -0,0 +1,349 @@
+"""
+Tracing
+=======
+
+Sampled, batched span export for AgentOS tracing.
+
+agno's default tracing exports every span synchronously, from the thread
+that ended it, into the database that serves sessions and memory: a run
+pays for two writes per span on its own critical path. ``tracing.setup()``
+installs the tracer provider before AgentOS does (agno keeps a provider
+that is already set) with:
+
+- head sampling: ``TRACE_HEAD_SAMPLE_RATE`` of traces are recorded at
+  all. Traces dropped here cost nothing, but their errors are lost too;
+- tail sampling: when a trace's root span ends, the trace is kept if any
+  span errored or the root took at least ``TRACE_SLOW_MS``, otherwise
+  with probability ``TRACE_SAMPLE_RATE`` (decided from the trace id, so
+  every worker agrees);
+- an in-memory buffer of kept spans (at most ``TRACE_BUFFER_SPANS``,
+  newest dropped on overflow) that a lifespan task exports in batches of
+  ``TRACE_BATCH_SPANS`` every ``TRACE_FLUSH_INTERVAL`` seconds, or as soon
+  as a batch is full, from a thread so the event loop never blocks on it.
+
+Spans go to ``get_trace_db()``: the main database, or ``TRACE_DB_URL``
+when set. The same task rolls traces older than
+``TRACE_RETENTION_DAYS`` up into daily aggregates and deletes them every
+``TRACE_RETENTION_INTERVAL`` seconds (see ``db/trace_retention.py``).
+Sampling decisions, buffer depth, export latency and drops are at
+``/ops/traces``.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from os import getenv
+from typing import Any
+
+from agno.db.postgres import PostgresDb
+from agno.tracing.exporter import DatabaseSpanExporter
+from agno.utils.log import log_info, log_warning
+from openinference.instrumentation.agno import AgnoInstrumentor
+from opentelemetry import trace as trace_api
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+
+from app.stats import percentiles
+from db.trace_retention import RollupResult, TraceRetention
+
+TRACE_HEAD_SAMPLE_RATE = float(getenv("TRACE_HEAD_SAMPLE_RATE", "1.0"))
+TRACE_SAMPLE_RATE = float(getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SLOW_MS = int(getenv("TRACE_SLOW_MS", "10000"))
+TRACE_BUFFER_SPANS = int(getenv("TRACE_BUFFER_SPANS", "20000"))
+TRACE_BATCH_SPANS = int(getenv("TRACE_BATCH_SPANS", "500"))
+TRACE_FLUSH_INTERVAL = float(getenv("TRACE_FLUSH_INTERVAL", "5.0"))
+TRACE_RETENTION_DAYS = int(getenv("TRACE_RETENTION_DAYS", "14"))
+TRACE_RETENTION_INTERVAL = float(getenv("TRACE_RETENTION_INTERVAL", "3600"))
+
+# A trace whose root never ends (e.g. a cancelled run) is decided without it after this long.
+_PENDING_TIMEOUT = 900.0
+# Decisions remembered for spans that end after their root.
+_DECISIONS = 10_000
+
+
+class TracingStats:
+    """Process-wide counters for ``/ops/traces``."""
+
+    def __init__(self) -> None:
+        self.traces: dict[str, int] = {"error": 0, "slow": 0, "sampled": 0, "dropped": 0}
+        self.spans_exported = 0
+        self.spans_dropped_overflow = 0
+        self.export_failures = 0
+        self.export_seconds: deque[float] = deque(maxlen=1000)
+        self.batch_spans: deque[int] = deque(maxlen=1000)
+        self.last_rollup: dict[str, Any] | None = None
+        self.rollup_failures = 0
+
+    def snapshot(self) -> dict:
+        kept = self.traces["error"] + self.traces["slow"] + self.traces["sampled"]
+        decided = kept + self.traces["dropped"]
+        return {
+            "traces": dict(self.traces),
+            "kept_ratio": round(kept / decided, 3) if decided else None,
+            "spans_exported": self.spans_exported,
+            "spans_dropped_overflow": self.spans_dropped_overflow,
+            "export_failures": self.export_failures,
+            "export_ms": percentiles(self.export_seconds, scale=1000, digits=1),
+            "batch_spans": percentiles(self.batch_spans, digits=1),
+            "last_rollup": self.last_rollup,
+            "rollup_failures": self.rollup_failures,
+        }
+
+
+class _PendingTrace:
+    def __init__(self) -> None:
+        self.spans: list[Any] = []
+        self.first_seen = time.monotonic()
+
+
+class SampledSpanBuffer(SpanProcessor):
+    """Span processor that tail-samples whole traces into a bounded buffer; ``TraceExport`` drains it."""
+
+    def __init__(
+        self,
+        *,
+        sample_rate: float,
+        slow_ms: int,
+        max_spans: int,
+        batch_spans: int,
+        stats: TracingStats,
+    ) -> None:
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_spans = max_spans
+        self.batch_spans = batch_spans
+        self.stats = stats
+        self.buffer: deque[ReadableSpan] = deque()
+        self.pending: dict[int, _PendingTrace] = {}
+        self.decisions: OrderedDict[int, bool] = OrderedDict()
+        self.lock = threading.Lock()
+        self._pending_spans = 0
+        self._wake: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake_requested = False
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        with self.lock:
+            decision = self.decisions.get(trace_id)
+            if decision is not None:
+                if decision:
+                    self._keep([span])
+                return
+            pending = self.pending.get(trace_id)
+            if pending is None:
+                pending = self.pending[trace_id] = _PendingTrace()
+            if self._pending_spans + len(self.buffer) < self.max_spans:
+                pending.spans.append(span)
+                self._pending_spans += 1
+            else:
+                self.stats.spans_dropped_overflow += 1
+            if span.parent is None or span.parent.is_remote:
+                self._decide(trace_id, root=span)
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+    # -- Used by TraceExport -----------------------------------------------
+
+    def attach(self, loop: asyncio.AbstractEventLoop, wake: asyncio.Event) -> None:
+        self._loop, self._wake = loop, wake
+
+    def take(self, limit: int, *, expire_before: float | None = None) -> list[ReadableSpan]:
+        """Pop up to ``limit`` kept spans, first deciding traces still pending since ``expire_before``."""
+        with self.lock:
+            self._wake_requested = False
+            if expire_before is not None:
+                for trace_id in [t for t, p in self.pending.items() if p.first_seen < expire_before]:
+                    self._decide(trace_id, root=None)
+            return [self.buffer.popleft() for _ in range(min(limit, len(self.buffer)))]
+
+    def depth(self) -> dict[str, int]:
+        with self.lock:
+            return {"buffered_spans": len(self.buffer), "pending_traces": len(self.pending)}
+
+    # -- Internals -----------------------------------------------------------
+
+    def _decide(self, trace_id: int, root: ReadableSpan | None) -> None:
+        pending = self.pending.pop(trace_id)
+        self._pending_spans -= len(pending.spans)
+        if any(s.status.status_code == StatusCode.ERROR for s in pending.spans):
+            reason = "error"
+        elif root is not None and _duration_ms(root) >= self.slow_ms:
+            reason = "slow"
+        elif _sampled(trace_id, self.sample_rate):
+            reason = "sampled"
+        else:
+            reason = "dropped"
+        self.stats.traces[reason] += 1
+        keep = reason != "dropped"
+        self.decisions[trace_id] = keep
+        if len(self.decisions) > _DECISIONS:
+            self.decisions.popitem(last=False)
+        if keep:
+            self._keep(pending.spans)
+
+    def _keep(self, spans: list[ReadableSpan]) -> None:
+        room = self.max_spans - len(self.buffer) - self._pending_spans
+        if room < len(spans):
+            self.stats.spans_dropped_overflow += len(spans) - max(room, 0)
+            spans = spans[: max(room, 0)]
+        self.buffer.extend(spans)
+        if len(self.buffer) >= self.batch_spans and not self._wake_requested and self._loop is not None:
+            self._wake_requested = True
+            loop, wake = self._loop, self._wake
+            try:
+                loop.call_soon_threadsafe(wake.set)  # type: ignore[union-attr]
+            except RuntimeError:
+                pass  # loop closed during shutdown; the final flush picks the spans up
+
+
+class TraceExport:
+    """Sets up sampled tracing and runs the lifespan task that exports spans and applies retention."""
+
+    def __init__(self) -> None:
+        self.stats = TracingStats()
+        self.processor: SampledSpanBuffer | None = None
+        self.exporter: DatabaseSpanExporter | None = None
+        self.retention: TraceRetention | None = None
+        self.separate_db = False
+        self._task: asyncio.Task | None = None
+        self._wake = asyncio.Event()
+
+    def setup(self, db: PostgresDb, *, separate_db: bool = False) -> bool:
+        """Install the sampled tracer provider; AgentOS(tracing=True) then keeps it.
+
+        Returns ``False`` if another tracer provider is already installed.
+        """
+        if isinstance(trace_api.get_tracer_provider(), TracerProvider):
+            return self.processor is not None
+        self.exporter = DatabaseSpanExporter(db=db)
+        self.retention = TraceRetention(db, retention_days=TRACE_RETENTION_DAYS) if TRACE_RETENTION_DAYS > 0 else None
+        self.separate_db = separate_db
+        self.processor = SampledSpanBuffer(
+            sample_rate=TRACE_SAMPLE_RATE,
+            slow_ms=TRACE_SLOW_MS,
+            max_spans=TRACE_BUFFER_SPANS,
+            batch_spans=TRACE_BATCH_SPANS,
+            stats=self.stats,
+        )
+        provider = TracerProvider(sampler=ParentBased(TraceIdRatioBased(TRACE_HEAD_SAMPLE_RATE)))
+        provider.add_span_processor(self.processor)
+        trace_api.set_tracer_provider(provider)
+        AgnoInstrumentor().instrument(tracer_provider=provider)
+        return True
+
+    async def start(self) -> None:
+        if self.processor is None or self._task is not None:
+            return
+        self._wake = asyncio.Event()
+        self.processor.attach(asyncio.get_running_loop(), self._wake)
+        self._task = asyncio.create_task(self._run(), name="trace-export")
+        log_info(
+            f"Trace export started (head {TRACE_HEAD_SAMPLE_RATE:g}, tail {TRACE_SAMPLE_RATE:g}, "
+            f"slow >= {TRACE_SLOW_MS}ms, batch {TRACE_BATCH_SPANS})"
+        )
+
+    async def stop(self) -> None:
+        """Stop the task and export everything still buffered, including undecided traces."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        assert self.processor is not None
+        expire: float | None = float("inf")
+        while batch := self.processor.take(TRACE_BATCH_SPANS, expire_before=expire):
+            expire = None
+            await self._export(batch)
+
+    def snapshot(self) -> dict:
+        if self.processor is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "head_sample_rate": TRACE_HEAD_SAMPLE_RATE,
+            "sample_rate": TRACE_SAMPLE_RATE,
+            "slow_ms": TRACE_SLOW_MS,
+            "trace_db": "separate" if self.separate_db else "shared",
+            "retention_days": TRACE_RETENTION_DAYS,
+            **self.processor.depth(),
+            **self.stats.snapshot(),
+        }
+
+    async def _run(self) -> None:
+        assert self.processor is not None
+        # Workers start together; spread their retention runs out.
+        next_rollup = time.monotonic() + random.uniform(0, min(TRACE_RETENTION_INTERVAL, 300))
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), TRACE_FLUSH_INTERVAL)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            expire: float | None = time.monotonic() - _PENDING_TIMEOUT
+            while batch := self.processor.take(TRACE_BATCH_SPANS, expire_before=expire):
+                expire = None
+                await self._export(batch)
+                if len(batch) < TRACE_BATCH_SPANS:
+                    break
+            if self.retention is not None and time.monotonic() >= next_rollup:
+                next_rollup = time.monotonic() + TRACE_RETENTION_INTERVAL
+                await self._roll_up()
+
+    async def _export(self, batch: list) -> None:
+        assert self.exporter is not None
+        started = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(self.exporter.export, batch)
+        except Exception as exc:
+            result = None
+            log_warning(f"Trace export failed: {exc}")
+        self.stats.export_seconds.append(time.perf_counter() - started)
+        self.stats.batch_spans.append(len(batch))
+        if result is not None and result.name == "SUCCESS":
+            self.stats.spans_exported += len(batch)
+        else:
+            self.stats.export_failures += 1
+
+    async def _roll_up(self) -> None:
+        assert self.retention is not None
+        started = time.perf_counter()
+        try:
+            result: RollupResult = await asyncio.to_thread(self.retention.roll_up)
+        except Exception as exc:
+            self.stats.rollup_failures += 1
+            log_warning(f"Trace retention failed: {exc}")
+            return
+        self.stats.last_rollup = {
+            "at": time.time(),
+            "traces": result.traces,
+            "spans": result.spans,
+            "skipped": result.skipped,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        if result.traces:
+            log_info(f"Trace retention: rolled up {result.traces} traces ({result.spans} spans)")
+
+
+tracing = TraceExport()
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _duration_ms(span: Any) -> float:
+    return ((span.end_time or 0) - (span.start_time or 0)) / 1e6
+
+
+def _sampled(trace_id: int, rate: float) -> bool:
+    """Deterministic per trace. Uses the high 64 bits; head sampling (``TraceIdRatioBased``) uses the low ones."""
+    return (trace_id >> 64) < rate * (1 << 64)
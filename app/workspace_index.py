@@ -0,0 +1,507 @@
+"""
+Workspace Index
+===============
+
+Incremental on-disk index behind the CodeSearch agent's workspace tools.
+
+``WorkspaceIndex`` keeps, per file: mtime and size, plus for text files
+a content hash, a symbol table (defs / classes / functions) and the
+file's trigrams. The
+index is persisted as JSON, so a restart only re-scans files whose mtime
+or size changed. A background thread keeps it fresh between requests:
+``watchfiles`` when it is installed, otherwise an mtime sweep every
+``refresh_interval`` seconds. Searches never sweep on their own path.
+
+``IndexedWorkspaceContextProvider`` is a drop-in for agno's
+``WorkspaceContextProvider`` whose sub-agent answers ``search_content``,
+recursive ``list_files`` and ``find_symbol`` from the index.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass, field
+from fnmatch import fnmatch
+from importlib.util import find_spec
+from pathlib import Path
+
+from agno.context.workspace import DEFAULT_WORKSPACE_INSTRUCTIONS, WorkspaceContextProvider
+from agno.tools.workspace import TEXT_EXTENSIONS, Workspace
+from agno.utils.log import log_debug, log_info, log_warning
+
+INDEX_VERSION = 1
+MAX_FILE_SIZE = 500 * 1024  # matches Workspace.search_content
+
+INDEXED_WORKSPACE_INSTRUCTIONS = (
+    DEFAULT_WORKSPACE_INSTRUCTIONS
+    + """
+When you know an identifier, call `find_symbol(name)` first: it returns the
+defining file and line straight from the index, no directory walk needed.
+"""
+)
+
+_SYMBOL_PATTERN = re.compile(
+    r"^[ \t]*(?:export[ \t]+)?(?:pub(?:\([^)]*\))?[ \t]+)?(?:async[ \t]+)?"
+    r"(def|class|function|func|fn|interface|struct|enum|trait|type)[ \t]+([A-Za-z_][\w]*)",
+    re.MULTILINE,
+)
+
+
+@dataclass
+class FileEntry:
+    path: str
+    mtime: float
+    size: int
+    sha1: str
+    symbols: list[tuple[str, str, int]] = field(default_factory=list)
+    trigrams: list[str] = field(default_factory=list)
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _symbols(content: str) -> list[tuple[str, str, int]]:
+    symbols = []
+    for match in _SYMBOL_PATTERN.finditer(content):
+        line = content.count("\n", 0, match.start()) + 1
+        symbols.append((match.group(1), match.group(2), line))
+    return symbols
+
+
+# The three helpers below match agno's Workspace output (agno.tools.workspace, agno.tools._local_file_utils);
+# they are copied rather than imported because agno keeps them private.
+
+
+def _excluded(path: Path, root: Path, exclude_patterns: Sequence[str]) -> bool:
+    """True when any path component under ``root`` matches an exclude pattern."""
+    try:
+        rel = path.relative_to(root)
+    except ValueError:
+        return False
+    return any(fnmatch(part, pattern) for part in rel.parts for pattern in exclude_patterns)
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{int(size)}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+def _extract_snippet(content: str, query: str, context_chars: int = 200) -> str:
+    """Up to ``context_chars`` either side of the first case-insensitive match."""
+    idx = content.lower().find(query.lower())
+    if idx == -1:
+        return ""
+    start = max(0, idx - context_chars)
+    end = min(len(content), idx + len(query) + context_chars)
+    return ("..." if start > 0 else "") + content[start:end] + ("..." if end < len(content) else "")
+
+
+class WorkspaceIndex:
+    """Path / symbol / trigram index over the files under ``root``.
+
+    ``exclude_patterns`` are fnmatch patterns for any path component, as
+    agno's ``Workspace`` takes them; the provider passes its own.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        index_path: Path | None = None,
+        exclude_patterns: Sequence[str] = (),
+        refresh_interval: float = 2.0,
+    ) -> None:
+        self.root = root.resolve()
+        self.index_path = index_path
+        self.exclude_patterns = list(exclude_patterns)
+        self.refresh_interval = refresh_interval
+        self.files: dict[str, FileEntry] = {}
+        self.postings: dict[str, set[str]] = {}
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._last_refresh = 0.0
+        self._watcher: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    # -- Build / refresh ----------------------------------------------------
+
+    def load(self) -> None:
+        """Load the persisted index, if any. Stale entries are fixed by ``refresh()``."""
+        if self.index_path is None or not self.index_path.exists():
+            return
+        try:
+            data = json.loads(self.index_path.read_text())
+        except (OSError, json.JSONDecodeError) as exc:
+            log_warning(f"workspace index: ignoring unreadable {self.index_path}: {exc}")
+            return
+        if data.get("version") != INDEX_VERSION or data.get("root") != str(self.root):
+            return
+        with self._lock:
+            for raw in data.get("files", []):
+                entry = FileEntry(**raw)
+                entry.symbols = [tuple(s) for s in entry.symbols]  # type: ignore[misc]
+                self._add(entry)
+
+    def save(self) -> None:
+        if self.index_path is None:
+            return
+        with self._lock:
+            payload = {
+                "version": INDEX_VERSION,
+                "root": str(self.root),
+                "files": [asdict(e) for e in self.files.values()],
+            }
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        # A temp file per writer: every worker saves the same index, and a shared one races on replace.
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.index_path.parent, prefix=f"{self.index_path.name}.", suffix=".tmp", delete=False
+        ) as tmp:
+            tmp.write(json.dumps(payload))
+        try:
+            os.replace(tmp.name, self.index_path)
+        except OSError:
+            Path(tmp.name).unlink(missing_ok=True)
+            raise
+
+    def refresh(self) -> int:
+        """Sweep the tree by mtime/size and re-scan only what changed. Returns the change count."""
+        started = time.perf_counter()
+        seen: set[str] = set()
+        changed = 0
+        for path in self._walk():
+            rel = str(path.relative_to(self.root))
+            seen.add(rel)
+            if self._update(path, rel):
+                changed += 1
+        with self._lock:
+            for rel in set(self.files) - seen:
+                self._remove(rel)
+                changed += 1
+        self._last_refresh = time.monotonic()
+        if changed:
+            self.save()
+        log_debug(
+            f"workspace index: {len(self.files)} files, {changed} changed, "
+            f"{(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        return changed
+
+    def ensure_fresh(self) -> None:
+        """Build the index on first use if startup didn't, and make sure a thread keeps it current."""
+        if not self._last_refresh:
+            with self._build_lock:
+                if not self._last_refresh:
+                    self.build()
+        self.watch()
+
+    def build(self) -> None:
+        """Load from disk, then bring the index up to date. Call once at startup."""
+        started = time.perf_counter()
+        self.load()
+        changed = self.refresh()
+        log_info(
+            f"workspace index ready: {len(self.files)} files ({changed} re-scanned) "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+    def watch(self) -> None:
+        """Start the background refresher: a ``watchfiles`` thread, or an mtime sweep without it."""
+        with self._lock:
+            if self._watcher is not None:
+                return
+            target = self._watch if find_spec("watchfiles") is not None else self._poll
+            self._watcher = threading.Thread(target=target, name="workspace-index-watch", daemon=True)
+            self._watcher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as exc:
+                log_warning(f"workspace index: refresh failed: {exc}")
+
+    def _watch(self) -> None:
+        from watchfiles import watch
+
+        for changes in watch(self.root, stop_event=self._stop, raise_interrupt=False):
+            try:
+                for _, raw_path in changes:
+                    path = Path(raw_path)
+                    if not self._indexable(path):
+                        continue
+                    rel = str(path.relative_to(self.root))
+                    if path.is_file():
+                        self._update(path, rel)
+                    else:
+                        with self._lock:
+                            self._remove(rel)
+                self.save()
+            except Exception as exc:
+                log_warning(f"workspace index: update failed: {exc}")
+
+    # -- Queries ------------------------------------------------------------
+
+    def candidates(self, query: str, directory: str = ".") -> list[str]:
+        """Paths that may contain ``query`` (case-insensitive), narrowed by trigram postings."""
+        lower = query.lower()
+        prefix = "" if directory in ("", ".") else directory.strip("/") + "/"
+        with self._lock:
+            if len(lower) < 3:
+                paths = set(self.files)
+            else:
+                grams = sorted(_trigrams(lower), key=lambda g: len(self.postings.get(g, ())))
+                paths = set(self.postings.get(grams[0], ()))
+                for gram in grams[1:]:
+                    if not paths:
+                        break
+                    paths &= self.postings.get(gram, set())
+            return sorted(p for p in paths if p.startswith(prefix))
+
+    def entries(self) -> list[FileEntry]:
+        with self._lock:
+            return list(self.files.values())
+
+    def find_symbol(self, name: str, limit: int = 20) -> list[dict]:
+        """Definitions whose name matches ``name`` exactly, then by substring."""
+        needle = name.lower()
+        exact: list[dict] = []
+        partial: list[dict] = []
+        with self._lock:
+            for entry in sorted(self.files.values(), key=lambda e: e.path):
+                for kind, symbol, line in entry.symbols:
+                    lowered = symbol.lower()
+                    if lowered == needle:
+                        exact.append({"file": entry.path, "line": line, "kind": kind, "name": symbol})
+                    elif needle in lowered:
+                        partial.append({"file": entry.path, "line": line, "kind": kind, "name": symbol})
+        return (exact + partial)[:limit]
+
+    def defines(self, path: str, query: str) -> bool:
+        lower = query.lower()
+        entry = self.files.get(path)
+        return entry is not None and any(lower == s.lower() for _, s, _ in entry.symbols)
+
+    # -- Internals ----------------------------------------------------------
+
+    def _indexable(self, path: Path) -> bool:
+        try:
+            path.relative_to(self.root)
+        except ValueError:
+            return False
+        return not _excluded(path, self.root, self.exclude_patterns)
+
+    def _walk(self):  # type: ignore[no-untyped-def]
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not _excluded(Path(dirpath) / d, self.root, self.exclude_patterns)]
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                if self._indexable(path):
+                    yield path
+
+    def _update(self, path: Path, rel: str) -> bool:
+        try:
+            stat = path.stat()
+        except OSError:
+            with self._lock:
+                return self._remove(rel)
+        current = self.files.get(rel)
+        if current is not None and current.mtime == stat.st_mtime and current.size == stat.st_size:
+            return False
+        if stat.st_size > MAX_FILE_SIZE or path.suffix.lower() not in TEXT_EXTENSIONS:
+            # Listed, but not content-searchable — same rule as Workspace.search_content.
+            with self._lock:
+                self._remove(rel)
+                self._add(FileEntry(path=rel, mtime=stat.st_mtime, size=stat.st_size, sha1=""))
+            return True
+        try:
+            raw = path.read_bytes()
+        except OSError:
+            return False
+        sha1 = hashlib.sha1(raw).hexdigest()
+        with self._lock:
+            if current is not None and current.sha1 == sha1:
+                # Touched but unchanged (e.g. git checkout): keep postings, bump stat.
+                current.mtime, current.size = stat.st_mtime, stat.st_size
+                return False
+            content = raw.decode("utf-8", errors="ignore")
+            self._remove(rel)
+            self._add(
+                FileEntry(
+                    path=rel,
+                    mtime=stat.st_mtime,
+                    size=stat.st_size,
+                    sha1=sha1,
+                    symbols=_symbols(content),
+                    trigrams=sorted(_trigrams(content.lower())),
+                )
+            )
+        return True
+
+    def _add(self, entry: FileEntry) -> None:
+        self.files[entry.path] = entry
+        for gram in entry.trigrams:
+            self.postings.setdefault(gram, set()).add(entry.path)
+
+    def _remove(self, rel: str) -> bool:
+        entry = self.files.pop(rel, None)
+        if entry is None:
+            return False
+        for gram in entry.trigrams:
+            paths = self.postings.get(gram)
+            if paths is not None:
+                paths.discard(rel)
+                if not paths:
+                    del self.postings[gram]
+        return True
+
+
+class IndexedWorkspace(Workspace):
+    """Read-only ``Workspace`` whose search and recursive listing come from a ``WorkspaceIndex``."""
+
+    def __init__(self, index: WorkspaceIndex, **kwargs) -> None:  # type: ignore[no-untyped-def]
+        self.index = index
+        super().__init__(root=index.root, exclude_patterns=index.exclude_patterns, **kwargs)
+        self.register(self.find_symbol)
+        self.register(self.afind_symbol, name="find_symbol")
+
+    def search_content(self, query: str, directory: str = ".", limit: int = 10) -> str:
+        """Recursive case-insensitive content grep across text files in the workspace.
+
+        Files that define a symbol named exactly ``query`` are listed first.
+
+        :param query: Substring to search for (case-insensitive).
+        :param directory: Subdirectory to scope the search to (default ".").
+        :param limit: Maximum number of matching files to return (default 10).
+        :return: JSON string with keys ``query``, ``matches_found``, and ``files`` (a list of
+            ``{"file", "size", "snippet"}`` objects).
+        """
+        if not query or not query.strip():
+            return "Error: query cannot be empty"
+        safe, search_dir = self._check_path(directory, self.root)
+        if not safe:
+            return "Error: directory escapes workspace root"
+        if not search_dir.is_dir():
+            return f"Error: not a directory: {directory}"
+        self.index.ensure_fresh()
+
+        rel_dir = str(search_dir.relative_to(self.root))
+        candidates = self.index.candidates(query, rel_dir)
+        candidates.sort(key=lambda p: not self.index.defines(p, query))
+        lower_query = query.lower()
+        matches: list[dict] = []
+        for rel_path in candidates:
+            if len(matches) >= limit:
+                break
+            file_path = self.root / rel_path
+            try:
+                content = file_path.read_text(encoding="utf-8", errors="ignore")
+            except OSError:
+                continue
+            if lower_query in content.lower():
+                matches.append(
+                    {
+                        "file": rel_path,
+                        "size": _format_size(file_path.stat().st_size),
+                        "snippet": _extract_snippet(content, query),
+                    }
+                )
+        return json.dumps({"query": query, "matches_found": len(matches), "files": matches}, indent=2)
+
+    def list_files(
+        self,
+        directory: str = ".",
+        pattern: str | None = None,
+        recursive: bool = False,
+        max_depth: int = 3,
+    ) -> str:
+        """List entries in a workspace directory.
+
+        Each entry is returned as ``{"path", "type", "size"}``. ``type`` is ``"file"``
+        or ``"dir"``; ``size`` is a human-readable string for files and ``null`` for
+        directories. Use ``recursive=True`` (defaults to depth 3) for a tree view.
+
+        :param directory: Subdirectory relative to the workspace root (default ".").
+        :param pattern: Optional glob pattern matched against each entry name (e.g. ``"*.py"``).
+        :param recursive: If True, walk the directory tree up to ``max_depth`` levels deep.
+        :param max_depth: Depth limit when ``recursive=True`` (default 3).
+        :return: JSON string with keys ``directory``, ``pattern``, ``recursive``, and ``files``.
+        """
+        if not recursive:
+            return super().list_files(directory, pattern, recursive, max_depth)
+        safe, d = self._check_path(directory, self.root)
+        if not safe:
+            return "Error: directory escapes workspace root"
+        if not d.is_dir():
+            return f"Error: not a directory: {directory}"
+        self.index.ensure_fresh()
+
+        base = d.relative_to(self.root).parts
+        entries: dict[str, dict] = {}
+        for entry in self.index.entries():
+            parts = Path(entry.path).parts
+            if parts[: len(base)] != base:
+                continue
+            rel_parts = parts[len(base) :]
+            # Directories along the way, up to max_depth levels.
+            for depth in range(1, min(len(rel_parts) - 1, max_depth + 1) + 1):
+                dir_path = str(Path(*base, *rel_parts[:depth]))
+                if not pattern or fnmatch(rel_parts[depth - 1], pattern):
+                    entries.setdefault(dir_path, {"path": dir_path, "type": "dir", "size": None})
+            if len(rel_parts) <= max_depth + 1 and (not pattern or fnmatch(rel_parts[-1], pattern)):
+                entries[entry.path] = {"path": entry.path, "type": "file", "size": _format_size(entry.size)}
+
+        files_out = [entries[k] for k in sorted(entries)]
+        return json.dumps(
+            {"directory": directory, "pattern": pattern, "recursive": recursive, "files": files_out},
+            indent=2,
+        )
+
+    def find_symbol(self, name: str, limit: int = 20) -> str:
+        """Find where a function, class or type is defined, by name.
+
+        Exact (case-insensitive) matches come first, then names containing ``name``.
+        Much faster than ``search_content`` when you know the identifier.
+
+        :param name: Symbol name, e.g. ``get_postgres_db``.
+        :param limit: Maximum number of definitions to return (default 20).
+        :return: JSON string with keys ``name`` and ``definitions`` (a list of
+            ``{"file", "line", "kind", "name"}`` objects).
+        """
+        if not name or not name.strip():
+            return "Error: name cannot be empty"
+        self.index.ensure_fresh()
+        return json.dumps({"name": name, "definitions": self.index.find_symbol(name.strip(), limit)}, indent=2)
+
+    async def afind_symbol(self, name: str, limit: int = 20) -> str:
+        """Async variant of ``find_symbol``."""
+        return await asyncio.to_thread(self.find_symbol, name, limit)
+
+
+class IndexedWorkspaceContextProvider(WorkspaceContextProvider):
+    """``WorkspaceContextProvider`` backed by a shared ``WorkspaceIndex``."""
+
+    def __init__(self, root: Path, *, index_path: Path | None = None, **kwargs) -> None:  # type: ignore[no-untyped-def]
+        kwargs.setdefault("instructions", INDEXED_WORKSPACE_INSTRUCTIONS)
+        super().__init__(root=root, **kwargs)
+        self.index = WorkspaceIndex(self.root, index_path=index_path, exclude_patterns=self.exclude_patterns)
+
+    def _build_workspace_tools(self) -> Workspace:
+        return IndexedWorkspace(
+            self.index,
+            allowed=Workspace.READ_TOOLS,
+            max_file_lines=self.max_file_lines,
+            max_file_length=self.max_file_length,
+        )
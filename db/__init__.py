@@ -3,7 +3,18 @@ Database Module
 ===============
 """
 
-from db.session import create_knowledge, get_postgres_db
+from db.pool import dispose_engines, get_engine, pool_stats
+from db.session import create_knowledge, get_postgres_db, get_trace_db
 from db.url import db_url
+from db.vector import IndexSpec
 
-__all__ = ["create_knowledge", "db_url", "get_postgres_db"]
+__all__ = [
+    "IndexSpec",
+    "create_knowledge",
+    "db_url",
+    "dispose_engines",
+    "get_engine",
+    "get_postgres_db",
+    "get_trace_db",
+    "pool_stats",
+]
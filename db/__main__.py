@@ -0,0 +1,135 @@
+"""
+Database Maintenance
+====================
+
+python -m db index build --table <name>            # build missing indexes concurrently
+python -m db index build --table <name> --force    # rebuild them
+python -m db index report --table <name>           # size, recall@k vs exact, latency
+python -m db traces rollup --days 14                # roll up and delete traces older than 14 days
+python -m db memories compact --similarity 0.9       # merge near-duplicate user memories
+
+Works on any table written by ``create_knowledge()``. The report samples
+query vectors from the table itself, so it makes no embedding calls.
+"""
+
+import typer
+from agno.knowledge.embedder.openai import OpenAIEmbedder
+from rich.console import Console
+from rich.table import Table
+
+from db.embedding_cache import CachedEmbedder
+from db.memory_compaction import MemoryCompaction
+from db.pool import get_engine
+from db.session import get_postgres_db, get_trace_db
+from db.trace_retention import TraceRetention
+from db.url import db_url
+from db.vector import IndexSpec, TunedPgVector, VectorIndexKind
+
+app = typer.Typer(add_completion=False, no_args_is_help=True, pretty_exceptions_show_locals=False)
+index_app = typer.Typer(no_args_is_help=True, help="Vector / full-text index maintenance.")
+app.add_typer(index_app, name="index")
+traces_app = typer.Typer(no_args_is_help=True, help="Trace retention.")
+app.add_typer(traces_app, name="traces")
+memories_app = typer.Typer(no_args_is_help=True, help="User memory maintenance.")
+app.add_typer(memories_app, name="memories")
+console = Console()
+
+
+def _vector_db(table: str, schema: str, spec: IndexSpec) -> TunedPgVector:
+    return TunedPgVector(table_name=table, schema=schema, db_url=db_url, db_engine=get_engine(db_url), index_spec=spec)
+
+
+def _ms(value: float | None) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}ms"
+
+
+@index_app.command("build")
+def build(
+    table: str = typer.Option(..., "--table", "-t", help="Vector table name."),
+    schema: str = typer.Option("ai", "--schema"),
+    kind: VectorIndexKind = typer.Option("hnsw", "--kind", help="hnsw, ivfflat or none."),
+    m: int = typer.Option(16, "--m", help="HNSW graph degree."),
+    ef_construction: int = typer.Option(64, "--ef-construction"),
+    lists: int | None = typer.Option(None, "--lists", help="IVFFlat lists (default: sized from row count)."),
+    gin: bool = typer.Option(True, "--gin/--no-gin", help="GIN index for full-text search."),
+    maintenance_work_mem: str | None = typer.Option(None, "--maintenance-work-mem", help="e.g. 2GB"),
+    force: bool = typer.Option(False, "--force", help="Rebuild indexes that already exist."),
+) -> None:
+    """Build the table's indexes with CREATE INDEX CONCURRENTLY."""
+    spec = IndexSpec(
+        kind=kind,
+        m=m,
+        ef_construction=ef_construction,
+        lists=lists,
+        gin=gin,
+        maintenance_work_mem=maintenance_work_mem,
+    )
+    built = _vector_db(table, schema, spec).build_indexes(force=force)
+    console.print(f"Built: {', '.join(built)}" if built else "All indexes already present.")
+
+
+@index_app.command("report")
+def report(
+    table: str = typer.Option(..., "--table", "-t", help="Vector table name."),
+    schema: str = typer.Option("ai", "--schema"),
+    kind: VectorIndexKind = typer.Option("hnsw", "--kind", help="Index kind the table uses."),
+    ef_search: int = typer.Option(40, "--ef-search"),
+    probes: int = typer.Option(10, "--probes"),
+    samples: int = typer.Option(50, "--samples", "-n", help="Query vectors sampled from the table."),
+    k: int = typer.Option(10, "-k", help="Neighbours per query."),
+) -> None:
+    """Index sizes, ANN recall@k against exact search, and query latency."""
+    vector_db = _vector_db(table, schema, IndexSpec(kind=kind, ef_search=ef_search, probes=probes))
+
+    sizes = Table(title=f"Indexes on {schema}.{table} ({vector_db.get_count()} rows)")
+    for column in ("Index", "Method", "Size", "Valid"):
+        sizes.add_column(column)
+    for row in vector_db.index_stats():
+        sizes.add_row(row["name"], row["method"], f"{row['size_bytes'] / 1024 / 1024:.1f} MB", str(row["valid"]))
+    console.print(sizes)
+
+    result = vector_db.measure_recall(samples=samples, k=k)
+    knob = f"ef_search={max(ef_search, k)}" if kind == "hnsw" else f"probes={probes}"
+    quality = Table(title=f"Recall@{k} over {result['samples']} queries ({kind}, {knob})")
+    for column in ("Recall", "ANN p50", "ANN p95", "Exact p50", "Exact p95"):
+        quality.add_column(column, justify="right")
+    recall = result["recall"]
+    quality.add_row(
+        "-" if recall is None else f"{recall:.3f}",
+        _ms(result["ann_latency"]["p50"]),
+        _ms(result["ann_latency"]["p95"]),
+        _ms(result["exact_latency"]["p50"]),
+        _ms(result["exact_latency"]["p95"]),
+    )
+    console.print(quality)
+
+
+@traces_app.command("rollup")
+def rollup(
+    days: int = typer.Option(14, "--days", help="Keep traces newer than this many days."),
+    batch_size: int = typer.Option(1000, "--batch-size"),
+) -> None:
+    """Fold traces older than the window into daily aggregates and delete them and their spans."""
+    result = TraceRetention(get_trace_db(), retention_days=days, batch_size=batch_size).roll_up()
+    if result.skipped:
+        console.print("Another worker is rolling up traces; try again later.")
+        return
+    console.print(f"Rolled up {result.traces} traces ({result.spans} spans) in {result.batches} batches.")
+
+
+@memories_app.command("compact")
+def compact(
+    similarity: float = typer.Option(0.9, "--similarity", help="Cosine similarity at which two memories merge."),
+    min_memories: int = typer.Option(10, "--min-memories", help="Skip users with fewer memories."),
+) -> None:
+    """Merge every user's near-duplicate memories into the newest of them."""
+    embedder = CachedEmbedder(embedder=OpenAIEmbedder(id="text-embedding-3-small"))
+    result = MemoryCompaction(get_postgres_db(), embedder, similarity=similarity, min_memories=min_memories).compact()
+    if result.skipped:
+        console.print("Another worker is compacting memories; try again later.")
+        return
+    console.print(f"Merged {result.merged} memories across {result.users} users.")
+
+
+if __name__ == "__main__":
+    app()
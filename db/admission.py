@@ -0,0 +1,185 @@
+"""
+Admission Store
+===============
+
+Postgres-backed token buckets and concurrency leases, shared by every
+worker and replica.
+
+A run is admitted against a list of ``Check``s (one per user, agent and
+interface key). ``acquire()`` does all of them in one transaction:
+
+- concurrency: the live leases of each capped key are counted under a
+  transaction-level advisory lock on that key; a key at its cap denies;
+- rate: each rate-limited key's bucket is refilled for the time since it
+  was last touched and one token is taken, in a single ``UPSERT``; a
+  bucket with less than one token denies, with the seconds until it has
+  one as ``retry_after``;
+- otherwise one lease row per capped key is inserted for ``holder``.
+
+A denial rolls the transaction back, so tokens taken from the other
+buckets are returned. ``release()`` deletes the holder's leases. A worker
+that dies mid-run leaves its leases behind until ``lease`` seconds pass;
+keep it above the longest agent run.
+"""
+
+from dataclasses import dataclass
+
+from sqlalchemy import Column, Connection, DateTime, Float, MetaData, PrimaryKeyConstraint, String, Table, text
+
+from db.pool import get_engine
+from db.url import db_url
+
+_PURGE_EVERY = 200
+
+
+@dataclass(frozen=True)
+class Check:
+    """Limits for one key. ``0`` means no limit of that kind."""
+
+    scope: str  # user | agent | interface
+    key: str
+    concurrency: int = 0
+    per_minute: float = 0
+    burst: float = 1
+
+    @property
+    def capacity(self) -> float:
+        """Most tokens the bucket holds: ``burst``, but never more than a minute's worth."""
+        return max(1.0, min(self.burst, self.per_minute))
+
+
+@dataclass
+class Decision:
+    admitted: bool
+    scope: str | None = None  # the scope that denied
+    reason: str | None = None  # "concurrency" | "rate"
+    retry_after: float = 0.0
+
+
+class AdmissionStore:
+    """Buckets in ``{schema}.{prefix}_buckets`` and leases in ``{schema}.{prefix}_leases``."""
+
+    def __init__(self, prefix: str = "admission", *, lease: int = 900, schema: str = "ai") -> None:
+        self.lease = lease
+        self._ready = False
+        self._released = 0
+        metadata = MetaData(schema=schema)
+        self.buckets = Table(
+            f"{prefix}_buckets",
+            metadata,
+            Column("key", String, primary_key=True),
+            Column("tokens", Float, nullable=False),
+            Column("updated_at", DateTime(timezone=True), nullable=False),
+        )
+        self.leases = Table(
+            f"{prefix}_leases",
+            metadata,
+            Column("holder", String(64), nullable=False),
+            Column("key", String, nullable=False, index=True),
+            Column("expires_at", DateTime(timezone=True), nullable=False),
+            PrimaryKeyConstraint("holder", "key"),
+        )
+        self._buckets = f"{schema}.{prefix}_buckets"
+        self._leases = f"{schema}.{prefix}_leases"
+
+    def acquire(self, checks: list[Check], holder: str, concurrency_retry: float = 1.0) -> Decision:
+        """Take a token from every rate-limited key and a slot on every capped key, or none of them."""
+        self._ensure_table()
+        capped = sorted((c for c in checks if c.concurrency > 0), key=lambda c: c.key)
+        limited = [c for c in checks if c.per_minute > 0]
+        with get_engine(db_url).connect() as conn:
+            trans = conn.begin()
+            try:
+                if capped:
+                    keys = [c.key for c in capped]
+                    # Sorted, so two runs sharing keys can't lock them in opposite orders.
+                    conn.execute(
+                        text("SELECT pg_advisory_xact_lock(hashtext(k)) FROM unnest(CAST(:keys AS text[])) AS k"),
+                        {"keys": keys},
+                    )
+                    rows = conn.execute(
+                        text(
+                            f"SELECT key, count(*) FROM {self._leases} "
+                            "WHERE key = ANY(CAST(:keys AS text[])) AND expires_at > now() GROUP BY key"
+                        ),
+                        {"keys": keys},
+                    ).all()
+                    held: dict[str, int] = {key: count for key, count in rows}
+                    for check in capped:
+                        if held.get(check.key, 0) >= check.concurrency:
+                            trans.rollback()
+                            return Decision(False, check.scope, "concurrency", concurrency_retry)
+                for check in limited:
+                    retry_after = self._take(conn, check)
+                    if retry_after is not None:
+                        trans.rollback()
+                        return Decision(False, check.scope, "rate", retry_after)
+                if capped:
+                    conn.execute(
+                        text(
+                            f"INSERT INTO {self._leases} (holder, key, expires_at) "
+                            "SELECT :holder, k, now() + make_interval(secs => :lease) "
+                            "FROM unnest(CAST(:keys AS text[])) AS k "
+                            "ON CONFLICT (holder, key) DO UPDATE SET expires_at = EXCLUDED.expires_at"
+                        ),
+                        {"holder": holder, "lease": self.lease, "keys": [c.key for c in capped]},
+                    )
+                trans.commit()
+            except BaseException:
+                trans.rollback()
+                raise
+        return Decision(True)
+
+    def release(self, holder: str) -> None:
+        """Free ``holder``'s concurrency slots."""
+        with get_engine(db_url).begin() as conn:
+            conn.execute(text(f"DELETE FROM {self._leases} WHERE holder = :holder"), {"holder": holder})
+            self._released += 1
+            if self._released % _PURGE_EVERY == 0:
+                conn.execute(text(f"DELETE FROM {self._leases} WHERE expires_at <= now()"))
+                # A bucket left alone this long has refilled; a missing row starts full too.
+                conn.execute(text(f"DELETE FROM {self._buckets} WHERE updated_at < now() - interval '1 hour'"))
+
+    def usage(self, limit: int = 10) -> dict[str, int]:
+        """Live leases of the busiest keys."""
+        self._ensure_table()
+        with get_engine(db_url).connect() as conn:
+            rows = conn.execute(
+                text(
+                    f"SELECT key, count(*) AS n FROM {self._leases} WHERE expires_at > now() "
+                    "GROUP BY key ORDER BY n DESC LIMIT :limit"
+                ),
+                {"limit": limit},
+            ).all()
+        return {key: n for key, n in rows}
+
+    # -- Internals ------------------------------------------------------------
+
+    def _take(self, conn: Connection, check: Check) -> float | None:
+        """Take one token from ``check``'s bucket; seconds until one is available when it is empty."""
+        rate = check.per_minute / 60
+        params = {"key": check.key, "capacity": check.capacity, "rate": rate}
+        refilled = "LEAST(:capacity, b.tokens + extract(epoch FROM now() - b.updated_at) * :rate)"
+        taken = conn.execute(
+            text(
+                f"INSERT INTO {self._buckets} AS b (key, tokens, updated_at) "
+                "VALUES (:key, :capacity - 1, now()) "
+                f"ON CONFLICT (key) DO UPDATE SET tokens = {refilled} - 1, updated_at = now() "
+                f"WHERE {refilled} >= 1 "
+                "RETURNING b.tokens"
+            ),
+            params,
+        ).first()
+        if taken is not None:
+            return None
+        tokens = conn.execute(text(f"SELECT {refilled} FROM {self._buckets} AS b WHERE b.key = :key"), params).scalar()
+        return max(0.0, (1 - float(tokens or 0)) / rate)
+
+    def _ensure_table(self) -> None:
+        if self._ready:
+            return
+        engine = get_engine(db_url)
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {self.buckets.schema}"))
+        self.buckets.metadata.create_all(engine, checkfirst=True)
+        self._ready = True
@@ -0,0 +1,233 @@
+"""
+Embedding Cache
+===============
+
+``CachedEmbedder`` wraps any agno ``Embedder`` with a Postgres table of
+embeddings keyed by ``sha256(model, dimensions, text)``. Re-ingesting a
+corpus only pays for chunks whose text changed; everything else is one
+``SELECT`` away.
+
+Misses are embedded in ``batch_size`` chunks with at most ``max_workers``
+requests in flight, then written back in a single bulk insert.
+
+    embedder = CachedEmbedder(embedder=OpenAIEmbedder(id="text-embedding-3-small"))
+
+Any ``Embedder`` works as the inner model, including a local fake for
+tests that must not touch the network.
+"""
+
+import asyncio
+import hashlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import Any
+
+from agno.knowledge.embedder.base import Embedder
+from agno.utils.log import log_debug, log_warning
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, DateTime, MetaData, String, Table, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from db.pool import get_engine
+from db.url import db_url
+
+Usage = dict[str, Any] | None
+
+
+@dataclass
+class CachedEmbedder(Embedder):
+    """Embedder with a content-hash keyed Postgres cache in front of ``embedder``.
+
+    ``batch_size`` and ``dimensions`` default to the inner embedder's.
+    ``max_workers`` bounds concurrent embedding requests on a cache miss.
+    """
+
+    embedder: Embedder | None = None
+    max_workers: int = 4
+    table_name: str = "embedding_cache"
+    schema: str = "ai"
+    enable_batch: bool = True
+    stats: Counter[str] = field(default_factory=Counter)
+
+    def __post_init__(self) -> None:
+        if self.embedder is None:
+            raise ValueError("CachedEmbedder needs an inner embedder")
+        self.dimensions = self.embedder.dimensions
+        self.batch_size = self.embedder.batch_size
+        self.model = f"{type(self.embedder).__name__}:{getattr(self.embedder, 'id', '')}:{self.dimensions}"
+        self._table = Table(
+            self.table_name,
+            MetaData(schema=self.schema),
+            Column("key", String(64), primary_key=True),
+            Column("model", String, nullable=False),
+            Column("embedding", Vector(), nullable=False),
+            Column("created_at", DateTime(timezone=True), nullable=False),
+        )
+        self._ready = False
+
+    # -- Embedder API -------------------------------------------------------
+
+    def get_embedding(self, text: str) -> list[float]:
+        return self.get_embedding_and_usage(text)[0]
+
+    def get_embedding_and_usage(self, text: str) -> tuple[list[float], Usage]:
+        embeddings, usages = self.get_embeddings_batch_and_usage([text])
+        return embeddings[0], usages[0]
+
+    async def async_get_embedding(self, text: str) -> list[float]:
+        return (await self.async_get_embedding_and_usage(text))[0]
+
+    async def async_get_embedding_and_usage(self, text: str) -> tuple[list[float], Usage]:
+        embeddings, usages = await self.async_get_embeddings_batch_and_usage([text])
+        return embeddings[0], usages[0]
+
+    def get_embeddings_batch_and_usage(self, texts: list[str]) -> tuple[list[list[float]], list[Usage]]:
+        """Embed ``texts``, serving cached vectors and batching the misses across a thread pool."""
+        keys = [self._key(t) for t in texts]
+        cached = self._safe_lookup(keys)
+        misses = _unique_misses(texts, keys, cached)
+        fresh: dict[str, tuple[list[float], Usage]] = {}
+        if misses:
+            batches = _chunks(misses, self.batch_size)
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                for batch, (embeddings, usages) in zip(batches, pool.map(self._embed_batch, batches)):
+                    fresh.update(_pair(batch, embeddings, usages))
+            self._safe_store(fresh)
+        return self._assemble(keys, cached, fresh)
+
+    async def async_get_embeddings_batch_and_usage(self, texts: list[str]) -> tuple[list[list[float]], list[Usage]]:
+        """Async variant of ``get_embeddings_batch_and_usage``; misses run under a semaphore."""
+        keys = [self._key(t) for t in texts]
+        cached = await asyncio.to_thread(self._safe_lookup, keys)
+        misses = _unique_misses(texts, keys, cached)
+        fresh: dict[str, tuple[list[float], Usage]] = {}
+        if misses:
+            semaphore = asyncio.Semaphore(self.max_workers)
+
+            async def run(batch: list[tuple[str, str]]) -> dict[str, tuple[list[float], Usage]]:
+                async with semaphore:
+                    return _pair(batch, *await self._async_embed_batch(batch))
+
+            for result in await asyncio.gather(*(run(b) for b in _chunks(misses, self.batch_size))):
+                fresh.update(result)
+            await asyncio.to_thread(self._safe_store, fresh)
+        return self._assemble(keys, cached, fresh)
+
+    def snapshot(self) -> dict:
+        """Hit / miss counters since startup."""
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            "model": self.model,
+            "hit_ratio": round(self.stats["hits"] / total, 4) if total else None,
+            "counters": dict(sorted(self.stats.items())),
+        }
+
+    # -- Inner embedder -----------------------------------------------------
+
+    def _embed_batch(self, batch: list[tuple[str, str]]) -> tuple[list[list[float]], list[Usage]]:
+        inner: Any = self.embedder
+        texts = [t for _, t in batch]
+        if inner.enable_batch and hasattr(inner, "get_embeddings_batch_and_usage"):
+            return inner.get_embeddings_batch_and_usage(texts)
+        results = [inner.get_embedding_and_usage(t) for t in texts]
+        return [e for e, _ in results], [u for _, u in results]
+
+    async def _async_embed_batch(self, batch: list[tuple[str, str]]) -> tuple[list[list[float]], list[Usage]]:
+        inner: Any = self.embedder
+        texts = [t for _, t in batch]
+        if inner.enable_batch and hasattr(inner, "async_get_embeddings_batch_and_usage"):
+            return await inner.async_get_embeddings_batch_and_usage(texts)
+        results = await asyncio.gather(*(inner.async_get_embedding_and_usage(t) for t in texts))
+        return [e for e, _ in results], [u for _, u in results]
+
+    # -- Storage ------------------------------------------------------------
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode()).hexdigest()
+
+    def _ensure_table(self) -> None:
+        if self._ready:
+            return
+        engine = get_engine(db_url)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {self.schema}"))
+        self._table.metadata.create_all(engine, checkfirst=True)
+        self._ready = True
+
+    def _safe_lookup(self, keys: list[str]) -> dict[str, list[float]]:
+        """Cached vectors for ``keys``. A cache outage degrades to "all misses"."""
+        try:
+            self._ensure_table()
+            t = self._table
+            with get_engine(db_url).connect() as conn:
+                rows = conn.execute(select(t.c.key, t.c.embedding).where(t.c.key.in_(set(keys)))).all()
+        except Exception as exc:
+            log_warning(f"embedding cache lookup failed: {exc}")
+            self.stats["errors"] += 1
+            return {}
+        found = {row.key: [float(x) for x in row.embedding] for row in rows}
+        hits = sum(1 for k in keys if k in found)
+        self.stats["hits"] += hits
+        self.stats["misses"] += len(keys) - hits
+        log_debug(f"embedding cache: {hits}/{len(keys)} hits")
+        return found
+
+    def _safe_store(self, fresh: dict[str, tuple[list[float], Usage]]) -> None:
+        # Failed embeddings come back empty; never cache those.
+        now = datetime.now(UTC)
+        rows = [
+            {"key": key, "model": self.model, "embedding": embedding, "created_at": now}
+            for key, (embedding, _) in fresh.items()
+            if embedding
+        ]
+        if not rows:
+            return
+        try:
+            self._ensure_table()
+            with get_engine(db_url).begin() as conn:
+                conn.execute(insert(self._table).on_conflict_do_nothing(index_elements=["key"]), rows)
+            self.stats["stores"] += len(rows)
+        except Exception as exc:
+            log_warning(f"embedding cache store failed: {exc}")
+            self.stats["errors"] += 1
+
+    @staticmethod
+    def _assemble(
+        keys: list[str], cached: dict[str, list[float]], fresh: dict[str, tuple[list[float], Usage]]
+    ) -> tuple[list[list[float]], list[Usage]]:
+        embeddings: list[list[float]] = []
+        usages: list[Usage] = []
+        for key in keys:
+            if key in cached:
+                embeddings.append(cached[key])
+                usages.append(None)
+            else:
+                embedding, usage = fresh.get(key, ([], None))
+                embeddings.append(embedding)
+                usages.append(usage)
+        return embeddings, usages
+
+
+def _unique_misses(texts: list[str], keys: list[str], cached: dict[str, list[float]]) -> list[tuple[str, str]]:
+    misses: dict[str, str] = {}
+    for key, text_ in zip(keys, texts):
+        if key not in cached:
+            misses.setdefault(key, text_)
+    return list(misses.items())
+
+
+def _chunks(items: list[tuple[str, str]], size: int) -> list[list[tuple[str, str]]]:
+    size = max(1, size)
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def _pair(
+    batch: list[tuple[str, str]], embeddings: list[list[float]], usages: list[Usage]
+) -> dict[str, tuple[list[float], Usage]]:
+    return {
+        key: (embeddings[i] if i < len(embeddings) else [], usages[i] if i < len(usages) else None)
+        for i, (key, _) in enumerate(batch)
+    }
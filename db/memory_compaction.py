@@ -0,0 +1,131 @@
+"""
+Memory Compaction
+=================
+
+Merges near-duplicate user memories.
+
+Agentic memory adds a row whenever the model decides something is worth
+keeping, and it often restates what is already stored ("Prefers Python",
+"The user likes Python best"). ``compact()`` embeds each user's memories
+(through the shared embedding cache, so a memory is only embedded once)
+and folds every memory whose cosine similarity to a newer one is at least
+``similarity`` into it: the newer text is kept, the topics of both are
+merged, and the older row is deleted.
+
+Only users with at least ``min_memories`` memories are looked at, and
+only memories older than ``settle_seconds`` are ever deleted, so a memory
+that a run is still writing is not merged away under it. A pass holds an
+advisory lock, so every worker may run it and only one does at a time.
+"""
+
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from agno.db.postgres import PostgresDb
+from agno.db.schemas.memory import UserMemory
+from sqlalchemy import text
+
+from db.embedding_cache import CachedEmbedder
+
+
+@dataclass
+class CompactionResult:
+    users: int = 0
+    merged: int = 0
+    skipped: bool = False  # another worker held the lock
+
+
+class MemoryCompaction:
+    """Near-duplicate merging for the user memories in ``db``."""
+
+    def __init__(
+        self,
+        db: PostgresDb,
+        embedder: CachedEmbedder,
+        *,
+        similarity: float = 0.9,
+        min_memories: int = 10,
+        max_memories: int = 500,
+        settle_seconds: int = 600,
+    ) -> None:
+        self.db = db
+        self.embedder = embedder
+        self.similarity = similarity
+        self.min_memories = min_memories
+        self.max_memories = max_memories
+        self.settle_seconds = settle_seconds
+        self._lock = f"{db.db_schema}.{db.memory_table_name}:compaction"
+
+    def compact(self, since: int | None = None) -> CompactionResult:
+        """Compact every user with a memory updated at or after ``since`` (epoch seconds; all users if None)."""
+        with self.db.db_engine.connect() as conn:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:name))"), {"name": self._lock}).scalar()
+            if not locked:
+                return CompactionResult(skipped=True)
+            try:
+                return self._compact(since)
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": self._lock})
+
+    def compact_user(self, user_id: str) -> int:
+        """Merge ``user_id``'s near-duplicate memories; returns how many were folded into another."""
+        memories = self.db.get_user_memories(
+            user_id=user_id, limit=self.max_memories, sort_by="updated_at", sort_order="desc"
+        )
+        memories = [m for m in memories if isinstance(m, UserMemory) and m.memory_id and m.memory]
+        if len(memories) < 2:
+            return 0
+        ids = [m.memory_id for m in memories if m.memory_id]  # one per memory, in order
+        embeddings, _ = self.embedder.get_embeddings_batch_and_usage([m.memory for m in memories])
+        settled = time.time() - self.settle_seconds
+        survivors: dict[str, UserMemory] = {}
+        merged: list[str] = []
+        for keeper, duplicates in _near_duplicates(embeddings, self.similarity).items():
+            duplicates = [i for i in duplicates if (memories[i].updated_at or 0) < settled]
+            if not duplicates:
+                continue
+            survivor = memories[keeper]
+            topics = list(survivor.topics or [])
+            for i in duplicates:
+                topics += [t for t in memories[i].topics or [] if t not in topics]
+                merged.append(ids[i])
+            survivor.topics = topics or None
+            survivors[ids[keeper]] = survivor
+        if not merged:
+            return 0
+        self.db.upsert_memories(list(survivors.values()), preserve_updated_at=True)
+        self.db.delete_user_memories(merged, user_id=user_id)
+        return len(merged)
+
+    def _compact(self, since: int | None) -> CompactionResult:
+        result = CompactionResult()
+        page = 1
+        while True:
+            # Users come newest-updated first, so the first one older than ``since`` ends the pass.
+            users, _ = self.db.get_user_memory_stats(limit=100, page=page)
+            for row in users:
+                if since is not None and (row["last_memory_updated_at"] or 0) < since:
+                    return result
+                if row["total_memories"] < self.min_memories:
+                    continue
+                result.users += 1
+                result.merged += self.compact_user(row["user_id"])
+            if len(users) < 100:
+                return result
+            page += 1
+
+
+def _near_duplicates(embeddings: list[list[float]], similarity: float) -> dict[int, list[int]]:
+    """Group rows (newest first) under the newest row they are at least ``similarity`` close to."""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    scores = vectors @ vectors.T
+    groups: dict[int, list[int]] = {}
+    for i in range(len(vectors)):
+        keeper = next((k for k in groups if scores[i, k] >= similarity), None)
+        if keeper is None:
+            groups[i] = []
+        else:
+            groups[keeper].append(i)
+    return {keeper: rows for keeper, rows in groups.items() if rows}
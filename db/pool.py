@@ -0,0 +1,105 @@
+"""
+Database Pool
+=============
+
+Process-wide SQLAlchemy engine registry.
+
+Every ``PostgresDb`` and ``PgVector`` in this process borrows its engine
+from here, so each uvicorn worker holds one connection pool per database
+URL instead of one per ``get_postgres_db()`` call. Pool sizing comes
+from env vars (see ``PoolSettings``); ``pool_stats()`` reports live usage
+for the ``/ops/db/pool`` endpoint.
+"""
+
+from dataclasses import asdict, dataclass
+from os import getenv
+from threading import Lock
+
+from agno.db.utils import json_serializer
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.pool import QueuePool
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    """Connection pool knobs, read from the environment."""
+
+    size: int = 5
+    max_overflow: int = 10
+    timeout: float = 30.0
+    recycle: int = 1800
+    pre_ping: bool = True
+
+    @classmethod
+    def from_env(cls) -> "PoolSettings":
+        return cls(
+            size=int(getenv("DB_POOL_SIZE", cls.size)),
+            max_overflow=int(getenv("DB_MAX_OVERFLOW", cls.max_overflow)),
+            timeout=float(getenv("DB_POOL_TIMEOUT", cls.timeout)),
+            recycle=int(getenv("DB_POOL_RECYCLE", cls.recycle)),
+            pre_ping=_env_bool("DB_POOL_PRE_PING", cls.pre_ping),
+        )
+
+
+_engines: dict[str, Engine] = {}
+_lock = Lock()
+
+
+def get_engine(url: str) -> Engine:
+    """Return the shared engine for ``url``, creating it on first use."""
+    engine = _engines.get(url)
+    if engine is not None:
+        return engine
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            settings = PoolSettings.from_env()
+            engine = create_engine(
+                url,
+                poolclass=QueuePool,
+                pool_size=settings.size,
+                max_overflow=settings.max_overflow,
+                pool_timeout=settings.timeout,
+                pool_recycle=settings.recycle,
+                pool_pre_ping=settings.pre_ping,
+                json_serializer=json_serializer,
+            )
+            _engines[url] = engine
+    return engine
+
+
+def pool_stats() -> list[dict]:
+    """Snapshot of every registered pool: configured limits and live usage."""
+    settings = asdict(PoolSettings.from_env())
+    stats: list[dict] = []
+    for engine in list(_engines.values()):
+        pool = engine.pool
+        entry: dict = {"url": engine.url.render_as_string(hide_password=True), "settings": settings}
+        if isinstance(pool, QueuePool):
+            entry.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+            )
+        stats.append(entry)
+    return stats
+
+
+def dispose_engines(*, close: bool = True) -> None:
+    """Close every pooled connection. Call on shutdown or after fork.
+
+    Engines stay registered; a disposed pool reconnects lazily on next use.
+    In a freshly forked worker pass ``close=False``: the child drops the
+    connections it inherited without closing sockets the parent still owns.
+    """
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose(close=close)
@@ -4,44 +4,151 @@ Database Session
 
 PostgreSQL connection helpers.
 ``get_postgres_db()`` for agent storage backed by Postgres.
+``get_trace_db()`` for traces, in ``TRACE_DB_URL`` when it is set.
 ``create_knowledge()`` for agent knowledge backed by PgVector.
+
+Both draw from the shared engine registry in ``db.pool``, and
+``get_postgres_db()`` hands back one ``PostgresDb`` per table config.
+
+Session reads are timed: every run loads its whole session (all stored
+runs) before building history, and ``session_load_seconds`` holds the
+last load in the current context for ``app.history`` to report.
+``session_has_runs()`` and ``user_has_memories()`` answer "is there any"
+with an indexed existence query instead of loading the rows.
 """
 
+import time
+from contextvars import ContextVar
+from os import getenv
+from threading import Lock
+from typing import Any
+
 from agno.db.postgres import PostgresDb
 from agno.knowledge import Knowledge
+from agno.knowledge.embedder.base import Embedder
 from agno.knowledge.embedder.openai import OpenAIEmbedder
-from agno.vectordb.pgvector import PgVector, SearchType
+from agno.vectordb.pgvector import SearchType
+from sqlalchemy import TextClause, text
+from sqlalchemy.exc import ProgrammingError
 
-from db.url import db_url
+from db.embedding_cache import CachedEmbedder
+from db.pool import get_engine
+from db.url import db_url, trace_db_url
+from db.vector import IndexSpec, TunedPgVector
 
 DB_ID = "agentos-db"
+TRACE_DB_ID = "agentos-traces"
+
+_dbs: dict[tuple[str, str | None], PostgresDb] = {}
+_dbs_lock = Lock()
+
+session_load_seconds: ContextVar[float | None] = ContextVar("session_load_seconds", default=None)
+
+
+class TimedPostgresDb(PostgresDb):
+    """PostgresDb that records how long each session read takes."""
+
+    def get_session(self, *args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return super().get_session(*args, **kwargs)
+        finally:
+            session_load_seconds.set(time.perf_counter() - started)
+
+    def session_has_runs(self, session_id: str, user_id: str | None = None) -> bool:
+        """Whether the agent session exists (for ``user_id``, if given) and has stored runs."""
+        query = text(
+            f"SELECT 1 FROM {self.db_schema}.{self.session_table_name} "
+            "WHERE session_id = :session_id AND session_type = 'agent' AND runs @> '[{}]' "
+            "AND (CAST(:user_id AS text) IS NULL OR user_id = :user_id)"
+        )
+        return self._exists(query, {"session_id": session_id, "user_id": user_id})
+
+    def user_has_memories(self, user_id: str) -> bool:
+        query = text(f"SELECT 1 FROM {self.db_schema}.{self.memory_table_name} WHERE user_id = :user_id LIMIT 1")
+        return self._exists(query, {"user_id": user_id})
+
+    def _exists(self, query: TextClause, params: dict[str, Any]) -> bool:
+        try:
+            with self.db_engine.connect() as conn:
+                return conn.execute(query, params).first() is not None
+        except ProgrammingError:
+            # agno creates its tables on first write; no table, no rows.
+            return False
 
 
 def get_postgres_db(contents_table: str | None = None) -> PostgresDb:
-    """Create a PostgresDb instance.
+    """Return the shared PostgresDb for this table config.
 
     Pass ``contents_table`` only when this database is the ``contents_db``
     of a Knowledge base — it tells agno where to persist document contents.
     For plain agent persistence (sessions, memory) leave it unset.
+
+    Instances are cached per ``(db_url, contents_table)`` and all of them
+    share one pooled engine, so calling this from every agent is cheap.
     """
-    if contents_table is not None:
-        return PostgresDb(id=DB_ID, db_url=db_url, knowledge_table=contents_table)
-    return PostgresDb(id=DB_ID, db_url=db_url)
+    key = (db_url, contents_table)
+    with _dbs_lock:
+        db = _dbs.get(key)
+        if db is None:
+            if contents_table is not None:
+                db = TimedPostgresDb(
+                    id=DB_ID, db_url=db_url, db_engine=get_engine(db_url), knowledge_table=contents_table
+                )
+            else:
+                db = TimedPostgresDb(id=DB_ID, db_url=db_url, db_engine=get_engine(db_url))
+            _dbs[key] = db
+    return db
 
 
-def create_knowledge(name: str, table_name: str) -> Knowledge:
+def get_trace_db() -> PostgresDb:
+    """Return the database traces are written to.
+
+    Without ``TRACE_DB_URL`` this is ``get_postgres_db()``. With it, span
+    writes and trace queries go to a separate database (and pool), so they
+    don't contend with the session and memory tables.
+    """
+    if trace_db_url == db_url:
+        return get_postgres_db()
+    key = (trace_db_url, None)
+    with _dbs_lock:
+        db = _dbs.get(key)
+        if db is None:
+            db = _dbs[key] = PostgresDb(id=TRACE_DB_ID, db_url=trace_db_url, db_engine=get_engine(trace_db_url))
+    return db
+
+
+def create_knowledge(
+    name: str,
+    table_name: str,
+    embedder: Embedder | None = None,
+    index: IndexSpec | None = None,
+) -> Knowledge:
     """PgVector knowledge base with hybrid search.
 
     Plug into an Agent's ``knowledge=`` to give it a RAG surface. Vectors
     land in ``table_name``; document contents in ``{table_name}_contents``.
+
+    Embeddings go through the shared embedding cache, so re-ingesting
+    unchanged chunks is free, and rows are written with ``COPY``. Pass
+    ``embedder`` to swap the model (e.g. a local fake in tests); it is
+    wrapped in the cache too.
+
+    ``index`` picks the ANN index (HNSW by default, or IVFFlat) and its
+    build / query parameters; a GIN index backs the full-text half of
+    hybrid search. New tables get their indexes on creation, existing ones
+    via ``python -m db index build --table <table_name>``.
     """
+    inner = embedder or OpenAIEmbedder(id="text-embedding-3-small", batch_size=int(getenv("EMBED_BATCH_SIZE", "100")))
     return Knowledge(
         name=name,
-        vector_db=PgVector(
+        vector_db=TunedPgVector(
             db_url=db_url,
+            db_engine=get_engine(db_url),
             table_name=table_name,
             search_type=SearchType.hybrid,
-            embedder=OpenAIEmbedder(id="text-embedding-3-small"),
+            embedder=CachedEmbedder(embedder=inner, max_workers=int(getenv("EMBED_MAX_WORKERS", "4"))),
+            index_spec=index,
         ),
         contents_db=get_postgres_db(contents_table=f"{table_name}_contents"),
     )
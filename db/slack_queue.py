@@ -0,0 +1,274 @@
+"""
+Slack Event Queue
+=================
+
+Durable Postgres queue for Slack Events API deliveries.
+
+The webhook only verifies and inserts; workers claim and process later.
+Rows are keyed by Slack's ``event_id``, so Slack's retries of a delivery
+(and any duplicate webhook) collapse into one row and one agent run.
+
+Claiming is serialized with a transaction-level advisory lock and only
+hands out the oldest pending event of a channel that has nothing running,
+so events in a channel are processed one at a time, in order, across all
+workers and replicas. A per-workspace (``team_id``) cap bounds how many
+events of one workspace run at once.
+
+A worker that dies mid-event leaves its row ``running``; once the lease
+expires the row goes back to ``pending`` (or ``failed`` after
+``max_attempts``).
+
+An event can also be deferred (e.g. when its user is over a rate limit):
+it goes back to ``pending`` but is not claimed again, nor is anything
+after it in its channel, until the delay is up.
+"""
+
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    extract,
+    func,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import JSONB, insert
+
+from db.pool import get_engine
+from db.url import db_url
+
+_PURGE_EVERY = 200
+
+
+@dataclass
+class ClaimedEvent:
+    event_id: str
+    team_id: str
+    channel_id: str
+    payload: dict
+    enqueued_at: datetime
+    started_at: datetime
+
+    @property
+    def wait_seconds(self) -> float:
+        return (self.started_at - self.enqueued_at).total_seconds()
+
+
+class SlackEventQueue:
+    """Deduplicating, per-channel ordered event queue in ``{schema}.{table_name}``.
+
+    ``lease`` is how long (seconds) a claimed event may run before it is
+    considered abandoned; keep it above the longest agent run. Finished
+    rows are kept for ``retention`` seconds for inspection, then purged.
+    """
+
+    def __init__(
+        self,
+        table_name: str = "slack_events",
+        *,
+        lease: int = 900,
+        max_attempts: int = 2,
+        retention: int = 86400,
+        schema: str = "ai",
+    ) -> None:
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self._ready = False
+        self._finished = 0
+        self.table = Table(
+            table_name,
+            MetaData(schema=schema),
+            Column("event_id", String, primary_key=True),
+            Column("team_id", String, nullable=False),
+            Column("channel_id", String, nullable=False),
+            Column("payload", JSONB, nullable=False),
+            Column("status", String(16), nullable=False),
+            Column("attempts", Integer, nullable=False, default=0),
+            Column("worker", String),
+            Column("error", Text),
+            Column("enqueued_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+            Column("started_at", DateTime(timezone=True)),
+            Column("finished_at", DateTime(timezone=True)),
+            Index(f"ix_{table_name}_status", "status", "enqueued_at"),
+            Index(f"ix_{table_name}_channel", "channel_id", "status"),
+        )
+        self._name = f"{schema}.{table_name}"
+
+    # -- Producer -------------------------------------------------------------
+
+    def enqueue(self, event_id: str, team_id: str, channel_id: str, payload: dict) -> bool:
+        """Insert a delivery. Returns ``False`` when ``event_id`` was already queued."""
+        self._ensure_table()
+        stmt = (
+            insert(self.table)
+            .values(event_id=event_id, team_id=team_id, channel_id=channel_id, payload=payload, status="pending")
+            .on_conflict_do_nothing(index_elements=["event_id"])
+        )
+        with get_engine(db_url).begin() as conn:
+            return conn.execute(stmt).rowcount > 0
+
+    # -- Consumer -------------------------------------------------------------
+
+    def claim(self, worker: str, limit: int, team_limit: int) -> list[ClaimedEvent]:
+        """Mark up to ``limit`` runnable events as running for ``worker`` and return them."""
+        self._ensure_table()
+        t = self.table
+        with get_engine(db_url).begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": self._name})
+            expired = t.c.started_at < func.now() - text(f"interval '{int(self.lease)} seconds'")
+            conn.execute(
+                update(t)
+                .where(t.c.status == "running", expired, t.c.attempts < self.max_attempts)
+                .values(status="pending", worker=None)
+            )
+            conn.execute(
+                update(t)
+                .where(t.c.status == "running", expired)
+                .values(status="failed", error="lease expired", finished_at=func.now())
+            )
+            rows = conn.execute(
+                text(
+                    f"""
+                    WITH busy AS (
+                        SELECT team_id, channel_id FROM {self._name} WHERE status = 'running'
+                    ), heads AS (
+                        SELECT DISTINCT ON (channel_id) event_id, team_id, channel_id, enqueued_at, started_at
+                        FROM {self._name}
+                        WHERE status = 'pending'
+                        ORDER BY channel_id, enqueued_at, event_id
+                    ), runnable AS (
+                        SELECT h.event_id, h.enqueued_at,
+                               row_number() OVER (PARTITION BY h.team_id ORDER BY h.enqueued_at)
+                               + (SELECT count(*) FROM busy b WHERE b.team_id = h.team_id) AS team_slot
+                        FROM heads h
+                        WHERE h.channel_id NOT IN (SELECT channel_id FROM busy)
+                          AND (h.started_at IS NULL OR h.started_at <= now())
+                    )
+                    UPDATE {self._name} e
+                    SET status = 'running', worker = :worker, attempts = e.attempts + 1, started_at = now()
+                    FROM (
+                        SELECT event_id FROM runnable WHERE team_slot <= :team_limit
+                        ORDER BY enqueued_at LIMIT :limit
+                    ) c
+                    WHERE e.event_id = c.event_id
+                    RETURNING e.event_id, e.team_id, e.channel_id, e.payload, e.enqueued_at, e.started_at
+                    """
+                ),
+                {"worker": worker, "limit": limit, "team_limit": team_limit},
+            ).all()
+        claimed = [
+            ClaimedEvent(
+                event_id=row.event_id,
+                team_id=row.team_id,
+                channel_id=row.channel_id,
+                payload=row.payload if isinstance(row.payload, dict) else json.loads(row.payload),
+                enqueued_at=row.enqueued_at,
+                started_at=row.started_at,
+            )
+            for row in rows
+        ]
+        return sorted(claimed, key=lambda c: c.enqueued_at)
+
+    def complete(self, event_id: str, error: str | None = None) -> None:
+        """Mark an event done (or failed, with ``error``)."""
+        t = self.table
+        with get_engine(db_url).begin() as conn:
+            conn.execute(
+                update(t)
+                .where(t.c.event_id == event_id)
+                .values(status="failed" if error else "done", error=error, finished_at=func.now())
+            )
+            self._finished += 1
+            if self._finished % _PURGE_EVERY == 0:
+                conn.execute(
+                    t.delete().where(
+                        t.c.status.in_(("done", "failed")),
+                        t.c.finished_at < func.now() - text(f"interval '{int(self.retention)} seconds'"),
+                    )
+                )
+
+    def release(self, event_ids: list[str]) -> None:
+        """Hand claimed events back to the queue (e.g. on shutdown) without counting the attempt."""
+        if not event_ids:
+            return
+        t = self.table
+        with get_engine(db_url).begin() as conn:
+            conn.execute(
+                update(t)
+                .where(t.c.event_id.in_(event_ids), t.c.status == "running")
+                .values(status="pending", worker=None, started_at=None, attempts=t.c.attempts - 1)
+            )
+
+    def defer(self, event_id: str, seconds: float) -> None:
+        """Hand a claimed event back, not to be claimed again for ``seconds``, without counting the attempt.
+
+        A pending row's ``started_at`` is the earliest time it may be
+        claimed; the rest of its channel waits behind it.
+        """
+        t = self.table
+        with get_engine(db_url).begin() as conn:
+            conn.execute(
+                update(t)
+                .where(t.c.event_id == event_id, t.c.status == "running")
+                .values(
+                    status="pending",
+                    worker=None,
+                    started_at=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, seconds),
+                    attempts=t.c.attempts - 1,
+                )
+            )
+
+    # -- Metrics --------------------------------------------------------------
+
+    def depth(self) -> dict[str, Any]:
+        """Pending / running counts, oldest pending age and busiest workspaces."""
+        self._ensure_table()
+        t = self.table
+        with get_engine(db_url).connect() as conn:
+            rows = conn.execute(
+                select(
+                    t.c.status,
+                    func.count(),
+                    extract("epoch", func.now() - func.min(t.c.enqueued_at)),
+                )
+                .where(t.c.status.in_(("pending", "running")))
+                .group_by(t.c.status)
+            ).all()
+            teams = conn.execute(
+                select(t.c.team_id, func.count())
+                .where(t.c.status.in_(("pending", "running")))
+                .group_by(t.c.team_id)
+                .order_by(func.count().desc())
+                .limit(10)
+            ).all()
+        by_status = {status: (count, age) for status, count, age in rows}
+        pending, oldest = by_status.get("pending", (0, None))
+        return {
+            "pending": pending,
+            "running": by_status.get("running", (0, None))[0],
+            "oldest_pending_seconds": round(float(oldest), 3) if oldest is not None else None,
+            "by_team": {team or "unknown": count for team, count in teams},
+        }
+
+    # -- Internals ------------------------------------------------------------
+
+    def _ensure_table(self) -> None:
+        if self._ready:
+            return
+        engine = get_engine(db_url)
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {self.table.schema}"))
+        self.table.metadata.create_all(engine, checkfirst=True)
+        self._ready = True
@@ -0,0 +1,292 @@
+"""
+Tool Cache
+==========
+
+Postgres-backed response cache for tool calls, plugged into an Agent
+through ``tool_hooks=[cache.hook]``.
+
+Each cached tool is declared as either a ``"query"`` tool (free-text
+search) or a ``"url"`` tool (page fetch). Arguments are normalized before
+hashing, so ``"Latest  OpenAI model?"`` and ``"latest openai model"``
+share an entry. Query tools can also hit on near-duplicate wording when
+an embedder and ``similarity`` threshold are configured.
+
+Queries that look time-sensitive ("latest", "today", "this week", ...)
+are stored with ``recent_ttl`` instead of ``ttl`` so answers about recent
+events stay fresh.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any, Literal
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from agno.knowledge.embedder.base import Embedder
+from agno.tools.function import ToolResult
+from agno.utils.log import log_debug, log_warning
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Boolean, Column, DateTime, Index, MetaData, String, Table, Text, delete, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from db.pool import get_engine
+from db.url import db_url
+
+ToolKind = Literal["query", "url"]
+
+_RECENT_PATTERN = re.compile(
+    r"\b(latest|newest|recent|recently|today|tonight|yesterday|breaking|news|now|current|currently|upcoming"
+    r"|this (?:week|month|year|morning|evening)|last (?:week|month|night))\b"
+)
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+_PURGE_EVERY = 100
+
+
+def normalize_query(value: str) -> str:
+    """Casefold, collapse whitespace and drop trailing punctuation."""
+    return " ".join(value.casefold().split()).strip(" ?!.")
+
+
+def normalize_url(value: str) -> str:
+    """Lowercase scheme/host, drop fragments, tracking params and trailing slashes."""
+    parts = urlsplit(value.strip())
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith(_TRACKING_PARAMS)))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+def is_time_sensitive(query: str) -> bool:
+    """True when the query asks about recent events."""
+    if _RECENT_PATTERN.search(query):
+        return True
+    year = datetime.now(UTC).year
+    return str(year) in query or str(year - 1) in query
+
+
+class ToolCache:
+    """Exact + optional semantic cache for a set of tools.
+
+    ``tools`` maps tool name to kind. ``ttl`` and ``recent_ttl`` are in
+    seconds. ``similarity`` (cosine, 0-1) enables near-duplicate hits for
+    query tools and requires ``embedder``.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        tools: dict[str, ToolKind],
+        *,
+        ttl: int = 3600,
+        recent_ttl: int = 300,
+        embedder: Embedder | None = None,
+        similarity: float | None = None,
+        enabled: bool = True,
+        schema: str = "ai",
+    ) -> None:
+        self.tools = tools
+        self.ttl = ttl
+        self.recent_ttl = recent_ttl
+        self.embedder = embedder if similarity is not None else None
+        self.similarity = similarity
+        self.enabled = enabled
+        self.stats: Counter[str] = Counter()
+        self._ready = False
+        self._writes = 0
+
+        columns: list[Column] = [
+            Column("key", String(64), primary_key=True),
+            Column("tool_name", String, nullable=False),
+            Column("params_key", String(64), nullable=False),
+            Column("normalized", Text, nullable=False),
+            Column("result", Text, nullable=False),
+            Column("is_tool_result", Boolean, nullable=False, default=False),
+            Column("created_at", DateTime(timezone=True), nullable=False),
+            Column("expires_at", DateTime(timezone=True), nullable=False, index=True),
+        ]
+        if self.embedder is not None:
+            columns.append(Column("embedding", Vector(self.embedder.dimensions)))
+        self.table = Table(
+            table_name,
+            MetaData(schema=schema),
+            *columns,
+            Index(f"ix_{table_name}_lookup", "tool_name", "params_key"),
+        )
+
+    def __deepcopy__(self, memo: dict) -> "ToolCache":
+        # AgentOS deep-copies the agent (and its hook list) per request; the stats and table state stay shared.
+        return self
+
+    # -- Hook ---------------------------------------------------------------
+
+    async def hook(self, function_name: str, function_call: Callable[..., Awaitable[Any]], arguments: dict) -> Any:
+        """Agno tool hook: serve cached results, otherwise call through and store."""
+        kind = self.tools.get(function_name)
+        if not self.enabled or kind is None:
+            return await function_call(**arguments)
+
+        normalized, params = self._normalize(kind, arguments)
+        params_key = _digest(function_name, params)
+        key = _digest(function_name, params, normalized)
+        embedding: list[float] | None = None
+        cached = None
+        try:
+            if kind == "query" and self.embedder is not None:
+                embedding = await asyncio.to_thread(self.embedder.get_embedding, normalized) or None
+            cached = await asyncio.to_thread(self._lookup, function_name, key, params_key, embedding)
+        except Exception as exc:
+            log_warning(f"tool cache lookup failed for {function_name}: {exc}")
+            self.stats["errors"] += 1
+        if cached is not None:
+            return cached
+
+        self.stats[f"{function_name}.misses"] += 1
+        result = await function_call(**arguments)
+        content, is_tool_result = _content_of(result)
+        if content is not None and not _is_error(content):
+            try:
+                await asyncio.to_thread(
+                    self._store, function_name, key, params_key, normalized, kind, content, is_tool_result, embedding
+                )
+            except Exception as exc:
+                log_warning(f"tool cache store failed for {function_name}: {exc}")
+                self.stats["errors"] += 1
+        return result
+
+    def snapshot(self) -> dict:
+        """Counters plus derived hit ratio, for the ops endpoint."""
+        hits = sum(v for k, v in self.stats.items() if k.endswith("hits"))
+        misses = sum(v for k, v in self.stats.items() if k.endswith(".misses"))
+        total = hits + misses
+        return {
+            "enabled": self.enabled,
+            "hit_ratio": round(hits / total, 4) if total else None,
+            "counters": dict(sorted(self.stats.items())),
+        }
+
+    # -- Internals ----------------------------------------------------------
+
+    def _normalize(self, kind: ToolKind, arguments: dict) -> tuple[str, dict]:
+        """Split arguments into the normalized cache text and the remaining params."""
+        texts: list[str] = []
+        params: dict = {}
+        for name, value in sorted(arguments.items()):
+            if value is None:
+                continue
+            if kind == "url" and name in ("url", "urls"):
+                urls = [value] if isinstance(value, str) else list(value)
+                texts.extend(sorted({normalize_url(u) for u in urls}))
+            elif kind == "query" and isinstance(value, str):
+                texts.append(normalize_query(value))
+            elif kind == "query" and isinstance(value, list) and all(isinstance(v, str) for v in value):
+                texts.extend(sorted({normalize_query(v) for v in value}))
+            else:
+                params[name] = value
+        return "\n".join(texts), params
+
+    def _ensure_table(self) -> None:
+        if self._ready:
+            return
+        engine = get_engine(db_url)
+        with engine.begin() as conn:
+            if self.embedder is not None:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {self.table.schema}"))
+        self.table.metadata.create_all(engine, checkfirst=True)
+        self._ready = True
+
+    def _lookup(self, tool_name: str, key: str, params_key: str, embedding: list[float] | None) -> Any:
+        self._ensure_table()
+        now = datetime.now(UTC)
+        t = self.table
+        with get_engine(db_url).connect() as conn:
+            row = conn.execute(
+                select(t.c.result, t.c.is_tool_result).where(t.c.key == key, t.c.expires_at > now)
+            ).first()
+            if row is not None:
+                self.stats[f"{tool_name}.hits"] += 1
+                return _restore(row.result, row.is_tool_result)
+
+            if embedding is None or self.similarity is None:
+                return None
+            distance = t.c.embedding.cosine_distance(embedding)
+            row = conn.execute(
+                select(t.c.result, t.c.is_tool_result, distance.label("distance"))
+                .where(
+                    t.c.tool_name == tool_name,
+                    t.c.params_key == params_key,
+                    t.c.expires_at > now,
+                    t.c.embedding.is_not(None),
+                )
+                .order_by(distance)
+                .limit(1)
+            ).first()
+        if row is None or 1 - row.distance < self.similarity:
+            return None
+        log_debug(f"tool cache semantic hit for {tool_name} (similarity {1 - row.distance:.3f})")
+        self.stats[f"{tool_name}.semantic_hits"] += 1
+        return _restore(row.result, row.is_tool_result)
+
+    def _store(
+        self,
+        tool_name: str,
+        key: str,
+        params_key: str,
+        normalized: str,
+        kind: ToolKind,
+        content: str,
+        is_tool_result: bool,
+        embedding: list[float] | None,
+    ) -> None:
+        self._ensure_table()
+        now = datetime.now(UTC)
+        ttl = self.recent_ttl if kind == "query" and is_time_sensitive(normalized) else self.ttl
+        values: dict = {
+            "key": key,
+            "tool_name": tool_name,
+            "params_key": params_key,
+            "normalized": normalized,
+            "result": content,
+            "is_tool_result": is_tool_result,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=ttl),
+        }
+        if self.embedder is not None:
+            values["embedding"] = embedding
+        stmt = insert(self.table).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=["key"], set_={k: v for k, v in values.items() if k != "key"})
+        self.stats[f"{tool_name}.stores"] += 1
+        self._writes += 1
+        with get_engine(db_url).begin() as conn:
+            conn.execute(stmt)
+            if self._writes % _PURGE_EVERY == 0:
+                conn.execute(delete(self.table).where(self.table.c.expires_at <= now))
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _content_of(result: Any) -> tuple[str | None, bool]:
+    if isinstance(result, str):
+        return result, False
+    if isinstance(result, ToolResult) and not (result.images or result.videos or result.audios or result.files):
+        return result.content, True
+    return None, False
+
+
+def _restore(content: str, is_tool_result: bool) -> Any:
+    return ToolResult(content=content) if is_tool_result else content
+
+
+def _is_error(content: str) -> bool:
+    if content.startswith(("Error", "error")):
+        return True
+    try:
+        payload = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return False
+    return isinstance(payload, dict) and "error" in payload
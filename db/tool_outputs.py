@@ -0,0 +1,87 @@
+"""
+Tool Output Store
+=================
+
+Postgres store for full tool outputs that were cut down before reaching
+the model (see ``app/tool_output.py``).
+
+Each output is kept under a short id derived from its content, so the
+same page fetched twice is stored once, and the compacted result handed
+to the model only carries the id. Rows expire after ``retention``
+seconds and are purged as new ones are written.
+"""
+
+import hashlib
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, Text, delete, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from db.pool import get_engine
+from db.url import db_url
+
+_PURGE_EVERY = 100
+
+
+class ToolOutputStore:
+    """Full tool outputs in ``{schema}.{table_name}``, by id."""
+
+    def __init__(self, table_name: str = "tool_outputs", *, retention: int = 604800, schema: str = "ai") -> None:
+        self.retention = retention
+        self._ready = False
+        self._writes = 0
+        self.table = Table(
+            table_name,
+            MetaData(schema=schema),
+            Column("output_id", String(32), primary_key=True),
+            Column("tool_name", String, nullable=False),
+            Column("source", Text, nullable=False),
+            Column("content", Text, nullable=False),
+            Column("created_at", DateTime(timezone=True), nullable=False),
+            Column("expires_at", DateTime(timezone=True), nullable=False, index=True),
+        )
+
+    @staticmethod
+    def output_id(content: str) -> str:
+        return "out_" + hashlib.sha256(content.encode()).hexdigest()[:16]
+
+    def put(self, tool_name: str, source: str, content: str) -> str:
+        """Store ``content`` (fetched from ``source``) and return its id."""
+        self._ensure_table()
+        output_id = self.output_id(content)
+        now = datetime.now(UTC)
+        values = {
+            "output_id": output_id,
+            "tool_name": tool_name,
+            "source": source,
+            "content": content,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.retention),
+        }
+        stmt = insert(self.table).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=["output_id"], set_={"expires_at": values["expires_at"]})
+        self._writes += 1
+        with get_engine(db_url).begin() as conn:
+            conn.execute(stmt)
+            if self._writes % _PURGE_EVERY == 0:
+                conn.execute(delete(self.table).where(self.table.c.expires_at <= now))
+        return output_id
+
+    def get(self, output_id: str) -> tuple[str, str] | None:
+        """``(source, content)`` of a stored output, or None if it is unknown or expired."""
+        self._ensure_table()
+        t = self.table
+        with get_engine(db_url).connect() as conn:
+            row = conn.execute(
+                select(t.c.source, t.c.content).where(t.c.output_id == output_id, t.c.expires_at > datetime.now(UTC))
+            ).first()
+        return (row.source, row.content) if row is not None else None
+
+    def _ensure_table(self) -> None:
+        if self._ready:
+            return
+        engine = get_engine(db_url)
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {self.table.schema}"))
+        self.table.metadata.create_all(engine, checkfirst=True)
+        self._ready = True
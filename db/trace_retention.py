@@ -0,0 +1,139 @@
+"""
+Trace Retention
+===============
+
+Rolls traces older than a retention window up into daily aggregates and
+deletes their rows.
+
+agno writes one row per trace and one per span and never removes them,
+so at production request rates the span table grows without bound. Past
+``retention_days`` a trace is only useful in aggregate. ``roll_up()``
+folds old traces into ``{schema}.{table_name}``: one row per day,
+component (workflow, team or agent id, else the trace name) and status,
+holding the trace count and total / max duration. The traces and their
+spans are then deleted.
+
+Each batch deletes and aggregates in one transaction, and rows are
+claimed with ``FOR UPDATE SKIP LOCKED`` under an advisory lock, so every
+worker may run it and no trace is counted twice.
+"""
+
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+from agno.db.postgres import PostgresDb
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    Integer,
+    MetaData,
+    PrimaryKeyConstraint,
+    String,
+    Table,
+    text,
+)
+
+
+@dataclass
+class RollupResult:
+    traces: int = 0
+    spans: int = 0
+    batches: int = 0
+    skipped: bool = False  # another worker held the lock
+
+
+class TraceRetention:
+    """Daily roll-up and deletion of traces older than ``retention_days`` in ``db``."""
+
+    def __init__(
+        self,
+        db: PostgresDb,
+        *,
+        retention_days: int = 14,
+        batch_size: int = 1000,
+        table_name: str = "agno_trace_rollups",
+    ) -> None:
+        self.db = db
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self._ready = False
+        self.table = Table(
+            table_name,
+            MetaData(schema=db.db_schema),
+            Column("day", Date, nullable=False),
+            Column("component", String, nullable=False),
+            Column("status", String(16), nullable=False),
+            Column("traces", Integer, nullable=False),
+            Column("total_ms", BigInteger, nullable=False),
+            Column("max_ms", BigInteger, nullable=False),
+            PrimaryKeyConstraint("day", "component", "status"),
+        )
+        self._rollups = f"{db.db_schema}.{table_name}"
+        self._traces = f"{db.db_schema}.{db.trace_table_name}"
+        self._spans = f"{db.db_schema}.{db.span_table_name}"
+
+    def roll_up(self) -> RollupResult:
+        """Aggregate and delete every trace older than the window, one batch per transaction."""
+        self._ensure_table()
+        # agno stores times as UTC ISO 8601 strings, which sort as text; comparing as text keeps the index usable.
+        cutoff = (datetime.now(UTC) - timedelta(days=self.retention_days)).isoformat()
+        result = RollupResult()
+        while True:
+            with self.db.db_engine.begin() as conn:
+                locked = conn.execute(
+                    text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), {"name": self._rollups}
+                ).scalar()
+                if not locked:
+                    result.skipped = True
+                    return result
+                ids = (
+                    conn.execute(
+                        text(
+                            f"SELECT trace_id FROM {self._traces} WHERE start_time < :cutoff "
+                            "ORDER BY start_time LIMIT :limit FOR UPDATE SKIP LOCKED"
+                        ),
+                        {"cutoff": cutoff, "limit": self.batch_size},
+                    )
+                    .scalars()
+                    .all()
+                )
+                if not ids:
+                    return result
+                result.spans += conn.execute(
+                    text(f"DELETE FROM {self._spans} WHERE trace_id = ANY(:ids)"), {"ids": ids}
+                ).rowcount
+                conn.execute(
+                    text(
+                        f"""
+                        WITH gone AS (
+                            DELETE FROM {self._traces} WHERE trace_id = ANY(:ids)
+                            RETURNING start_time, status, duration_ms,
+                                      coalesce(workflow_id, team_id, agent_id, name) AS component
+                        )
+                        INSERT INTO {self._rollups} AS r (day, component, status, traces, total_ms, max_ms)
+                        SELECT left(start_time, 10)::date, component, status,
+                               count(*), sum(duration_ms), max(duration_ms)
+                        FROM gone
+                        GROUP BY 1, 2, 3
+                        ON CONFLICT (day, component, status) DO UPDATE
+                        SET traces = r.traces + excluded.traces,
+                            total_ms = r.total_ms + excluded.total_ms,
+                            max_ms = greatest(r.max_ms, excluded.max_ms)
+                        """
+                    ),
+                    {"ids": ids},
+                )
+            result.traces += len(ids)
+            result.batches += 1
+            if len(ids) < self.batch_size:
+                return result
+
+    def _ensure_table(self) -> None:
+        if self._ready:
+            return
+        engine = self.db.db_engine
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {self.table.schema}"))
+        self.table.metadata.create_all(engine, checkfirst=True)
+        self._ready = True
@@ -20,3 +20,6 @@ def build_db_url() -> str:
 
 
 db_url = build_db_url()
+
+# Traces can live in their own database (a full SQLAlchemy URL); unset, they share db_url.
+trace_db_url = getenv("TRACE_DB_URL") or db_url
@@ -0,0 +1,503 @@
+"""
+Tuned PgVector
+==============
+
+``PgVector`` tuned for large knowledge tables.
+
+Writes:
+
+- every document in a call is embedded up front through the embedder's
+  batch API (``CachedEmbedder`` turns repeat chunks into cache hits)
+- rows are streamed into the table with ``COPY`` instead of one
+  multi-row ``INSERT`` per batch
+- upserts ``COPY`` into a temp table and merge with a single
+  ``INSERT ... SELECT ... ON CONFLICT``
+
+Indexes and search, driven by an ``IndexSpec``:
+
+- an HNSW or IVFFlat index on ``embedding`` plus a GIN index on
+  ``to_tsvector(content)``, built with ``CREATE INDEX CONCURRENTLY``
+- ``hnsw.ef_search`` / ``ivfflat.probes`` set per query (``SET LOCAL``)
+- hybrid search scores only a candidate pool (top ANN hits plus top
+  full-text hits) instead of every row, so both indexes are usable
+
+Record ids, cleaning, metadata merging and hybrid scoring match upstream
+``PgVector``, so tables written by either class are interchangeable. On
+engines not using the psycopg 3 driver, writes fall back to the parent.
+
+Build or inspect indexes on an existing table with ``python -m db index``.
+"""
+
+import asyncio
+import json
+import re
+import time
+from dataclasses import dataclass
+from hashlib import md5
+from math import sqrt
+from typing import Any, Literal
+
+from agno.knowledge.document import Document
+from agno.utils.log import log_error, log_info, log_warning
+from agno.vectordb.distance import Distance
+from agno.vectordb.pgvector import HNSW, Ivfflat, PgVector
+from sqlalchemy import ColumnElement, and_, bindparam, desc, func, literal_column, select, text, union
+
+from app.stats import distribution
+
+_COLUMNS = ("id", "name", "meta_data", "filters", "content", "embedding", "usage", "content_hash", "content_id")
+_JSON_COLUMNS = {"meta_data", "filters", "usage"}
+_OPS = {Distance.cosine: "vector_cosine_ops", Distance.l2: "vector_l2_ops", Distance.max_inner_product: "vector_ip_ops"}
+
+VectorIndexKind = Literal["hnsw", "ivfflat", "none"]
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """Index layout and query-time knobs for a ``TunedPgVector`` table.
+
+    ``lists=None`` sizes IVFFlat from the row count (rows / 1000 up to 1M
+    rows, sqrt(rows) above). ``candidates`` is the per-branch pool size
+    for hybrid search; it also floors ``ef_search`` so HNSW can return it.
+    """
+
+    kind: VectorIndexKind = "hnsw"
+    m: int = 16
+    ef_construction: int = 64
+    ef_search: int = 40
+    lists: int | None = None
+    probes: int = 10
+    gin: bool = True
+    candidates: int = 100
+    maintenance_work_mem: str | None = None
+
+
+class TunedPgVector(PgVector):
+    """PgVector with COPY-based writes, managed indexes and candidate-pool hybrid search."""
+
+    def __init__(self, *args: Any, index_spec: IndexSpec | None = None, **kwargs: Any) -> None:
+        spec = index_spec or IndexSpec()
+        if spec.kind == "ivfflat":
+            kwargs["vector_index"] = Ivfflat(lists=spec.lists or 100, probes=spec.probes, configuration={})
+        else:
+            kwargs["vector_index"] = HNSW(
+                m=spec.m, ef_construction=spec.ef_construction, ef_search=spec.ef_search, configuration={}
+            )
+        super().__init__(*args, **kwargs)
+        if not re.fullmatch(r"[a-z_]+", self.content_language):
+            raise ValueError(f"unsupported content_language {self.content_language!r}")
+        self.index_spec = spec
+
+    # -- Write path ---------------------------------------------------------
+
+    def insert(
+        self,
+        content_hash: str,
+        documents: list[Document],
+        filters: dict[str, Any] | None = None,
+        batch_size: int = 100,
+    ) -> None:
+        if not self._can_copy():
+            return super().insert(content_hash, documents, filters, batch_size)
+        self._embed(documents)
+        self._copy(self._records(documents, filters, content_hash), upsert=False)
+
+    async def async_insert(
+        self,
+        content_hash: str,
+        documents: list[Document],
+        filters: dict[str, Any] | None = None,
+        batch_size: int = 100,
+    ) -> None:
+        if not self._can_copy():
+            return await super().async_insert(content_hash, documents, filters, batch_size)
+        await self._async_embed(documents)
+        await asyncio.to_thread(self._copy, self._records(documents, filters, content_hash), upsert=False)
+
+    def _upsert(
+        self,
+        content_hash: str,
+        documents: list[Document],
+        filters: dict[str, Any] | None = None,
+        batch_size: int = 100,
+    ) -> None:
+        if not self._can_copy():
+            return super()._upsert(content_hash, documents, filters, batch_size)
+        self._embed(documents)
+        self._copy(self._records(documents, filters, content_hash), upsert=True)
+
+    async def _async_upsert(
+        self,
+        content_hash: str,
+        documents: list[Document],
+        filters: dict[str, Any] | None = None,
+        batch_size: int = 100,
+    ) -> None:
+        if not self._can_copy():
+            return await super()._async_upsert(content_hash, documents, filters, batch_size)
+        await self._async_embed(documents)
+        await asyncio.to_thread(self._copy, self._records(documents, filters, content_hash), upsert=True)
+
+    # -- Indexes ------------------------------------------------------------
+
+    def create(self) -> None:
+        """Create the table; a brand-new table also gets its HNSW / GIN indexes.
+
+        Existing tables are left alone so startup never blocks on an index
+        build. IVFFlat needs data to train on and is never built here; use
+        ``python -m db index build`` once the table is loaded.
+        """
+        existed = self.table_exists()
+        super().create()
+        if not existed and self.table_exists():
+            try:
+                self.build_indexes(skip_ivfflat=True)
+            except Exception as exc:
+                log_warning(f"index build for {self.table.fullname} failed: {exc}")
+
+    def optimize(self, force_recreate: bool = False) -> None:
+        self.build_indexes(force=force_recreate)
+
+    def index_names(self) -> dict[str, str]:
+        return {
+            "hnsw": f"{self.table_name}_hnsw_index",
+            "ivfflat": f"{self.table_name}_ivfflat_index",
+            "gin": f"{self.table_name}_content_gin_index",
+        }
+
+    def build_indexes(self, *, force: bool = False, skip_ivfflat: bool = False) -> list[str]:
+        """Build missing (or invalid) indexes with ``CREATE INDEX CONCURRENTLY``.
+
+        ``force`` rebuilds existing ones. A vector index of the kind not in
+        the spec is dropped. Returns the names of the indexes built.
+        """
+        spec = self.index_spec
+        names = self.index_names()
+        wanted: dict[str, str] = {}
+        ops = _OPS.get(self.distance, "vector_cosine_ops")
+        table = self.table.fullname
+        if spec.kind == "hnsw":
+            wanted[names["hnsw"]] = (
+                f"USING hnsw (embedding {ops}) WITH (m = {int(spec.m)}, ef_construction = {int(spec.ef_construction)})"
+            )
+        elif spec.kind == "ivfflat" and not skip_ivfflat:
+            lists = spec.lists or self._auto_lists()
+            if lists:
+                wanted[names["ivfflat"]] = f"USING ivfflat (embedding {ops}) WITH (lists = {lists})"
+            else:
+                log_warning(f"{table} is empty; skipping IVFFlat index (it needs rows to train on)")
+        if spec.gin:
+            wanted[names["gin"]] = f"USING GIN ({self._tsvector_sql()})"
+        stale = [n for kind, n in names.items() if kind in ("hnsw", "ivfflat") and kind != spec.kind]
+
+        built: list[str] = []
+        with self.db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if spec.maintenance_work_mem:
+                conn.execute(
+                    text("SELECT set_config('maintenance_work_mem', :v, false)"), {"v": spec.maintenance_work_mem}
+                )
+            try:
+                for name in stale:
+                    if self._index_valid(conn, name) is not None:
+                        log_info(f"Dropping {name}: index spec is now {spec.kind}")
+                        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{self.schema}"."{name}"'))
+                for name, using in wanted.items():
+                    valid = self._index_valid(conn, name)
+                    if valid and not force:
+                        continue
+                    if valid is not None:
+                        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{self.schema}"."{name}"'))
+                    started = time.perf_counter()
+                    conn.execute(text(f'CREATE INDEX CONCURRENTLY "{name}" ON {table} {using}'))
+                    log_info(f"Built {name} in {time.perf_counter() - started:.1f}s")
+                    built.append(name)
+            finally:
+                if spec.maintenance_work_mem:
+                    conn.execute(text("RESET maintenance_work_mem"))
+        return built
+
+    def index_stats(self) -> list[dict[str, Any]]:
+        """Every index on the table with its access method, size and validity."""
+        query = text(
+            "SELECT c.relname AS name, am.amname AS method, i.indisvalid AS valid, "
+            "pg_relation_size(c.oid) AS size_bytes "
+            "FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid "
+            "JOIN pg_class t ON t.oid = i.indrelid "
+            "JOIN pg_namespace n ON n.oid = t.relnamespace "
+            "JOIN pg_am am ON am.oid = c.relam "
+            "WHERE n.nspname = :schema AND t.relname = :table "
+            "ORDER BY c.relname"
+        )
+        with self.db_engine.connect() as conn:
+            rows = conn.execute(query, {"schema": self.schema, "table": self.table_name}).mappings().all()
+        return [dict(row) for row in rows]
+
+    def measure_recall(self, *, samples: int = 50, k: int = 10) -> dict[str, Any]:
+        """Recall@k of the ANN index against exact search, plus per-query latency.
+
+        Query vectors are sampled from the table's own embeddings, so no
+        embedding API calls are made. Exact search runs with index scans
+        disabled.
+        """
+        t = self.table
+        distance = self._distance_expr
+        with self.db_engine.connect() as conn:
+            queries = (
+                conn.execute(
+                    select(t.c.embedding).where(t.c.embedding.is_not(None)).order_by(func.random()).limit(samples)
+                )
+                .scalars()
+                .all()
+            )
+        ann_times: list[float] = []
+        exact_times: list[float] = []
+        recalls: list[float] = []
+        for vector in queries:
+            vector = [float(x) for x in vector]
+            stmt = select(t.c.id).order_by(distance(vector)).limit(k)
+            with self.db_engine.connect() as conn, conn.begin():
+                self._set_search_params(conn, k)
+                started = time.perf_counter()
+                ann = conn.execute(stmt).scalars().all()
+                ann_times.append(time.perf_counter() - started)
+            with self.db_engine.connect() as conn, conn.begin():
+                conn.execute(text("SET LOCAL enable_indexscan = off"))
+                conn.execute(text("SET LOCAL enable_bitmapscan = off"))
+                started = time.perf_counter()
+                exact = conn.execute(stmt).scalars().all()
+                exact_times.append(time.perf_counter() - started)
+            if exact:
+                recalls.append(len(set(ann) & set(exact)) / len(exact))
+        return {
+            "samples": len(queries),
+            "k": k,
+            "recall": sum(recalls) / len(recalls) if recalls else None,
+            "ann_latency": distribution(ann_times),
+            "exact_latency": distribution(exact_times),
+        }
+
+    # -- Search -------------------------------------------------------------
+
+    def hybrid_search(
+        self,
+        query: str,
+        limit: int = 5,
+        filters: dict[str, Any] | list | None = None,
+    ) -> list[Document]:
+        """Upstream hybrid scoring, evaluated over ANN + full-text candidates only."""
+        try:
+            query_embedding = self.embedder.get_embedding(query)
+            if not query_embedding:
+                log_error(f"Error getting embedding for Query: {query}")
+                return []
+            if not 0 <= self.vector_score_weight <= 1:
+                raise ValueError("vector_score_weight must be between 0 and 1")
+
+            t = self.table
+            conditions = self._filter_conditions(filters)
+            pool = max(self.index_spec.candidates, limit)
+            ts_vector: ColumnElement[Any] = literal_column(self._tsvector_sql())
+            processed = self.enable_prefix_matching(query) if self.prefix_match else query
+            ts_query = func.websearch_to_tsquery(
+                literal_column(f"'{self.content_language}'::regconfig"), bindparam("query", value=processed)
+            )
+            distance = self._distance_expr(query_embedding)
+
+            vector_hits = select(t.c.id).where(*conditions).order_by(distance).limit(pool)
+            text_hits = (
+                select(t.c.id)
+                .where(*conditions, ts_vector.op("@@")(ts_query))
+                .order_by(desc(func.ts_rank_cd(ts_vector, ts_query)))
+                .limit(pool)
+            )
+            candidates = union(vector_hits, text_hits).subquery()
+
+            raw_rank = func.ts_rank_cd(ts_vector, ts_query)
+            text_rank = raw_rank / (raw_rank + 0.1)
+            if self.distance == Distance.l2:
+                vector_score = 1 / (1 + distance)
+            elif self.distance == Distance.max_inner_product:
+                vector_score = func.greatest(0.0, func.least(1.0, (-distance + 1) / 2))
+            else:
+                vector_score = func.greatest(0.0, 1 - distance)
+            hybrid_score = self.vector_score_weight * vector_score + (1 - self.vector_score_weight) * text_rank
+
+            stmt = select(
+                t.c.id,
+                t.c.name,
+                t.c.meta_data,
+                t.c.content,
+                t.c.embedding,
+                t.c.usage,
+                hybrid_score.label("hybrid_score"),
+            ).where(t.c.id.in_(select(candidates.c.id)))
+            if self.similarity_threshold is not None:
+                stmt = stmt.where(hybrid_score >= self.similarity_threshold)
+            stmt = stmt.order_by(desc("hybrid_score")).limit(limit)
+
+            try:
+                with self.Session() as sess, sess.begin():
+                    self._set_search_params(sess, pool)
+                    results = sess.execute(stmt).fetchall()
+            except Exception as e:
+                log_error(f"Error performing hybrid search: {str(e)}")
+                return []
+
+            documents: list[Document] = []
+            for row in results:
+                meta_data = dict(row.meta_data) if row.meta_data else {}
+                meta_data["similarity_score"] = float(row.hybrid_score)
+                documents.append(
+                    Document(
+                        id=row.id,
+                        name=row.name,
+                        meta_data=meta_data,
+                        content=row.content,
+                        embedder=self.embedder,
+                        embedding=row.embedding,
+                        usage=row.usage,
+                    )
+                )
+            if self.reranker:
+                documents = self.reranker.rerank(query=query, documents=documents)
+            log_info(f"Found {len(documents)} documents")
+            return documents
+        except Exception as e:
+            log_error(f"Error during hybrid search: {str(e)}")
+            return []
+
+    # -- Internals ----------------------------------------------------------
+
+    def _tsvector_sql(self) -> str:
+        # Must match the GIN index expression exactly for the planner to use it.
+        return f"to_tsvector('{self.content_language}'::regconfig, content)"
+
+    def _distance_expr(self, vector: list[float]) -> Any:
+        column = self.table.c.embedding
+        if self.distance == Distance.l2:
+            return column.l2_distance(vector)
+        if self.distance == Distance.max_inner_product:
+            return column.max_inner_product(vector)
+        return column.cosine_distance(vector)
+
+    def _filter_conditions(self, filters: dict[str, Any] | list | None) -> list[ColumnElement[bool]]:
+        if filters is None:
+            return []
+        if isinstance(filters, dict):
+            return [self.table.c.meta_data.contains(filters)]
+        return [
+            and_(*(self._dsl_to_sqlalchemy(f.to_dict() if hasattr(f, "to_dict") else f, self.table) for f in filters))
+        ]
+
+    def _set_search_params(self, conn: Any, pool: int) -> None:
+        """Per-transaction ANN knobs; ``ef_search`` is floored at the candidate pool size."""
+        spec = self.index_spec
+        if spec.kind == "hnsw":
+            conn.execute(text(f"SET LOCAL hnsw.ef_search = {max(int(spec.ef_search), int(pool))}"))
+        elif spec.kind == "ivfflat":
+            conn.execute(text(f"SET LOCAL ivfflat.probes = {int(spec.probes)}"))
+
+    def _auto_lists(self) -> int:
+        rows = self.get_count()
+        if rows == 0:
+            return 0
+        return max(int(rows / 1000), 1) if rows < 1_000_000 else max(int(sqrt(rows)), 1)
+
+    def _index_valid(self, conn: Any, name: str) -> bool | None:
+        """``True``/``False`` for an existing index's validity, ``None`` if it doesn't exist."""
+        return conn.execute(
+            text(
+                "SELECT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = :schema AND c.relname = :name"
+            ),
+            {"schema": self.schema, "name": name},
+        ).scalar()
+
+    def _can_copy(self) -> bool:
+        return self.db_engine.dialect.driver == "psycopg"
+
+    def _embed(self, documents: list[Document]) -> None:
+        embedder: Any = self.embedder
+        pending = [d for d in documents if not d.embedding]
+        if not pending:
+            return
+        if embedder.enable_batch and hasattr(embedder, "get_embeddings_batch_and_usage"):
+            embeddings, usages = embedder.get_embeddings_batch_and_usage([d.content for d in pending])
+            for doc, embedding, usage in zip(pending, embeddings, usages):
+                doc.embedding, doc.usage = embedding, usage
+        else:
+            for doc in pending:
+                doc.embed(embedder=embedder)
+
+    async def _async_embed(self, documents: list[Document]) -> None:
+        pending = [d for d in documents if not d.embedding]
+        if pending:
+            await self._async_embed_documents(pending)
+
+    def _records(
+        self, documents: list[Document], filters: dict[str, Any] | None, content_hash: str
+    ) -> list[dict[str, Any]]:
+        """Row dicts keyed by record id (later duplicates win, as in upstream upserts)."""
+        records: dict[str, dict[str, Any]] = {}
+        for doc in documents:
+            content = self._clean_content(doc.content)
+            base_id = doc.id or md5(content.encode()).hexdigest()
+            record_id = md5(f"{base_id}_{content_hash}".encode()).hexdigest()
+            meta_data = doc.meta_data or {}
+            if filters:
+                meta_data.update(filters)
+            records[record_id] = {
+                "id": record_id,
+                "name": doc.name,
+                "meta_data": meta_data,
+                "filters": filters,
+                "content": content,
+                "embedding": doc.embedding,
+                "usage": doc.usage,
+                "content_hash": content_hash,
+                "content_id": doc.content_id,
+            }
+        return list(records.values())
+
+    def _copy(self, records: list[dict[str, Any]], *, upsert: bool) -> None:
+        if not records:
+            return
+        target = f'"{self.schema}"."{self.table_name}"'
+        columns = ", ".join(_COLUMNS)
+        raw = self.db_engine.raw_connection()
+        try:
+            conn: Any = raw.driver_connection
+            with conn.cursor() as cur:
+                staging = target
+                if upsert:
+                    staging = "_bulk_pgvector_stage"
+                    cur.execute(f"CREATE TEMP TABLE {staging} (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP")
+                with cur.copy(f"COPY {staging} ({columns}) FROM STDIN") as copy:
+                    for record in records:
+                        copy.write_row([_copy_value(c, record[c]) for c in _COLUMNS])
+                if upsert:
+                    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in _COLUMNS if c != "id")
+                    cur.execute(
+                        f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {staging} "
+                        f"ON CONFLICT (id) DO UPDATE SET {updates}, updated_at = now()"
+                    )
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+        log_info(f"{'Upserted' if upsert else 'Inserted'} {len(records)} documents into {target} via COPY.")
+
+
+def _copy_value(column: str, value: Any) -> str | None:
+    if value is None:
+        return "{}" if column == "meta_data" else None
+    if column in _JSON_COLUMNS:
+        return json.dumps(value, default=str)
+    if column == "embedding":
+        return "[" + ",".join(repr(float(x)) for x in value) + "]" if len(value) else None
+    return value
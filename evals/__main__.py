@@ -2,13 +2,27 @@
 Run Evals
 =========
 
-python -m evals                # run all cases (concise UI)
-python -m evals --case <name>  # run one case
-python -m evals -v             # stream the agent's run with full panels
+python -m evals                  # run all cases (concise UI)
+python -m evals --case <name>    # run one case
+python -m evals -v               # stream the agent's run with full panels
+python -m evals --concurrency 4  # run up to 4 cases at once
+python -m evals --record         # run live and record every HTTP call into a cassette (see evals/cassette.py)
+python -m evals --replay         # replay the cassette; only misses go to the network (--offline: misses fail)
+python -m evals bench            # latency / token percentiles (see evals/bench.py)
+python -m evals slack-stream     # Slack streaming writers vs. a fake Slack API (see evals/slack_stream.py)
+python -m evals mcp-pool         # MCP session pool vs. a local MCP server (see evals/mcp_pool.py)
+python -m evals fan-out          # search_many one branch at a time vs. fanned out (see evals/fanout.py)
+python -m evals metrics-overhead # cost of the /ops/metrics instrumentation (see evals/metrics_overhead.py)
+python -m evals tool-output      # fetched-page tokens / TTFT with and without compaction (see evals/tool_output.py)
+python -m evals load             # step load against a local replica with a stub model (see evals/load.py)
 
 Each case runs the agent once, then optionally checks the response with
 `AgentAsJudgeEval` (when `criteria` is set) and `ReliabilityEval` (when
-`expected_tool_calls` is set).
+`expected_tool_calls` is set). The two checks run concurrently.
+
+All cases share one event loop. With `--concurrency N` up to N cases are
+in flight at a time; each case's output is buffered and printed when it
+finishes, and the summary table stays in case order.
 
 Both log to Postgres through `eval_db`. Connect your AgentOS at os.agno.com to see history.
 
@@ -22,7 +36,12 @@ from evals.dotenv import load_dotenv
 load_dotenv()
 
 import asyncio  # noqa: E402
+import time  # noqa: E402
+from collections.abc import Callable  # noqa: E402
 from dataclasses import dataclass  # noqa: E402
+from io import StringIO  # noqa: E402
+from pathlib import Path  # noqa: E402
+from typing import Any  # noqa: E402
 from uuid import uuid4  # noqa: E402
 
 import typer  # noqa: E402
@@ -32,8 +51,12 @@ from rich.console import Console  # noqa: E402
 from rich.live import Live  # noqa: E402
 from rich.status import Status  # noqa: E402
 from rich.table import Table  # noqa: E402
+from rich.text import Text  # noqa: E402
 
+from app.slack_stream import SLACK_STREAM_INTERVAL, SLACK_STREAM_MAX_CHARS  # noqa: E402
+from evals import bench as benchmark  # noqa: E402
 from evals.cases import CASES, Case, eval_db  # noqa: E402
+from evals.harness import ResultsTable, report  # noqa: E402
 
 app = typer.Typer(add_completion=False, no_args_is_help=False, pretty_exceptions_show_locals=False)
 console = Console()
@@ -45,6 +68,9 @@ class CaseOutcome:
     judge_passed: bool | None = None
     reliability_passed: bool | None = None
     error: str | None = None
+    wall_time: float | None = None
+    input_tokens: int | None = None
+    output_tokens: int | None = None
 
     @property
     def passed(self) -> bool:
@@ -54,12 +80,14 @@ class CaseOutcome:
         return bool(checks) and all(checks)
 
 
-async def _run_case_async(case: Case, *, verbose: bool) -> CaseOutcome:
-    judge_passed: bool | None = None
-    rel_passed: bool | None = None
-    judge_err: str | None = None
-    rel_err: str | None = None
+async def _run_case_async(case: Case, *, verbose: bool, out: Console = console, live: bool = True) -> CaseOutcome:
+    started = time.perf_counter()
+    outcome = await _run_case_checks(case, verbose=verbose, out=out, live=live)
+    outcome.wall_time = time.perf_counter() - started
+    return outcome
 
+
+async def _run_case_checks(case: Case, *, verbose: bool, out: Console, live: bool) -> CaseOutcome:
     # Dedicated session_id per case so eval traffic doesn't bleed into agent
     # history, and so verbose mode can fetch the run back via aget_last_run_output.
     session_id = f"eval-{case.name}-{uuid4().hex[:8]}"
@@ -77,63 +105,105 @@ async def _run_case_async(case: Case, *, verbose: bool) -> CaseOutcome:
                 markdown=True,
             )
             response = await case.agent.aget_last_run_output(session_id=session_id)
-        else:
+        elif live:
             response = await _run_with_live_spinner(case, session_id)
+        else:
+            response = await _stream_run(case, session_id)
         if response is None:
             return CaseOutcome(name=case.name, error="agent: no run output recorded")
     except Exception as exc:
         return CaseOutcome(name=case.name, error=f"agent.arun: {type(exc).__name__}: {exc}")
 
     output_str = str(response.content) if response.content else ""
+    metrics = response.metrics
 
     if not verbose:
-        _print_response_concise(response, output_str)
+        _print_response_concise(response, output_str, out)
 
-    if case.criteria is not None:
-        try:
-            judge = await AgentAsJudgeEval(
-                name=case.name,
-                criteria=case.criteria,
-                scoring_strategy="binary",
-                db=eval_db,
-            ).arun(input=case.input, output=output_str, print_results=verbose)
-        except Exception as exc:
-            judge_err = f"judge: {type(exc).__name__}: {exc}"
-        else:
-            if judge and judge.results:
-                judge_passed = judge.results[0].passed
-                if not verbose:
-                    _print_judge_verdict(judge.results[0])
-            else:
-                judge_err = "judge: returned no result"
-
-    if case.expected_tool_calls is not None:
-        try:
-            rel = ReliabilityEval(
-                name=case.name,
-                agent_response=response,
-                expected_tool_calls=list(case.expected_tool_calls),
-                allow_additional_tool_calls=case.allow_additional_tool_calls,
-                db=eval_db,
-            ).run(print_results=verbose)
-        except Exception as exc:
-            rel_err = f"reliability: {type(exc).__name__}: {exc}"
-        else:
-            if rel is None:
-                rel_err = "reliability: returned no result"
-            else:
-                rel_passed = rel.eval_status == "PASSED"
-                if not verbose:
-                    _print_reliability_verdict(rel, case.expected_tool_calls)
+    # Judge and reliability are independent — run them side by side, then
+    # print verdicts in a fixed order.
+    (judge_passed, judge_err, judge_result), (rel_passed, rel_err, rel_result) = await asyncio.gather(
+        _check_judge(case, output_str, verbose=verbose),
+        _check_reliability(case, response, verbose=verbose),
+    )
+    if not verbose:
+        if judge_result is not None:
+            _print_judge_verdict(judge_result, out)
+        if rel_result is not None and case.expected_tool_calls is not None:
+            _print_reliability_verdict(rel_result, case.expected_tool_calls, out)
 
     return CaseOutcome(
         name=case.name,
         judge_passed=judge_passed,
         reliability_passed=rel_passed,
         error="; ".join(e for e in (judge_err, rel_err) if e) or None,
+        input_tokens=metrics.input_tokens if metrics else None,
+        output_tokens=metrics.output_tokens if metrics else None,
     )
 
 
+async def _check_judge(case: Case, output_str: str, *, verbose: bool) -> tuple[bool | None, str | None, Any]:
+    """Run the LLM judge. Returns ``(passed, error, result)``; all None when no criteria."""
+    if case.criteria is None:
+        return None, None, None
+    try:
+        judge = await AgentAsJudgeEval(
+            name=case.name,
+            criteria=case.criteria,
+            scoring_strategy="binary",
+            db=eval_db,
+        ).arun(input=case.input, output=output_str, print_results=verbose)
+    except Exception as exc:
+        return None, f"judge: {type(exc).__name__}: {exc}", None
+    if judge and judge.results:
+        return judge.results[0].passed, None, judge.results[0]
+    return None, "judge: returned no result", None
+
+
+async def _check_reliability(case: Case, response: RunOutput, *, verbose: bool) -> tuple[bool | None, str | None, Any]:
+    """Run the tool-call assertion. Returns ``(passed, error, result)``; all None when not configured."""
+    if case.expected_tool_calls is None:
+        return None, None, None
+    try:
+        rel = await asyncio.to_thread(
+            ReliabilityEval(
+                name=case.name,
+                agent_response=response,
+                expected_tool_calls=list(case.expected_tool_calls),
+                allow_additional_tool_calls=case.allow_additional_tool_calls,
+                db=eval_db,
+            ).run,
+            print_results=verbose,
+        )
+    except Exception as exc:
+        return None, f"reliability: {type(exc).__name__}: {exc}", None
+    if rel is None:
+        return None, "reliability: returned no result", None
+    return rel.eval_status == "PASSED", None, rel
+
+
+async def _stream_run(
+    case: Case,
+    session_id: str,
+    on_event: Callable[[Any], None] | None = None,
+) -> RunOutput | None:
+    """Stream the agent's run, passing each event to ``on_event``. Returns the final RunOutput."""
+    response: RunOutput | None = None
+    async for event in case.agent.arun(
+        input=case.input,
+        stream=True,
+        stream_events=True,
+        yield_run_output=True,
+        session_id=session_id,
+    ):
+        if isinstance(event, RunOutput):
+            response = event
+            continue
+        if on_event is not None:
+            on_event(event)
+    return response
+
+
 async def _run_with_live_spinner(case: Case, session_id: str) -> RunOutput | None:
     """Stream the agent's run with a single-line spinner that updates per tool call.
 
@@ -143,62 +213,83 @@ async def _run_with_live_spinner(case: Case, session_id: str) -> RunOutput | Non
     base_label = f"[bold]running[/bold] {case.agent.id}…"
     spinner = Status(base_label, spinner="dots")
 
-    response: RunOutput | None = None
-    with Live(spinner, console=console, transient=True, refresh_per_second=10):
-        async for event in case.agent.arun(
-            input=case.input,
-            stream=True,
-            stream_events=True,
-            yield_run_output=True,
-            session_id=session_id,
-        ):
-            if isinstance(event, RunOutput):
-                response = event
-                continue
-            event_type = getattr(event, "event", None)
-            if event_type == "ToolCallStarted":
-                tool = getattr(event, "tool", None)
-                tool_name = getattr(tool, "tool_name", None)
-                if tool_name:
-                    spinner.update(f"[bold]running[/bold] {case.agent.id} → [cyan]{tool_name}[/cyan]…")
-            elif event_type == "ToolCallCompleted":
-                spinner.update(base_label)
+    def on_event(event: Any) -> None:
+        event_type = getattr(event, "event", None)
+        if event_type == "ToolCallStarted":
+            tool = getattr(event, "tool", None)
+            tool_name = getattr(tool, "tool_name", None)
+            if tool_name:
+                spinner.update(f"[bold]running[/bold] {case.agent.id} → [cyan]{tool_name}[/cyan]…")
+        elif event_type == "ToolCallCompleted":
+            spinner.update(base_label)
 
-    return response
+    with Live(spinner, console=console, transient=True, refresh_per_second=10):
+        return await _stream_run(case, session_id, on_event)
 
 
-def _print_response_concise(response: RunOutput, output_str: str) -> None:
+def _print_response_concise(response: RunOutput, output_str: str, out: Console = console) -> None:
     """Plain-text response + one-line tool summary. Used in default (non-verbose) mode."""
-    console.print()
-    console.print("[bold]Response[/bold]")
-    console.print(output_str or "[dim](empty)[/dim]")
+    out.print()
+    out.print("[bold]Response[/bold]")
+    out.print(output_str or "[dim](empty)[/dim]")
 
     tools = response.tools or []
     if tools:
         names = ", ".join(t.tool_name or "?" for t in tools)
-        console.print(f"\n[dim]tools fired:[/dim] {names}")
+        out.print(f"\n[dim]tools fired:[/dim] {names}")
 
 
-def _print_judge_verdict(eval_result: object) -> None:
+def _print_judge_verdict(eval_result: object, out: Console = console) -> None:
     passed: bool = bool(getattr(eval_result, "passed", False))
     reason: str = str(getattr(eval_result, "reason", "") or "")
     style = "green" if passed else "red"
     tag = "PASS" if passed else "FAIL"
-    console.print(f"\n[bold]Judge:[/bold] [{style}]{tag}[/{style}]")
+    out.print(f"\n[bold]Judge:[/bold] [{style}]{tag}[/{style}]")
     if reason:
-        console.print(f"[dim]  {reason}[/dim]")
+        out.print(f"[dim]  {reason}[/dim]")
 
 
-def _print_reliability_verdict(rel_result: object, expected_tools: tuple[str, ...]) -> None:
+def _print_reliability_verdict(rel_result: object, expected_tools: tuple[str, ...], out: Console = console) -> None:
     passed = getattr(rel_result, "eval_status", "") == "PASSED"
     style = "green" if passed else "red"
     tag = "PASS" if passed else "FAIL"
     expected = ", ".join(expected_tools)
-    console.print(f"\n[bold]Reliability:[/bold] [{style}]{tag}[/{style}]  [dim]expected: {expected}[/dim]")
-
+    out.print(f"\n[bold]Reliability:[/bold] [{style}]{tag}[/{style}]  [dim]expected: {expected}[/dim]")
+
+
+async def _run_suite(cases: list[Case], *, verbose: bool, concurrency: int) -> list[CaseOutcome]:
+    """Run every case on one event loop. Outcomes come back in case order."""
+    if concurrency <= 1:
+        outcomes: list[CaseOutcome] = []
+        for i, c in enumerate(cases, 1):
+            console.rule(f"[bold]{c.name}[/bold]  [dim]{c.agent.id} · {i}/{len(cases)}[/dim]")
+            outcomes.append(await _run_case_async(c, verbose=verbose))
+        return outcomes
+
+    semaphore = asyncio.Semaphore(concurrency)
+    finished = 0
+    status = console.status(f"[bold]running[/bold] {len(cases)} cases, {concurrency} at a time…", spinner="dots")
+
+    async def run_one(i: int, c: Case) -> CaseOutcome:
+        nonlocal finished
+        async with semaphore:
+            # Buffer per-case output so concurrent cases don't interleave.
+            buffer = StringIO()
+            out = Console(
+                file=buffer,
+                force_terminal=console.is_terminal,
+                color_system=console.color_system,  # type: ignore[arg-type]
+                width=console.width,
+            )
+            out.rule(f"[bold]{c.name}[/bold]  [dim]{c.agent.id} · {i}/{len(cases)}[/dim]")
+            outcome = await _run_case_async(c, verbose=False, out=out, live=False)
+        finished += 1
+        console.print(Text.from_ansi(buffer.getvalue()))
+        status.update(f"[bold]running[/bold] {finished}/{len(cases)} done, {concurrency} at a time…")
+        return outcome
 
-def run_case(case: Case, *, verbose: bool) -> CaseOutcome:
-    return asyncio.run(_run_case_async(case, verbose=verbose))
+    with status:
+        return list(await asyncio.gather(*(run_one(i, c) for i, c in enumerate(cases, 1))))
 
 
 def _check_cell(passed: bool | None) -> str:
@@ -209,6 +300,33 @@ def _check_cell(passed: bool | None) -> str:
     return f"[{style}]{tag}[/{style}]"
 
 
+def _time_cell(seconds: float | None) -> str:
+    return "[dim]—[/dim]" if seconds is None else f"{seconds:.1f}s"
+
+
+def _tokens_cell(input_tokens: int | None, output_tokens: int | None) -> str:
+    if input_tokens is None and output_tokens is None:
+        return "[dim]—[/dim]"
+    return f"{input_tokens or 0:,} / {output_tokens or 0:,}"
+
+
+def _select_cases(case: str | None, agent: str | None = None) -> list[Case]:
+    cases = list(CASES)
+    if case:
+        cases = [c for c in cases if c.name == case]
+        if not cases:
+            console.print(f"[red]no case named[/red] {case!r}")
+            console.print(f"  [dim]available:[/dim] {', '.join(c.name for c in CASES)}")
+            raise typer.Exit(2)
+    if agent:
+        cases = [c for c in cases if c.agent.id == agent]
+        if not cases:
+            console.print(f"[red]no cases for agent[/red] {agent!r}")
+            console.print(f"  [dim]available:[/dim] {', '.join(sorted({str(c.agent.id) for c in CASES}))}")
+            raise typer.Exit(2)
+    return cases
+
+
 @app.callback(invoke_without_command=True)
 def main(
     ctx: typer.Context,
@@ -219,32 +337,63 @@ def main(
         "-v",
         help="Stream the full agent run with rich panels (Message → Tool Calls → Response), plus full eval tables.",
     ),
+    concurrency: int = typer.Option(
+        1,
+        "--concurrency",
+        "-c",
+        min=1,
+        help="Run up to N cases at once. Output is buffered per case; not compatible with -v.",
+    ),
+    record: bool = typer.Option(False, "--record", help="Run live and record every HTTP call into the cassette."),
+    replay: bool = typer.Option(False, "--replay", help="Serve HTTP calls from the cassette; misses go live."),
+    offline: bool = typer.Option(False, "--offline", help="With --replay: fail cassette misses instead of going live."),
+    cassette_path: Path = typer.Option(None, "--cassette", help="Cassette file (default evals/cassettes/evals.json)"),
 ) -> None:
     """Run the eval suite, or one case with --case <name>."""
     if ctx.invoked_subcommand is not None:
         return
 
-    cases = list(CASES)
-    if case:
-        cases = [c for c in cases if c.name == case]
-        if not cases:
-            console.print(f"[red]no case named[/red] {case!r}")
-            console.print(f"  [dim]available:[/dim] {', '.join(c.name for c in CASES)}")
-            raise typer.Exit(2)
+    cases = _select_cases(case)
+    if verbose and concurrency > 1:
+        console.print("[red]--verbose streams one run at a time; drop -v or use --concurrency 1[/red]")
+        raise typer.Exit(2)
+    if record and replay:
+        console.print("[red]--record and --replay are exclusive[/red]")
+        raise typer.Exit(2)
+    if offline and not replay:
+        console.print("[red]--offline only applies to --replay[/red]")
+        raise typer.Exit(2)
+
+    from contextlib import nullcontext
 
-    outcomes: list[CaseOutcome] = []
-    for i, c in enumerate(cases, 1):
-        console.rule(f"[bold]{c.name}[/bold]  [dim]{c.agent.id} · {i}/{len(cases)}[/dim]")
-        outcomes.append(run_case(c, verbose=verbose))
+    from evals.cassette import DEFAULT_CASSETTE, Cassette
+
+    cassette = None
+    if record or replay:
+        cassette = Cassette(cassette_path or DEFAULT_CASSETTE, mode="record" if record else "replay", offline=offline)
+
+    suite_started = time.perf_counter()
+    with cassette.use() if cassette is not None else nullcontext():
+        outcomes = asyncio.run(_run_suite(cases, verbose=verbose, concurrency=concurrency))
+    suite_time = time.perf_counter() - suite_started
 
     table = Table(title="Eval Summary", title_style="bold sky_blue1", show_header=True, header_style="bold")
     table.add_column("Case", overflow="fold")
     table.add_column("Judge")
     table.add_column("Reliability")
+    table.add_column("Time", justify="right")
+    table.add_column("Tokens (in / out)", justify="right")
     table.add_column("Status")
     for o in outcomes:
         status = "[green]PASS[/green]" if o.passed else "[red]FAIL[/red]"
-        table.add_row(o.name, _check_cell(o.judge_passed), _check_cell(o.reliability_passed), status)
+        table.add_row(
+            o.name,
+            _check_cell(o.judge_passed),
+            _check_cell(o.reliability_passed),
+            _time_cell(o.wall_time),
+            _tokens_cell(o.input_tokens, o.output_tokens),
+            status,
+        )
 
     console.print()
     console.print(table)
@@ -254,7 +403,10 @@ def main(
     summary = f"[green]{passed}/{len(outcomes)} passed[/green]"
     if failed:
         summary += f", [red]{failed} failed[/red]"
+    summary += f"  [dim]{suite_time:.1f}s wall, concurrency {concurrency}[/dim]"
     console.print(f"\n{summary}")
+    if cassette is not None:
+        console.print(f"[dim]cassette {cassette.path}: {cassette.summary()}[/dim]")
 
     for o in outcomes:
         if o.error:
@@ -263,5 +415,452 @@ def main(
     raise typer.Exit(0 if failed == 0 else 1)
 
 
+def _dist_cell(dist: dict, *, unit: str = "s", stats: tuple[str, ...] = ("p50", "p95", "p99")) -> str:
+    values = [dist.get(stat) for stat in stats]
+    if all(v is None for v in values):
+        return "[dim]—[/dim]"
+    if unit == "s":
+        return " / ".join("—" if v is None else f"{v:.2f}" for v in values) + "s"
+    return " / ".join("—" if v is None else f"{v:,.0f}" for v in values)
+
+
+@app.command()
+def bench(
+    case: str = typer.Option(None, "--case", help="Benchmark only this case by name"),
+    agent: str = typer.Option(None, "--agent", help="Benchmark only the cases for this agent id"),
+    runs: int = typer.Option(5, "--runs", "-n", min=1, help="Runs per case"),
+    concurrency: int = typer.Option(1, "--concurrency", "-c", min=1, help="Runs in flight at once"),
+    output: Path = typer.Option(Path("tmp/evals-bench.json"), "--output", "-o", help="Where to write the JSON report"),
+    baseline: Path = typer.Option(None, "--baseline", help="Saved report to compare against; regressions exit 1"),
+    tolerance: float = typer.Option(0.2, "--tolerance", help="Allowed slowdown vs. baseline, as a fraction"),
+    stub_model: bool = typer.Option(False, "--stub-model", help="Swap every agent's model for a local stub"),
+    stub_latency: float = typer.Option(0.2, "--stub-latency", help="Stub time-to-first-token (s)"),
+    stub_tps: float = typer.Option(50.0, "--stub-tps", help="Stub tokens per second"),
+) -> None:
+    """Benchmark latency, time-to-first-token, tool time and tokens per case.
+
+    Judge and reliability checks are skipped — this measures the agent run only.
+    """
+    from contextlib import ExitStack
+
+    from evals.stub_model import StubModelServer
+    from evals.stub_model import stub_model as make_stub_model
+
+    cases = _select_cases(case, agent)
+    with ExitStack() as stack:
+        if stub_model:
+            server = stack.enter_context(StubModelServer(latency=stub_latency, tokens_per_second=stub_tps))
+            for c in cases:
+                c.agent.model = make_stub_model(server)
+            model_label = f"stub ({stub_latency}s ttft, {stub_tps} tok/s)"
+        else:
+            model_label = ", ".join(sorted({str(getattr(c.agent.model, "id", "?")) for c in cases}))
+
+        with console.status(f"[bold]benchmarking[/bold] {len(cases)} cases × {runs} runs…", spinner="dots"):
+            started = time.perf_counter()
+            results = asyncio.run(benchmark.run_bench(cases, runs=runs, concurrency=concurrency))
+            wall_time = time.perf_counter() - started
+
+    report = benchmark.build_report(results, runs=runs, concurrency=concurrency, model=model_label, wall_time=wall_time)
+    benchmark.save_report(report, output)
+
+    table = Table(title="Bench Summary", title_style="bold sky_blue1", show_header=True, header_style="bold")
+    table.add_column("Case", overflow="fold")
+    table.add_column("Runs", justify="right")
+    table.add_column("Errors", justify="right")
+    table.add_column("Latency p50/p95/p99", justify="right")
+    table.add_column("TTFT p50/p95/p99", justify="right")
+    table.add_column("Tokens in / out (p50)", justify="right")
+    table.add_column("Tools (p50)", overflow="fold")
+    for name, summary in report["cases"].items():
+        tools = ", ".join(f"{tool} {dist['p50']:.2f}s" for tool, dist in summary["tools"].items())
+        errors = summary["errors"]
+        table.add_row(
+            name,
+            str(summary["runs"]),
+            f"[red]{errors}[/red]" if errors else "0",
+            _dist_cell(summary["latency"]),
+            _dist_cell(summary["ttft"]),
+            _dist_cell(summary["input_tokens"], unit="tokens", stats=("p50",))
+            + " / "
+            + _dist_cell(summary["output_tokens"], unit="tokens", stats=("p50",)),
+            tools or "[dim]—[/dim]",
+        )
+    console.print()
+    console.print(table)
+    meta = report["meta"]
+    console.print(
+        f"\n[dim]{meta['wall_time']:.1f}s wall · {meta['throughput_rps']:.2f} runs/s · model {meta['model']}[/dim]"
+    )
+    console.print(f"[dim]report:[/dim] {output}")
+
+    failed = any(s["errors"] for s in report["cases"].values())
+    for name, summary in report["cases"].items():
+        for message in summary["error_messages"]:
+            console.print(f"  [dim]{name}:[/dim] [red]{message}[/red]")
+
+    if baseline is not None:
+        regressions = benchmark.compare(report, benchmark.load_report(baseline), tolerance=tolerance)
+        if regressions:
+            console.print(
+                f"\n[red]{len(regressions)} regression(s) vs {baseline}[/red] [dim](tolerance {tolerance:.0%})[/dim]"
+            )
+            for line in regressions:
+                console.print(f"  [red]{line}[/red]")
+            failed = True
+        else:
+            console.print(f"\n[green]no regressions vs {baseline}[/green] [dim](tolerance {tolerance:.0%})[/dim]")
+
+    raise typer.Exit(1 if failed else 0)
+
+
+def _ms_cell(dist: dict) -> str:
+    return _dist_cell(dist, unit="ms", stats=("p50", "p95")) + (" ms" if dist.get("p50") is not None else "")
+
+
+def _count_cell(count: int, *, bad: bool | None = None) -> str:
+    return f"[red]{count}[/red]" if (count if bad is None else bad) else str(count)
+
+
+def _or_dash(value: float | None, fmt: str) -> str:
+    return "[dim]—[/dim]" if value is None else fmt.format(value)
+
+
+@app.command("slack-stream")
+def slack_stream(
+    words: int = typer.Option(600, "--words", "-n", min=1, help="Words in the streamed reply"),
+    tps: float = typer.Option(60.0, "--tps", help="Words per second (0 = as fast as possible)"),
+    task_every: int = typer.Option(100, "--task-every", help="Start/complete a task card every N words (0 = none)"),
+    rate: float = typer.Option(1.0, "--rate", help="Fake Slack: stream calls per second per channel (0 = unlimited)"),
+    burst: int = typer.Option(3, "--burst", help="Fake Slack: calls allowed at once before limiting"),
+    interval: float = typer.Option(SLACK_STREAM_INTERVAL, "--interval", help="Coalescing flush interval (s)"),
+    max_chars: int = typer.Option(SLACK_STREAM_MAX_CHARS, "--max-chars", help="Coalescing flush size (chars)"),
+    buffer_size: int = typer.Option(100, "--buffer-size", help="slack_sdk chat_stream buffer size, for comparison"),
+) -> None:
+    """Stream a reply through slack_sdk's chat_stream and through CoalescingStream against a fake Slack API.
+
+    Exits 1 when the coalescing writer errors or its final message is missing text.
+    """
+    from evals.fake_slack import FakeSlackServer
+    from evals.slack_stream import WRITERS, StreamResult, stream_reply
+
+    async def run_all(server: FakeSlackServer) -> list[StreamResult]:
+        return [
+            await stream_reply(
+                server,
+                writer,
+                words=words,
+                tokens_per_second=tps,
+                task_every=task_every,
+                buffer_size=buffer_size,
+                interval=interval,
+                max_chars=max_chars,
+            )
+            for writer in WRITERS
+        ]
+
+    with FakeSlackServer(rate=rate, burst=burst) as server:
+        with console.status(f"[bold]streaming[/bold] {words} words through {len(WRITERS)} writers…", spinner="dots"):
+            results = asyncio.run(run_all(server))
+
+    columns: dict[str, Callable[[StreamResult], str]] = {
+        "Writer": lambda r: r.writer,
+        "Wall": lambda r: f"{r.wall_time:.1f}s",
+        "API calls": lambda r: str(r.api_calls),
+        "429s": lambda r: _count_cell(r.rate_limited),
+        "Flushes": lambda r: str(r.flushes),
+        "Flush p50/p95": lambda r: _ms_cell(r.flush_ms),
+        "Final": lambda r: _or_dash(r.final_ms, "{:.0f} ms"),
+        "Complete": lambda r: "[green]yes[/green]" if r.complete else "[red]no[/red]",
+    }
+    report(
+        console,
+        ResultsTable("Slack Stream", columns, left=["Writer"]),
+        results,
+        note=f"fake Slack: {rate:g} call/s per channel, burst {burst} · {tps:g} words/s",
+        label=lambda r: r.writer,
+    )
+    coalescing = next(r for r in results if r.writer == "coalescing")
+    raise typer.Exit(0 if coalescing.complete and not coalescing.error else 1)
+
+
+@app.command("mcp-pool")
+def mcp_pool(
+    calls: int = typer.Option(200, "--calls", "-n", min=1, help="web_search calls per pool size"),
+    concurrency: int = typer.Option(16, "--concurrency", "-c", min=1, help="Calls in flight at once"),
+    sizes: str = typer.Option("1,4", "--sizes", help="Comma-separated pool sizes to compare"),
+    latency: float = typer.Option(0.2, "--latency", help="Fake MCP server: seconds per call"),
+    restart_after: int = typer.Option(
+        0, "--restart-after", help="Restart the server after this many calls, dropping every session (0 = never)"
+    ),
+) -> None:
+    """Load PooledMCPTools against a local MCP server at each pool size.
+
+    Exits 1 when any call fails at the largest pool size.
+    """
+    from evals.fake_mcp import FakeMCPServer
+    from evals.mcp_pool import PoolResult, load_pool
+
+    pool_sizes = [int(size) for size in sizes.split(",") if size.strip()]
+
+    async def run_all(server: FakeMCPServer) -> list[PoolResult]:
+        return [
+            await load_pool(server, size, calls=calls, concurrency=concurrency, restart_after=restart_after)
+            for size in pool_sizes
+        ]
+
+    with FakeMCPServer(latency=latency) as server:
+        with console.status(f"[bold]calling[/bold] web_search {calls}× at pool sizes {sizes}…", spinner="dots"):
+            results = asyncio.run(run_all(server))
+
+    columns: dict[str, Callable[[PoolResult], str]] = {
+        "Size": lambda r: str(r.size),
+        "Wall": lambda r: f"{r.wall_time:.1f}s",
+        "Calls/s": lambda r: f"{r.throughput:.1f}",
+        "Call p50/p95": lambda r: _ms_cell(r.call_ms),
+        "Wait p50/p95": lambda r: _ms_cell(r.wait_ms),
+        "Failed": lambda r: _count_cell(r.failed),
+        "Timeouts": lambda r: str(r.timeouts),
+        "Reconnects": lambda r: str(r.reconnects),
+    }
+    report(
+        console,
+        ResultsTable("MCP Pool", columns),
+        results,
+        note=f"fake MCP: {latency:g}s per call · {concurrency} in flight",
+        label=lambda r: f"size {r.size}",
+    )
+    largest = max(results, key=lambda r: r.size)
+    raise typer.Exit(0 if not largest.failed and not largest.error else 1)
+
+
+@app.command("fan-out")
+def fan_out(
+    queries: int = typer.Option(6, "--queries", "-q", min=0, help="Searches in the call"),
+    urls: int = typer.Option(2, "--urls", min=0, help="Page reads in the call"),
+    concurrency: int = typer.Option(4, "--concurrency", "-c", min=1, help="Branches in flight at once when fanned out"),
+    timeout: float = typer.Option(1.0, "--timeout", help="Per-branch timeout when fanned out (s)"),
+    latency: float = typer.Option(0.2, "--latency", help="Fake MCP server: seconds per call"),
+    slow: bool = typer.Option(True, "--slow/--no-slow", help="Make one query take --slow-latency seconds"),
+    slow_latency: float = typer.Option(3.0, "--slow-latency", help="Fake MCP server: seconds for the slow query"),
+) -> None:
+    """Time one search_many call, one branch at a time and fanned out, against a local MCP server.
+
+    Exits 1 when a branch fails for any reason other than the slow query timing out.
+    """
+    from evals.fake_mcp import FakeMCPServer
+    from evals.fanout import FanOutResult, compare
+
+    if not queries and not urls:
+        raise typer.BadParameter("need at least one query or URL")
+
+    with FakeMCPServer(latency=latency, slow_latency=slow_latency) as server:
+        with console.status(f"[bold]searching[/bold] {queries} queries + {urls} pages…", spinner="dots"):
+            results = asyncio.run(
+                compare(server, queries=queries, urls=urls, slow=slow, concurrency=concurrency, timeout=timeout)
+            )
+
+    columns: dict[str, Callable[[FanOutResult], str]] = {
+        "Mode": lambda r: r.mode,
+        "Wall": lambda r: f"{r.wall_time:.2f}s",
+        "Branches": lambda r: str(r.branches),
+        "Results": lambda r: str(r.results),
+        "Duplicates": lambda r: str(r.duplicates),
+        "Failed": lambda r: _count_cell(r.failed, bad=r.failed > r.timeouts),
+        "Timeouts": lambda r: str(r.timeouts),
+        "Top hit": lambda r: r.top or "[dim]—[/dim]",
+    }
+    slow_note = f", one query {slow_latency:g}s" if slow and queries else ""
+    report(
+        console,
+        ResultsTable("Web Fan-Out", columns, left=["Mode", "Top hit"]),
+        results,
+        note=f"fake MCP: {latency:g}s per call{slow_note} · fan-out timeout {timeout:g}s",
+        label=lambda r: r.mode,
+    )
+    raise typer.Exit(0 if all(not r.error and r.failed <= r.timeouts for r in results) else 1)
+
+
+@app.command("metrics-overhead")
+def metrics_overhead(
+    n: int = typer.Option(20_000, "--n", "-n", min=100, help="Operations per round"),
+    repeats: int = typer.Option(5, "--repeats", min=1, help="Rounds; the median round is reported"),
+) -> None:
+    """Time run requests, tool calls, run hooks and queries with and without the Prometheus instrumentation."""
+    from evals.metrics_overhead import Overhead, run
+
+    with console.status(f"[bold]measuring[/bold] {repeats} × {n:,} operations…", spinner="dots"):
+        results = run(n, repeats)
+
+    columns: dict[str, Callable[[Overhead], str]] = {
+        "Operation": lambda r: r.operation,
+        "Bare": lambda r: _or_dash(r.bare_us, "{:.2f} µs"),
+        "Instrumented": lambda r: f"{r.instrumented_us:.2f} µs",
+        "Overhead": lambda r: f"{r.instrumented_us:.2f} µs" if r.overhead_us is None else f"{r.overhead_us:+.2f} µs",
+    }
+    report(
+        console,
+        ResultsTable("Metrics Overhead", columns, left=["Operation"]),
+        results,
+        note="per operation, median of rounds · no network, model or Postgres involved",
+    )
+
+
+@app.command("tool-output")
+def tool_output(
+    files: list[Path] = typer.Argument(None, help="Page text files; a synthetic page when omitted"),
+    query: str = typer.Option(None, "--query", "-q", help="Question the pages are compacted for"),
+    budget: int = typer.Option(2000, "--budget", min=100, help="Token budget per page"),
+    ttft: bool = typer.Option(False, "--ttft", help="Also time the default model on each page, whole and compacted"),
+    repeats: int = typer.Option(
+        3, "--repeats", min=1, help="Model calls per variant with --ttft; the median is reported"
+    ),
+) -> None:
+    """Tokens before / after fetched-page compaction, and optionally time to first token."""
+    from evals.tool_output import DEFAULT_QUERY, PageResult, run
+
+    with console.status("[bold]compacting[/bold]…", spinner="dots"):
+        results = run(files or [], query or DEFAULT_QUERY, budget, ttft=ttft, repeats=repeats)
+
+    columns: dict[str, Callable[[PageResult], str]] = {
+        "Page": lambda r: r.name,
+        "Tokens before": lambda r: f"{r.tokens_before:,}",
+        "Tokens after": lambda r: f"{r.tokens_after:,} ({r.tokens_after / max(r.tokens_before, 1):.0%})",
+        "Compaction": lambda r: f"{r.compaction_ms:.1f} ms",
+        "TTFT before": lambda r: _or_dash(r.ttft_before, "{:.2f}s"),
+        "TTFT after": lambda r: _or_dash(r.ttft_after, "{:.2f}s"),
+        "Input tokens": lambda r: (
+            "[dim]—[/dim]" if r.input_tokens_before is None else f"{r.input_tokens_before:,} → {r.input_tokens_after:,}"
+        ),
+    }
+    report(
+        console,
+        ResultsTable("Tool Output Compaction", columns, left=["Page"]),
+        results,
+        note=f"budget {budget:,} tokens per page" + (f" · TTFT median of {repeats}" if ttft else ""),
+    )
+
+
+@app.command()
+def load(
+    rates: str = typer.Option("1,2,4,8", "--rates", "-r", help="Requests per second, one step each (comma-separated)"),
+    seconds: float = typer.Option(30.0, "--seconds", "-s", min=1, help="Length of each step (s)"),
+    agent: str = typer.Option("web-search", "--agent", "-a", help="Agent id to run"),
+    mix: str = typer.Option("stream=6,run=3,sessions=1", "--mix", help="Weights of stream, run and sessions requests"),
+    users: int = typer.Option(20, "--users", min=1, help="Distinct users; each keeps one session"),
+    workers: int = typer.Option(2, "--workers", "-w", min=1, help="Gunicorn workers (WEB_CONCURRENCY)"),
+    max_in_flight: int = typer.Option(200, "--max-in-flight", min=1, help="Requests past this are dropped, not queued"),
+    timeout: float = typer.Option(120.0, "--timeout", help="Per-request timeout (s)"),
+    latency: float = typer.Option(0.5, "--latency", help="Stub model: seconds to first token"),
+    tokens_per_second: float = typer.Option(50.0, "--tps", help="Stub model: tokens per second (0 = all at once)"),
+    tool: str = typer.Option("web_search", "--tool", help="Stub model calls this tool once per run ('' for none)"),
+    search_latency: float = typer.Option(0.3, "--search-latency", help="Fake MCP server: seconds per call"),
+    admission: bool = typer.Option(
+        False, "--admission", help="Turn admission control on (no JWT: agent and interface limits only)"
+    ),
+    warm_up: int = typer.Option(4, "--warm-up", min=0, help="Streaming runs sent before the first step, not reported"),
+    stop_p95: float = typer.Option(None, "--stop-p95", help="Stop after the first step whose run p95 exceeds this (s)"),
+    output: Path = typer.Option(Path("tmp/load.json"), "--output", "-o", help="Where to write the JSON report"),
+) -> None:
+    """Step load against one replica (gunicorn + the compose Postgres) with a stub model and fake search.
+
+    Exits 1 when any request fails for a reason other than a 429.
+    """
+    from evals.fake_mcp import FakeMCPServer
+    from evals.load import Replica, Step, build_report, parse_mix, replica_env, run_load, save_report
+    from evals.stub_model import StubModelServer
+
+    try:
+        steps_rates = [float(rate) for rate in rates.split(",") if rate.strip()]
+        weights = parse_mix(mix)
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from exc
+    if not steps_rates or any(rate <= 0 for rate in steps_rates):
+        raise typer.BadParameter("--rates needs positive requests per second")
+
+    p50_p95 = ("p50", "p95")
+    columns: dict[str, Callable[[Step], str]] = {
+        "Rate": lambda step: f"{step.rate:g}/s",
+        "Sent": lambda step: str(len(step.samples)) + (f" [yellow]+{step.dropped}[/yellow]" if step.dropped else ""),
+        "Done/s": lambda step: f"{step.throughput:.2f}",
+        "Err / 429": lambda step: _count_cell(step.errors) + f" / {step.rejected}",
+        "Stream": lambda step: _dist_cell(step.latency("stream"), stats=p50_p95),
+        "TTFT": lambda step: _dist_cell(step.ttft(), stats=p50_p95),
+        "Run": lambda step: _dist_cell(step.latency("run"), stats=p50_p95),
+        "Sessions": lambda step: _dist_cell(step.latency("sessions"), stats=p50_p95),
+        "Loop lag": lambda step: (
+            "[dim]—[/dim]"
+            if step.loop_lag.get("mean_ms") is None
+            else f"{step.loop_lag['mean_ms']:.0f} / ≤{step.loop_lag['p99_ms']:g} ms"
+        ),
+        "Memory": lambda step: _or_dash(step.memory_mb, "{:,.0f} MB"),
+        "Pool": lambda step: (
+            "[dim]—[/dim]" if step.pool_saturation is None else f"{step.pool_in_use:g}/{step.pool_limit:g}"
+        ),
+    }
+    table = ResultsTable("Load", columns)
+
+    def add_row(step: Step) -> None:
+        table.add(step)
+        console.print(f"[dim]{step.rate:g}/s: {len(step.ok)} done in {step.wall_time:.1f}s, {step.errors} errors[/dim]")
+
+    log = output.with_suffix(".log")
+    with StubModelServer(latency=latency, tokens_per_second=tokens_per_second, tool_call=tool or None) as model:
+        with FakeMCPServer(latency=search_latency) as search:
+            env = replica_env(model_url=model.url, search_url=search.url, admission=admission)
+            replica = Replica(env, workers=workers, log=log)
+            try:
+                with console.status(f"[bold]starting[/bold] {workers} workers…", spinner="dots"):
+                    replica.start()
+                steps, baseline = asyncio.run(
+                    run_load(
+                        replica,
+                        agent_id=agent,
+                        rates=steps_rates,
+                        seconds=seconds,
+                        mix=weights,
+                        users=users,
+                        max_in_flight=max_in_flight,
+                        timeout=timeout,
+                        warm_up=warm_up,
+                        stop_p95=stop_p95,
+                        on_step=add_row,
+                    )
+                )
+            finally:
+                replica.stop()
+
+    config = {
+        "agent": agent,
+        "rates": steps_rates,
+        "seconds": seconds,
+        "mix": weights,
+        "users": users,
+        "workers": workers,
+        "max_in_flight": max_in_flight,
+        "stub": {"latency": latency, "tokens_per_second": tokens_per_second, "tool": tool or None},
+        "search_latency": search_latency,
+        "admission": admission,
+    }
+    save_report(build_report(steps, baseline, config), output)
+
+    report(
+        console,
+        table,
+        [],
+        note="latency p50 / p95 (p99 in the report) · loop lag mean / p99 bucket, all workers · "
+        f"memory: PSS of the process tree, {baseline or 0:,.0f} MB after warm-up · pool: peak in use / limit · "
+        "+N: dropped at --max-in-flight",
+    )
+    console.print(f"[dim]report: {output} · server log: {log}[/dim]")
+    if len(steps) < len(steps_rates):
+        console.print(f"[yellow]stopped after {steps[-1].rate:g}/s: run p95 over {stop_p95:g}s[/yellow]")
+    errors = sorted({s.error for step in steps for s in step.samples if s.error and s.status != 429})
+    for error in errors[:5]:
+        console.print(f"  [red]{error}[/red]")
+
+    raise typer.Exit(1 if errors else 0)
+
+
 if __name__ == "__main__":
     app()
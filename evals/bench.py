@@ -0,0 +1,181 @@
+"""
+Eval Benchmarks
+===============
+
+Latency / token benchmark over the eval cases, driven by
+``python -m evals bench``.
+
+Each case runs ``runs`` times (``concurrency`` at a time). Per run we
+record total latency, time-to-first-token (first non-empty ``RunContent``
+event), per-tool durations (``ToolCallStarted`` → ``ToolCallCompleted``)
+and input/output tokens from ``RunOutput.metrics``. Results are reduced
+to p50/p95/p99 per case, written as JSON, and optionally compared to a
+saved baseline so CI can fail on regressions.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import platform
+import time
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+from agno.run.agent import RunOutput
+
+from app.stats import distribution
+from evals.cases import Case
+
+BENCH_VERSION = 1
+
+# Metrics compared against the baseline: (metric, percentile).
+REGRESSION_CHECKS: tuple[tuple[str, str], ...] = (
+    ("latency", "p50"),
+    ("latency", "p95"),
+    ("ttft", "p50"),
+    ("ttft", "p95"),
+    ("input_tokens", "p50"),
+    ("output_tokens", "p50"),
+)
+
+
+@dataclass
+class Sample:
+    """One timed agent run."""
+
+    latency: float
+    ttft: float | None = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    tools: dict[str, list[float]] = field(default_factory=dict)
+    error: str | None = None
+
+
+async def timed_run(case: Case) -> Sample:
+    """Stream one run of ``case`` and time it from the event stream."""
+    session_id = f"bench-{case.name}-{uuid4().hex[:8]}"
+    started = time.perf_counter()
+    ttft: float | None = None
+    tool_started: dict[str, float] = {}
+    tools: dict[str, list[float]] = {}
+    response: RunOutput | None = None
+    try:
+        async for event in case.agent.arun(
+            input=case.input,
+            stream=True,
+            stream_events=True,
+            yield_run_output=True,
+            session_id=session_id,
+        ):
+            now = time.perf_counter()
+            if isinstance(event, RunOutput):
+                response = event
+                continue
+            event_type = getattr(event, "event", None)
+            if event_type == "RunContent" and ttft is None and getattr(event, "content", None):
+                ttft = now - started
+            elif event_type in ("ToolCallStarted", "ToolCallCompleted"):
+                tool = getattr(event, "tool", None)
+                name = getattr(tool, "tool_name", None) or "?"
+                key = getattr(tool, "tool_call_id", None) or name
+                if event_type == "ToolCallStarted":
+                    tool_started[key] = now
+                elif key in tool_started:
+                    tools.setdefault(name, []).append(now - tool_started.pop(key))
+    except Exception as exc:
+        return Sample(latency=time.perf_counter() - started, error=f"{type(exc).__name__}: {exc}")
+
+    latency = time.perf_counter() - started
+    if response is None:
+        return Sample(latency=latency, ttft=ttft, tools=tools, error="no run output recorded")
+    metrics = response.metrics
+    return Sample(
+        latency=latency,
+        ttft=ttft,
+        input_tokens=metrics.input_tokens if metrics else 0,
+        output_tokens=metrics.output_tokens if metrics else 0,
+        tools=tools,
+    )
+
+
+async def run_bench(cases: list[Case], *, runs: int, concurrency: int) -> dict[str, list[Sample]]:
+    """Run every case ``runs`` times with at most ``concurrency`` runs in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(case: Case) -> Sample:
+        async with semaphore:
+            return await timed_run(case)
+
+    results: dict[str, list[Sample]] = {}
+    for case in cases:
+        results[case.name] = list(await asyncio.gather(*(one(case) for _ in range(runs))))
+    return results
+
+
+def summarize(samples: list[Sample]) -> dict[str, Any]:
+    """Reduce one case's samples to percentiles. Failed runs only count toward ``errors``."""
+    ok = [s for s in samples if s.error is None]
+    tool_names = sorted({name for s in ok for name in s.tools})
+    return {
+        "runs": len(samples),
+        "errors": len(samples) - len(ok),
+        "error_messages": sorted({s.error for s in samples if s.error}),
+        "latency": distribution([s.latency for s in ok]),
+        "ttft": distribution([s.ttft for s in ok if s.ttft is not None]),
+        "input_tokens": distribution([float(s.input_tokens) for s in ok]),
+        "output_tokens": distribution([float(s.output_tokens) for s in ok]),
+        "tools": {name: distribution([d for s in ok for d in s.tools.get(name, [])]) for name in tool_names},
+    }
+
+
+def build_report(
+    results: dict[str, list[Sample]], *, runs: int, concurrency: int, model: str, wall_time: float
+) -> dict[str, Any]:
+    total_runs = sum(len(v) for v in results.values())
+    return {
+        "version": BENCH_VERSION,
+        "created_at": datetime.now(UTC).isoformat(timespec="seconds"),
+        "meta": {
+            "runs": runs,
+            "concurrency": concurrency,
+            "model": model,
+            "python": platform.python_version(),
+            "wall_time": wall_time,
+            "throughput_rps": total_runs / wall_time if wall_time else None,
+        },
+        "cases": {name: summarize(samples) for name, samples in results.items()},
+    }
+
+
+def save_report(report: dict[str, Any], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2) + "\n")
+
+
+def load_report(path: Path) -> dict[str, Any]:
+    report = json.loads(path.read_text())
+    if report.get("version") != BENCH_VERSION:
+        raise ValueError(f"{path}: unsupported bench report version {report.get('version')!r}")
+    return report
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], *, tolerance: float) -> list[str]:
+    """Regressions where ``current`` exceeds ``baseline`` by more than ``tolerance`` (fraction)."""
+    regressions: list[str] = []
+    for name, case in current["cases"].items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            continue
+        if case["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: errors {base.get('errors', 0)} → {case['errors']}")
+        for metric, stat in REGRESSION_CHECKS:
+            now, before = case[metric].get(stat), base.get(metric, {}).get(stat)
+            if now is None or before is None or before <= 0:
+                continue
+            if now > before * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {stat} {before:.3f} → {now:.3f} (+{(now / before - 1):.0%})")
+    return regressions
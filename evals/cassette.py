@@ -0,0 +1,268 @@
+"""
+Eval Cassettes
+==============
+
+Record / replay for ``python -m evals``: every HTTP request the suite
+makes to a remote service (the agents' and the judge's model calls,
+Parallel's SDK and the search MCP endpoint) is captured into one
+cassette file with its response, keyed by a hash of the request, and
+played back on later runs without going to the network.
+
+    python -m evals --record            # run live, (re)write the cassette
+    python -m evals --replay            # serve hits from the cassette; misses go live and are recorded
+    python -m evals --replay --offline  # misses fail with a 400, no network at all
+
+Requests are intercepted at the httpx transport, so every SDK built on
+httpx is covered without changes to the agents. The key is the method,
+URL and body, with values that change from run to run scrubbed out
+(UUIDs, timestamps, the per-case session id, JSON-RPC ids), so a change
+to an agent's instructions or tools is a miss and everything else is a
+hit. A request seen several times in a run is recorded as a sequence and
+replayed in that order.
+
+Local servers (the fake MCP, Slack and stub-model servers) and agno's
+telemetry are passed through and never recorded. Long-lived MCP event
+streams are passed through when recording and answered with 405 (the
+server doesn't offer one) when offline. Postgres isn't HTTP and isn't
+touched: the eval DB still needs to be up.
+
+The file carries ``CASSETTE_VERSION``; a cassette from another version
+is ignored and recorded again.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import Counter
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Literal
+
+import httpx
+from agno.utils.log import log_warning
+
+CASSETTE_VERSION = 1
+DEFAULT_CASSETTE = Path(__file__).parent / "cassettes" / "evals.json"
+
+Mode = Literal["record", "replay"]
+
+# Never recorded: local fakes and agno's own telemetry.
+_PASSTHROUGH_HOSTS = ("127.0.0.1", "localhost", "::1")
+_PASSTHROUGH_SUFFIXES = (".agno.com",)
+# Response headers worth keeping; the body is stored decoded, so encoding and length go.
+_KEPT_HEADERS = ("content-type", "mcp-session-id", "x-request-id")
+
+_SCRUB = (
+    (re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.I), "<uuid>"),
+    (re.compile(r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?"), "<time>"),
+    (re.compile(r"\beval-([\w-]+)-[0-9a-f]{8}\b"), r"eval-\1-<id>"),
+)
+
+
+class Cassette:
+    """Recorded HTTP interactions in ``path``, and the httpx patch that records or replays them."""
+
+    def __init__(self, path: Path = DEFAULT_CASSETTE, *, mode: Mode = "replay", offline: bool = False) -> None:
+        self.path = path
+        self.mode = mode
+        self.offline = offline
+        self.interactions: dict[str, list[dict]] = self._load()
+        self.stats: Counter[str] = Counter()
+        self._played: Counter[str] = Counter()
+        self._recorded: set[str] = set()
+        self._lock = threading.Lock()
+
+    # -- Patch ------------------------------------------------------------------
+
+    @contextmanager
+    def use(self) -> Iterator[Cassette]:
+        """Route every httpx request in the process through the cassette until exit, then save it."""
+        send_async = httpx.AsyncHTTPTransport.handle_async_request
+        send_sync = httpx.HTTPTransport.handle_request
+        cassette = self
+
+        # Same signatures as the methods they replace (``self`` is the transport), so only the patch itself is ignored.
+        async def handle_async_request(self: httpx.AsyncHTTPTransport, request: httpx.Request) -> httpx.Response:
+            return await cassette._handle_async(lambda: send_async(self, request), request)
+
+        def handle_request(self: httpx.HTTPTransport, request: httpx.Request) -> httpx.Response:
+            return cassette._handle_sync(lambda: send_sync(self, request), request)
+
+        httpx.AsyncHTTPTransport.handle_async_request = handle_async_request  # type: ignore[method-assign]
+        httpx.HTTPTransport.handle_request = handle_request  # type: ignore[method-assign]
+        try:
+            yield self
+        finally:
+            httpx.AsyncHTTPTransport.handle_async_request = send_async  # type: ignore[method-assign]
+            httpx.HTTPTransport.handle_request = send_sync  # type: ignore[method-assign]
+            if self._recorded:
+                self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with self._lock:
+            payload = {"version": CASSETTE_VERSION, "interactions": dict(sorted(self.interactions.items()))}
+        tmp.write_text(json.dumps(payload, indent=1, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+
+    def summary(self) -> str:
+        parts = [f"{self.stats[k]} {k}" for k in ("hits", "misses", "recorded") if self.stats[k]]
+        return f"{self.mode}{' offline' if self.offline else ''}: " + (", ".join(parts) or "no requests")
+
+    # -- Requests ---------------------------------------------------------------
+
+    async def _handle_async(
+        self, send: Callable[[], Awaitable[httpx.Response]], request: httpx.Request
+    ) -> httpx.Response:
+        if _passthrough(request):
+            return await send()
+        if _is_event_stream(request):
+            return httpx.Response(405, request=request) if self.offline else await send()
+        await request.aread()
+        key, rpc_id = _key(request)
+        replayed = self._replay(key, rpc_id, request)
+        if replayed is not None:
+            return replayed
+        response = await send()
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        return self._record(key, rpc_id, request, response, body)
+
+    def _handle_sync(self, send: Callable[[], httpx.Response], request: httpx.Request) -> httpx.Response:
+        if _passthrough(request):
+            return send()
+        if _is_event_stream(request):
+            return httpx.Response(405, request=request) if self.offline else send()
+        request.read()
+        key, rpc_id = _key(request)
+        replayed = self._replay(key, rpc_id, request)
+        if replayed is not None:
+            return replayed
+        response = send()
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        return self._record(key, rpc_id, request, response, body)
+
+    def _replay(self, key: str, rpc_id: Any, request: httpx.Request) -> httpx.Response | None:
+        """The next recorded response for ``key``, an error response on an offline miss, or None to go live."""
+        if self.mode == "replay":
+            with self._lock:
+                recorded = self.interactions.get(key) if key not in self._recorded else None
+                index = self._played[key]
+                self._played[key] += 1
+                self.stats["hits" if recorded else "misses"] += 1
+            if recorded:
+                return _response(recorded[min(index, len(recorded) - 1)], rpc_id, request)
+            if self.offline:
+                # A 400 rather than a transport error, so SDKs fail at once instead of retrying.
+                message = f"cassette miss: {request.method} {_url(request)} ({key[:12]}); run with --record"
+                return httpx.Response(
+                    400, json={"error": {"message": message, "type": "cassette_miss"}}, request=request
+                )
+        return None
+
+    def _record(
+        self, key: str, rpc_id: Any, request: httpx.Request, response: httpx.Response, body: bytes
+    ) -> httpx.Response:
+        try:
+            text, encoding = body.decode(), None
+        except UnicodeDecodeError:
+            text, encoding = base64.b64encode(body).decode(), "base64"
+        entry = {
+            "request": f"{request.method} {_url(request)}",
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() in _KEPT_HEADERS},
+            "body": text,
+            **({"encoding": encoding} if encoding else {}),
+            **({"rpc_id": rpc_id} if rpc_id is not None else {}),
+        }
+        with self._lock:
+            if key not in self._recorded:
+                # First time this run: replace what an earlier recording had for it.
+                self._recorded.add(key)
+                self.interactions[key] = []
+            self.interactions[key].append(entry)
+            self.stats["recorded"] += 1
+        return httpx.Response(response.status_code, headers=entry["headers"], content=body, request=request)
+
+    def _load(self) -> dict[str, list[dict]]:
+        if not self.path.exists():
+            return {}
+        try:
+            payload = json.loads(self.path.read_text())
+        except (OSError, json.JSONDecodeError) as exc:
+            log_warning(f"Ignoring unreadable cassette {self.path}: {exc}")
+            return {}
+        if payload.get("version") != CASSETTE_VERSION:
+            log_warning(f"Ignoring cassette {self.path}: version {payload.get('version')}, expected {CASSETTE_VERSION}")
+            return {}
+        return payload.get("interactions") or {}
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _key(request: httpx.Request) -> tuple[str, Any]:
+    """``(hash of the scrubbed request, its JSON-RPC id if any)``."""
+    body = request.content.decode(errors="replace")
+    rpc_id = None
+    try:
+        payload = json.loads(body) if body else None
+    except json.JSONDecodeError:
+        payload = None
+    if isinstance(payload, dict):
+        if "jsonrpc" in payload:
+            rpc_id = payload.pop("id", None)
+        body = json.dumps(payload, sort_keys=True)
+    for pattern, replacement in _SCRUB:
+        body = pattern.sub(replacement, body)
+    digest = hashlib.sha256(f"{request.method}\n{_url(request)}\n{body}".encode()).hexdigest()
+    return digest, rpc_id
+
+
+def _response(entry: dict, rpc_id: Any, request: httpx.Request) -> httpx.Response:
+    body = entry["body"]
+    if entry.get("encoding") == "base64":
+        content = base64.b64decode(body)
+    else:
+        recorded_id = entry.get("rpc_id")
+        if rpc_id is not None and recorded_id is not None and rpc_id != recorded_id:
+            # The session matches responses to requests by id; answer with this request's.
+            body = re.sub(
+                rf'("id"\s*:\s*){re.escape(json.dumps(recorded_id))}(?=\s*[,}}])',
+                rf"\g<1>{json.dumps(rpc_id)}",
+                body,
+                count=1,
+            )
+        content = body.encode()
+    return httpx.Response(entry["status"], headers=entry.get("headers") or {}, content=content, request=request)
+
+
+def _url(request: httpx.Request) -> str:
+    url = request.url
+    query = "&".join(sorted(url.query.decode().split("&"))) if url.query else ""
+    for pattern, replacement in _SCRUB:
+        query = pattern.sub(replacement, query)
+    return f"{url.scheme}://{url.host}{url.path}" + (f"?{query}" if query else "")
+
+
+def _passthrough(request: httpx.Request) -> bool:
+    host = request.url.host
+    return host in _PASSTHROUGH_HOSTS or host.endswith(_PASSTHROUGH_SUFFIXES)
+
+
+def _is_event_stream(request: httpx.Request) -> bool:
+    return request.method == "GET" and "text/event-stream" in request.headers.get("accept", "")
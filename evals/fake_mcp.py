@@ -0,0 +1,85 @@
+"""
+Fake MCP Server
+===============
+
+A local stand-in for Parallel's keyless search MCP endpoint, serving
+``web_search`` and ``web_fetch`` over streamable HTTP with canned results.
+Point ``PooledMCPTools`` at it (``WEB_SEARCH_MCP_URL`` for the app) to
+exercise the pool with no network and no rate ceiling.
+
+    with FakeMCPServer(latency=0.2) as server:
+        tools = PooledMCPTools(url=server.url)
+
+Each call sleeps ``latency`` seconds (± ``jitter``), the way a real search
+round-trip would; a query or URL containing "slow" sleeps ``slow_latency``
+instead, to exercise timeouts. Every query's results include the same two
+guide pages, so results from several queries overlap. ``restart()`` stops
+the server and starts a fresh one on the same port, dropping every
+session, to exercise reconnects.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+from dataclasses import dataclass, field
+
+from mcp.server.fastmcp import FastMCP
+from starlette.applications import Starlette
+
+from evals.harness import LocalServer
+
+
+@dataclass
+class FakeMCPState:
+    latency: float = 0.2
+    jitter: float = 0.05
+    slow_latency: float = 5.0
+    calls: list[str] = field(default_factory=list)  # tool names, in call order
+
+
+def create_app(state: FakeMCPState) -> Starlette:
+    server = FastMCP("Fake Search", host="127.0.0.1")
+
+    async def pause(subject: str) -> None:
+        latency = state.slow_latency if "slow" in subject else state.latency
+        await asyncio.sleep(max(0.0, latency + random.uniform(-state.jitter, state.jitter)))
+
+    @server.tool()
+    async def web_search(query: str) -> str:
+        """Search the web. Returns titles, URLs and snippets for the query."""
+        state.calls.append("web_search")
+        await pause(query)
+        urls = [f"https://example.com/{i}?q={query.replace(' ', '+')}" for i in range(1, 4)]
+        urls[1:1] = ["https://example.com/guide", "https://example.com/faq/"]
+        return "\n".join(
+            f"{i}. {query} — result {i}\n   {url}\n   Snippet about {query}." for i, url in enumerate(urls, start=1)
+        )
+
+    @server.tool()
+    async def web_fetch(url: str) -> str:
+        """Fetch a web page and return its main text."""
+        state.calls.append("web_fetch")
+        await pause(url)
+        return f"# {url}\n\nPage text for {url}."
+
+    return server.streamable_http_app()
+
+
+class FakeMCPServer(LocalServer):
+    """Run the fake MCP server on 127.0.0.1 in a background thread."""
+
+    name = "fake MCP server"
+    path = "/mcp"
+
+    def __init__(self, *, latency: float = 0.2, jitter: float = 0.05, slow_latency: float = 5.0, port: int = 0) -> None:
+        super().__init__(port=port)
+        self.state = FakeMCPState(latency=latency, jitter=jitter, slow_latency=slow_latency)
+
+    def create_app(self) -> Starlette:
+        return create_app(self.state)
+
+    def restart(self) -> None:
+        """Drop every session: stop and start a fresh server on the same port."""
+        self.stop()
+        self.start()
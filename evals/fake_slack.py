@@ -0,0 +1,140 @@
+"""
+Fake Slack API
+==============
+
+A local stand-in for the Slack Web API methods the Slack interface calls,
+with Slack-style rate limiting. Point a Web API client at it
+(``AsyncWebClient(base_url=server.url)``, or ``SLACK_API_URL`` for the
+app) to exercise streaming replies with no workspace and no real limits
+to trip over.
+
+    with FakeSlackServer(rate=1.0, burst=3) as server:
+        client = AsyncWebClient(token="xoxb-fake", base_url=server.url)
+
+Each ``chat.*Stream`` method allows ``rate`` calls per second per channel
+(``burst`` at once); calls over the limit get a 429 with ``Retry-After``,
+like Slack. Streamed messages are assembled from their markdown chunks so
+the final text can be checked, and every call is recorded.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any
+from uuid import uuid4
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from evals.harness import LocalServer
+
+RATE_LIMITED_METHODS = ("chat.startStream", "chat.appendStream", "chat.stopStream", "chat.postMessage")
+
+
+@dataclass
+class FakeMessage:
+    channel: str
+    text: str = ""
+    task_updates: int = 0
+    stopped: bool = False
+
+
+@dataclass
+class FakeSlackState:
+    rate: float = 1.0  # calls per second per (method, channel); 0 = unlimited
+    burst: int = 3
+    calls: list[tuple[str, int]] = field(default_factory=list)  # (method, HTTP status)
+    messages: dict[str, FakeMessage] = field(default_factory=dict)
+    _buckets: dict[tuple[str, str], tuple[float, float]] = field(default_factory=dict)
+
+    def take(self, method: str, channel: str) -> float:
+        """Spend one call from the bucket; returns seconds to wait when it is empty."""
+        if self.rate <= 0 or method not in RATE_LIMITED_METHODS:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.get((method, channel), (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[(method, channel)] = (tokens, now)
+            return (1 - tokens) / self.rate
+        self._buckets[(method, channel)] = (tokens - 1, now)
+        return 0.0
+
+    def count(self, method: str | None = None, status: int | None = None) -> int:
+        return sum(1 for m, s in self.calls if (method is None or m == method) and (status is None or s == status))
+
+
+def _apply_chunks(message: FakeMessage, chunks: list | None) -> None:
+    for chunk in chunks or []:
+        if chunk.get("type") == "markdown_text":
+            message.text += chunk.get("text", "")
+        elif chunk.get("type") == "task_update":
+            message.task_updates += 1
+
+
+def create_app(state: FakeSlackState) -> FastAPI:
+    app = FastAPI(title="Fake Slack API")
+
+    @app.api_route("/api/{method}", methods=["GET", "POST"], response_model=None)
+    async def api(method: str, request: Request) -> dict[str, Any] | JSONResponse:
+        body: dict[str, Any]
+        if request.method == "GET":
+            body = dict(request.query_params)
+        elif request.headers.get("content-type", "").startswith("application/json"):
+            body = await request.json()
+        else:
+            body = dict(await request.form())
+        channel = str(body.get("channel") or body.get("channel_id") or "")
+
+        retry_after = state.take(method, channel)
+        if retry_after:
+            state.calls.append((method, 429))
+            return JSONResponse(
+                {"ok": False, "error": "ratelimited"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+        state.calls.append((method, 200))
+
+        if method == "chat.startStream":
+            ts = f"{time.time():.6f}"
+            started = state.messages[ts] = FakeMessage(channel=channel)
+            _apply_chunks(started, body.get("chunks"))
+            return {"ok": True, "channel": channel, "ts": ts}
+        if method in ("chat.appendStream", "chat.stopStream"):
+            streaming = state.messages.get(str(body.get("ts")))
+            if streaming is None or streaming.stopped:
+                return {"ok": False, "error": "message_not_in_streaming_state"}
+            _apply_chunks(streaming, body.get("chunks"))
+            streaming.stopped = method == "chat.stopStream"
+            return {"ok": True, "channel": channel, "ts": body.get("ts")}
+        if method == "chat.postMessage":
+            ts = f"{time.time():.6f}"
+            state.messages[ts] = FakeMessage(channel=channel, text=str(body.get("text", "")), stopped=True)
+            return {"ok": True, "channel": channel, "ts": ts}
+        if method == "auth.test":
+            return {"ok": True, "user_id": "UFAKEBOT", "bot_id": "BFAKE", "team_id": "TFAKE"}
+        if method == "users.info":
+            user = str(body.get("user", ""))
+            return {"ok": True, "user": {"id": user, "name": user.lower(), "profile": {"display_name": user}}}
+        if method == "conversations.info":
+            return {"ok": True, "channel": {"id": channel, "name": f"fake-{channel.lower()}"}}
+        return {"ok": True, "id": uuid4().hex}
+
+    return app
+
+
+class FakeSlackServer(LocalServer):
+    """Run the fake Slack API on 127.0.0.1 in a background thread."""
+
+    name = "fake Slack server"
+    path = "/api/"
+
+    def __init__(self, *, rate: float = 1.0, burst: int = 3, port: int = 0) -> None:
+        super().__init__(port=port)
+        self.state = FakeSlackState(rate=rate, burst=burst)
+
+    def create_app(self) -> FastAPI:
+        return create_app(self.state)
@@ -0,0 +1,85 @@
+"""
+Web Fan-Out Benchmark
+=====================
+
+Runs the same ``search_many`` call (``app/fanout.py``) one branch at a
+time and fanned out, through ``PooledMCPTools`` against the local search
+server (``evals/fake_mcp.py``), driven by ``python -m evals fan-out``.
+
+The call has ``queries`` searches and ``urls`` page reads. With ``slow``
+set, one of the queries hits the server's slow path, so the fanned-out
+run shows the per-branch timeout cutting it loose while the one-at-a-time
+run waits it out. Every query's results include the same two guide
+pages, so the merged results show the URL dedupe. Per mode we record
+wall time, branches run, merged results, duplicates merged, and failed
+and timed-out branches.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from dataclasses import dataclass
+
+from app.fanout import FanOutStats, WebFanOut
+from app.mcp_pool import MCPPoolStats, PooledMCPTools
+from evals.fake_mcp import FakeMCPServer
+
+
+@dataclass
+class FanOutResult:
+    mode: str
+    wall_time: float = 0.0
+    branches: int = 0
+    results: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    timeouts: int = 0
+    top: str = ""
+    error: str | None = None
+
+
+async def compare(
+    server: FakeMCPServer,
+    *,
+    queries: int,
+    urls: int,
+    slow: bool,
+    concurrency: int,
+    timeout: float,
+) -> list[FanOutResult]:
+    """Time one ``search_many`` call with one branch at a time, then with ``concurrency`` at a time."""
+    tools = PooledMCPTools(url=server.url, size=concurrency, health_interval=1.0, stats=MCPPoolStats())
+    await tools.connect()
+    asked = [f"advisory locks angle {i}" for i in range(queries)]
+    if slow and asked:
+        asked[-1] = "advisory locks slow mirror"
+    pages = [f"https://example.com/page/{i}" for i in range(urls)]
+    modes = [
+        ("one at a time", WebFanOut(tools, concurrency=1, timeout=server.state.slow_latency * 2, max_branches=64)),
+        (f"fan-out ×{concurrency}", WebFanOut(tools, concurrency=concurrency, timeout=timeout, max_branches=64)),
+    ]
+    results = []
+    try:
+        for mode, fanout in modes:
+            fanout.stats = FanOutStats()
+            result = FanOutResult(mode=mode)
+            started = time.perf_counter()
+            try:
+                output = json.loads(await fanout.search_many(queries=asked, urls=pages))
+            except Exception as exc:
+                result.error = f"{type(exc).__name__}: {exc}"[:200]
+                output = {}
+            result.wall_time = time.perf_counter() - started
+            result.branches = sum(fanout.stats.branches.values())
+            result.results = len(output.get("results", []))
+            result.duplicates = fanout.stats.duplicates
+            result.failed = len(output.get("failed", []))
+            result.timeouts = fanout.stats.timeouts
+            hits = [item for item in output.get("results", []) if "queries" in item]
+            result.top = hits[0]["url"] if hits else ""
+            result.error = result.error or output.get("error")
+            results.append(result)
+    finally:
+        await tools.stop()
+    return results
@@ -0,0 +1,107 @@
+"""
+Benchmark Harness
+=================
+
+What the ``python -m evals`` benchmark subcommands share:
+
+- ``LocalServer`` runs one of the local stand-ins (``stub_model``,
+  ``fake_mcp``, ``fake_slack``) on 127.0.0.1 in a background thread;
+- ``ResultsTable`` turns result objects into table rows, one cell
+  function per column;
+- ``report()`` prints the table, a footnote and each result's error.
+
+Each subcommand only parses its options, runs its benchmark module and
+decides its exit code from the results.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Iterable
+from typing import Any, Generic, Self, TypeVar
+
+import uvicorn
+from rich.console import Console
+from rich.table import Table
+
+R = TypeVar("R")
+
+
+class LocalServer:
+    """Serve ``create_app()`` on 127.0.0.1 in a background thread. Subclasses set ``name`` and ``path``."""
+
+    name = "local server"
+    path = ""
+
+    def __init__(self, *, port: int = 0) -> None:
+        self.port = port
+        self._server: uvicorn.Server | None = None
+        self._thread: threading.Thread | None = None
+
+    def create_app(self) -> Any:
+        raise NotImplementedError
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}{self.path}"
+
+    def start(self) -> None:
+        # A fresh app per start: some (the MCP session manager) can only run once.
+        self._server = uvicorn.Server(
+            uvicorn.Config(self.create_app(), host="127.0.0.1", port=self.port, log_level="warning")
+        )
+        self._thread = threading.Thread(target=self._server.run, name=self.name.replace(" ", "-"), daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError(f"{self.name} failed to start")
+            time.sleep(0.01)
+        self.port = self._server.servers[0].sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        if self._server is not None and self._thread is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+
+class ResultsTable(Generic[R]):
+    """A rich table with one row per result; ``columns`` maps each header to its cell."""
+
+    def __init__(self, title: str, columns: dict[str, Callable[[R], str]], *, left: Iterable[str] = ()) -> None:
+        self.columns = columns
+        self.table = Table(title=title, title_style="bold sky_blue1", show_header=True, header_style="bold")
+        left = set(left)
+        for column in columns:
+            self.table.add_column(column, justify="left" if column in left else "right", no_wrap=True)
+
+    def add(self, result: R) -> None:
+        self.table.add_row(*(cell(result) for cell in self.columns.values()))
+
+
+def report(
+    console: Console,
+    table: ResultsTable[R],
+    results: Iterable[R],
+    *,
+    note: str,
+    label: Callable[[R], str] | None = None,
+) -> None:
+    """Print ``table`` (adding ``results``), a dim footnote, then ``label: error`` for each failed result."""
+    results = list(results)
+    for result in results:
+        table.add(result)
+    console.print()
+    console.print(table.table)
+    console.print(f"[dim]{note}[/dim]")
+    for result in results:
+        error = getattr(result, "error", None)
+        if error and label is not None:
+            console.print(f"  [dim]{label(result)}:[/dim] [red]{error}[/red]")
@@ -0,0 +1,535 @@
+"""
+Load Test
+=========
+
+Stepped load against one replica, driven by ``python -m evals load``.
+
+The replica is the production server (``gunicorn -c python:app.gunicorn_conf
+app.asgi:app``, ``WEB_CONCURRENCY`` workers) in a subprocess, on the
+compose Postgres from ``.env``, with nothing remote behind it:
+
+- Models point at the local stub (``evals/stub_model.py``) through
+  ``OPENAI_BASE_URL``, with a configurable time to first token and token
+  rate. With ``tool_call`` the stub calls the search tool once per run
+  before it answers, so runs go through the tool loop.
+- Search is the local MCP server (``evals/fake_mcp.py``) through
+  ``WEB_SEARCH_MCP_URL``.
+- Admission control is off unless asked for, since every request comes
+  from one client address.
+
+A few streaming runs warm every worker up first (imports, MCP sessions);
+memory growth is measured from after them. Each step sends requests at ``rate`` per second (Poisson arrivals) for
+``seconds`` seconds: streaming runs, non-streaming runs and session
+listings, mixed by weight, for ``users`` users that each keep one
+session, so history grows as it would. Requests past ``max_in_flight``
+are dropped rather than queued client-side. The step ends when its last
+request does.
+
+Per step we record throughput, latency percentiles per request kind,
+time to first token for streaming runs, errors and 429s, the replica's
+event-loop lag (``agentos_event_loop_lag_seconds``, all workers), its
+memory (PSS of the gunicorn process tree) and DB pool saturation
+(``db_pool_connections_in_use`` over ``db_pool_connections_limit``,
+sampled every second). Client-side latency includes this process, which
+also runs the stubs; the lag, memory and pool numbers are the server's.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.stats import distribution
+
+LOAD_VERSION = 1
+OPERATIONS = ("stream", "run", "sessions")
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class Sample:
+    """One request."""
+
+    op: str
+    latency: float
+    ttft: float | None = None
+    status: int | None = None
+    error: str | None = None
+
+
+@dataclass
+class Step:
+    rate: float
+    seconds: float
+    samples: list[Sample] = field(default_factory=list)
+    dropped: int = 0
+    wall_time: float = 0.0
+    loop_lag: dict[str, float | None] = field(default_factory=dict)
+    memory_mb: float | None = None
+    pool_in_use: float = 0.0
+    pool_limit: float = 0.0
+
+    @property
+    def ok(self) -> list[Sample]:
+        return [s for s in self.samples if s.error is None]
+
+    @property
+    def throughput(self) -> float:
+        return len(self.ok) / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def errors(self) -> int:
+        return sum(1 for s in self.samples if s.error is not None and s.status != 429)
+
+    @property
+    def rejected(self) -> int:
+        return sum(1 for s in self.samples if s.status == 429)
+
+    @property
+    def pool_saturation(self) -> float | None:
+        return self.pool_in_use / self.pool_limit if self.pool_limit else None
+
+    def latency(self, op: str) -> dict[str, float | None]:
+        return distribution([s.latency for s in self.ok if s.op == op])
+
+    def ttft(self) -> dict[str, float | None]:
+        return distribution([s.ttft for s in self.ok if s.op == "stream" and s.ttft is not None])
+
+
+# ---------------------------------------------------------------------------
+# Replica
+# ---------------------------------------------------------------------------
+
+
+class Replica:
+    """The production server in a subprocess, on ``127.0.0.1`` and a free port."""
+
+    def __init__(self, env: dict[str, str], *, workers: int, log: Path, ready_timeout: float = 180.0) -> None:
+        self.env = env
+        self.workers = workers
+        self.log = log
+        self.ready_timeout = ready_timeout
+        self.port = _free_port()
+        self.process: subprocess.Popen | None = None
+        self._metrics_dir = tempfile.mkdtemp(prefix="agentos-load-metrics-")
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> None:
+        env = {
+            **self.env,
+            "PORT": str(self.port),
+            "WEB_CONCURRENCY": str(self.workers),
+            "PROMETHEUS_MULTIPROC_DIR": self._metrics_dir,
+        }
+        self.log.parent.mkdir(parents=True, exist_ok=True)
+        with self.log.open("wb") as out:
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", "python:app.gunicorn_conf", "app.asgi:app"],
+                cwd=_ROOT,
+                env=env,
+                stdout=out,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        self._wait_ready()
+
+    def stop(self) -> None:
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+
+    def memory_mb(self) -> float | None:
+        """PSS (RSS where PSS isn't available) of the master and its workers, in MB; None off Linux."""
+        if self.process is None or not Path("/proc").is_dir():
+            return None
+        total = 0
+        for pid in _process_tree(self.process.pid):
+            total += _pss_kb(pid)
+        return round(total / 1024, 1)
+
+    def _wait_ready(self) -> None:
+        # /health answers 503 until a worker's app is up (app/asgi.py); wait for a few 200s in a row
+        # so every worker has had a chance to finish starting.
+        deadline = time.monotonic() + self.ready_timeout
+        healthy = 0
+        while healthy < self.workers * 2:
+            if self.process is None or self.process.poll() is not None:
+                raise RuntimeError(f"replica exited during startup; see {self.log}\n{_tail(self.log)}")
+            if time.monotonic() > deadline:
+                raise RuntimeError(
+                    f"replica not ready after {self.ready_timeout:g}s; see {self.log}\n{_tail(self.log)}"
+                )
+            try:
+                healthy = healthy + 1 if httpx.get(f"{self.url}/health", timeout=5).status_code == 200 else 0
+            except httpx.HTTPError:
+                healthy = 0
+            time.sleep(0.5)
+
+    def __enter__(self) -> Replica:
+        try:
+            self.start()
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+
+def replica_env(*, model_url: str, search_url: str, admission: bool) -> dict[str, str]:
+    """This process's environment (``.env`` included), pointed at the stubs."""
+    # No Parallel SDK (search goes to the MCP URL), no Slack interface, no embedding calls the stub can't answer.
+    dropped = ("PARALLEL_API_KEY", "SLACK_BOT_TOKEN", "SLACK_SIGNING_SECRET", "WEB_CACHE_SIMILARITY")
+    env = {k: v for k, v in os.environ.items() if k not in dropped}
+    env.update(
+        {
+            "OPENAI_BASE_URL": model_url,
+            "OPENAI_API_KEY": "stub",
+            "WEB_SEARCH_MCP_URL": search_url,
+            "ADMISSION_ENABLED": str(admission),
+            "AGNO_TELEMETRY": "false",
+            # Authorization is only on in prd; the load generator doesn't carry a JWT.
+            "RUNTIME_ENV": "dev",
+        }
+    )
+    return env
+
+
+# ---------------------------------------------------------------------------
+# Load
+# ---------------------------------------------------------------------------
+
+
+class LoadGenerator:
+    """Sends the request mix to ``url`` and measures each step."""
+
+    def __init__(
+        self,
+        replica: Replica,
+        *,
+        agent_id: str,
+        mix: dict[str, float],
+        users: int,
+        max_in_flight: int,
+        timeout: float,
+    ) -> None:
+        self.replica = replica
+        self.agent_id = agent_id
+        self.mix = {op: weight for op, weight in mix.items() if weight > 0}
+        self.users = max(1, users)
+        self.max_in_flight = max_in_flight
+        self.client = httpx.AsyncClient(
+            base_url=replica.url,
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=max_in_flight + 10, max_keepalive_connections=max_in_flight + 10),
+        )
+        self.sent = 0
+        self.in_flight = 0
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def warm_up(self, requests: int) -> None:
+        """Send ``requests`` streaming runs at once and forget them: first-run imports and MCP connects."""
+        step = Step(rate=0.0, seconds=0.0)
+        await asyncio.gather(*(self._request("stream", step) for _ in range(requests)))
+
+    async def step(self, rate: float, seconds: float) -> Step:
+        step = Step(rate=rate, seconds=seconds)
+        before = await self._scrape()
+        sampling = asyncio.create_task(self._sample_pool(step))
+        tasks: list[asyncio.Task] = []
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        next_at = started
+        ops, weights = zip(*self.mix.items(), strict=True)
+        while True:
+            next_at += random.expovariate(rate)
+            if next_at - started >= seconds:
+                break
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+            if self.in_flight >= self.max_in_flight:
+                step.dropped += 1
+                continue
+            op = random.choices(ops, weights)[0]
+            tasks.append(asyncio.create_task(self._request(op, step)))
+        await asyncio.gather(*tasks)
+        step.wall_time = loop.time() - started
+        sampling.cancel()
+        after = await self._scrape()
+        step.loop_lag = _lag_between(before, after)
+        step.memory_mb = self.replica.memory_mb()
+        return step
+
+    async def _request(self, op: str, step: Step) -> None:
+        n = self.sent
+        self.sent += 1
+        user = f"load-user-{n % self.users}"
+        self.in_flight += 1
+        started = time.perf_counter()
+        sample = Sample(op=op, latency=0.0)
+        try:
+            if op == "sessions":
+                params = {"type": "agent", "component_id": self.agent_id, "user_id": user, "limit": "20"}
+                response = await self.client.get("/sessions", params=params)
+                sample.status = response.status_code
+            else:
+                data = {
+                    "message": f"Load test question {n}: how do PostgreSQL advisory locks work?",
+                    "stream": str(op == "stream").lower(),
+                    "session_id": f"load-{user}",
+                    "user_id": user,
+                }
+                if op == "stream":
+                    await self._stream(data, sample, started)
+                else:
+                    response = await self.client.post(f"/agents/{self.agent_id}/runs", data=data)
+                    sample.status = response.status_code
+            if sample.error is None and sample.status is not None and sample.status >= 400:
+                sample.error = f"HTTP {sample.status}"
+        except httpx.HTTPError as exc:
+            sample.error = f"{type(exc).__name__}: {exc}"[:200]
+        finally:
+            sample.latency = time.perf_counter() - started
+            self.in_flight -= 1
+            step.samples.append(sample)
+
+    async def _stream(self, data: dict, sample: Sample, started: float) -> None:
+        async with self.client.stream("POST", f"/agents/{self.agent_id}/runs", data=data) as response:
+            sample.status = response.status_code
+            if response.status_code >= 400:
+                await response.aread()
+                return
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    payload = json.loads(line[5:])
+                except json.JSONDecodeError:
+                    continue
+                kind = payload.get("event") if isinstance(payload, dict) else None
+                if kind == "RunContent" and payload.get("content") and sample.ttft is None:
+                    sample.ttft = time.perf_counter() - started
+                elif kind == "RunError":
+                    sample.error = str(payload.get("content") or "RunError")[:200]
+
+    async def _sample_pool(self, step: Step, interval: float = 1.0) -> None:
+        while True:
+            scraped = await self._scrape()
+            if scraped["pool_limit"]:
+                step.pool_limit = scraped["pool_limit"]
+                step.pool_in_use = max(step.pool_in_use, scraped["pool_in_use"])
+            await asyncio.sleep(interval)
+
+    async def _scrape(self) -> dict[str, Any]:
+        """Loop-lag histogram and pool gauges from the replica's ``/ops/metrics`` (all workers)."""
+        scraped: dict[str, Any] = {"lag_buckets": Counter(), "lag_sum": 0.0, "lag_count": 0.0}
+        scraped.update(pool_in_use=0.0, pool_limit=0.0)
+        try:
+            families = list(text_string_to_metric_families((await self.client.get("/ops/metrics")).text))
+        except (httpx.HTTPError, ValueError):
+            return scraped
+        for family in families:
+            for sample in family.samples:
+                if sample.name == "agentos_event_loop_lag_seconds_bucket":
+                    scraped["lag_buckets"][float(sample.labels["le"])] += sample.value
+                elif sample.name == "agentos_event_loop_lag_seconds_sum":
+                    scraped["lag_sum"] += sample.value
+                elif sample.name == "agentos_event_loop_lag_seconds_count":
+                    scraped["lag_count"] += sample.value
+                elif sample.name == "db_pool_connections_in_use":
+                    scraped["pool_in_use"] += sample.value
+                elif sample.name == "db_pool_connections_limit":
+                    scraped["pool_limit"] += sample.value
+        return scraped
+
+
+async def run_load(
+    replica: Replica,
+    *,
+    agent_id: str,
+    rates: list[float],
+    seconds: float,
+    mix: dict[str, float],
+    users: int,
+    max_in_flight: int,
+    timeout: float,
+    warm_up: int = 0,
+    stop_p95: float | None = None,
+    on_step: Callable[[Step], None] | None = None,
+) -> tuple[list[Step], float | None]:
+    """Warm up, then run each step in turn; stop after the first whose run p95 exceeds ``stop_p95``.
+
+    Returns the steps and the memory after warm-up, which growth is measured from.
+    """
+    generator = LoadGenerator(
+        replica, agent_id=agent_id, mix=mix, users=users, max_in_flight=max_in_flight, timeout=timeout
+    )
+    steps: list[Step] = []
+    try:
+        await generator.warm_up(warm_up)
+        baseline = replica.memory_mb()
+        for rate in rates:
+            step = await generator.step(rate, seconds)
+            steps.append(step)
+            if on_step is not None:
+                on_step(step)
+            p95 = max((step.latency(op)["p95"] or 0.0) for op in ("stream", "run"))
+            if stop_p95 is not None and p95 > stop_p95:
+                break
+    finally:
+        await generator.close()
+    return steps, baseline
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+
+def summarize(step: Step, baseline_mb: float | None) -> dict[str, Any]:
+    return {
+        "rate": step.rate,
+        "seconds": step.seconds,
+        "sent": len(step.samples),
+        "dropped": step.dropped,
+        "completed": len(step.ok),
+        "errors": step.errors,
+        "rejected": step.rejected,
+        "throughput": round(step.throughput, 3),
+        "wall_time": round(step.wall_time, 3),
+        "latency": {op: step.latency(op) for op in OPERATIONS},
+        "ttft": step.ttft(),
+        "loop_lag": step.loop_lag,
+        "memory_mb": step.memory_mb,
+        "memory_growth_mb": (
+            round(step.memory_mb - baseline_mb, 1) if step.memory_mb is not None and baseline_mb is not None else None
+        ),
+        "pool": {
+            "max_in_use": step.pool_in_use,
+            "limit": step.pool_limit,
+            "saturation": None if step.pool_saturation is None else round(step.pool_saturation, 3),
+        },
+        "error_samples": sorted({s.error for s in step.samples if s.error})[:5],
+    }
+
+
+def build_report(steps: list[Step], baseline_mb: float | None, config: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "version": LOAD_VERSION,
+        "started_at": datetime.now(UTC).isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": config,
+        "baseline_memory_mb": baseline_mb,
+        "steps": [summarize(step, baseline_mb) for step in steps],
+    }
+
+
+def save_report(report: dict[str, Any], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2) + "\n")
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """``"stream=6,run=3,sessions=1"`` → weights per request kind."""
+    mix: dict[str, float] = {}
+    for part in value.split(","):
+        op, _, weight = part.partition("=")
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError(f"unknown request kind {op!r}; expected one of {', '.join(OPERATIONS)}")
+        mix[op] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("the mix needs at least one positive weight")
+    return mix
+
+
+def _lag_between(before: dict[str, Any], after: dict[str, Any]) -> dict[str, float | None]:
+    """Mean and p50 / p99 of the loop-lag samples taken between two scrapes, in ms.
+
+    The percentiles are histogram bucket bounds: "at most this"; ``inf`` means past the largest bucket.
+    """
+    count = after["lag_count"] - before["lag_count"]
+    if count <= 0:
+        return {"mean_ms": None, "p50_ms": None, "p99_ms": None}
+    buckets = sorted((le, after["lag_buckets"][le] - before["lag_buckets"].get(le, 0.0)) for le in after["lag_buckets"])
+
+    def bound(q: float) -> float | None:
+        return next((round(le * 1000, 1) for le, cumulative in buckets if cumulative >= q * count), None)
+
+    return {
+        "mean_ms": round((after["lag_sum"] - before["lag_sum"]) / count * 1000, 2),
+        "p50_ms": bound(0.5),
+        "p99_ms": bound(0.99),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree(pid: int) -> list[int]:
+    pids, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        pids.append(current)
+        for task in Path(f"/proc/{current}/task").glob("*/children"):
+            try:
+                todo += [int(child) for child in task.read_text().split()]
+            except OSError:
+                continue
+    return pids
+
+
+def _pss_kb(pid: int) -> int:
+    try:
+        for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+            if line.startswith("Pss:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        return int(Path(f"/proc/{pid}/statm").read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _tail(path: Path, lines: int = 20) -> str:
+    try:
+        return "\n".join(path.read_text(errors="replace").splitlines()[-lines:])
+    except OSError:
+        return ""
@@ -0,0 +1,95 @@
+"""
+MCP Pool Benchmark
+==================
+
+Drives concurrent ``web_search`` calls through ``PooledMCPTools`` against
+the local MCP server (``evals/fake_mcp.py``), once per pool size, driven
+by ``python -m evals mcp-pool``.
+
+``calls`` calls run ``concurrency`` at a time. With ``restart_after`` set
+the server is restarted once that many calls have finished, dropping
+every session mid-run, so the numbers include the reconnects. Per pool
+size we record wall time, throughput, call latency, time spent waiting
+for a free session, errors, timeouts and reconnects.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+from app.mcp_pool import MCPPoolStats, PooledMCPTools
+from app.stats import percentile
+from evals.fake_mcp import FakeMCPServer
+
+
+@dataclass
+class PoolResult:
+    size: int
+    wall_time: float = 0.0
+    calls: int = 0
+    failed: int = 0
+    call_ms: dict[str, float | None] = field(default_factory=dict)
+    wait_ms: dict[str, float | None] = field(default_factory=dict)
+    timeouts: int = 0
+    reconnects: int = 0
+    error: str | None = None
+
+    @property
+    def throughput(self) -> float:
+        return self.calls / self.wall_time if self.wall_time else 0.0
+
+
+async def load_pool(
+    server: FakeMCPServer,
+    size: int,
+    *,
+    calls: int,
+    concurrency: int,
+    restart_after: int = 0,
+    call_timeout: float = 30.0,
+) -> PoolResult:
+    """Run ``calls`` searches through a pool of ``size`` sessions and summarize them."""
+    stats = MCPPoolStats()
+    tools = PooledMCPTools(url=server.url, size=size, call_timeout=call_timeout, health_interval=1.0, stats=stats)
+    result = PoolResult(size=size)
+    await tools.connect()
+    search = tools.functions["web_search"].entrypoint if "web_search" in tools.functions else None
+    if search is None:
+        await tools.stop()
+        result.error = f"no web_search tool at {server.url}"
+        return result
+
+    gate = asyncio.Semaphore(concurrency)
+    done = 0
+    latencies: list[float] = []
+
+    async def one(i: int) -> None:
+        nonlocal done
+        async with gate:
+            started = time.perf_counter()
+            output = await search(query=f"query {i}")
+            latencies.append((time.perf_counter() - started) * 1000)
+            if str(output.content).startswith("Error"):
+                result.failed += 1
+            done += 1
+            if restart_after and done == restart_after:
+                await asyncio.to_thread(server.restart)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(i) for i in range(calls)))
+    except Exception as exc:
+        result.error = f"{type(exc).__name__}: {exc}"[:200]
+    finally:
+        result.wall_time = time.perf_counter() - started
+        await tools.stop()
+
+    waits = [s * 1000 for s in stats.wait_seconds]
+    result.calls = len(latencies)
+    result.call_ms = {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95)}
+    result.wait_ms = {"p50": percentile(waits, 50), "p95": percentile(waits, 95)}
+    result.timeouts = stats.timeouts
+    result.reconnects = stats.reconnects
+    return result
@@ -0,0 +1,144 @@
+"""
+Metrics Overhead
+================
+
+Microbenchmark of what ``app/metrics.py`` adds to each instrumented
+operation, driven by ``python -m evals metrics-overhead``.
+
+Each operation runs ``n`` times bare and ``n`` times instrumented,
+alternating over ``repeats`` rounds; the median per-operation time of
+each side is reported along with the difference:
+
+- run request: an ASGI ``POST /agents/<id>/runs`` answered by a trivial
+  app, with and without ``RunMetricsMiddleware`` (no HTTP server, so the
+  difference is the middleware alone);
+- tool call: an async no-op tool, called directly and through
+  ``metrics.tool_hook``;
+- run hook: ``metrics.run_hook`` on a completed run's output;
+- query: ``SELECT 1`` on in-memory SQLite, on a bare engine and on one
+  with the query / pool listeners;
+- scrape: rendering ``/ops/metrics`` once everything above has been recorded.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from agno.metrics import RunMetrics
+from agno.run.agent import RunOutput
+from prometheus_client import REGISTRY, generate_latest
+from sqlalchemy import create_engine, text
+
+from app.metrics import Metrics, RunMetricsMiddleware
+
+
+@dataclass
+class Overhead:
+    operation: str
+    bare_us: float | None
+    instrumented_us: float
+
+    @property
+    def overhead_us(self) -> float | None:
+        return None if self.bare_us is None else self.instrumented_us - self.bare_us
+
+
+async def _per_op_us(op: Callable[[], Awaitable[None]], n: int) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        await op()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+async def _compare(
+    name: str, bare: Callable[[], Awaitable[None]], instrumented: Callable[[], Awaitable[None]], n: int, repeats: int
+) -> Overhead:
+    bare_runs, instrumented_runs = [], []
+    for _ in range(repeats):
+        bare_runs.append(await _per_op_us(bare, n))
+        instrumented_runs.append(await _per_op_us(instrumented, n))
+    return Overhead(name, statistics.median(bare_runs), statistics.median(instrumented_runs))
+
+
+async def measure(n: int = 20_000, repeats: int = 5) -> list[Overhead]:
+    recorder = Metrics()
+    results = []
+
+    # -- Run request ----------------------------------------------------------
+    async def app(scope: dict, receive: Callable, send: Callable) -> None:
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    middleware = RunMetricsMiddleware(app, recorder=recorder)
+    scope = {"type": "http", "method": "POST", "path": "/agents/web-search/runs"}
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        pass
+
+    results.append(
+        await _compare(
+            "run request", lambda: app(scope, receive, send), lambda: middleware(scope, receive, send), n, repeats
+        )
+    )
+
+    # -- Tool call ------------------------------------------------------------
+    async def tool(query: str) -> str:
+        return query
+
+    async def bare_tool() -> None:
+        await tool(query="q")
+
+    async def hooked_tool() -> None:
+        await recorder.tool_hook("web_search", tool, {"query": "q"})
+
+    results.append(await _compare("tool call", bare_tool, hooked_tool, n, repeats))
+
+    # -- Run hook -------------------------------------------------------------
+    output = RunOutput(
+        agent_id="web-search",
+        model="gpt-5.4",
+        metrics=RunMetrics(input_tokens=2400, output_tokens=300, cache_read_tokens=1800, time_to_first_token=0.8),
+    )
+
+    async def run_hook() -> None:
+        recorder.run_hook(output)
+
+    hook_runs = [await _per_op_us(run_hook, n) for _ in range(repeats)]
+    results.append(Overhead("run hook", None, statistics.median(hook_runs)))
+
+    # -- Query ----------------------------------------------------------------
+    bare_engine = create_engine("sqlite://")
+    instrumented_engine = create_engine("sqlite://")
+    recorder.instrument_engine(instrumented_engine)
+    queries = max(n // 4, 1)
+    with bare_engine.connect() as bare_conn, instrumented_engine.connect() as instrumented_conn:
+        select = text("SELECT 1")
+
+        async def bare_query() -> None:
+            bare_conn.execute(select)
+
+        async def instrumented_query() -> None:
+            instrumented_conn.execute(select)
+
+        results.append(await _compare("query", bare_query, instrumented_query, queries, repeats))
+    bare_engine.dispose()
+    instrumented_engine.dispose()
+
+    # -- Scrape ---------------------------------------------------------------
+    async def scrape() -> None:
+        generate_latest(REGISTRY)
+
+    scrape_runs = [await _per_op_us(scrape, 50) for _ in range(repeats)]
+    results.append(Overhead("scrape /ops/metrics", None, statistics.median(scrape_runs)))
+    return results
+
+
+def run(n: int = 20_000, repeats: int = 5) -> list[Overhead]:
+    return asyncio.run(measure(n, repeats))
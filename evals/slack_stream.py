@@ -0,0 +1,119 @@
+"""
+Slack Stream Benchmark
+======================
+
+Streams a synthetic reply into the fake Slack API (``evals/fake_slack.py``)
+through slack_sdk's ``chat_stream`` helper and through the app's
+``CoalescingStream``, driven by ``python -m evals slack-stream``.
+
+The reply is ``words`` words at ``tokens_per_second``, with a task card
+started and completed every ``task_every`` words, the way a tool-using
+agent run renders in Slack. Per writer we record wall time, Slack API
+calls, 429s, flushes, flush latency and whether the finished message
+carries the full text.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+from slack_sdk.web.async_chat_stream import AsyncChatStream
+from slack_sdk.web.async_client import AsyncWebClient
+
+from app.slack_stream import SLACK_STREAM_INTERVAL, SLACK_STREAM_MAX_CHARS, CoalescingStream, SlackStreamStats
+from app.stats import percentile
+from evals.fake_slack import FakeSlackServer
+
+WRITERS = ("sdk", "coalescing")
+
+
+@dataclass
+class StreamResult:
+    writer: str
+    wall_time: float = 0.0
+    api_calls: int = 0
+    rate_limited: int = 0
+    flushes: int = 0
+    flush_ms: dict[str, float | None] = field(default_factory=dict)
+    final_ms: float | None = None
+    complete: bool = False
+    error: str | None = None
+
+
+def _reply(words: int) -> list[str]:
+    return [f"word{i}" if i == 0 else f" word{i}" for i in range(words)]
+
+
+async def stream_reply(
+    server: FakeSlackServer,
+    writer: str,
+    *,
+    words: int,
+    tokens_per_second: float,
+    task_every: int,
+    buffer_size: int = 100,
+    interval: float = SLACK_STREAM_INTERVAL,
+    max_chars: int = SLACK_STREAM_MAX_CHARS,
+) -> StreamResult:
+    """Stream one reply with ``writer`` (``sdk`` or ``coalescing``) and check what Slack ended up with."""
+    client = AsyncWebClient(token="xoxb-fake", base_url=server.url)
+    channel = f"C{writer.upper()}"
+    args = {"channel": channel, "thread_ts": "1.0", "recipient_team_id": "TFAKE", "recipient_user_id": "UFAKE"}
+    stats = SlackStreamStats()
+    stream: AsyncChatStream | CoalescingStream
+    if writer == "sdk":
+        stream = await client.chat_stream(**args, buffer_size=buffer_size)
+    else:
+        stream = CoalescingStream(
+            client,
+            channel=args["channel"],
+            thread_ts=args["thread_ts"],
+            recipient_team_id=args["recipient_team_id"],
+            recipient_user_id=args["recipient_user_id"],
+            interval=interval,
+            max_chars=max_chars,
+            stats=stats,
+        )
+
+    calls_before = len(server.state.calls)
+    messages_before = set(server.state.messages)
+    result = StreamResult(writer=writer)
+    text = _reply(words)
+    started = time.perf_counter()
+    try:
+        for i, word in enumerate(text):
+            await stream.append(markdown_text=word)
+            if task_every and i % task_every == 0:
+                card = {"type": "task_update", "id": f"tool-{i}", "title": "web_search", "status": "in_progress"}
+                await stream.append(markdown_text="", chunks=[card])
+            if task_every and i % task_every == task_every // 2:
+                card = {
+                    "type": "task_update",
+                    "id": f"tool-{i - task_every // 2}",
+                    "title": "web_search",
+                    "status": "complete",
+                }
+                await stream.append(markdown_text="", chunks=[card])
+            if tokens_per_second > 0:
+                await asyncio.sleep(1 / tokens_per_second)
+        final_started = time.perf_counter()
+        await stream.stop()
+        result.final_ms = (time.perf_counter() - final_started) * 1000
+    except Exception as exc:
+        result.error = f"{type(exc).__name__}: {exc}"[:200]
+    result.wall_time = time.perf_counter() - started
+
+    calls = server.state.calls[calls_before:]
+    result.api_calls = len(calls)
+    result.rate_limited = sum(1 for _, status in calls if status == 429)
+    if writer == "sdk":
+        result.flushes = sum(1 for method, status in calls if status == 200 and method != "chat.stopStream")
+    else:
+        result.flushes = stats.flushes
+        samples = [s * 1000 for s in stats.flush_seconds]
+        result.flush_ms = {"p50": percentile(samples, 50), "p95": percentile(samples, 95)}
+    new = [m for ts, m in server.state.messages.items() if ts not in messages_before and m.channel == channel]
+    result.complete = bool(new) and new[-1].stopped and new[-1].text == "".join(text)
+    return result
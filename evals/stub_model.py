@@ -0,0 +1,257 @@
+"""
+Stub Model
+==========
+
+A local OpenAI-compatible server (``/v1/chat/completions`` and
+``/v1/responses``) with a fixed reply, a configurable time-to-first-token
+and a configurable token rate. Point an ``OpenAIChat`` at it
+(``stub_model(server)``) to run agents and benchmarks with no network and
+no API spend, or set ``OPENAI_BASE_URL`` to ``server.url`` to point a
+whole AgentOS process (whose models use the Responses API) at it.
+
+    with StubModelServer(latency=0.2, tokens_per_second=80) as server:
+        agent.model = stub_model(server)
+
+With ``tool_call`` set to a tool name, a Responses request that offers
+that tool and has no tool output yet is answered with one call to it
+(its required string arguments set to the user's message) instead of the
+reply, so runs go through the agent's tool loop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from uuid import uuid4
+
+from agno.models.openai import OpenAIChat
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from evals.harness import LocalServer
+
+DEFAULT_REPLY = (
+    "This is a stubbed response from the local benchmark model. It streams at a fixed "
+    "rate so latency numbers reflect the agent runtime rather than the provider."
+)
+
+
+@dataclass
+class StubModelConfig:
+    reply: str = DEFAULT_REPLY
+    latency: float = 0.2  # seconds before the first token
+    tokens_per_second: float = 50.0  # 0 = send everything at once
+    tool_call: str | None = None  # Responses API: call this tool once per run when it is offered
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def create_app(config: StubModelConfig) -> FastAPI:
+    app = FastAPI(title="Stub Model")
+
+    @app.post("/v1/chat/completions", response_model=None)
+    async def chat_completions(request: Request) -> JSONResponse | StreamingResponse:
+        body = await request.json()
+        model = body.get("model", "stub")
+        prompt_tokens = _estimate_tokens(json.dumps(body.get("messages", [])))
+        words = config.reply.split(" ")
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        }
+        completion_id = f"chatcmpl-{uuid4().hex}"
+        created = int(time.time())
+
+        await asyncio.sleep(config.latency)
+        if not body.get("stream"):
+            if config.tokens_per_second > 0:
+                await asyncio.sleep(len(words) / config.tokens_per_second)
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": config.reply},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                }
+            )
+
+        def chunk(delta: dict, finish_reason: str | None = None, **extra: object) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream() -> AsyncIterator[str]:
+            yield chunk({"role": "assistant", "content": ""})
+            for i, word in enumerate(words):
+                yield chunk({"content": word if i == 0 else " " + word})
+                if config.tokens_per_second > 0:
+                    await asyncio.sleep(1 / config.tokens_per_second)
+            yield chunk({}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/v1/responses", response_model=None)
+    async def responses(request: Request) -> JSONResponse | StreamingResponse:
+        body = await request.json()
+        items = body.get("input") if isinstance(body.get("input"), list) else []
+        prompt_tokens = _estimate_tokens(json.dumps(body.get("input")) + str(body.get("instructions") or ""))
+        call = _tool_call(config.tool_call, body.get("tools") or [], items)
+        words = [] if call is not None else config.reply.split(" ")
+        response_id = f"resp_{uuid4().hex}"
+        item_id = f"{'fc' if call else 'msg'}_{uuid4().hex}"
+
+        def item(done: bool) -> dict:
+            if call is not None:
+                name, arguments = call
+                return {
+                    "type": "function_call",
+                    "id": item_id,
+                    "call_id": f"call_{item_id[3:]}",
+                    "name": name,
+                    "arguments": arguments if done else "",
+                    "status": "completed" if done else "in_progress",
+                }
+            content = [{"type": "output_text", "text": config.reply, "annotations": []}] if done else []
+            status = "completed" if done else "in_progress"
+            return {"type": "message", "id": item_id, "role": "assistant", "status": status, "content": content}
+
+        def response(done: bool) -> dict:
+            completion_tokens = len(words) or _estimate_tokens(call[1] if call else "")
+            return {
+                "id": response_id,
+                "object": "response",
+                "created_at": int(time.time()),
+                "model": body.get("model", "stub"),
+                "status": "completed" if done else "in_progress",
+                "output": [item(True)] if done else [],
+                "parallel_tool_calls": True,
+                "tool_choice": "auto",
+                "tools": [],
+                "error": None,
+                "usage": {
+                    "input_tokens": prompt_tokens,
+                    "input_tokens_details": {"cached_tokens": 0},
+                    "output_tokens": completion_tokens,
+                    "output_tokens_details": {"reasoning_tokens": 0},
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+                if done
+                else None,
+            }
+
+        await asyncio.sleep(config.latency)
+        if not body.get("stream"):
+            if config.tokens_per_second > 0:
+                await asyncio.sleep(len(words) / config.tokens_per_second)
+            return JSONResponse(response(True))
+
+        sequence = iter(range(1_000_000))
+
+        def event(kind: str, **payload: object) -> str:
+            data = {"type": kind, "sequence_number": next(sequence), **payload}
+            return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+        async def stream() -> AsyncIterator[str]:
+            yield event("response.created", response=response(False))
+            yield event("response.output_item.added", output_index=0, item=item(False))
+            if call is not None:
+                yield event("response.function_call_arguments.delta", item_id=item_id, output_index=0, delta=call[1])
+            else:
+                for i, word in enumerate(words):
+                    delta = word if i == 0 else " " + word
+                    yield event(
+                        "response.output_text.delta",
+                        item_id=item_id,
+                        output_index=0,
+                        content_index=0,
+                        delta=delta,
+                        logprobs=[],
+                    )
+                    if config.tokens_per_second > 0:
+                        await asyncio.sleep(1 / config.tokens_per_second)
+            yield event("response.output_item.done", output_index=0, item=item(True))
+            yield event("response.completed", response=response(True))
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def _tool_call(name: str | None, tools: list[dict], items: list) -> tuple[str, str] | None:
+    """``(tool name, JSON arguments)`` when ``name`` is offered and no tool has run yet in this input."""
+    tool = next((t for t in tools if name and t.get("name") == name), None)
+    if tool is None or any(isinstance(i, dict) and i.get("type") == "function_call_output" for i in items):
+        return None
+    text = ""
+    for message in reversed(items):
+        if isinstance(message, dict) and message.get("role") == "user":
+            content = message.get("content")
+            parts = content if isinstance(content, list) else [{"text": content}]
+            text = " ".join(str(part.get("text") or "") for part in parts if isinstance(part, dict))
+            break
+    parameters = tool.get("parameters") or {}
+    properties = parameters.get("properties") or {}
+    arguments = {
+        key: text for key in parameters.get("required") or [] if (properties.get(key) or {}).get("type") == "string"
+    }
+    return tool["name"], json.dumps(arguments)
+
+
+class StubModelServer(LocalServer):
+    """Run the stub model on 127.0.0.1 in a background thread."""
+
+    name = "stub model server"
+    path = "/v1"
+
+    def __init__(
+        self,
+        *,
+        reply: str = DEFAULT_REPLY,
+        latency: float = 0.2,
+        tokens_per_second: float = 50.0,
+        tool_call: str | None = None,
+        port: int = 0,
+    ) -> None:
+        super().__init__(port=port)
+        self.config = StubModelConfig(
+            reply=reply, latency=latency, tokens_per_second=tokens_per_second, tool_call=tool_call
+        )
+
+    def create_app(self) -> FastAPI:
+        return create_app(self.config)
+
+
+def stub_model(server: StubModelServer) -> OpenAIChat:
+    """An ``OpenAIChat`` wired to ``server``."""
+    return OpenAIChat(id="stub-model", base_url=server.url, api_key="stub")
@@ -0,0 +1,111 @@
+"""
+Tool Output Compaction
+======================
+
+Before / after numbers for ``app/tool_output.py``, driven by
+``python -m evals tool-output``.
+
+Each page (text files given on the command line, or a synthetic page:
+navigation and consent boilerplate around many sections, a few of which
+answer the question) is compacted for the question, and we report its
+tokens before and after and the time compaction took.
+
+With ``--ttft`` each page is also sent to the default model tier twice
+per round, whole and compacted, as a fetched-page tool result would be,
+and the median time to first token and input tokens of each are
+reported. This needs ``OPENAI_API_KEY``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from agno.agent import Agent
+from agno.run.agent import RunContentEvent, RunOutput
+from agno.utils.tokens import count_text_tokens
+
+from app.model_router import MODEL_DEFAULT_TIER, MODEL_TIERS
+from app.prompt import StablePromptResponses
+from app.stats import percentile
+from app.tool_output import compact_text
+
+DEFAULT_QUERY = "How do PostgreSQL advisory locks work, and when are they released?"
+
+
+@dataclass
+class PageResult:
+    name: str
+    tokens_before: int
+    tokens_after: int
+    compaction_ms: float
+    ttft_before: float | None = None
+    ttft_after: float | None = None
+    input_tokens_before: int | None = None
+    input_tokens_after: int | None = None
+
+
+def synthetic_page(sections: int = 120) -> str:
+    """A long page with boilerplate, where only a few sections are about the default question."""
+    nav = "[Home](/) | [Docs](/docs) | [Blog](/blog) | [Pricing](/pricing)\nAccept all cookies\nSubscribe to our newsletter"
+    body = []
+    for i in range(sections):
+        if i % 40 == 7:
+            text = (
+                "PostgreSQL advisory locks are application-defined locks keyed by a number. Session-level locks "
+                "are held until released or the session ends; transaction-level locks are released at commit or "
+                "rollback. pg_try_advisory_lock returns immediately instead of waiting."
+            )
+        else:
+            text = f"Notes on release {i} of the gardening planner: watering schedules, soil mixes and seed trays. " * 4
+        body.append(f"## Section {i}\n\n{text}")
+    return f"# Example docs\n\n{nav}\n\n" + "\n\n".join(body) + f"\n\n{nav}\n© 2026 Example. All rights reserved."
+
+
+async def _first_token(model_id: str, query: str, page: str) -> tuple[float | None, int]:
+    agent = Agent(
+        model=StablePromptResponses(id=model_id), instructions="Answer from the fetched page.", telemetry=False
+    )
+    prompt = f"{query}\n\n<fetched_page>\n{page}\n</fetched_page>"
+    started = time.perf_counter()
+    ttft: float | None = None
+    output: RunOutput | None = None
+    async for event in agent.arun(prompt, stream=True, yield_run_output=True):
+        if ttft is None and isinstance(event, RunContentEvent) and event.content:
+            ttft = time.perf_counter() - started
+        if isinstance(event, RunOutput):
+            output = event
+    tokens = output.metrics.input_tokens if output is not None and output.metrics is not None else 0
+    return ttft, tokens
+
+
+async def measure(
+    pages: dict[str, str], query: str, budget: int, *, ttft: bool = False, repeats: int = 3
+) -> list[PageResult]:
+    results = []
+    model_id = MODEL_TIERS[MODEL_DEFAULT_TIER]
+    for name, page in pages.items():
+        started = time.perf_counter()
+        compacted, _, _ = compact_text(page, query, budget)
+        elapsed = (time.perf_counter() - started) * 1000
+        result = PageResult(name, count_text_tokens(page), count_text_tokens(compacted), elapsed)
+        if ttft:
+            before, after = [], []
+            for _ in range(repeats):
+                before.append(await _first_token(model_id, query, page))
+                after.append(await _first_token(model_id, query, compacted))
+            result.ttft_before = percentile([t for t, _ in before if t is not None], 50)
+            result.ttft_after = percentile([t for t, _ in after if t is not None], 50)
+            result.input_tokens_before = before[-1][1]
+            result.input_tokens_after = after[-1][1]
+        results.append(result)
+    return results
+
+
+def run(
+    files: list[Path], query: str = DEFAULT_QUERY, budget: int = 2000, *, ttft: bool = False, repeats: int = 3
+) -> list[PageResult]:
+    pages = {path.name: path.read_text() for path in files} or {"synthetic": synthetic_page()}
+    return asyncio.run(measure(pages, query, budget, ttft=ttft, repeats=repeats))
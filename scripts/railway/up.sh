@@ -96,6 +96,7 @@ RAILWAY_VARS=(
     -v "WAIT_FOR_DB=True"
     -v "PORT=8000"
     -v "OPENAI_API_KEY=${OPENAI_API_KEY}"
+    -v "AGENTOS_INTERNAL_TOKEN=${AGENTOS_INTERNAL_TOKEN:-$(openssl rand -base64 32)}"
 )
 [[ -n "$PARALLEL_API_KEY" ]] && RAILWAY_VARS+=(-v "PARALLEL_API_KEY=${PARALLEL_API_KEY}")
 
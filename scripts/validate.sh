@@ -40,6 +40,12 @@ if ! mypy "${REPO_ROOT}" --config-file "${REPO_ROOT}/pyproject.toml"; then
   failed=1
 fi
 
+echo ""
+echo -e "${DIM}> pytest ${REPO_ROOT}/tests${NC}"
+if ! pytest -q "${REPO_ROOT}/tests"; then
+  failed=1
+fi
+
 echo ""
 if [[ $failed -eq 0 ]]; then
   echo -e "${BOLD}Done.${NC}"
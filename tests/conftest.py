@@ -0,0 +1,42 @@
+"""
+Test Fixtures
+=============
+
+Tests that need Postgres use the ``postgres`` fixture and are skipped when
+the database from ``DB_*`` isn't reachable (``docker compose up -d
+agentos-db``). Local stand-ins for remote services come from ``evals/``.
+"""
+
+from collections.abc import Iterator
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from db.pool import get_engine
+from db.url import db_url
+from evals.fake_mcp import FakeMCPServer
+from evals.fake_slack import FakeSlackServer
+
+
+@pytest.fixture(scope="session")
+def postgres() -> Engine:
+    engine = get_engine(db_url)
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as exc:
+        pytest.skip(f"Postgres not reachable: {type(exc).__name__}")
+    return engine
+
+
+@pytest.fixture
+def fake_search() -> Iterator[FakeMCPServer]:
+    with FakeMCPServer(latency=0.0, jitter=0.0) as server:
+        yield server
+
+
+@pytest.fixture
+def fake_slack() -> Iterator[FakeSlackServer]:
+    with FakeSlackServer(rate=0) as server:
+        yield server
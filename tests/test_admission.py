@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from app.admission import SCHEDULER_USER, Admission, AdmissionMiddleware, Limits, LocalLimiter, Overloaded
+from db.admission import Check
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def _admission(user: Limits, max_wait: float = 0.0) -> Admission:
+    admission = Admission("local", enabled=True, max_wait=max_wait, burst=1)
+    admission.limits = {"user": user, "agent": Limits(0, 0), "api": Limits(0, 0), "slack": Limits(0, 0)}
+    return admission
+
+
+def test_concurrency_cap_and_release_frees_a_slot() -> None:
+    limiter = LocalLimiter()
+    checks = [Check("user", "user:u1", concurrency=2)]
+
+    assert limiter.acquire(checks, "h1").admitted
+    assert limiter.acquire(checks, "h2").admitted
+    denied = limiter.acquire(checks, "h3")
+    assert (denied.admitted, denied.scope, denied.reason) == (False, "user", "concurrency")
+
+    limiter.release("h1")
+    assert limiter.acquire(checks, "h3").admitted
+    assert limiter.usage() == {"user:u1": 2}
+
+
+def test_rate_bucket_refills_over_time(monkeypatch: pytest.MonkeyPatch) -> None:
+    clock = _Clock()
+    monkeypatch.setattr("app.admission.time", clock)
+    limiter = LocalLimiter()
+    checks = [Check("user", "user:u1", per_minute=30, burst=2)]
+
+    assert limiter.acquire(checks, "h1").admitted
+    assert limiter.acquire(checks, "h2").admitted
+    denied = limiter.acquire(checks, "h3")
+    assert (denied.admitted, denied.reason) == (False, "rate")
+    assert denied.retry_after == pytest.approx(2.0)
+
+    clock.now += 1.5
+    assert limiter.acquire(checks, "h3").retry_after == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.acquire(checks, "h3").admitted
+
+
+def test_a_waiting_run_gets_the_released_slot() -> None:
+    admission = _admission(Limits(1, 0), max_wait=2.0)
+
+    async def main() -> float:
+        first = await admission.acquire(user="u1", agent="a", interface="api")
+        waiter = asyncio.create_task(admission.acquire(user="u1", agent="a", interface="api"))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        await admission.release(first)
+        second = await asyncio.wait_for(waiter, 1)
+        await admission.release(second)
+        return second.waited
+
+    assert 0 < asyncio.run(main()) < 1
+    assert admission.admitted["api"] == 2
+    assert admission.limiter.usage() == {}
+
+
+def test_scheduler_runs_are_not_limited() -> None:
+    admission = _admission(Limits(1, 1))
+
+    async def main() -> None:
+        await admission.acquire(user="u1", agent="a", interface="api")
+        with pytest.raises(Overloaded):
+            await admission.acquire(user="u1", agent="a", interface="api")
+        for _ in range(3):
+            ticket = await admission.acquire(user=SCHEDULER_USER, agent="a", interface="api")
+            assert ticket.holder is None
+
+    asyncio.run(main())
+
+
+def test_middleware_answers_429_with_retry_after() -> None:
+    admission = _admission(Limits(0, 1))
+    calls: list[str] = []
+    sent: list[dict] = []
+
+    async def app(scope: dict, receive: object, send: object) -> None:
+        calls.append(scope["path"])
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    middleware = AdmissionMiddleware(app, admission)
+    scope = {"type": "http", "method": "POST", "path": "/agents/a/runs", "state": {"user_id": "u1"}}
+
+    async def main() -> None:
+        await middleware(scope, None, send)
+        await middleware(scope, None, send)
+        await middleware(scope | {"method": "GET"}, None, send)
+
+    asyncio.run(main())
+    assert calls == ["/agents/a/runs", "/agents/a/runs"]
+    start = sent[0]
+    assert start["status"] == 429
+    assert dict(start["headers"])[b"retry-after"] == b"60"
+    assert admission.rejected == {"api.user.rate": 1}
@@ -0,0 +1,15 @@
+import asyncio
+
+from evals.fake_mcp import FakeMCPServer
+from evals.fanout import compare
+
+
+def test_fan_out_cuts_the_slow_branch_loose() -> None:
+    with FakeMCPServer(latency=0.0, jitter=0.0, slow_latency=2.0) as server:
+        serial, fanned = asyncio.run(compare(server, queries=3, urls=1, slow=True, concurrency=4, timeout=0.5))
+
+    assert serial.failed == 0 and serial.branches == 4
+    assert fanned.failed == fanned.timeouts == 1
+    assert fanned.wall_time < serial.wall_time
+    # The shared guide pages come back once per result set, not once per query.
+    assert fanned.duplicates > 0 and fanned.top == "https://example.com/guide"
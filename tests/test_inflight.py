@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from app.inflight import RUN_PATH, InFlightMiddleware, InFlightRuns
+
+
+@pytest.mark.parametrize(
+    "path, kind, entity_id",
+    [
+        ("/agents/web-search/runs", "agents", "web-search"),
+        ("/teams/t1/runs/", "teams", "t1"),
+        ("/workflows/wf/runs/run-1/continue", "workflows", "wf"),
+    ],
+)
+def test_run_path(path: str, kind: str, entity_id: str) -> None:
+    match = RUN_PATH.match(path)
+    assert match is not None and match.groups() == (kind, entity_id)
+
+
+@pytest.mark.parametrize("path", ["/agents/web-search", "/agents/a/runs/r1", "/sessions", "/slack/events"])
+def test_not_a_run_path(path: str) -> None:
+    assert RUN_PATH.match(path) is None
+
+
+def test_counts_runs_and_slack_events_until_the_response_ends() -> None:
+    tracker = InFlightRuns()
+    seen: list[int] = []
+
+    async def app(scope: dict, receive: object, send: object) -> None:
+        seen.append(tracker.active)
+
+    middleware = InFlightMiddleware(app, tracker)
+
+    async def main() -> None:
+        for method, path in [("POST", "/agents/a/runs"), ("POST", "/slack/events"), ("GET", "/agents/a/runs")]:
+            await middleware({"type": "http", "method": method, "path": path}, None, None)
+        await middleware({"type": "lifespan"}, None, None)
+
+    asyncio.run(main())
+    assert seen == [1, 1, 0, 0]
+    assert (tracker.active, tracker.started, tracker.finished) == (0, 2, 2)
@@ -0,0 +1,12 @@
+import asyncio
+
+from evals.fake_mcp import FakeMCPServer
+from evals.mcp_pool import load_pool
+
+
+def test_calls_survive_a_server_restart(fake_search: FakeMCPServer) -> None:
+    result = asyncio.run(load_pool(fake_search, 2, calls=24, concurrency=4, restart_after=8))
+
+    assert result.error is None
+    assert result.calls == 24 and result.failed == 0
+    assert result.reconnects >= 1
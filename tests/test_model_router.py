@@ -0,0 +1,50 @@
+from typing import Any
+
+import pytest
+from agno.exceptions import ModelProviderError
+from agno.models.message import Message
+from agno.models.response import ModelResponse
+
+from app.model_router import RoutedResponses
+from app.prompt import StablePromptResponses
+
+
+class _Tier(StablePromptResponses):
+    """Records the messages each call starts with; fails ``before`` or ``after`` a tool turn, or not at all."""
+
+    def __init__(self, id: str, fails: str | None = None) -> None:
+        super().__init__(id=id)
+        self.fails = fails
+        self.seen: list[list[str]] = []
+
+    def response(self, messages: list[Message], *args: Any, **kwargs: Any) -> ModelResponse:
+        self.seen.append([m.role for m in messages])
+        if self.fails == "after":
+            messages.append(Message(role="assistant", content="calling a tool"))
+            messages.append(Message(role="tool", content="tool output"))
+        if self.fails:
+            raise ModelProviderError("upstream error", status_code=500)
+        return ModelResponse(content="ok")
+
+
+def _messages() -> list[Message]:
+    return [Message(role="system", content="Be brief."), Message(role="user", content="hi")]
+
+
+def test_escalates_a_call_that_fails_before_any_tool() -> None:
+    fast, standard = _Tier("fast-model", fails="before"), _Tier("standard-model")
+    model = RoutedResponses(id="standard-model", tier="fast", tier_models={"fast": fast, "standard": standard})
+    messages = _messages()
+
+    assert model.response(messages).content == "ok"
+    assert fast.seen == [["system", "user"]]
+    assert standard.seen == [["system", "user"]]
+
+
+def test_does_not_replay_tools_after_a_failure() -> None:
+    fast, standard = _Tier("fast-model", fails="after"), _Tier("standard-model")
+    model = RoutedResponses(id="standard-model", tier="fast", tier_models={"fast": fast, "standard": standard})
+
+    with pytest.raises(ModelProviderError):
+        model.response(_messages())
+    assert standard.seen == []
@@ -0,0 +1,19 @@
+from agno.agent import Agent
+from agno.metrics import RunMetrics
+from agno.run.agent import RunOutput
+
+from app.prompt import PromptCacheStats
+
+
+def test_stats_are_shared_by_deep_copies_of_the_agent() -> None:
+    stats = PromptCacheStats()
+    agent = Agent(id="a", post_hooks=[stats.hook])
+
+    copied = agent.deep_copy()
+
+    assert copied.post_hooks is not None
+    hook = copied.post_hooks[0]
+    assert callable(hook)
+    hook(RunOutput(agent_id="a", metrics=RunMetrics(input_tokens=100, cache_read_tokens=80)))
+    assert stats.agents["a"]["runs"] == 1
+    assert stats.agents["a"]["cached_tokens"] == 80
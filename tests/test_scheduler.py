@@ -0,0 +1,78 @@
+import asyncio
+from typing import Any
+from uuid import uuid4
+
+from agno.agent import Agent
+from agno.db.schemas.scheduler import Schedule
+from agno.models.message import Message
+from agno.models.response import ModelResponse
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.prompt import StablePromptResponses
+from app.scheduler import ScheduleDispatcher, SchedulerLeader, SchedulerStats
+
+
+class _Echo(StablePromptResponses):
+    """Answers with the last user message, without a provider."""
+
+    async def aresponse(self, messages: list[Message], *args: Any, **kwargs: Any) -> ModelResponse:
+        return ModelResponse(role="assistant", content=f"echo: {messages[-1].content}")
+
+
+def _schedule(endpoint: str, **payload: Any) -> Schedule:
+    return Schedule(id=uuid4().hex, name="nightly", cron_expr="0 3 * * *", endpoint=endpoint, payload=payload)
+
+
+def _dispatcher(agent: Agent, token: str = "token") -> ScheduleDispatcher:
+    return ScheduleDispatcher(
+        entities=[agent], stats=SchedulerStats(), base_url="http://127.0.0.1:9", internal_service_token=token
+    )
+
+
+def test_local_agent_runs_in_process() -> None:
+    agent = Agent(id="echo", model=_Echo(id="echo-model"), telemetry=False)
+    dispatcher = _dispatcher(agent)
+    schedule = _schedule("/agents/echo/runs", message="ping", user_id="u1", metadata='{"source": "cron"}')
+
+    assert dispatcher._local_entity(schedule) is agent
+    result = asyncio.run(dispatcher._call_endpoint(schedule))
+    assert result["status"] == "success"
+    assert result["error"] is None
+    assert result["run_id"] and result["session_id"]
+    assert "echo: ping" in str(result["output"])
+
+
+def test_other_schedules_are_not_dispatched_locally() -> None:
+    agent = Agent(id="echo", model=_Echo(id="echo-model"), telemetry=False)
+    dispatcher = _dispatcher(agent, token="")
+
+    assert dispatcher._local_entity(_schedule("/agents/other/runs", message="ping")) is None
+    assert dispatcher._local_entity(_schedule("/teams/echo/runs", message="ping")) is None
+    assert dispatcher._local_entity(_schedule("/agents/echo/runs", message="ping", files="a.pdf")) is None
+    assert dispatcher._local_entity(_schedule("/agents/echo/runs")) is None
+
+    # Without a shared token, an HTTP schedule fails instead of being sent.
+    result = asyncio.run(dispatcher._call_endpoint(_schedule("/sessions")))
+    assert result["status"] == "failed"
+    assert "AGENTOS_INTERNAL_TOKEN" in result["error"]
+
+
+def test_leader_stands_by_while_the_lock_is_held(postgres: Engine) -> None:
+    key = f"test-scheduler-{uuid4().hex[:8]}"
+    leader = SchedulerLeader(db=None, base_url="http://127.0.0.1:9", internal_service_token="token", lock_key=key)
+    with postgres.connect() as other:
+        other.execute(text("SELECT pg_advisory_lock(hashtext(:key))"), {"key": key})
+        assert not leader._try_lock()
+        assert not leader.is_leader and leader._lock_conn is None
+        other.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": key})
+        other.commit()
+
+    assert leader._try_lock()
+    assert leader._still_locked()
+    leader._unlock()
+    assert not leader._still_locked()
+    with postgres.connect() as other:
+        assert other.execute(text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": key}).scalar()
+        other.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": key})
+        other.commit()
@@ -0,0 +1,40 @@
+from collections.abc import Iterator
+from uuid import uuid4
+
+import pytest
+from agno.db.schemas.memory import UserMemory
+from agno.run.agent import RunOutput
+from agno.session.agent import AgentSession
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from db.session import TimedPostgresDb
+from db.url import db_url
+
+
+@pytest.fixture
+def db(postgres: Engine) -> Iterator[TimedPostgresDb]:
+    schema = f"test_{uuid4().hex[:8]}"
+    yield TimedPostgresDb(db_url=db_url, db_engine=postgres, db_schema=schema)
+    with postgres.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+
+
+def test_existence_checks_before_and_after_writes(db: TimedPostgresDb) -> None:
+    # No tables yet: agno creates them on first write.
+    assert not db.session_has_runs("s1")
+    assert not db.user_has_memories("u1")
+
+    session = AgentSession(session_id="s1", agent_id="a", user_id="u1", created_at=0)
+    db.upsert_session(session)
+    assert not db.session_has_runs("s1")
+
+    session.upsert_run(RunOutput(run_id="r1", session_id="s1", user_id="u1", content="hi"))
+    db.upsert_session(session)
+    assert db.session_has_runs("s1")
+    assert db.session_has_runs("s1", "u1")
+    assert not db.session_has_runs("s1", "u2")
+
+    db.upsert_user_memory(UserMemory(memory="Prefers Python", user_id="u1"))
+    assert db.user_has_memories("u1")
+    assert not db.user_has_memories("u2")
@@ -0,0 +1,39 @@
+import asyncio
+
+from slack_sdk.web.async_client import AsyncWebClient
+
+from app.slack_stream import CoalescingStream, SlackStreamStats
+from evals.fake_slack import FakeSlackServer
+from evals.slack_stream import stream_reply
+
+
+def test_appends_are_batched_and_cards_collapse(fake_slack: FakeSlackServer) -> None:
+    async def reply() -> CoalescingStream:
+        client = AsyncWebClient(token="xoxb-fake", base_url=fake_slack.url)
+        stream = CoalescingStream(client, channel="CTEST", thread_ts="1.0", interval=60.0, stats=SlackStreamStats())
+        for i in range(200):
+            await stream.append(markdown_text=f" word{i}")
+        card = {"type": "task_update", "id": "tool-1", "title": "web_search"}
+        await stream.append(chunks=[{**card, "status": "in_progress"}])
+        await stream.append(chunks=[{**card, "status": "complete"}])
+        await stream.stop()
+        return stream
+
+    stream = asyncio.run(reply())
+    (message,) = fake_slack.state.messages.values()
+    assert message.stopped and message.text == "".join(f" word{i}" for i in range(200))
+    assert message.task_updates == 1
+    assert fake_slack.state.count() == 2  # chat.startStream + chat.stopStream
+    assert stream.stats.appends == 202
+
+
+def test_rate_limited_reply_is_complete_with_fewer_calls() -> None:
+    with FakeSlackServer(rate=1.0, burst=2) as server:
+        sdk, coalescing = [
+            asyncio.run(stream_reply(server, writer, words=60, tokens_per_second=0, task_every=10, interval=0.2))
+            for writer in ("sdk", "coalescing")
+        ]
+
+    assert coalescing.complete and coalescing.error is None
+    assert coalescing.api_calls < sdk.api_calls
+    assert server.state.count(status=429) >= 1
@@ -0,0 +1,12 @@
+from app.stats import distribution, percentile, percentiles
+
+
+def test_percentile_interpolates() -> None:
+    assert percentile([], 50) is None
+    assert percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+
+
+def test_snapshot_and_report_shapes() -> None:
+    assert percentiles(None) == {"count": 0}
+    assert percentiles([0.1, 0.2, 0.3], scale=1000, digits=1) == {"count": 3, "p50": 200.0, "p95": 290.0, "max": 300.0}
+    assert distribution([1.0, 2.0, 3.0, 4.0]) == {"p50": 2.5, "p95": 3.85, "p99": 3.97, "n": 4}
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from uuid import uuid4
+
+import pytest
+from agno.agent import Agent
+from mcp import ClientSession
+from mcp.client.streamable_http import streamable_http_client
+from mcp.types import TextContent
+from sqlalchemy.engine import Engine
+
+from db.tool_cache import ToolCache
+from evals.fake_mcp import FakeMCPServer
+
+
+@pytest.fixture
+def cache(postgres: Engine) -> Iterator[ToolCache]:
+    cache = ToolCache(f"test_tool_cache_{uuid4().hex[:8]}", {"web_search": "query"}, ttl=1, recent_ttl=1)
+    yield cache
+    cache.table.drop(postgres, checkfirst=True)
+
+
+def _searcher(server: FakeMCPServer) -> Callable[[str], Awaitable[str]]:
+    async def web_search(query: str) -> str:
+        async with streamable_http_client(server.url) as (read, write, _):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                result = await session.call_tool("web_search", {"query": query})
+        return "\n".join(c.text for c in result.content if isinstance(c, TextContent))
+
+    return web_search
+
+
+def test_hit_then_expiry(cache: ToolCache, fake_search: FakeMCPServer) -> None:
+    search = _searcher(fake_search)
+
+    first = asyncio.run(cache.hook("web_search", search, {"query": "How do advisory locks work?"}))
+    again = asyncio.run(cache.hook("web_search", search, {"query": "how do  advisory locks work"}))
+    assert again == first
+    assert fake_search.state.calls == ["web_search"]
+    assert cache.stats["web_search.hits"] == 1
+
+    time.sleep(1.1)
+    asyncio.run(cache.hook("web_search", search, {"query": "How do advisory locks work?"}))
+    assert fake_search.state.calls == ["web_search", "web_search"]
+    assert cache.stats["web_search.misses"] == 2
+
+
+def test_shared_across_agent_copies(cache: ToolCache, fake_search: FakeMCPServer) -> None:
+    agent = Agent(tool_hooks=[cache.hook], telemetry=False)
+    copies = [agent.deep_copy(), agent.deep_copy()]
+    assert all(copy.tool_hooks and getattr(copy.tool_hooks[0], "__self__", None) is cache for copy in copies)
+
+    search = _searcher(fake_search)
+    for copy in copies:
+        assert copy.tool_hooks is not None
+        asyncio.run(copy.tool_hooks[0]("web_search", search, {"query": "pgvector index types"}))
+    assert fake_search.state.calls == ["web_search"]
+    assert cache.stats["web_search.hits"] == 1
@@ -0,0 +1,14 @@
+from agno.utils.tokens import count_text_tokens
+
+from app.tool_output import compact_text
+from evals.tool_output import DEFAULT_QUERY, synthetic_page
+
+
+def test_compaction_keeps_the_answer_within_budget() -> None:
+    page = synthetic_page()
+    compacted, kept, total = compact_text(page, DEFAULT_QUERY, 500)
+
+    assert count_text_tokens(compacted) <= 500 < count_text_tokens(page)
+    assert 0 < kept < total
+    assert "pg_try_advisory_lock" in compacted
+    assert "Accept all cookies" not in compacted
@@ -0,0 +1,60 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from app.workspace_index import IndexedWorkspace, WorkspaceIndex
+
+
+def _workspace(root: Path) -> IndexedWorkspace:
+    (root / "pkg").mkdir()
+    (root / "pkg" / "pool.py").write_text("def get_engine(url):\n    return engines[url]\n")
+    (root / ".venv").mkdir()
+    (root / ".venv" / "site.py").write_text("def get_engine(url):\n    pass\n")
+    index = WorkspaceIndex(root, exclude_patterns=[".venv"], refresh_interval=0.05)
+    return IndexedWorkspace(index)
+
+
+def test_search_and_symbols_come_from_the_index(tmp_path: Path) -> None:
+    workspace = _workspace(tmp_path)
+
+    found = json.loads(workspace.search_content("engines[url]"))
+    assert [f["file"] for f in found["files"]] == ["pkg/pool.py"]
+    assert found["files"][0]["size"].endswith("B")
+    definitions = json.loads(workspace.find_symbol("get_engine"))["definitions"]
+    assert definitions == [{"file": "pkg/pool.py", "line": 1, "kind": "def", "name": "get_engine"}]
+
+
+def test_concurrent_saves_do_not_collide(tmp_path: Path) -> None:
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").write_text("def a():\n    pass\n")
+    index_path = tmp_path / "cache" / "index.json"
+    indexes = [WorkspaceIndex(tmp_path / "src", index_path=index_path) for _ in range(8)]
+    for index in indexes:
+        index.refresh()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda index: [index.save() for _ in range(20)], indexes))
+
+    assert json.loads(index_path.read_text())["files"][0]["path"] == "a.py"
+    assert [p.name for p in index_path.parent.iterdir()] == ["index.json"]
+
+
+@pytest.mark.parametrize("watchfiles", [True, False], ids=["watchfiles", "polling"])
+def test_new_files_are_picked_up_in_the_background(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, watchfiles: bool
+) -> None:
+    if not watchfiles:
+        monkeypatch.setattr("app.workspace_index.find_spec", lambda name: None)
+    workspace = _workspace(tmp_path)
+    workspace.search_content("get_engine")
+    try:
+        (tmp_path / "pkg" / "later.py").write_text("class LateArrival:\n    pass\n")
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not workspace.index.find_symbol("LateArrival"):
+            time.sleep(0.05)
+        assert workspace.index.find_symbol("LateArrival")[0]["file"] == "pkg/later.py"
+    finally:
+        workspace.index.stop()